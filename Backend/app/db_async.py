@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from app.db import (
+    DEFAULT_PARTITION,
+    DSN,
+    POOL_KWARGS,
+    POOL_SHARES,
+    PoolSizer,
+    PoolWaitStats,
+    partition_limits,
+)
+
+from app.db_metrics import AsyncTimedCursor, add_pool_wait
+
+log = logging.getLogger("db")
+
+# Pools async para handlers `async def`: la espera de la DB no ocupa un hilo
+# del threadpool de Starlette ni bloquea el event loop.
+# Mismo DSN, opciones y crecimiento por espera que app/db.py. Sólo las
+# particiones que usan las rutas async (ingest / interactive), con su parte
+# de DB_POOL_BUDGET (ver POOL_SHARES en app/db.py).
+
+
+async def _configure_conn(conn) -> None:
+    # Cursores instrumentados (cantidad de SQL, tiempo y filas por request)
+    conn.cursor_factory = AsyncTimedCursor
+
+
+class AsyncPoolPartition:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        min_size, max_size, hard_max, timeout = partition_limits(name, "async")
+        self.stats = PoolWaitStats()
+        self.sizer = PoolSizer(min_size, max_size, hard_max)
+        self._resize_lock = asyncio.Lock()
+        self.pool = AsyncConnectionPool(
+            conninfo=DSN,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,  # segundos para conseguir una conexión del pool
+            kwargs=POOL_KWARGS,
+            configure=_configure_conn,
+            name=f"{name}-async",
+            open=False,  # se abre en el startup, dentro del event loop
+        )
+
+    async def _adapt(self, force: bool = False) -> None:
+        if self._resize_lock.locked():
+            return
+        async with self._resize_lock:
+            new_max = self.sizer.next_size(self.stats, force=force)
+            if new_max is None:
+                return
+            await self.pool.resize(self.sizer.min_size, new_max)
+            log.info(
+                "pool %s-async: max_size %s -> %s (espera ewma=%.1f ms)",
+                self.name,
+                self.sizer.max_size,
+                new_max,
+                self.stats.ewma_ms,
+            )
+            self.sizer.applied(new_max)
+
+    @asynccontextmanager
+    async def connection(self):
+        t0 = time.perf_counter()
+        acquired = False
+        try:
+            async with self.pool.connection() as conn:
+                acquired = True
+                wait_ms = (time.perf_counter() - t0) * 1000
+                self.stats.record(wait_ms)
+                add_pool_wait(wait_ms)
+                await self._adapt()
+                yield conn
+        except PoolTimeout:
+            if not acquired:
+                self.stats.record_timeout((time.perf_counter() - t0) * 1000)
+                await self._adapt(force=True)
+            raise
+
+    def info(self) -> dict:
+        ps = self.pool.get_stats()
+        return {
+            "min_size": self.sizer.min_size,
+            "max_size": self.sizer.max_size,
+            "base_max": self.sizer.base_max,
+            "hard_max": self.sizer.hard_max,
+            "resizes": self.sizer.resizes,
+            "size": ps.get("pool_size", 0),
+            "available": ps.get("pool_available", 0),
+            "waiting": ps.get("requests_waiting", 0),
+            **self.stats.snapshot(),
+        }
+
+
+apartitions = {name: AsyncPoolPartition(name) for name in POOL_SHARES["async"]}
+
+
+async def open_async_pool():
+    # wait=False: si la DB no está al arrancar, la app levanta igual y el
+    # pool reintenta en segundo plano (como el pool sync).
+    for p in apartitions.values():
+        await p.pool.open(wait=False)
+
+
+def get_aconn(partition: str = DEFAULT_PARTITION):
+    """Uso: async with get_aconn() as conn: ...  /  async with get_aconn("ingest") as conn: ..."""
+    return apartitions[partition].connection()
+
+
+def async_pool_stats() -> dict:
+    return {name: p.info() for name, p in apartitions.items()}
+
+
+async def close_async_pool():
+    for p in apartitions.values():
+        try:
+            await p.pool.close()
+        except Exception:
+            pass
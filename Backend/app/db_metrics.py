@@ -0,0 +1,326 @@
+# app/db_metrics.py
+"""
+Instrumentación de queries por request.
+
+- Los cursores de get_conn() / get_aconn() son TimedCursor / AsyncTimedCursor
+  (cursor_factory de la conexión): cada execute suma cantidad de SQL,
+  tiempo en la DB y filas (rowcount) al request en curso.
+- La espera para conseguir conexión del pool también se suma (db.py /
+  db_async.py llaman a add_pool_wait()).
+- QueryMetricsMiddleware abre el contexto del request, agrega el header
+  Server-Timing (db, pool, app) y acumula por ruta ("GET /kpi/...").
+  Lo que corre fuera de un request (hilos de fondo) va a la ruta
+  "background".
+- Queries más lentas que SLOW_QUERY_MS van al log "slow-query" con el
+  SQL normalizado (literales -> ?) y la forma de los parámetros (tipos,
+  no valores), y quedan las últimas SLOW_QUERY_KEEP en memoria.
+
+render_prometheus() arma el texto para GET /metrics.
+
+Env:
+  SLOW_QUERY_MS    (default 500)
+  SLOW_QUERY_KEEP  (default 200)
+"""
+from __future__ import annotations
+
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Optional
+import logging
+import os
+import re
+import threading
+import time
+
+import psycopg
+
+log = logging.getLogger("slow-query")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "200"))
+
+BACKGROUND_ROUTE = "background"
+
+# Rutas que no se miden (el propio scrape de métricas)
+_SKIP_PATHS = {"/metrics"}
+
+
+class RequestDbStats:
+    __slots__ = ("scope", "queries", "db_ms", "rows", "pool_wait_ms")
+
+    def __init__(self, scope: dict) -> None:
+        # La ruta se resuelve recién cuando el router la agrega al scope
+        self.scope = scope
+        self.queries = 0
+        self.db_ms = 0.0
+        self.rows = 0
+        self.pool_wait_ms = 0.0
+
+
+_current: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _route_key(scope: dict) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None) or "<sin ruta>"
+    return f"{scope.get('method', 'GET')} {path}"
+
+
+# ============================================================
+# Acumulado por ruta
+# ============================================================
+class RouteMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # route -> [requests, queries, db_ms, rows, pool_wait_ms, duration_ms]
+        self._by_route: dict[str, list] = {}
+        self.slow: deque = deque(maxlen=SLOW_QUERY_KEEP)
+        self.slow_total = 0
+
+    def _row(self, route: str) -> list:
+        row = self._by_route.get(route)
+        if row is None:
+            row = self._by_route[route] = [0, 0, 0.0, 0, 0.0, 0.0]
+        return row
+
+    def add_request(self, st: RequestDbStats, duration_ms: float) -> None:
+        with self._lock:
+            row = self._row(_route_key(st.scope))
+            row[0] += 1
+            row[1] += st.queries
+            row[2] += st.db_ms
+            row[3] += st.rows
+            row[4] += st.pool_wait_ms
+            row[5] += duration_ms
+
+    def add_background(self, queries: int, db_ms: float, rows: int, pool_wait_ms: float) -> None:
+        with self._lock:
+            row = self._row(BACKGROUND_ROUTE)
+            row[1] += queries
+            row[2] += db_ms
+            row[3] += rows
+            row[4] += pool_wait_ms
+
+    def add_slow(self, entry: dict) -> None:
+        with self._lock:
+            self.slow.append(entry)
+            self.slow_total += 1
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                route: {
+                    "requests": r[0],
+                    "queries": r[1],
+                    "db_ms": r[2],
+                    "rows": r[3],
+                    "pool_wait_ms": r[4],
+                    "duration_ms": r[5],
+                }
+                for route, r in self._by_route.items()
+            }
+
+
+route_metrics = RouteMetrics()
+
+
+# ============================================================
+# Registro (cursores / pools)
+# ============================================================
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_SPACES = re.compile(r"\s+")
+
+
+def normalize_sql(query: Any, limit: int = 600) -> str:
+    """SQL en una línea, literales como ?, recortado."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        # psycopg.sql.Composed / SQL: sin conexión a mano, repr corto
+        query = str(query)
+    q = _RE_STRING.sub("?", query)
+    q = _RE_NUMBER.sub("?", q)
+    q = _RE_SPACES.sub(" ", q).strip()
+    return q[:limit]
+
+
+def _type_name(v: Any) -> str:
+    if isinstance(v, (list, tuple)):
+        return f"{type(v).__name__}[{len(v)}]"
+    return type(v).__name__
+
+
+def params_shape(params: Any) -> Any:
+    """Tipos de los parámetros, nunca los valores."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _type_name(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_type_name(v) for v in params]
+    return _type_name(params)
+
+
+def _record_query(query: Any, params: Any, elapsed_ms: float, rowcount: int) -> None:
+    rows = rowcount if rowcount and rowcount > 0 else 0
+    st = _current.get()
+    if st is not None:
+        st.queries += 1
+        st.db_ms += elapsed_ms
+        st.rows += rows
+    else:
+        route_metrics.add_background(1, elapsed_ms, rows, 0.0)
+
+    if elapsed_ms >= SLOW_QUERY_MS:
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "route": _route_key(st.scope) if st is not None else BACKGROUND_ROUTE,
+            "ms": round(elapsed_ms, 1),
+            "rows": rows,
+            "sql": normalize_sql(query),
+            "params": params_shape(params),
+        }
+        route_metrics.add_slow(entry)
+        log.warning(
+            "slow query %.0f ms route=%s rows=%s sql=%s params=%s",
+            elapsed_ms,
+            entry["route"],
+            rows,
+            entry["sql"],
+            entry["params"],
+        )
+
+
+def add_pool_wait(wait_ms: float) -> None:
+    st = _current.get()
+    if st is not None:
+        st.pool_wait_ms += wait_ms
+    else:
+        route_metrics.add_background(0, 0.0, 0, wait_ms)
+
+
+class TimedCursor(psycopg.Cursor):
+    def execute(self, query, params=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            _record_query(query, params, (time.perf_counter() - t0) * 1000, self.rowcount)
+
+    def executemany(self, query, params_seq, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            _record_query(query, None, (time.perf_counter() - t0) * 1000, self.rowcount)
+
+
+class AsyncTimedCursor(psycopg.AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            _record_query(query, params, (time.perf_counter() - t0) * 1000, self.rowcount)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            _record_query(query, None, (time.perf_counter() - t0) * 1000, self.rowcount)
+
+
+# ============================================================
+# Middleware ASGI
+# ============================================================
+class QueryMetricsMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in _SKIP_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        st = RequestDbStats(scope)
+        token = _current.set(st)
+        t0 = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                app_ms = (time.perf_counter() - t0) * 1000
+                timing = (
+                    f'db;dur={st.db_ms:.1f};desc="{st.queries} queries, {st.rows} rows", '
+                    f"pool;dur={st.pool_wait_ms:.1f}, "
+                    f"app;dur={app_ms:.1f}"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route_metrics.add_request(st, (time.perf_counter() - t0) * 1000)
+
+
+# ============================================================
+# Prometheus
+# ============================================================
+def _label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+_ROUTE_SERIES = (
+    ("dirac_route_requests_total", "counter", "Requests por ruta", "requests", 1.0),
+    ("dirac_route_db_queries_total", "counter", "Queries SQL ejecutadas por ruta", "queries", 1.0),
+    ("dirac_route_db_seconds_total", "counter", "Tiempo en execute() por ruta", "db_ms", 0.001),
+    ("dirac_route_db_rows_total", "counter", "Filas devueltas/afectadas por ruta", "rows", 1.0),
+    ("dirac_route_pool_wait_seconds_total", "counter", "Espera por conexión del pool por ruta", "pool_wait_ms", 0.001),
+    ("dirac_route_duration_seconds_total", "counter", "Duración total de los requests por ruta", "duration_ms", 0.001),
+)
+
+_POOL_SERIES = (
+    ("dirac_db_pool_size", "gauge", "Conexiones abiertas", "size"),
+    ("dirac_db_pool_max", "gauge", "max_size actual (crece según la espera)", "max_size"),
+    ("dirac_db_pool_available", "gauge", "Conexiones libres", "available"),
+    ("dirac_db_pool_waiting", "gauge", "Requests esperando conexión", "waiting"),
+    ("dirac_db_pool_acquired_total", "counter", "Conexiones entregadas", "acquired"),
+    ("dirac_db_pool_timeouts_total", "counter", "Timeouts esperando conexión", "timeouts"),
+    ("dirac_db_pool_wait_p95_ms", "gauge", "p95 de espera por conexión (últimas 512)", "wait_p95_ms"),
+)
+
+
+def render_prometheus(pools: dict[str, dict[str, dict]]) -> str:
+    """pools: {"sync": pool_stats(), "async": async_pool_stats()}"""
+    routes = route_metrics.snapshot()
+    lines: list[str] = []
+
+    for name, kind, help_, key, scale in _ROUTE_SERIES:
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+        for route, r in sorted(routes.items()):
+            method, _, path = route.partition(" ")
+            if not path:
+                method, path = "", route
+            lines.append(
+                f'{name}{{method="{_label(method)}",route="{_label(path)}"}} {r[key] * scale:g}'
+            )
+
+    for name, kind, help_, key in _POOL_SERIES:
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+        for mode, parts in pools.items():
+            for partition, info in parts.items():
+                lines.append(f'{name}{{mode="{mode}",partition="{partition}"}} {info.get(key, 0):g}')
+
+    lines.append("# HELP dirac_slow_queries_total Queries por encima de SLOW_QUERY_MS")
+    lines.append("# TYPE dirac_slow_queries_total counter")
+    lines.append(f"dirac_slow_queries_total {route_metrics.slow_total}")
+
+    return "\n".join(lines) + "\n"
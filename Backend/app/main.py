@@ -5,13 +5,31 @@ import logging
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from app.db import get_conn, close_pool
+from app.db import get_conn, close_pool, pool_budget, pool_stats
+from app.db_async import open_async_pool, close_async_pool, async_pool_stats
+from app.db_metrics import QueryMetricsMiddleware, render_prometheus, route_metrics
 
 # ===== Telegram reporter (30 min) =====
 from app.services.telegram_reporter import start_telegram_reporter, stop_telegram_reporter
 
+# ===== Heartbeats (write-behind) =====
+from app.services.heartbeat_buffer import start_heartbeat_buffer, stop_heartbeat_buffer
+
+# ===== Últimas lecturas en memoria =====
+from app.services.latest_store import start_latest_store, stop_latest_store
+
+# ===== Rollup incremental de estado de bombas =====
+from app.services.pump_rollup import start_pump_rollup, stop_pump_rollup
+from app.services.tank_rollup import start_tank_rollup, stop_tank_rollup
+
+# ===== LISTEN/NOTIFY de Postgres =====
+from app.services.pg_listen import start_pg_listener, stop_pg_listener
+
+# ===== Cache de respuestas =====
+from app.services.response_cache import response_cache_stats
+
 # ===== Telegram test router =====
 from app.services.telegram_test import router as telegram_test_router
 
@@ -21,6 +39,9 @@ from app.routes.pumps import router as pumps_router
 from app.routes.ingest import router as ingest_router
 from app.routes.arduino_controler import router as arduino_router
 
+# ===== Live (push a pantallas SCADA) =====
+from app.routes.live import router as live_router
+
 # Infraestructura (lectura)
 from app.routes.infraestructura import router as infraestructura_router
 
@@ -105,6 +126,9 @@ app.add_middleware(
 
 app.add_middleware(GZipMiddleware, minimum_size=1024)
 
+# SQL / tiempo de DB / espera de pool por request: header Server-Timing + /metrics
+app.add_middleware(QueryMetricsMiddleware)
+
 
 # ===== Global exception handler =====
 @app.exception_handler(Exception)
@@ -171,11 +195,45 @@ def health_db():
         )
 
 
+@app.get("/health/db/pools", tags=["health"])
+def health_db_pools():
+    """
+    Particiones del pool (ingest / interactive / analytics), sync y async:
+    tamaño actual y tope, conexiones libres, requests esperando y tiempo
+    de espera para conseguir conexión (promedio, ewma, p95, máximo), más
+    el presupuesto de conexiones por worker (DB_POOL_BUDGET).
+    """
+    return {
+        "budget": pool_budget(),
+        "sync": pool_stats(),
+        "async": async_pool_stats(),
+    }
+
+
+@app.get("/health/cache", tags=["health"])
+def health_cache():
+    """Caches de respuestas (app/services/response_cache): entradas, hits, misses, coalescidos."""
+    return response_cache_stats()
+
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics():
+    """Métricas estilo Prometheus: DB por ruta y estado de los pools."""
+    return render_prometheus({"sync": pool_stats(), "async": async_pool_stats()})
+
+
+@app.get("/metrics/slow-queries", tags=["health"])
+def metrics_slow_queries(limit: int = 50):
+    """Últimas queries lentas (SQL normalizado + forma de los parámetros)."""
+    return {"total": route_metrics.slow_total, "items": list(route_metrics.slow)[-limit:][::-1]}
+
+
 # ===== Rutas (operaciÃ³n base) =====
 app.include_router(tanks_router)
 app.include_router(pumps_router)
 app.include_router(ingest_router)
 app.include_router(arduino_router)
+app.include_router(live_router)
 
 # ===== Infraestructura =====
 app.include_router(infraestructura_router)
@@ -214,10 +272,30 @@ app.include_router(telegram_test_router)
 # ===== Startup / Shutdown =====
 @app.on_event("startup")
 def _startup():
+    start_latest_store()
+    start_pg_listener()
     start_telegram_reporter()
+    start_heartbeat_buffer()
+    start_pump_rollup()
+    start_tank_rollup()
+
+
+@app.on_event("startup")
+async def _startup_async_pool():
+    await open_async_pool()
 
 
 @app.on_event("shutdown")
 def _shutdown():
     stop_telegram_reporter()
+    stop_pump_rollup()
+    stop_tank_rollup()
+    stop_heartbeat_buffer()
+    stop_latest_store()
+    stop_pg_listener()
     close_pool()
+
+
+@app.on_event("shutdown")
+async def _shutdown_async_pool():
+    await close_async_pool()
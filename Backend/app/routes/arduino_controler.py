@@ -1,14 +1,29 @@
+import os
+import time
+
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, Literal, List
 from datetime import datetime, timezone
 from app.db import get_conn
 from psycopg.rows import dict_row
 from psycopg.types.json import Json  # adaptador JSON (psycopg3)
-from psycopg import DatabaseError
+from psycopg import DatabaseError, OperationalError
+
+from app.services.heartbeat_buffer import heartbeat_buffer, pump_ids
+from app.services.latest_store import latest_store
+from app.services.live_bus import live_bus
+from app.services.command_notify import command_notifier, notify_command_created
+from app.services.pg_listen import pg_listener
 
 router = APIRouter(prefix="/arduino-controler", tags=["arduino-controler"])
 
+# Long-poll de next_commands
+CMD_LONGPOLL_MAX_SEC = int(os.getenv("CMD_LONGPOLL_MAX_SEC", "55"))
+# Sin LISTEN (pg_listener desconectado): cada cuánto se mira la DB mientras se espera
+CMD_LONGPOLL_RECHECK_SEC = float(os.getenv("CMD_LONGPOLL_RECHECK_SEC", "5"))
+
 # ===== Modelos =====
 
 class CommandIn(BaseModel):
@@ -72,7 +87,7 @@ class CommandOut(BaseModel):
 
 @router.post("/command")
 def create_command(cmd: CommandIn):
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute("SELECT 1 FROM public.pumps WHERE id=%s", (cmd.pump_id,))
         if cur.fetchone() is None:
             raise HTTPException(status_code=404, detail="pump not found")
@@ -91,13 +106,25 @@ def create_command(cmd: CommandIn):
             "UPDATE public.pump_commands SET status='sent', sent_at=now() WHERE id=%s",
             (row["id"],),
         )
+        notify_command_created(cur, cmd.pump_id)
         conn.commit()
 
+    command_notifier.notify(cmd.pump_id)
+
     return {"ok": True, "command_id": row["id"], "status": "sent"}
 
 
 # ========== Arduino -> heartbeat (PLC estado + conectividad) ==========
 
+def _check_pump(pump_id: int) -> None:
+    try:
+        ok = pump_ids.exists(pump_id)
+    except OperationalError:
+        raise HTTPException(status_code=503, detail="Base de datos no disponible")
+    if not ok:
+        raise HTTPException(status_code=404, detail="pump not found")
+
+
 @router.post("/heartbeat")
 def push_heartbeat(body: HeartbeatIn):
     """
@@ -107,11 +134,8 @@ def push_heartbeat(body: HeartbeatIn):
     - Calcula y guarda plc_state ('run' / 'stop') según state / relay
     """
 
-    # 1) validar bomba
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute("SELECT 1 FROM public.pumps WHERE id=%s", (body.pump_id,))
-        if cur.fetchone() is None:
-            raise HTTPException(status_code=404, detail="pump not found")
+    # 1) validar bomba (set en memoria, sin ir a la DB en cada latido)
+    _check_pump(body.pump_id)
 
     # 2) determinar plc_state desde state / relay
     plc_state: Optional[str]
@@ -138,12 +162,26 @@ def push_heartbeat(body: HeartbeatIn):
             if v is not None and k != "payload"
         }
 
-    payload_json = Json(raw_payload)  # psycopg3 -> json/jsonb
     rssi = body.rssi if body.rssi is not None else None
 
-    # 4) insertar en DB
+    # 4a) write-behind: se encola y lo escribe el hilo de heartbeat_buffer
+    if heartbeat_buffer.running:
+        ts = datetime.now(timezone.utc)
+        heartbeat_buffer.enqueue(body.pump_id, rssi, raw_payload, plc_state, ts)
+        latest_store.update_pump(body.pump_id, plc_state, ts)
+        return {
+            "ok": True,
+            "hb_id": None,
+            "ts": ts,
+            "plc_state": plc_state,
+            "queued": True,
+        }
+
+    payload_json = Json(raw_payload)  # psycopg3 -> json/jsonb
+
+    # 4b) insertar en DB (buffer deshabilitado)
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 """
                 INSERT INTO public.pump_heartbeat (pump_id, rssi, payload, plc_state)
@@ -160,6 +198,8 @@ def push_heartbeat(body: HeartbeatIn):
             detail=f"heartbeat insert failed: {e}",
         ) from e
 
+    latest_store.update_pump(body.pump_id, plc_state, row["created_at"])
+
     return {
         "ok": True,
         "hb_id": row["id"],
@@ -171,10 +211,15 @@ def push_heartbeat(body: HeartbeatIn):
 # Variante ultra simple por querystring (NO guarda plc_state, solo latido)
 @router.get("/hb")
 def heartbeat_get(pump_id: int = Query(...)):
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute("SELECT 1 FROM public.pumps WHERE id=%s", (pump_id,))
-        if cur.fetchone() is None:
-            raise HTTPException(status_code=404, detail="pump not found")
+    _check_pump(pump_id)
+
+    if heartbeat_buffer.running:
+        ts = datetime.now(timezone.utc)
+        heartbeat_buffer.enqueue(pump_id, None, None, None, ts)
+        latest_store.update_pump(pump_id, None, ts)
+        return {"ok": True, "hb_id": None, "ts": ts, "queued": True}
+
+    with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(
             """
             INSERT INTO public.pump_heartbeat (pump_id)
@@ -185,9 +230,16 @@ def heartbeat_get(pump_id: int = Query(...)):
         )
         row = cur.fetchone()
         conn.commit()
+    latest_store.update_pump(pump_id, None, row["created_at"])
     return {"ok": True, "hb_id": row["id"], "ts": row["created_at"]}
 
 
+# Métricas del write-behind (cola, flush, spill a disco)
+@router.get("/heartbeat/buffer-stats")
+def heartbeat_buffer_stats():
+    return heartbeat_buffer.stats()
+
+
 # ========== Arduino -> estado real del relé (historial de eventos) ==========
 
 @router.post("/state")
@@ -204,7 +256,7 @@ def push_state(body: StateIn):
     else:
         raise HTTPException(status_code=422, detail="missing 'state' or 'relay'")
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute("SELECT 1 FROM public.pumps WHERE id=%s", (body.pump_id,))
         if cur.fetchone() is None:
             raise HTTPException(status_code=404, detail="pump not found")
@@ -231,6 +283,12 @@ def push_state(body: StateIn):
 
         conn.commit()
 
+    live_bus.publish(
+        "pump_event",
+        body.pump_id,
+        {"event_id": ev["id"], "state": state, "source": body.source, "ts": ev["created_at"]},
+    )
+
     return {"ok": True, "event_id": ev["id"], "state": state, "ts": ev["created_at"]}
 
 
@@ -238,7 +296,7 @@ def push_state(body: StateIn):
 @router.get("/st")
 def state_get(pump_id: int = Query(...), relay: int = Query(...)):
     state = "run" if int(relay) == 1 else "stop"
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute("SELECT 1 FROM public.pumps WHERE id=%s", (pump_id,))
         if cur.fetchone() is None:
             raise HTTPException(status_code=404, detail="pump not found")
@@ -252,18 +310,20 @@ def state_get(pump_id: int = Query(...), relay: int = Query(...)):
         )
         ev = cur.fetchone()
         conn.commit()
+    live_bus.publish(
+        "pump_event",
+        pump_id,
+        {"event_id": ev["id"], "state": state, "source": "device", "ts": ev["created_at"]},
+    )
     return {"ok": True, "event_id": ev["id"], "state": state, "ts": ev["created_at"]}
 
 
 # ========== Backend -> Arduino: comandos pendientes (pull) ==========
 
-@router.get("/next_commands")
-def next_commands(
-    pump_id: int = Query(...),
-    limit: int = Query(5, ge=1, le=50),
-):
+def _take_commands(pump_id: int, limit: int) -> list:
+    """pending/sent de la bomba; los pending pasan a sent."""
     now = datetime.now(timezone.utc)
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(
             """
             SELECT id, pump_id, action, status, requested_at, sent_at
@@ -303,4 +363,50 @@ def next_commands(
         )
         for r in rows
     ]
-    return {"commands": [c.model_dump() for c in cmds]}
+    return [c.model_dump() for c in cmds]
+
+
+@router.get("/next_commands")
+async def next_commands(
+    pump_id: int = Query(...),
+    limit: int = Query(5, ge=1, le=50),
+    wait: int = Query(
+        0,
+        ge=0,
+        le=CMD_LONGPOLL_MAX_SEC,
+        description="Long-poll: segundos a esperar si no hay comandos (0 = responde al toque)",
+    ),
+):
+    """
+    Comandos pendientes para la bomba.
+
+    Con ?wait=N, si no hay nada la respuesta se demora hasta que se cree
+    un comando para esa bomba (create_command, /dirac/pumps/{id}/command,
+    o pg_notify('pump_commands') desde otro worker) o hasta N segundos.
+    El equipo puede volver a llamar en seguida: una llamada cada N
+    segundos en vez de un SELECT+UPDATE por vuelta del loop.
+    """
+    seq = command_notifier.seq(pump_id)
+    cmds = await run_in_threadpool(_take_commands, pump_id, limit)
+
+    if cmds or wait <= 0:
+        return {"commands": cmds}
+
+    deadline = time.monotonic() + wait
+
+    while not cmds:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        # Sin LISTEN, los comandos creados en otro worker no despiertan:
+        # se re-chequea la DB cada tanto.
+        step = remaining if pg_listener.connected else min(remaining, CMD_LONGPOLL_RECHECK_SEC)
+
+        woke = await command_notifier.wait(pump_id, seq, step)
+        seq = command_notifier.seq(pump_id)
+
+        if woke or time.monotonic() >= deadline or not pg_listener.connected:
+            cmds = await run_in_threadpool(_take_commands, pump_id, limit)
+
+    return {"commands": cmds}
@@ -2,6 +2,7 @@ from typing import List, Dict, Any
 from fastapi import APIRouter, HTTPException
 from psycopg.rows import dict_row
 from app.db import get_conn
+from app.services.live_bus import live_bus
 
 router = APIRouter(prefix="/dirac/admin", tags=["admin-manifold-signals"])
 
@@ -25,6 +26,20 @@ def _to_float(v: Any, field: str) -> float:
         raise HTTPException(status_code=400, detail=f"{field} debe ser numérico")
 
 
+def _publish_reading(manifold_id: int, signal_type: str, unit: Any, reading: Dict[str, Any]) -> None:
+    live_bus.publish(
+        "manifold_signal",
+        manifold_id,
+        {
+            "signal_id": reading["manifold_signal_id"],
+            "signal_type": signal_type,
+            "unit": unit,
+            "value": reading["value"],
+            "ts": reading["created_at"],
+        },
+    )
+
+
 # ---------------------------
 # GET: Config + última lectura
 # ---------------------------
@@ -168,7 +183,7 @@ def insert_manifold_reading(manifold_id: int, payload: Dict[str, Any]):
         RETURNING id, manifold_signal_id, value, created_at;
     """
 
-    with get_conn() as conn:
+    with get_conn("ingest") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql_find, (manifold_id, st))
             sig = cur.fetchone()
@@ -185,6 +200,8 @@ def insert_manifold_reading(manifold_id: int, payload: Dict[str, Any]):
 
         conn.commit()
 
+    _publish_reading(manifold_id, st, sig["unit"], out)
+
     return {
         "ok": True,
         "manifold_id": manifold_id,
@@ -213,7 +230,7 @@ def insert_signal_reading(manifold_signal_id: int, payload: Dict[str, Any]):
     ts = payload.get("ts")
 
     sql_sig = """
-        SELECT id, unit, COALESCE(scale_mult, 1) AS scale_mult, COALESCE(scale_add, 0) AS scale_add
+        SELECT id, manifold_id, signal_type, unit, COALESCE(scale_mult, 1) AS scale_mult, COALESCE(scale_add, 0) AS scale_add
         FROM public.manifold_signals
         WHERE id = %s
         LIMIT 1;
@@ -225,7 +242,7 @@ def insert_signal_reading(manifold_signal_id: int, payload: Dict[str, Any]):
         RETURNING id, manifold_signal_id, value, created_at;
     """
 
-    with get_conn() as conn:
+    with get_conn("ingest") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql_sig, (manifold_signal_id,))
             sig = cur.fetchone()
@@ -239,6 +256,8 @@ def insert_signal_reading(manifold_signal_id: int, payload: Dict[str, Any]):
 
         conn.commit()
 
+    _publish_reading(sig["manifold_id"], sig["signal_type"], sig["unit"], out)
+
     return {
         "ok": True,
         "manifold_signal_id": manifold_signal_id,
@@ -6,6 +6,8 @@ from datetime import datetime, timezone
 
 from psycopg.rows import dict_row
 from app.db import get_conn
+from app.services.downsample import DownsampleMethod, downsample_info, downsample_rows
+from app.services.latest_store import latest_store
 
 router = APIRouter(
     prefix="/components/network_analyzers",
@@ -243,7 +245,7 @@ def insert_snapshot(
     ts = parse_ts(payload.get("ts"))
     n = norm_payload(payload)
 
-    with get_conn() as conn:
+    with get_conn("ingest") as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -345,6 +347,8 @@ def insert_snapshot(
             row_id = cur.fetchone()[0]
             conn.commit()
 
+    latest_store.update_meter(analyzer_id, {"id": row_id, "ts": ts, **n})
+
     return {"ok": True, "id": row_id, "ts": ts}
 
 
@@ -359,6 +363,13 @@ def get_latest_snapshot(
     if analyzer_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid analyzer_id")
 
+    # lite: desde el cache de últimas lecturas (sin ir a la DB)
+    if fields == "lite":
+        latest_store.ensure_warm()
+        row = latest_store.meter(analyzer_id)
+        if row:
+            return row
+
     select_sql = """
         select
             id,
@@ -406,6 +417,10 @@ def get_history(
     to_ts: datetime = Query(..., alias="to", description="ISO datetime, ej 2026-01-30T23:59:59Z"),
     granularity: Literal["minute", "hour", "day"] = Query("minute"),
     limit: int = Query(20000, ge=1, le=200000),
+    max_points: Optional[int] = Query(
+        None, ge=10, le=100000, description="Máximo de puntos; mantiene picos de kW y mínimos de FP"
+    ),
+    downsample: DownsampleMethod = Query("minmax"),
 ):
     if analyzer_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid analyzer_id")
@@ -418,7 +433,7 @@ def get_history(
     if to_ts <= from_ts:
         raise HTTPException(status_code=400, detail="Invalid range: to must be > from")
 
-    with get_conn() as conn:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             has_q_1h_avg = has_column(cur, "kpi", "analyzers_1h", "q_kvar_avg")
             has_q_1h_max = has_column(cur, "kpi", "analyzers_1h", "q_kvar_max")
@@ -501,10 +516,16 @@ def get_history(
     if not rows:
         raise HTTPException(status_code=404, detail="No history for range")
 
-    return {
+    points = downsample_rows(rows, max_points, ["kw_max", "pf_min"], method=downsample)
+
+    out = {
         "analyzer_id": analyzer_id,
         "granularity": granularity,
         "from": from_ts,
         "to": to_ts,
-        "points": rows,
-    }
\ No newline at end of file
+        "points": points,
+    }
+    info = downsample_info(downsample, max_points, len(rows), len(points))
+    if info:
+        out["downsample"] = info
+    return out
\ No newline at end of file
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends
 from psycopg.rows import dict_row
 from app.db import get_conn
-from app.security import require_user
+from app.security import issue_token, require_basic_user, require_user
 
 router = APIRouter(prefix="/dirac", tags=["me"])
 
@@ -34,3 +34,15 @@ def my_pumps(user=Depends(require_user)):
     with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, (user["user_id"],))
         return cur.fetchall() or []
+
+@router.post(
+    "/me/token",
+    summary="Token de sesión",
+    description=(
+        "Con credenciales Basic devuelve un token firmado para mandar como "
+        "'Authorization: Bearer <token>'. Se valida sin consultar la DB; deja "
+        "de valer al vencer o cuando se modifica el usuario."
+    ),
+)
+def my_token(user=Depends(require_basic_user)):
+    return issue_token(user)
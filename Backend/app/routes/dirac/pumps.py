@@ -4,7 +4,8 @@ from fastapi import APIRouter, HTTPException, Query, Request
 from pydantic import BaseModel, field_validator
 from psycopg.rows import dict_row
 
-from app.db import get_conn
+from app.db_async import get_aconn
+from app.services.command_notify import anotify_command_created, command_notifier
 
 router = APIRouter(prefix="/dirac/pumps", tags=["dirac-pumps"])
 
@@ -50,25 +51,25 @@ def _get_user_labels_from_request(request: Request) -> tuple[Optional[str], Opti
         return (None, None)
 
 
-def _ensure_pump_visible(cur, pump_id: int, company_id: Optional[int]) -> dict:
+async def _ensure_pump_visible(cur, pump_id: int, company_id: Optional[int]) -> dict:
     """
     Trae la fila de 'pumps' y valida (si se suministra company_id)
     que la bomba pertenezca a una location de esa empresa.
     """
     if company_id is None:
-        cur.execute("""
+        await cur.execute("""
             SELECT p.id, p.name, p.location_id, p.pin_code, p.require_pin
             FROM public.pumps p
             WHERE p.id = %s
         """, (pump_id,))
     else:
-        cur.execute("""
+        await cur.execute("""
             SELECT p.id, p.name, p.location_id, p.pin_code, p.require_pin
             FROM public.pumps p
             JOIN public.locations l ON l.id = p.location_id
             WHERE p.id = %s AND l.company_id = %s
         """, (pump_id, company_id))
-    row = cur.fetchone()
+    row = await cur.fetchone()
     if not row:
         # 404 si no existe o no pertenece a la empresa indicada
         raise HTTPException(status_code=404, detail="Bomba no encontrada o fuera de alcance de la empresa")
@@ -94,9 +95,9 @@ async def post_pump_command(
       4) (Opcional) Registra evento en pump_events (source='ui').
     """
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        async with get_aconn("interactive") as conn, conn.cursor(row_factory=dict_row) as cur:
             # 1) Alcance y datos de la bomba
-            pump = _ensure_pump_visible(cur, pump_id, company_id)
+            pump = await _ensure_pump_visible(cur, pump_id, company_id)
             require_pin = bool(pump.get("require_pin"))
             pin_code_db = (pump.get("pin_code") or "").strip()
 
@@ -113,22 +114,26 @@ async def post_pump_command(
             req_by_email, req_by_id = _get_user_labels_from_request(request)
 
             # 3) Registrar comando (status 'pending' para que lo consuma tu service/Node-RED/PLC)
-            cur.execute("""
+            await cur.execute("""
                 INSERT INTO public.pump_commands (pump_id, action, status, requested_by, requested_by_user_id)
                 VALUES (%s, %s, 'pending', %s, %s)
                 RETURNING id, pump_id, action, status, requested_at
             """, (pump_id, payload.action, req_by_email, req_by_id))
-            cmd = cur.fetchone()
+            cmd = await cur.fetchone()
 
             # 4) (Opcional) Insertar evento (útil para timeline)
-            cur.execute("""
+            await cur.execute("""
                 INSERT INTO public.pump_events (pump_id, state, source, created_by, created_by_user_id)
                 VALUES (%s, %s, 'ui', %s, %s)
                 RETURNING id, created_at
             """, (pump_id, 'run' if payload.action == 'start' else 'stop', req_by_email, req_by_id))
-            ev = cur.fetchone()
+            ev = await cur.fetchone()
 
-            conn.commit()
+            # 5) Despertar el long-poll de next_commands (este y otros workers)
+            await anotify_command_created(cur, pump_id)
+
+            await conn.commit()
+            command_notifier.notify(pump_id)
             return {
                 "ok": True,
                 "command": cmd,
@@ -6,6 +6,7 @@ from pydantic import BaseModel, field_validator
 
 from app.db import get_conn
 from app.security import require_user
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
 from .location_utils import ensure_location_id
 
 router = APIRouter(prefix="/dirac/admin", tags=["admin-manifolds"])
@@ -318,7 +319,9 @@ def delete_manifold(manifold_id: int, force: bool = Query(False), user=Depends(r
             cur.execute("DELETE FROM public.manifolds WHERE id=%s", (manifold_id,))
             if cur.rowcount == 0:
                 raise HTTPException(404, "Manifold no encontrado")
+            notify_cache_invalidated(cur, "layout_edges")
             conn.commit()
+            invalidate_cache("layout_edges")
             return Response(status_code=204)
         except HTTPException:
             conn.rollback(); raise
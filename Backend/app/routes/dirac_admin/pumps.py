@@ -6,6 +6,7 @@ from pydantic import BaseModel, constr
 
 from app.db import get_conn
 from app.security import require_user
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
 from .location_utils import ensure_location_id
 
 router = APIRouter(prefix="/dirac/admin", tags=["admin-pumps"])
@@ -214,7 +215,9 @@ def create_pump(payload: PumpCreate, user=Depends(require_user)):
             row = cur.fetchone()
             # Semilla de layout para que aparezca en el diagrama
             _seed_layout_pump(cur, row["id"])
+            notify_cache_invalidated(cur, "kpi_pumps_status", "dirac_me_summary")
             conn.commit()
+            invalidate_cache("kpi_pumps_status", "dirac_me_summary")
             return row
         except Exception as e:
             conn.rollback()
@@ -295,7 +298,9 @@ def update_pump(pump_id: int, payload: PumpPatch, user=Depends(require_user)):
                 (new_name, loc_id, payload.pin_code, payload.require_pin, pump_id),
             )
             row = cur.fetchone()
+            notify_cache_invalidated(cur, "kpi_pumps_status")
             conn.commit()
+            invalidate_cache("kpi_pumps_status")
             return row or {}
         except Exception as e:
             conn.rollback()
@@ -346,7 +351,9 @@ def delete_pump(pump_id: int, force: bool = Query(False), user=Depends(require_u
             if cur.rowcount == 0:
                 raise HTTPException(404, "Bomba no encontrada")
 
+            notify_cache_invalidated(cur, "layout_edges", "kpi_pumps_status", "dirac_me_summary")
             conn.commit()
+            invalidate_cache("layout_edges", "kpi_pumps_status", "dirac_me_summary")
             return Response(status_code=204)
         except HTTPException:
             conn.rollback(); raise
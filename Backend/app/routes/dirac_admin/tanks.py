@@ -5,6 +5,8 @@ from typing import Optional, Dict, Any
 
 from app.db import get_conn
 from app.security import require_user
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
+from app.services.tank_rollup import delete_tank_rollup
 from .location_utils import ensure_location_id
 
 router = APIRouter(prefix="/dirac/admin", tags=["admin-tanks"])
@@ -346,12 +348,15 @@ def delete_tank(tank_id: int, force: bool = Query(False), user=Depends(require_u
             cur.execute("DELETE FROM public.layout_tanks  WHERE tank_id=%s OR node_id=%s", (tank_id, node_id))
             cur.execute("DELETE FROM public.tank_configs  WHERE tank_id=%s", (tank_id,))
             cur.execute("DELETE FROM public.tank_ingest   WHERE tank_id=%s", (tank_id,))
+            delete_tank_rollup(cur, tank_id)
 
             cur.execute("DELETE FROM public.tanks WHERE id=%s", (tank_id,))
             if cur.rowcount == 0:
                 raise HTTPException(404, "Tanque no encontrado")
 
+            notify_cache_invalidated(cur, "layout_edges", "dirac_me_summary")
             conn.commit()
+            invalidate_cache("layout_edges", "dirac_me_summary")
             return Response(status_code=204)
         except HTTPException:
             conn.rollback(); raise
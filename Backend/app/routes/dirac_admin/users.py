@@ -3,6 +3,8 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 from psycopg.rows import dict_row
 from app.db import get_conn
+from app.security import invalidate_user, notify_user_changed
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
 
 router = APIRouter(prefix="/dirac/admin", tags=["admin-users"])
 
@@ -160,9 +162,12 @@ def patch_user(user_id: int, payload: UserPatch):
             (payload.full_name, payload.status, user_id),
         )
         row = cur.fetchone()
+        if row:
+            notify_user_changed(cur, user_id)
         conn.commit()
         if not row:
             raise HTTPException(404, "Usuario inexistente")
+        invalidate_user(user_id)
         return row
 
 # ========= Cambiar password (admin/alias) =========
@@ -192,7 +197,9 @@ def change_password_admin(
         )
         if not cur.fetchone():
             raise HTTPException(404, "Usuario inexistente")
+        notify_user_changed(cur, user_id)
         conn.commit()
+    invalidate_user(user_id)
     return {"ok": True, "user_id": user_id}
 
 # ========= Empresas del usuario =========
@@ -283,7 +290,9 @@ def grant_user_location(user_id: int, location_id: int, body: GrantAccessIn | No
             (user_id, location_id, acc),
         )
         row = cur.fetchone()
+        notify_cache_invalidated(cur, "dirac_me_summary")
         conn.commit()
+        invalidate_cache("dirac_me_summary")
         return row
 
 @router.delete("/users/{user_id}/locations/{location_id}", summary="Quitar acceso explícito a una localización")
@@ -293,7 +302,9 @@ def delete_user_location(user_id: int, location_id: int):
             "DELETE FROM user_location_access WHERE user_id=%s AND location_id=%s",
             (user_id, location_id),
         )
+        notify_cache_invalidated(cur, "dirac_me_summary")
         conn.commit()
+        invalidate_cache("dirac_me_summary")
         return {"ok": True}
 
 # ========= Eliminar usuario =========
@@ -330,7 +341,9 @@ def delete_user(user_id: int, force: bool = Query(default=False)):
                 )
 
             cur.execute("DELETE FROM app_users WHERE id=%s", (user_id,))
+            notify_user_changed(cur, user_id)
             conn.commit()
+            invalidate_user(user_id)
             return {"ok": True, "deleted": user_id, "forced": False}
 
         # forzado: limpiar refs y borrar
@@ -339,5 +352,7 @@ def delete_user(user_id: int, force: bool = Query(default=False)):
         cur.execute("UPDATE pump_events   SET created_by_user_id=NULL WHERE created_by_user_id=%s", (user_id,))
         cur.execute("UPDATE pump_commands SET requested_by_user_id=NULL WHERE requested_by_user_id=%s", (user_id,))
         cur.execute("DELETE FROM app_users WHERE id=%s", (user_id,))
+        notify_user_changed(cur, user_id)
         conn.commit()
+        invalidate_user(user_id)
         return {"ok": True, "deleted": user_id, "forced": True}
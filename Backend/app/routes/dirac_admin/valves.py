@@ -6,6 +6,7 @@ from pydantic import BaseModel, field_validator
 
 from app.db import get_conn
 from app.security import require_user
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
 from .location_utils import ensure_location_id
 
 router = APIRouter(prefix="/dirac/admin", tags=["admin-valves"])
@@ -369,7 +370,9 @@ def delete_valve(valve_id: int, force: bool = Query(False), user=Depends(require
             if cur.rowcount == 0:
                 raise HTTPException(404, "Válvula no encontrada")
 
+            notify_cache_invalidated(cur, "layout_edges", "dirac_me_summary")
             conn.commit()
+            invalidate_cache("layout_edges", "dirac_me_summary")
             return Response(status_code=204)
         except HTTPException:
             conn.rollback(); raise
@@ -5,6 +5,7 @@ from psycopg.rows import dict_row
 
 from app.db import get_conn
 from app.security import require_user
+from app.services.response_cache import cached_response
 
 router = APIRouter(prefix="/dirac", tags=["me"])
 
@@ -115,6 +116,12 @@ def get_my_locations(
         return {"explicit": explicit, "effective": effective}
 
 @router.get("/me/summary", summary="Resumen de activos accesibles (por empresa)")
+@cached_response(
+    "dirac_me_summary",
+    ttl=60,
+    key=lambda kw: (kw["user"]["user_id"], kw["company_id"]),
+    cache_control="private",
+)
 def get_my_summary(
     company_id: int = Query(..., description="Empresa sobre la que se calcula el resumen"),
     user = Depends(require_user),
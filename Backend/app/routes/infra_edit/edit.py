@@ -4,6 +4,7 @@ from psycopg.rows import dict_row
 
 # Tu proyecto expone get_conn en app/db.py
 from app.db import get_conn
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
 
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 
@@ -72,7 +73,9 @@ def create_edge(payload: EdgeCreate):
             (payload.src_node_id, payload.dst_node_id, payload.relacion, payload.prioridad),
         )
         row = cur.fetchone()
+        notify_cache_invalidated(cur, "layout_edges")
         conn.commit()
+        invalidate_cache("layout_edges")
         return row
 
 @router.put("/edges/{edge_id}")
@@ -100,7 +103,9 @@ def update_edge(edge_id: int, payload: EdgeUpdate):
         row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Edge no encontrado")
+        notify_cache_invalidated(cur, "layout_edges")
         conn.commit()
+        invalidate_cache("layout_edges")
         return row
 
 @router.delete("/edges/{edge_id}")
@@ -109,7 +114,9 @@ def delete_edge(edge_id: int):
         cur.execute("DELETE FROM public.layout_edges WHERE edge_id = %s", (edge_id,))
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Edge no encontrado")
+        notify_cache_invalidated(cur, "layout_edges")
         conn.commit()
+        invalidate_cache("layout_edges")
         return {"ok": True}
 
 # --------- Batch de posiciones (auto-orden) ---------
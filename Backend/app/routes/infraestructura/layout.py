@@ -1,13 +1,37 @@
 ﻿from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 import json
 
-from app.db import get_conn
+from app.db_async import get_aconn
+from app.services.latest_store import latest_store
+from app.services.response_cache import anotify_cache_invalidated, cached_response, invalidate_cache
 from psycopg.rows import dict_row
 
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 
 
+async def _latest_params() -> tuple:
+    """
+    Últimas lecturas de tanques/bombas (latest_store) como 6 arrays para
+    los CTE li_cache / hb_cache. El online se sigue calculando en SQL con
+    now() contra el timestamp cacheado.
+    """
+    if not latest_store.warm:
+        # El warm-up usa el pool sync: fuera del event loop.
+        await run_in_threadpool(latest_store.ensure_warm)
+    tanks = latest_store.tanks()
+    pumps = latest_store.pumps()
+    return (
+        [t["tank_id"] for t in tanks],
+        [t["level_pct"] for t in tanks],
+        [t["created_at"] for t in tanks],
+        [p["pump_id"] for p in pumps],
+        [p["plc_state"] for p in pumps],
+        [p["created_at"] for p in pumps],
+    )
+
+
 # -------------------------------------------------------------------
 # GET /infraestructura/health_db
 # -------------------------------------------------------------------
@@ -15,9 +39,9 @@ router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 async def health_db():
     """Health-check simple contra la DB."""
     try:
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("SELECT 1")
-            cur.fetchone()
+        async with get_aconn() as conn, conn.cursor() as cur:
+            await cur.execute("SELECT 1")
+            await cur.fetchone()
         return {"ok": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB down: {e}")
@@ -27,6 +51,7 @@ async def health_db():
 # GET /infraestructura/get_layout_edges
 # -------------------------------------------------------------------
 @router.get("/get_layout_edges", response_model=List[dict])
+@cached_response("layout_edges", ttl=30)
 async def get_layout_edges(company_id: int | None = Query(default=None)):
     """
     Devuelve conexiones de layout (edges) desde public.v_layout_edges_flow,
@@ -35,9 +60,9 @@ async def get_layout_edges(company_id: int | None = Query(default=None)):
     - Con company_id: sólo aristas cuyos endpoints pertenecen a nodos de esa empresa.
     """
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
             if company_id is None:
-                cur.execute(
+                await cur.execute(
                     """
                     SELECT
                       e.edge_id, e.src_node_id, e.dst_node_id, e.relacion, e.prioridad, e.updated_at,
@@ -48,9 +73,9 @@ async def get_layout_edges(company_id: int | None = Query(default=None)):
                     ORDER BY e.updated_at DESC
                     """
                 )
-                return cur.fetchall()
+                return await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 WITH nodes AS (
                   SELECT COALESCE(lt.node_id,'tank:'||t.id) AS node_id
@@ -100,7 +125,7 @@ async def get_layout_edges(company_id: int | None = Query(default=None)):
                 """,
                 (company_id, company_id, company_id, company_id, company_id),
             )
-            return cur.fetchall()
+            return await cur.fetchall()
     except HTTPException:
         raise
     except Exception as e:
@@ -134,8 +159,8 @@ async def update_edge_knots(request: Request):
             raise HTTPException(status_code=400, detail="knots inválido: x/y deben ser numéricos")
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 """
                 INSERT INTO public.layout_edge_knots (edge_id, knots, updated_at)
                 VALUES (%s, %s::jsonb, now())
@@ -145,8 +170,10 @@ async def update_edge_knots(request: Request):
                 """,
                 (edge_id, json.dumps(knots)),
             )
-            row = cur.fetchone()
-            conn.commit()
+            row = await cur.fetchone()
+            await anotify_cache_invalidated(cur, "layout_edges")
+            await conn.commit()
+            invalidate_cache("layout_edges")
             return {"ok": True, "saved": row}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (edge_knots): {e}")
@@ -165,18 +192,18 @@ async def get_layout_combined(company_id: int | None = Query(default=None)):
     ✅ NUEVO: incluye `name` para que el front pueda mostrar nombre de tanque/equipo.
     ✅ NUEVO: incluye `in_maintenance` para bombas.
 
-    OPTIMIZADO (LATERAL + LIMIT 1):
-    - Tanques: último tank_ingest por tanque via índice (N lookups, no scan global).
-    - Bombas: último pump_heartbeat por bomba via índice (N lookups, no scan global).
+    OPTIMIZADO:
+    - Tanques: último tank_ingest por tanque desde latest_store (memoria).
+    - Bombas: último pump_heartbeat por bomba desde latest_store (memoria).
     - Manifolds: latest por señal desde public.v_manifold_signals_latest.
     """
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
                         # SIN company_id:
             # leemos la view general y agregamos explícitamente los analizadores
             # para no depender de que v_layout_combined los incluya.
             if company_id is None:
-                cur.execute(
+                await cur.execute(
                     """
                     SELECT
                       c.node_id,
@@ -274,9 +301,9 @@ async def get_layout_combined(company_id: int | None = Query(default=None)):
                     ORDER BY type, id
                     """
                 )
-                return cur.fetchall()
+                return await cur.fetchall()
 # CON company_id: query rápida
-            cur.execute(
+            await cur.execute(
                 """
                 WITH
                 locs AS (
@@ -285,6 +312,19 @@ async def get_layout_combined(company_id: int | None = Query(default=None)):
                   WHERE company_id = %s
                 ),
 
+                -- Últimas lecturas: vienen de latest_store como arrays
+                li_cache AS (
+                  SELECT *
+                  FROM unnest(%s::bigint[], %s::numeric[], %s::timestamptz[])
+                    AS x(tank_id, level_pct, created_at)
+                ),
+
+                hb_cache AS (
+                  SELECT *
+                  FROM unnest(%s::bigint[], %s::text[], %s::timestamptz[])
+                    AS x(pump_id, plc_state, hb_ts)
+                ),
+
                 t AS (
                   SELECT
                     COALESCE(lt.node_id, 'tank:'||t.id) AS node_id,
@@ -320,13 +360,7 @@ async def get_layout_combined(company_id: int | None = Query(default=None)):
                   JOIN locs lx ON lx.id = l.id
                   LEFT JOIN public.layout_tanks lt ON lt.tank_id = t.id
                   LEFT JOIN public.tank_configs tc ON tc.tank_id = t.id
-                  LEFT JOIN LATERAL (
-                    SELECT i.level_pct, i.created_at
-                    FROM public.tank_ingest i
-                    WHERE i.tank_id = t.id
-                    ORDER BY i.created_at DESC, i.id DESC
-                    LIMIT 1
-                  ) li ON TRUE
+                  LEFT JOIN li_cache li ON li.tank_id = t.id
                 ),
 
                 p AS (
@@ -365,13 +399,7 @@ async def get_layout_combined(company_id: int | None = Query(default=None)):
                   JOIN public.locations l ON l.id = p.location_id
                   JOIN locs lx ON lx.id = l.id
                   LEFT JOIN public.layout_pumps lp ON lp.pump_id = p.id
-                  LEFT JOIN LATERAL (
-                    SELECT ph.created_at AS hb_ts, ph.plc_state
-                    FROM public.pump_heartbeat ph
-                    WHERE ph.pump_id = p.id
-                    ORDER BY ph.created_at DESC, ph.id DESC
-                    LIMIT 1
-                  ) hb ON TRUE
+                  LEFT JOIN hb_cache hb ON hb.pump_id = p.id
                 ),
 
                 v AS (
@@ -497,9 +525,9 @@ async def get_layout_combined(company_id: int | None = Query(default=None)):
                 SELECT node_id,id,type,x,y,updated_at,online,state,level_pct,alarma,name,in_maintenance,categoria,orientacion,servicio,location_id,location_name,meta,signals FROM na
                 ORDER BY type,id
                 """,
-                (company_id,),
+                (company_id, *(await _latest_params())),
             )
-            return cur.fetchall()
+            return await cur.fetchall()
 
     except HTTPException:
         raise
@@ -542,7 +570,7 @@ async def update_layout(request: Request):
         "network_analyzer": ("layout_network_analyzers", "analyzer_id"),
     }
 
-    def _exec_update(cur, table: str, id_col: str, where_sql: str, params: tuple):
+    async def _exec_update(cur, table: str, id_col: str, where_sql: str, params: tuple):
         sql = f"""
             UPDATE public.{table}
             SET x = %s::double precision,
@@ -551,17 +579,17 @@ async def update_layout(request: Request):
             WHERE {where_sql}
             RETURNING node_id, {id_col} AS entity_id, x, y, updated_at
         """
-        cur.execute(sql, params)
-        return cur.fetchone()
+        await cur.execute(sql, params)
+        return await cur.fetchone()
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
             meta = table_map.get(tipo)
             if meta:
                 table, id_col = meta
                 try:
                     id_numeric = int(sufijo)
-                    row = _exec_update(
+                    row = await _exec_update(
                         cur,
                         table,
                         id_col,
@@ -569,7 +597,7 @@ async def update_layout(request: Request):
                         (x, y, id_numeric),
                     )
                 except ValueError:
-                    row = _exec_update(
+                    row = await _exec_update(
                         cur,
                         table,
                         id_col,
@@ -583,10 +611,10 @@ async def update_layout(request: Request):
                         detail=f"no se encontró fila en {table} para {node_id}",
                     )
 
-                conn.commit()
+                await conn.commit()
                 return {"ok": True, "table": table, "updated": row}
 
-            row = _exec_update(
+            row = await _exec_update(
                 cur,
                 "layout_network_analyzers",
                 "analyzer_id",
@@ -594,7 +622,7 @@ async def update_layout(request: Request):
                 (x, y, node_id),
             )
             if row:
-                conn.commit()
+                await conn.commit()
                 return {
                     "ok": True,
                     "table": "layout_network_analyzers",
@@ -609,7 +637,7 @@ async def update_layout(request: Request):
             ]
 
             for table, id_col in candidates:
-                row = _exec_update(
+                row = await _exec_update(
                     cur,
                     table,
                     id_col,
@@ -617,7 +645,7 @@ async def update_layout(request: Request):
                     (x, y, node_id),
                 )
                 if row:
-                    conn.commit()
+                    await conn.commit()
                     return {"ok": True, "table": table, "updated": row}
 
             raise HTTPException(
@@ -651,9 +679,9 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
       - /get_layout_edges (edges)
     """
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
             if company_id is None:
-                cur.execute(
+                await cur.execute(
                     """
                     SELECT
                       c.node_id, c.id, c.type, c.x, c.y, c.updated_at, c.online, c.state, c.level_pct, c.alarma,
@@ -669,9 +697,9 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                     ORDER BY c.type, c.id
                     """
                 )
-                nodes = cur.fetchall()
+                nodes = await cur.fetchall()
 
-                cur.execute(
+                await cur.execute(
                     """
                     SELECT
                       e.edge_id, e.src_node_id, e.dst_node_id, e.relacion, e.prioridad, e.updated_at,
@@ -682,11 +710,11 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                     ORDER BY e.updated_at DESC
                     """
                 )
-                edges = cur.fetchall()
+                edges = await cur.fetchall()
 
                 return {"nodes": nodes, "edges": edges}
 
-            cur.execute(
+            await cur.execute(
                 """
                 WITH
                 locs AS (
@@ -695,6 +723,19 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                   WHERE company_id = %s
                 ),
 
+                -- Últimas lecturas: vienen de latest_store como arrays
+                li_cache AS (
+                  SELECT *
+                  FROM unnest(%s::bigint[], %s::numeric[], %s::timestamptz[])
+                    AS x(tank_id, level_pct, created_at)
+                ),
+
+                hb_cache AS (
+                  SELECT *
+                  FROM unnest(%s::bigint[], %s::text[], %s::timestamptz[])
+                    AS x(pump_id, plc_state, hb_ts)
+                ),
+
                 t AS (
                   SELECT
                     COALESCE(lt.node_id, 'tank:'||t.id) AS node_id,
@@ -725,13 +766,7 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                   JOIN locs lx ON lx.id = l.id
                   LEFT JOIN public.layout_tanks lt ON lt.tank_id = t.id
                   LEFT JOIN public.tank_configs tc ON tc.tank_id = t.id
-                  LEFT JOIN LATERAL (
-                    SELECT i.level_pct, i.created_at
-                    FROM public.tank_ingest i
-                    WHERE i.tank_id = t.id
-                    ORDER BY i.created_at DESC, i.id DESC
-                    LIMIT 1
-                  ) li ON TRUE
+                  LEFT JOIN li_cache li ON li.tank_id = t.id
                 ),
 
                 p AS (
@@ -759,13 +794,7 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                   JOIN public.locations l ON l.id = p.location_id
                   JOIN locs lx ON lx.id = l.id
                   LEFT JOIN public.layout_pumps lp ON lp.pump_id = p.id
-                  LEFT JOIN LATERAL (
-                    SELECT ph.created_at AS hb_ts, ph.plc_state
-                    FROM public.pump_heartbeat ph
-                    WHERE ph.pump_id = p.id
-                    ORDER BY ph.created_at DESC, ph.id DESC
-                    LIMIT 1
-                  ) hb ON TRUE
+                  LEFT JOIN hb_cache hb ON hb.pump_id = p.id
                 ),
 
                 v AS (
@@ -873,11 +902,11 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                 SELECT node_id,id,type,x,y,updated_at,online,state,level_pct,alarma,name,in_maintenance,categoria,orientacion,servicio,location_id,location_name,meta,signals FROM na
                 ORDER BY type,id
                 """,
-                (company_id,),
+                (company_id, *(await _latest_params())),
             )
-            nodes = cur.fetchall()
+            nodes = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 WITH nodes AS (
                   SELECT COALESCE(lt.node_id,'tank:'||t.id) AS node_id
@@ -922,7 +951,7 @@ async def bootstrap_layout(company_id: int | None = Query(default=None)):
                 """,
                 (company_id, company_id, company_id, company_id, company_id),
             )
-            edges = cur.fetchall()
+            edges = await cur.fetchall()
 
             return {"nodes": nodes, "edges": edges}
 
@@ -5,6 +5,7 @@ from typing import Literal
 from psycopg.rows import dict_row
 
 from app.db import get_conn
+from app.services.location_alarm_queue import alarm_queue, notify_alarm_added
 
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura-alarmas"])
 
@@ -56,8 +57,18 @@ def create_location_alarm_command(
             ),
         )
         row = cur.fetchone()
+
+        cmd = {
+            **row,
+            "location_name": loc["name"],
+            "company_id": loc["company_id"],
+        }
+        # Aviso a los long-poll de /plc/location_alarm/pending (sale al commit)
+        notify_alarm_added(cur, cmd)
         conn.commit()
 
+        alarm_queue.add(cmd)
+
         return {
             "id": row["id"],
             "location_id": row["location_id"],
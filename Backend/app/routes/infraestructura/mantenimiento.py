@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional
 from decimal import Decimal
-from app.db import get_conn
+from app.db_async import get_aconn
 from psycopg.rows import dict_row
 
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura-mantenimiento"])
@@ -44,8 +44,8 @@ def _normalize_text(v):
     return s if s else None
 
 
-def _require_pump_exists(cur, pump_id: int):
-    cur.execute(
+async def _require_pump_exists(cur, pump_id: int):
+    await cur.execute(
         """
         SELECT id, name, location_id
         FROM public.pumps
@@ -53,7 +53,7 @@ def _require_pump_exists(cur, pump_id: int):
         """,
         (pump_id,),
     )
-    row = cur.fetchone()
+    row = await cur.fetchone()
     if not row:
         raise HTTPException(status_code=404, detail=f"Bomba {pump_id} no encontrada")
     return row
@@ -193,10 +193,10 @@ async def get_pump_maintenance(
     - último runtime conocido
     """
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            pump = _require_pump_exists(cur, pump_id)
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            pump = await _require_pump_exists(cur, pump_id)
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT *
                 FROM public.pump_maintenance_orders
@@ -208,9 +208,9 @@ async def get_pump_maintenance(
                 """,
                 (pump_id, limit),
             )
-            items = cur.fetchall()
+            items = await cur.fetchall()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT *
                 FROM public.pump_maintenance_orders
@@ -221,9 +221,9 @@ async def get_pump_maintenance(
                 """,
                 (pump_id,),
             )
-            current_order = cur.fetchone()
+            current_order = await cur.fetchone()
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT *
                 FROM public.pump_runtime_history
@@ -233,7 +233,7 @@ async def get_pump_maintenance(
                 """,
                 (pump_id,),
             )
-            runtime = cur.fetchone()
+            runtime = await cur.fetchone()
 
             return {
                 "ok": True,
@@ -262,10 +262,10 @@ async def create_pump_maintenance(pump_id: int, request: Request):
     payload = _validate_order_payload(data, partial=False)
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            pump = _require_pump_exists(cur, pump_id)
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            pump = await _require_pump_exists(cur, pump_id)
 
-            cur.execute(
+            await cur.execute(
                 """
                 INSERT INTO public.pump_maintenance_orders (
                   pump_id,
@@ -315,8 +315,8 @@ async def create_pump_maintenance(pump_id: int, request: Request):
                     payload.get("downtime_days"),
                 ),
             )
-            row = cur.fetchone()
-            conn.commit()
+            row = await cur.fetchone()
+            await conn.commit()
 
             return {
                 "ok": True,
@@ -375,8 +375,8 @@ async def update_pump_maintenance(order_id: int, request: Request):
     values.append(order_id)
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 f"""
                 UPDATE public.pump_maintenance_orders
                 SET {", ".join(fields)}
@@ -385,11 +385,11 @@ async def update_pump_maintenance(order_id: int, request: Request):
                 """,
                 tuple(values),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
             if not row:
                 raise HTTPException(status_code=404, detail=f"Orden {order_id} no encontrada")
 
-            conn.commit()
+            await conn.commit()
             return {"ok": True, "item": row}
     except HTTPException:
         raise
@@ -407,8 +407,8 @@ async def delete_pump_maintenance(order_id: int):
     Elimina una orden de mantenimiento existente.
     """
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 """
                 DELETE FROM public.pump_maintenance_orders
                 WHERE id = %s
@@ -416,12 +416,12 @@ async def delete_pump_maintenance(order_id: int):
                 """,
                 (order_id,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
             if not row:
                 raise HTTPException(status_code=404, detail=f"Orden {order_id} no encontrada")
 
-            conn.commit()
+            await conn.commit()
             return {"ok": True, "deleted_id": order_id}
     except HTTPException:
         raise
@@ -464,8 +464,8 @@ async def list_maintenance_orders(
     where_sql = f"WHERE {' AND '.join(where)}" if where else ""
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 f"""
                 SELECT
                   pmo.*,
@@ -482,7 +482,7 @@ async def list_maintenance_orders(
                 """,
                 tuple(params + [limit]),
             )
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
             return {"ok": True, "items": rows}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (list_maintenance_orders): {e}")
@@ -495,10 +495,10 @@ async def list_maintenance_orders(
 @router.get("/pumps/{pump_id}/maintenance/plans")
 async def get_pump_maintenance_plans(pump_id: int):
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            pump = _require_pump_exists(cur, pump_id)
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            pump = await _require_pump_exists(cur, pump_id)
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT *
                 FROM public.pump_maintenance_plans
@@ -507,7 +507,7 @@ async def get_pump_maintenance_plans(pump_id: int):
                 """,
                 (pump_id,),
             )
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
 
             return {
                 "ok": True,
@@ -526,10 +526,10 @@ async def create_pump_maintenance_plan(pump_id: int, request: Request):
     payload = _validate_plan_payload(data, partial=False)
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            pump = _require_pump_exists(cur, pump_id)
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            pump = await _require_pump_exists(cur, pump_id)
 
-            cur.execute(
+            await cur.execute(
                 """
                 INSERT INTO public.pump_maintenance_plans (
                   pump_id,
@@ -566,8 +566,8 @@ async def create_pump_maintenance_plan(pump_id: int, request: Request):
                     payload.get("active", True),
                 ),
             )
-            row = cur.fetchone()
-            conn.commit()
+            row = await cur.fetchone()
+            await conn.commit()
 
             return {
                 "ok": True,
@@ -614,8 +614,8 @@ async def update_pump_maintenance_plan(plan_id: int, request: Request):
     values.append(plan_id)
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 f"""
                 UPDATE public.pump_maintenance_plans
                 SET {", ".join(fields)}
@@ -624,11 +624,11 @@ async def update_pump_maintenance_plan(plan_id: int, request: Request):
                 """,
                 tuple(values),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
             if not row:
                 raise HTTPException(status_code=404, detail=f"Plan {plan_id} no encontrado")
 
-            conn.commit()
+            await conn.commit()
             return {"ok": True, "item": row}
     except HTTPException:
         raise
@@ -646,10 +646,10 @@ async def get_pump_runtime_history(
     limit: int = Query(default=100, ge=1, le=1000),
 ):
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            pump = _require_pump_exists(cur, pump_id)
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            pump = await _require_pump_exists(cur, pump_id)
 
-            cur.execute(
+            await cur.execute(
                 """
                 SELECT *
                 FROM public.pump_runtime_history
@@ -659,7 +659,7 @@ async def get_pump_runtime_history(
                 """,
                 (pump_id, limit),
             )
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
 
             return {
                 "ok": True,
@@ -682,10 +682,10 @@ async def create_pump_runtime_history(pump_id: int, request: Request):
         raise HTTPException(status_code=400, detail="runtime_hours_total es requerido")
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            pump = _require_pump_exists(cur, pump_id)
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            pump = await _require_pump_exists(cur, pump_id)
 
-            cur.execute(
+            await cur.execute(
                 """
                 INSERT INTO public.pump_runtime_history (
                   pump_id,
@@ -701,8 +701,8 @@ async def create_pump_runtime_history(pump_id: int, request: Request):
                 """,
                 (pump_id, runtime_hours_total, measured_at),
             )
-            row = cur.fetchone()
-            conn.commit()
+            row = await cur.fetchone()
+            await conn.commit()
 
             return {
                 "ok": True,
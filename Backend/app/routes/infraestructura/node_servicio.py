@@ -1,6 +1,6 @@
 from fastapi import APIRouter, HTTPException, Request
 from psycopg.rows import dict_row
-from app.db import get_conn
+from app.db_async import get_aconn
 
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 
@@ -33,15 +33,15 @@ async def update_node_servicio(request: Request):
     table, id_col = TABLES[tipo]
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 f"UPDATE public.{table} SET servicio=%s WHERE {id_col}=%s RETURNING {id_col} AS id, servicio",
                 (servicio, entity_id),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
             if not row:
                 raise HTTPException(status_code=404, detail="nodo no encontrado")
-            conn.commit()
+            await conn.commit()
             return {"ok": True, "node_id": node_id, "servicio": row["servicio"]}
     except HTTPException:
         raise
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from psycopg.rows import dict_row
 
-from app.db import get_conn
+from app.db_async import get_aconn
 
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 
@@ -9,8 +9,8 @@ router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 @router.get("/pump_availability")
 async def list_pump_availability():
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 """
                 SELECT
                   p.id,
@@ -25,7 +25,7 @@ async def list_pump_availability():
                 ORDER BY p.location_id, p.id
                 """
             )
-            return cur.fetchall()
+            return await cur.fetchall()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (pump_availability): {e}")
 
@@ -33,8 +33,8 @@ async def list_pump_availability():
 @router.get("/pump_availability/{pump_id}")
 async def get_pump_availability(pump_id: int):
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 """
                 SELECT
                   p.id,
@@ -49,7 +49,7 @@ async def get_pump_availability(pump_id: int):
                 """,
                 (pump_id,),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
         if not row:
             raise HTTPException(status_code=404, detail="Bomba no encontrada")
@@ -78,8 +78,8 @@ async def update_pump_availability(pump_id: int, request: Request):
         descripcion = None
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 """
                 UPDATE public.pumps
                 SET disponible = %s,
@@ -98,8 +98,8 @@ async def update_pump_availability(pump_id: int, request: Request):
                 """,
                 (disponible, descripcion, pump_id),
             )
-            row = cur.fetchone()
-            conn.commit()
+            row = await cur.fetchone()
+            await conn.commit()
 
         if not row:
             raise HTTPException(
@@ -1,14 +1,14 @@
 from fastapi import APIRouter, HTTPException, Request
 from psycopg.rows import dict_row
-from app.db import get_conn
+from app.db_async import get_aconn
 router = APIRouter(prefix="/infraestructura", tags=["infraestructura"])
 
 @router.get("/pump_pipe_taps")
 async def list_pump_pipe_taps():
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute("""SELECT t.id,t.pump_id,COALESCE(lp.node_id,'pump:'||t.pump_id) AS pump_node_id,t.edge_id,t.mode,t.t,t.x,t.y,t.created_at,t.updated_at FROM public.layout_pump_pipe_taps t LEFT JOIN public.layout_pumps lp ON lp.pump_id=t.pump_id ORDER BY t.pump_id""")
-            return cur.fetchall()
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute("""SELECT t.id,t.pump_id,COALESCE(lp.node_id,'pump:'||t.pump_id) AS pump_node_id,t.edge_id,t.mode,t.t,t.x,t.y,t.created_at,t.updated_at FROM public.layout_pump_pipe_taps t LEFT JOIN public.layout_pumps lp ON lp.pump_id=t.pump_id ORDER BY t.pump_id""")
+            return await cur.fetchall()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (pump_pipe_taps): {e}")
 
@@ -28,9 +28,9 @@ async def upsert_pump_pipe_tap(request: Request):
     except Exception:
         raise HTTPException(status_code=400, detail="x, y y t deben ser numericos")
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute("""INSERT INTO public.layout_pump_pipe_taps(pump_id,edge_id,mode,t,x,y,updated_at) VALUES(%s,%s,%s,%s,%s,%s,now()) ON CONFLICT(pump_id) DO UPDATE SET edge_id=excluded.edge_id,mode=excluded.mode,t=excluded.t,x=excluded.x,y=excluded.y,updated_at=now() RETURNING *""", (pump_id,edge_id,mode,t,x,y))
-            row = cur.fetchone(); conn.commit(); return {"ok": True, "tap": row}
+        async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute("""INSERT INTO public.layout_pump_pipe_taps(pump_id,edge_id,mode,t,x,y,updated_at) VALUES(%s,%s,%s,%s,%s,%s,now()) ON CONFLICT(pump_id) DO UPDATE SET edge_id=excluded.edge_id,mode=excluded.mode,t=excluded.t,x=excluded.x,y=excluded.y,updated_at=now() RETURNING *""", (pump_id,edge_id,mode,t,x,y))
+            row = await cur.fetchone(); await conn.commit(); return {"ok": True, "tap": row}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB error (save pump tap): {e}")
 
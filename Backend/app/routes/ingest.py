@@ -1,21 +1,36 @@
 # app/routes/ingest.py
+import json
 import logging
+import threading
 import time
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from psycopg.rows import dict_row
+from pydantic import ValidationError
 import psycopg
 
-from app.db import get_conn
-from app.schemas import TankIngestIn, TankIngestOut
+from app.db_async import get_aconn
+from app.schemas import TankIngestBatchOut, TankIngestIn, TankIngestOut
+from app.services.latest_store import latest_store
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
+# Máximo de lecturas por POST a /ingest/tank/batch
+TANK_BATCH_MAX_ROWS = 10000
+
+# Ids de tanques válidos (para no depender del FK fila por fila)
+_TANK_IDS_CACHE = {"ts": 0.0, "ids": frozenset()}
+_TANK_IDS_TTL_SECONDS = 300
+# Ante un id desconocido se relee, pero no más seguido que esto
+_TANK_IDS_MIN_REFRESH_SECONDS = 10
+_TANK_IDS_LOCK = threading.Lock()
+
 
 @router.post("/tank", response_model=TankIngestOut)
-def ingest_tank(body: TankIngestIn):
+async def ingest_tank(body: TankIngestIn):
     """
     Inserta una lectura para un tanque.
     Requiere: tank_id, level_pct (0..100).
@@ -30,21 +45,21 @@ def ingest_tank(body: TankIngestIn):
     t0 = time.perf_counter()
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        async with get_aconn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
             # Limitar cuánto puede tardar la query en la DB (ej: 5 s)
             try:
-                cur.execute("SET LOCAL statement_timeout = 5000;")
+                await cur.execute("SET LOCAL statement_timeout = 5000;")
             except Exception:
                 logger.warning(
                     "No se pudo setear statement_timeout local en ingest_tank",
                     exc_info=True,
                 )
 
-            cur.execute(
+            await cur.execute(
                 sql_insert,
                 (body.tank_id, body.level_pct, body.created_at),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
             if not row:
                 raise HTTPException(
@@ -56,15 +71,19 @@ def ingest_tank(body: TankIngestIn):
             if row["level_pct"] is not None:
                 row["level_pct"] = float(row["level_pct"])
 
-            dt = time.perf_counter() - t0
-            logger.info(
-                "ingest_tank tank_id=%s level_pct=%s tardó %.3f s",
-                body.tank_id,
-                body.level_pct,
-                dt,
-            )
+        # Ya commiteado (al salir del with): recién ahora se cachea y se
+        # difunde por /live/ws, igual que en el lote.
+        latest_store.update_tank(row["tank_id"], row["level_pct"], row["created_at"], id=row["id"])
 
-            return row
+        dt = time.perf_counter() - t0
+        logger.info(
+            "ingest_tank tank_id=%s level_pct=%s tardó %.3f s",
+            body.tank_id,
+            body.level_pct,
+            dt,
+        )
+
+        return row
 
     except psycopg.errors.ForeignKeyViolation:
         # Si el tank_id no existe, el FK falla
@@ -98,10 +117,215 @@ def ingest_tank(body: TankIngestIn):
         )
 
 
+async def _tank_ids(cur, unknown=None, force: bool = False) -> frozenset:
+    """
+    Set de ids de public.tanks, cacheado.
+    Se relee si venció el TTL, si force=True, o si aparece un id
+    desconocido (tanque recién creado) y la última lectura no es muy reciente.
+    """
+    now = time.time()
+    age = now - _TANK_IDS_CACHE["ts"]
+    ids = _TANK_IDS_CACHE["ids"]
+
+    has_unknown = bool(unknown) and not set(unknown) <= ids
+
+    if not (
+        force
+        or age >= _TANK_IDS_TTL_SECONDS
+        or (has_unknown and age >= _TANK_IDS_MIN_REFRESH_SECONDS)
+    ):
+        return ids
+
+    await cur.execute("select id from public.tanks")
+    ids = frozenset(int(r[0]) for r in await cur.fetchall())
+
+    with _TANK_IDS_LOCK:
+        _TANK_IDS_CACHE.update({"ts": now, "ids": ids})
+
+    return ids
+
+
+def _parse_tank_batch(raw: bytes, content_type: str) -> list:
+    """
+    Acepta:
+      - JSON array: [{tank_id, level_pct, created_at?}, ...]
+      - JSON objeto: {"readings": [...]}
+      - NDJSON (Content-Type application/x-ndjson): un objeto por línea
+    En NDJSON una línea inválida se rechaza sola; el resto sigue.
+    """
+    text = raw.decode("utf-8-sig")
+
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                items.append(ValueError(f"JSON inválido: {e.msg}"))
+        return items
+
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON inválido: {e.msg}")
+
+    if isinstance(data, dict) and isinstance(data.get("readings"), list):
+        data = data["readings"]
+
+    if not isinstance(data, list):
+        raise ValueError('Se espera un array de lecturas, {"readings": [...]} o NDJSON')
+
+    return data
+
+
+async def _copy_tank_rows(cur, rows: list):
+    """
+    COPY de [(tank_id, level_pct, created_at|None)]; created_at None = now()
+    de la DB. Devuelve ese now().
+    """
+    await cur.execute("SET LOCAL statement_timeout = 15000;")
+    await cur.execute("select now()")
+    db_now = (await cur.fetchone())[0]
+
+    async with cur.copy("copy public.tank_ingest (tank_id, level_pct, created_at) from stdin") as copy:
+        for tank_id, level_pct, created_at in rows:
+            await copy.write_row((tank_id, level_pct, created_at or db_now))
+
+    return db_now
+
+
+async def _ingest_tank_batch(items: list) -> dict:
+    results = []
+    valid = []
+
+    for i, item in enumerate(items):
+        if isinstance(item, Exception):
+            results.append({"index": i, "status": "rejected", "error": str(item)})
+            continue
+
+        try:
+            body = TankIngestIn.model_validate(item)
+        except ValidationError as e:
+            err = e.errors()[0]
+            loc = ".".join(str(x) for x in err.get("loc", ()))
+            tank_id = item.get("tank_id") if isinstance(item, dict) else None
+            results.append({
+                "index": i,
+                "status": "rejected",
+                "tank_id": tank_id if isinstance(tank_id, int) else None,
+                "error": f"{loc}: {err.get('msg')}" if loc else err.get("msg"),
+            })
+            continue
+
+        results.append({"index": i, "status": "accepted", "tank_id": body.tank_id})
+        valid.append((i, body))
+
+    t0 = time.perf_counter()
+    to_write = []
+    db_now = None
+
+    async with get_aconn("ingest") as conn, conn.cursor() as cur:
+        ids = await _tank_ids(cur, unknown={b.tank_id for _, b in valid})
+
+        for attempt in (1, 2):
+            to_write = []
+
+            # Estados recalculados en cada intento: con los ids releídos
+            # una fila rechazada antes puede entrar ahora (y viceversa).
+            for i, b in valid:
+                if b.tank_id in ids:
+                    to_write.append((b.tank_id, b.level_pct, b.created_at))
+                    results[i]["status"] = "accepted"
+                    results[i].pop("error", None)
+                else:
+                    results[i].update(status="rejected", error=f"tank_id={b.tank_id} no existe")
+
+            if not to_write:
+                break
+
+            try:
+                db_now = await _copy_tank_rows(cur, to_write)
+                break
+            except psycopg.errors.ForeignKeyViolation:
+                # Se borró un tanque después de cachear los ids: releer y reintentar una vez.
+                await conn.rollback()
+                if attempt == 2:
+                    raise
+                ids = await _tank_ids(cur, force=True)
+
+    # Ya commiteado (al salir del with): actualizar últimas lecturas.
+    # COPY no devuelve ids; get_tank_latest los completa desde la DB.
+    if db_now is not None:
+        for tank_id, level_pct, created_at in to_write:
+            latest_store.update_tank(tank_id, level_pct, created_at or db_now)
+
+    accepted = sum(1 for r in results if r["status"] == "accepted")
+
+    logger.info(
+        "ingest_tank_batch recibidas=%s aceptadas=%s tardó %.3f s",
+        len(items),
+        accepted,
+        time.perf_counter() - t0,
+    )
+
+    return {
+        "received": len(items),
+        "accepted": accepted,
+        "rejected": len(items) - accepted,
+        "results": results,
+    }
+
+
+@router.post("/tank/batch", response_model=TankIngestBatchOut)
+async def ingest_tank_batch(request: Request):
+    """
+    Ingesta por lotes (gateways que acumulan lecturas sin conexión).
+    Body: array JSON de {tank_id, level_pct, created_at?} o NDJSON.
+
+    Valida cada fila (rango de level_pct, tank_id contra un set cacheado
+    de public.tanks) y escribe las válidas con COPY en una sola
+    transacción. Devuelve el estado por fila, en el mismo orden.
+    """
+    raw = await request.body()
+
+    try:
+        items = _parse_tank_batch(raw, (request.headers.get("content-type") or "").lower())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(items) > TANK_BATCH_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo {TANK_BATCH_MAX_ROWS} lecturas por lote",
+        )
+
+    try:
+        return await _ingest_tank_batch(items)
+
+    except psycopg.OperationalError:
+        logger.exception("Error operacional de DB en ingest_tank_batch")
+        raise HTTPException(
+            status_code=503,
+            detail="Base de datos no disponible",
+        )
+
+    except Exception:
+        logger.exception("Error no esperado en ingest_tank_batch")
+        raise HTTPException(
+            status_code=500,
+            detail="Error interno en ingest_tank_batch",
+        )
+
+
 @router.get("/tank/latest/{tank_id}", response_model=TankIngestOut)
-def get_tank_latest(tank_id: int):
+async def get_tank_latest(tank_id: int):
     """
     Devuelve la última lectura (por created_at desc) para un tanque.
+    Sale del cache de últimas lecturas; va a la DB solo si el tanque no
+    está cacheado o si la última lectura vino por lote (sin id).
     """
     sql_select = """
     select id, tank_id, level_pct, created_at
@@ -114,18 +338,25 @@ def get_tank_latest(tank_id: int):
     t0 = time.perf_counter()
 
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        if not latest_store.warm:
+            # El warm-up usa el pool sync: fuera del event loop.
+            await run_in_threadpool(latest_store.ensure_warm)
+        cached = latest_store.tank(tank_id)
+        if cached and cached["id"] is not None:
+            return cached
+
+        async with get_aconn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
             # Limita tiempo de la query también aquí
             try:
-                cur.execute("SET LOCAL statement_timeout = 5000;")
+                await cur.execute("SET LOCAL statement_timeout = 5000;")
             except Exception:
                 logger.warning(
                     "No se pudo setear statement_timeout local en get_tank_latest",
                     exc_info=True,
                 )
 
-            cur.execute(sql_select, (tank_id,))
-            row = cur.fetchone()
+            await cur.execute(sql_select, (tank_id,))
+            row = await cur.fetchone()
 
             if not row:
                 raise HTTPException(
@@ -136,6 +367,8 @@ def get_tank_latest(tank_id: int):
             if row["level_pct"] is not None:
                 row["level_pct"] = float(row["level_pct"])
 
+            latest_store.update_tank(tank_id, row["level_pct"], row["created_at"], id=row["id"])
+
             dt = time.perf_counter() - t0
             logger.info(
                 "get_tank_latest tank_id=%s tardó %.3f s",
@@ -41,7 +41,7 @@ def _fetch_one(cur, sql: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
 
 
 def build_operation_context() -> Dict[str, Any]:
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         network = _fetch_one(cur, "select * from kpi.v_ai_network_now") or {}
 
         alerts = _fetch_all(
@@ -251,7 +251,7 @@ DevolvÃ© SOLO JSON vÃ¡lido con esta forma:
 
 
 def _latest_analysis(max_age_minutes: int = 5) -> Optional[Dict[str, Any]]:
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(
             """
             select
@@ -275,7 +275,7 @@ def ai_operation_context():
 
 @router.get("/latest", summary="Ãšltimo anÃ¡lisis IA guardado")
 def ai_latest():
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         row = _fetch_one(
             cur,
             """
@@ -318,7 +318,7 @@ def analyze_operation(
     result = _call_openai(context)
     analysis = result["analysis"]
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(
             """
             insert into kpi.ai_operation_analyses (
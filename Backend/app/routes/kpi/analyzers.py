@@ -52,7 +52,7 @@ def get_analyzer_month_kpis(
 ):
     start_ts, end_ts = month_bounds_utc(month)
 
-    with get_conn() as conn:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             # ---------------------------
             # ANALYZER INFO
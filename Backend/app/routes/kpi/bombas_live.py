@@ -5,10 +5,18 @@ from decimal import Decimal
 from typing import Any, Dict, Optional, List, Tuple
 from uuid import UUID
 
+import numpy as np
+
 from fastapi import APIRouter, Query, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from psycopg.rows import dict_row
 
 from app.db import get_conn
+from app.db_async import get_aconn
+from app.services.latest_store import latest_store
+from app.services.pump_rollup import PUMP_ROLLUP_TABLE, pump_rollup, pump_rollup_ready
+from app.services import series_engine as se
+from app.services.downsample import DownsampleMethod, downsample_info, downsample_rows
 
 router = APIRouter(prefix="/kpi/bombas", tags=["kpi-bombas"])
 
@@ -17,9 +25,11 @@ LOCAL_TZ = (os.getenv("LOCAL_TZ") or "America/Argentina/Buenos_Aires").strip()
 PUMPS_TABLE = (os.getenv("PUMPS_TABLE") or "public.pumps").strip()
 LOCATIONS_TABLE = (os.getenv("LOCATIONS_TABLE") or "public.locations").strip()
 
-HB_SOURCE = (os.getenv("PUMP_HB_SOURCE") or "kpi.v_pump_hb_clean").strip()
-
-PUMP_STATE_1M = (os.getenv("PUMP_STATE_1M") or "kpi.mv_pump_state_1m").strip()
+# Estado por minuto: tabla del rollup incremental (app/services/pump_rollup)
+# cuando está prendido y al día; si no (apagado, backfill, atrasado), la
+# vista materializada. PUMP_STATE_1M fija la fuente y no mira el rollup.
+PUMP_STATE_1M = (os.getenv("PUMP_STATE_1M") or "").strip()
+PUMP_STATE_1M_MV = (os.getenv("PUMP_STATE_1M_MV") or "kpi.mv_pump_state_1m").strip()
 
 OP_PUMP_STATE_1M_FULL = (
     os.getenv("OP_PUMP_STATE_1M_FULL") or "kpi.v_operation_pump_state_1m_full"
@@ -198,15 +208,28 @@ def _avg(values: List[Any]) -> Optional[float]:
     return round(sum(xs) / len(xs), 2)
 
 
-@router.post("/refresh")
-def refresh_mv_pump_state_1m(x_token: str = Header(default="", alias="X-Token")):
+def _pump_state_table() -> str:
+    if PUMP_STATE_1M:
+        return PUMP_STATE_1M
+    return PUMP_ROLLUP_TABLE if pump_rollup_ready.ready() else PUMP_STATE_1M_MV
+
+
+async def _apump_state_table() -> str:
+    if PUMP_STATE_1M:
+        return PUMP_STATE_1M
+    return PUMP_ROLLUP_TABLE if await pump_rollup_ready.aready() else PUMP_STATE_1M_MV
+
+
+def _check_refresh_token(x_token: str) -> None:
     if not ADMIN_REFRESH_TOKEN:
         raise HTTPException(status_code=500, detail="ADMIN_REFRESH_TOKEN no configurado")
 
     if x_token != ADMIN_REFRESH_TOKEN:
         raise HTTPException(status_code=401, detail="unauthorized")
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+
+def _refresh_pump_state_mv() -> dict:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute("select pg_try_advisory_lock(%s) as ok;", (REFRESH_LOCK_KEY,))
         row = cur.fetchone()
         ok = bool(row["ok"]) if row else False
@@ -220,11 +243,11 @@ def refresh_mv_pump_state_1m(x_token: str = Header(default="", alias="X-Token"))
 
         try:
             try:
-                cur.execute(f"refresh materialized view concurrently {PUMP_STATE_1M};")
+                cur.execute(f"refresh materialized view concurrently {PUMP_STATE_1M_MV};")
                 mode = "concurrently"
             except Exception:
                 conn.rollback()
-                cur.execute(f"refresh materialized view {PUMP_STATE_1M};")
+                cur.execute(f"refresh materialized view {PUMP_STATE_1M_MV};")
                 mode = "normal_fallback"
 
             cur.execute(
@@ -232,7 +255,7 @@ def refresh_mv_pump_state_1m(x_token: str = Header(default="", alias="X-Token"))
                 select
                   max(minute_ts) as last_minute,
                   now() - max(minute_ts) as lag
-                from {PUMP_STATE_1M};
+                from {PUMP_STATE_1M_MV};
                 """
             )
             r = cur.fetchone() or {}
@@ -255,8 +278,39 @@ def refresh_mv_pump_state_1m(x_token: str = Header(default="", alias="X-Token"))
                 pass
 
 
+@router.post("/refresh")
+def refresh_mv_pump_state_1m(
+    x_token: str = Header(default="", alias="X-Token"),
+    full: bool = Query(False, description="REFRESH completo de la vista materializada (legacy)"),
+):
+    """
+    Corre un lote del rollup incremental (sólo los minutos tocados desde
+    la última corrida). El hilo de pump_rollup ya lo hace cada
+    PUMP_ROLLUP_INTERVAL_SEC; esto sirve para forzarlo.
+    Si el rollup está apagado o atrasado, las lecturas salen de
+    PUMP_STATE_1M_MV: entonces (o con ?full=true) se hace el REFRESH de
+    la vista como antes, para que el cron la mantenga al día.
+    """
+    _check_refresh_token(x_token)
+
+    if full:
+        return _refresh_pump_state_mv()
+
+    result = pump_rollup.run_once()
+    if pump_rollup_ready.ready():
+        return {"mode": "incremental", **result}
+
+    return {**_refresh_pump_state_mv(), "rollup": result}
+
+
+@router.get("/rollup/status")
+def pump_rollup_status():
+    """High-water mark, último minuto consolidado y resultado de la última corrida."""
+    return _clean_row(pump_rollup.status())
+
+
 @router.get("/live")
-def pumps_live(
+async def pumps_live(
     company_id: Optional[int] = Query(None),
     location_id: Optional[int] = Query(None),
     pump_ids: Optional[str] = Query(None, description="CSV de pump_id"),
@@ -270,11 +324,17 @@ def pumps_live(
     ids = _parse_ids(pump_ids)
     bucket = _validate_bucket(bucket)
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    if not latest_store.warm:
+        # El warm-up usa el pool sync: fuera del event loop.
+        await run_in_threadpool(latest_store.ensure_warm)
+
+    state_1m = await _apump_state_table()
+
+    async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
         if ids:
             scope_ids_all = ids
         else:
-            cur.execute(
+            await cur.execute(
                 f"""
                 with params as (
                   select
@@ -291,7 +351,7 @@ def pumps_live(
                 """,
                 (company_id, location_id),
             )
-            scope_ids_all = [int(r["pump_id"]) for r in cur.fetchall()]
+            scope_ids_all = [int(r["pump_id"]) for r in await cur.fetchall()]
 
         pumps_total_all = len(scope_ids_all)
 
@@ -308,33 +368,12 @@ def pumps_live(
 
         recent_from = now_utc - timedelta(minutes=PUMP_CONNECTED_WINDOW_MIN)
 
-        cur.execute(
-            f"""
-            with scope as (
-              select unnest(%s::int[]) as pump_id
-            )
-            select
-              s.pump_id,
-              h.hb_ts
-            from scope s
-            left join lateral (
-              select h.hb_ts
-              from {HB_SOURCE} h
-              where h.pump_id = s.pump_id
-                and h.hb_ts <= %s
-              order by h.hb_ts desc
-              limit 1
-            ) h on true;
-            """,
-            (scope_ids_all, now_utc),
-        )
-        last_rows = cur.fetchall() or []
-
-        connected_set = {
-            int(r["pump_id"])
-            for r in last_rows
-            if r.get("hb_ts") is not None and r["hb_ts"] >= recent_from
-        }
+        # Último heartbeat por bomba: desde latest_store, sin LATERAL por bomba.
+        connected_set = set()
+        for pid in scope_ids_all:
+            last = latest_store.pump(pid)
+            if last and last["created_at"] is not None and last["created_at"] >= recent_from:
+                connected_set.add(pid)
 
         scope_ids = (
             scope_ids_all
@@ -356,10 +395,37 @@ def pumps_live(
         if agg_mode not in ("avg", "max"):
             raise HTTPException(status_code=400, detail="agg_mode inválido")
 
+        if se.use_numpy():
+            # Filas (minuto, encendida) una vez; suma por minuto y bucket en NumPy
+            minute, on = await se.afetch_columns(
+                conn,
+                f"""
+                select extract(epoch from m.minute_ts)::float8, m.is_on::int::float8
+                from {state_1m} m
+                where m.pump_id = any(%(ids)s::int[])
+                  and m.minute_ts >= %(df)s
+                  and m.minute_ts < %(dt)s
+                """,
+                {"df": df, "dt": dt, "ids": scope_ids},
+                2,
+            )
+            minutes, inv = np.unique(minute, return_inverse=True)
+            on_count = np.bincount(inv, weights=on, minlength=minutes.size)
+            timestamps, is_on = se.to_json_lists(*se.reduce_buckets(minutes, on_count, bucket, agg_mode))
+            return {
+                "timestamps": timestamps,
+                "is_on": is_on,
+                "bucket": bucket,
+                "agg_mode": agg_mode,
+                "pumps_total": pumps_total_all,
+                "pumps_connected": len(connected_set),
+                "window": {"from": df.isoformat(), "to": dt.isoformat()},
+            }
+
         bucket_expr = _bucket_expr_sql("minute_ts", bucket)
         agg_sql = "avg(on_count)" if agg_mode == "avg" else "max(on_count)"
 
-        cur.execute(
+        await cur.execute(
             f"""
             with bounds as (
               select
@@ -373,7 +439,7 @@ def pumps_live(
               select
                 m.minute_ts,
                 case when m.is_on then 1 else 0 end as on_int
-              from {PUMP_STATE_1M} m
+              from {state_1m} m
               join scope s on s.pump_id = m.pump_id
               where m.minute_ts >= (select df from bounds)
                 and m.minute_ts < (select dt from bounds)
@@ -405,7 +471,7 @@ def pumps_live(
             },
         )
 
-        rows = cur.fetchall() or []
+        rows = await cur.fetchall() or []
 
     return {
         "timestamps": [int(r["ts_ms"]) for r in rows],
@@ -489,7 +555,7 @@ def operation_pumps_timeline_1m(
         "limit": limit,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, params)
         rows = cur.fetchall() or []
 
@@ -510,12 +576,18 @@ def operation_pumps_on_1m(
     date_to: Optional[datetime] = Query(None, alias="to"),
     online_only: bool = Query(False),
     bucket: str = Query("5min", pattern="^(1min|5min|15min|1h|1d)$"),
+    max_points: Optional[int] = Query(
+        None, ge=10, le=100000,
+        description="Máximo de puntos de la serie; mantiene picos de bombas encendidas / en línea",
+    ),
+    downsample: DownsampleMethod = Query("minmax"),
 ):
     df, dt, _now_utc = _bounds_utc_minute(date_from, date_to)
     ids = _parse_ids(pump_ids)
     bucket = _validate_bucket(bucket)
 
     bucket_expr = _bucket_expr_sql("m.minute_ts", bucket)
+    state_1m = _pump_state_table()
 
     sql = f"""
         with scope as (
@@ -537,7 +609,7 @@ def operation_pumps_on_1m(
                 {bucket_expr} as bucket_ts,
                 m.pump_id,
                 bool_or(m.is_on) as is_on
-            from {PUMP_STATE_1M} m
+            from {state_1m} m
             join scope s
               on s.pump_id = m.pump_id
             where m.minute_ts >= %(df)s
@@ -624,13 +696,15 @@ def operation_pumps_on_1m(
         "online_only": online_only,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, params)
         rows = cur.fetchall() or []
 
     items = _clean_rows(rows)
+    points_in = len(items)
+    items = downsample_rows(items, max_points, ["pumps_on", "pumps_online"], method=downsample)
 
-    return {
+    response = {
         "ok": True,
         "bucket": bucket,
         "window": {"from": df.isoformat(), "to": dt.isoformat()},
@@ -643,6 +717,12 @@ def operation_pumps_on_1m(
         "items": items,
     }
 
+    info = downsample_info(downsample, max_points, points_in, len(items))
+    if info:
+        response["downsample"] = info
+
+    return response
+
 
 @router.get("/operation/summary-24h")
 def operation_pumps_summary_24h(
@@ -658,6 +738,7 @@ def operation_pumps_summary_24h(
     df = dt - timedelta(hours=24)
     online_from = dt - timedelta(minutes=PUMP_CONNECTED_WINDOW_MIN)
     expected_minutes = int((dt - df).total_seconds() // 60)
+    state_1m = _pump_state_table()
 
     sql = f"""
         with scope as (
@@ -679,7 +760,7 @@ def operation_pumps_summary_24h(
                 m.minute_ts,
                 m.pump_id,
                 m.is_on
-            from {PUMP_STATE_1M} m
+            from {state_1m} m
             join scope s
               on s.pump_id = m.pump_id
             where m.minute_ts >= %(df)s
@@ -861,7 +942,7 @@ def operation_pumps_summary_24h(
         "expected_minutes": expected_minutes,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, params)
         rows_all = _clean_rows(cur.fetchall())
 
@@ -1038,7 +1119,7 @@ def operation_pump_events(
         "limit": limit,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, params)
         rows = cur.fetchall() or []
 
@@ -2,6 +2,7 @@
 from fastapi import APIRouter, Query
 from psycopg.rows import dict_row
 from app.db import get_conn
+from app.services.response_cache import cached_response
 from datetime import datetime
 from typing import Optional, List, Any
 
@@ -18,7 +19,16 @@ def kpi_ping():
     return {"ok": True, "module": "kpi", "tz": LOCAL_TZ}
 
 # ---- Estado de bombas / listado liviano ----
+# Liviano (selectores): cambia sólo con el ABM de bombas.
+# Con include_status: estado vivo, TTL corto.
+PUMPS_STATUS_TTL_LITE_SEC = 60
+PUMPS_STATUS_TTL_FULL_SEC = 5
+
 @router.get("/pumps/status", summary="Bombas para selector o estado operativo")
+@cached_response(
+    "kpi_pumps_status",
+    ttl=lambda kw: PUMPS_STATUS_TTL_FULL_SEC if kw.get("include_status") else PUMPS_STATUS_TTL_LITE_SEC,
+)
 def list_pumps_status(
     company_id: Optional[int] = Query(None, description="Filtra por empresa"),
     location_id: Optional[int] = Query(None, description="Filtra por localidad específica"),
@@ -47,7 +57,7 @@ def list_pumps_status(
         """
         params: List[Any] = [company_id, company_id, location_id, location_id]
 
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
             logger.debug(
                 "[KPI] /pumps/status LIVIANO SQL WHERE company_id=%s, location_id=%s",
                 company_id, location_id
@@ -80,7 +90,7 @@ def list_pumps_status(
     """
     params = [company_id, company_id, location_id, location_id]
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         logger.debug(
             "[KPI] /pumps/status PESADO SQL WHERE company_id=%s, location_id=%s",
             company_id, location_id
@@ -131,7 +141,7 @@ def buckets(
     FROM hours
     ORDER BY local_hour_ts;
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, (df, dt))
         rows = cur.fetchall()
         _log_rows("/graphs/buckets", rows)
@@ -198,7 +208,7 @@ def pumps_active(
     if location_id is not None:
         params.append(location_id)
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         logger.debug("[KPI] /graphs/pumps/active ejecutando SQL (firma) WHERE company_id=%s, location_id=%s",
                      company_id, location_id)
         cur.execute(sql, tuple(params))
@@ -256,7 +266,7 @@ def pumps_starts(
     if location_id is not None: params.append(location_id)
     if entity_id   is not None: params.append(entity_id)
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         logger.debug("[KPI] /graphs/pumps/starts ejecutando SQL (firma) WHERE company_id=%s, location_id=%s, entity_id=%s",
                      company_id, location_id, entity_id)
         cur.execute(sql, tuple(params))
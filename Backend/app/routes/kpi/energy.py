@@ -57,7 +57,7 @@ def runtime(
         "set": band_set_id,
     }
 
-    with get_conn() as con, con.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as con, con.cursor(row_factory=dict_row) as cur:
         logger.debug("[KPI] /energy/runtime ejecutando SQL con params=%s", params)
         cur.execute(sql, params)
         rows: List[dict] = cur.fetchall() or []
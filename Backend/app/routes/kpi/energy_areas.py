@@ -6,6 +6,7 @@ from datetime import datetime, timezone
 from psycopg.rows import dict_row
 
 from app.db import get_conn
+from app.services.downsample import DownsampleMethod, downsample_info, downsample_rows
 
 router = APIRouter(
     prefix="/energy_areas",
@@ -179,7 +180,7 @@ def list_energy_areas(
         order by ea.name
     """
 
-    with get_conn() as conn:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql, params)
             rows = cur.fetchall() or []
@@ -192,7 +193,7 @@ def get_energy_area(area_id: int):
     if area_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid area_id")
 
-    with get_conn() as conn:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 """
@@ -260,7 +261,7 @@ def get_energy_area_month_kpis(
 
     start_ts, end_ts = month_bounds_utc(month)
 
-    with get_conn() as conn:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 """
@@ -402,6 +403,10 @@ def get_energy_area_history(
     to_ts: datetime = Query(..., alias="to", description="ISO datetime"),
     granularity: Literal["minute", "hour", "day"] = Query("day"),
     limit: int = Query(20000, ge=1, le=200000),
+    max_points: Optional[int] = Query(
+        None, ge=10, le=100000, description="Máximo de puntos; mantiene picos de kW y mínimos de FP"
+    ),
+    downsample: DownsampleMethod = Query("minmax"),
 ):
     if area_id <= 0:
         raise HTTPException(status_code=400, detail="Invalid area_id")
@@ -412,7 +417,7 @@ def get_energy_area_history(
     if to_ts <= from_ts:
         raise HTTPException(status_code=400, detail="Invalid range: to must be > from")
 
-    with get_conn() as conn:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(
                 "select id, name, contracted_power_kw from public.energy_areas where id = %(area_id)s",
@@ -524,11 +529,17 @@ def get_energy_area_history(
     if not rows:
         raise HTTPException(status_code=404, detail="No history for range")
 
-    return {
+    points = downsample_rows(rows, max_points, ["kw_max", "pf_min"], method=downsample)
+
+    out = {
         "area_id": area_id,
         "granularity": granularity,
         "from": from_ts,
         "to": to_ts,
         "area": area,
-        "points": rows,
-    }
\ No newline at end of file
+        "points": points,
+    }
+    info = downsample_info(downsample, max_points, len(rows), len(points))
+    if info:
+        out["downsample"] = info
+    return out
\ No newline at end of file
@@ -2,17 +2,22 @@
 from decimal import Decimal
 from uuid import UUID
 from calendar import monthrange
+import os
 
 from fastapi import APIRouter, Query
 from psycopg.rows import dict_row
 
 from app.db import get_conn
+from app.services.response_cache import cached_response
 
 router = APIRouter(
     prefix="/kpi/operation-reliability",
     tags=["kpi-operation-reliability"],
 )
 
+# /snapshot: segundos que se reutiliza el mismo resultado por location_id/mes
+SNAPSHOT_TTL_SEC = float(os.getenv("OPERATION_SNAPSHOT_TTL_SEC", "15"))
+
 
 def _jsonable(v):
     if v is None:
@@ -30,21 +35,132 @@ def _clean_row(row: dict) -> dict:
     return {k: _jsonable(v) for k, v in row.items()}
 
 
-def _fetch_all(sql: str, params: tuple = ()) -> list[dict]:
-    with get_conn() as conn:
+def _fetch_all(sql: str, params: tuple | dict = ()) -> list[dict]:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql, params)
             return [_clean_row(dict(r)) for r in cur.fetchall()]
 
 
-def _fetch_one(sql: str, params: tuple = ()) -> dict:
-    with get_conn() as conn:
+def _fetch_one(sql: str, params: tuple | dict = ()) -> dict:
+    with get_conn("analytics") as conn:
         with conn.cursor(row_factory=dict_row) as cur:
             cur.execute(sql, params)
             row = cur.fetchone()
             return _clean_row(dict(row)) if row else {}
 
 
+_SQL_PUMP_RANKING = """
+    select
+        pump_id,
+        pump_name,
+        location_id,
+        location_name,
+
+        coalesce(sum(starts_count), 0)::int as starts_count,
+        coalesce(sum(stops_count), 0)::int as stops_count,
+        coalesce(sum(running_seconds), 0)::int as running_seconds,
+        coalesce(sum(stopped_seconds), 0)::int as stopped_seconds,
+
+        case
+            when coalesce(sum(running_seconds + stopped_seconds), 0) > 0 then
+                round(
+                    sum(running_seconds)::numeric
+                    / nullif(sum(running_seconds + stopped_seconds)::numeric, 0)
+                    * 100,
+                    2
+                )
+            else null
+        end as availability_pct,
+
+        coalesce(sum(total_state_events), 0)::int as total_state_events,
+        min(first_event_at) as first_event_at,
+        max(last_event_at) as last_event_at,
+        coalesce(sum(problem_score), 0)::numeric(12,2) as problem_score,
+
+        case
+            when coalesce(sum(starts_count), 0) >= 40 then 'ciclado severo'
+            when coalesce(sum(starts_count), 0) >= 20 then 'muchos arranques'
+            when (
+                coalesce(sum(running_seconds + stopped_seconds), 0) > 0
+                and (
+                    sum(running_seconds)::numeric
+                    / nullif(sum(running_seconds + stopped_seconds)::numeric, 0)
+                    * 100
+                ) < 30
+            ) then 'baja disponibilidad'
+            when coalesce(sum(starts_count), 0) >= 10 then 'revisar ciclos'
+            else 'normal'
+        end as estado_operativo
+
+    from kpi.v_pump_operation_1d_corrected
+    where day_ts between %s::date and %s::date
+      and (%s::bigint is null or location_id = %s::bigint)
+    group by
+        pump_id,
+        pump_name,
+        location_id,
+        location_name
+    order by problem_score desc, starts_count desc, pump_name asc
+    limit %s::int
+"""
+
+_SQL_TANK_RANKING = """
+    select
+        tank_id,
+        tank_name,
+        location_id,
+        location_name,
+
+        coalesce(sum(total_events), 0)::int as total_events,
+        coalesce(sum(active_events), 0)::int as active_events,
+        coalesce(sum(normalized_events), 0)::int as normalized_events,
+
+        coalesce(sum(low_events), 0)::int as low_events,
+        coalesce(sum(low_critical_events), 0)::int as low_critical_events,
+        coalesce(sum(high_events), 0)::int as high_events,
+        coalesce(sum(high_critical_events), 0)::int as high_critical_events,
+
+        min(min_detected_value) as min_detected_value,
+        max(max_detected_value) as max_detected_value,
+        round(avg(avg_detected_value), 2) as avg_detected_value,
+
+        coalesce(sum(total_duration_seconds), 0)::int as total_duration_seconds,
+
+        (
+            coalesce(sum(total_events), 0) * 2.0
+            + coalesce(sum(low_critical_events), 0) * 5.0
+            + coalesce(sum(high_critical_events), 0) * 5.0
+            + coalesce(sum(active_events), 0) * 8.0
+            + case
+                when coalesce(sum(total_duration_seconds), 0) > 3600 then 10
+                else 0
+              end
+        )::numeric(12,2) as problem_score,
+
+        case
+            when coalesce(sum(active_events), 0) > 0 then 'activo'
+            when coalesce(sum(low_critical_events), 0) >= 5 then 'riesgo vacio'
+            when coalesce(sum(high_critical_events), 0) >= 5 then 'riesgo rebalse'
+            when coalesce(sum(total_events), 0) >= 20 then 'muy inestable'
+            when coalesce(sum(total_events), 0) >= 10 then 'inestable'
+            when coalesce(sum(total_duration_seconds), 0) > 3600 then 'evento prolongado'
+            else 'normal'
+        end as estado_operativo
+
+    from kpi.v_tank_operation_1d
+    where day_ts between %s::date and %s::date
+      and (%s::bigint is null or location_id = %s::bigint)
+    group by
+        tank_id,
+        tank_name,
+        location_id,
+        location_name
+    order by problem_score desc, total_events desc, tank_name asc
+    limit %s::int
+"""
+
+
 def _month_bounds(month: str | None):
     if not month:
         today = date.today()
@@ -64,67 +180,38 @@ def _month_bounds(month: str | None):
 def get_operation_reliability_summary(
     location_id: int | None = Query(default=None),
 ):
+    # Un recorrido por vista (FILTER) en vez de seis sub-selects
     sql = """
+        with ev as (
+            select
+                count(*) filter (where status = 'active')::int as active_tank_events,
+                count(*)::int as total_tank_events
+            from kpi.v_tank_critical_events_detail
+            where (%(location_id)s::bigint is null or location_id = %(location_id)s::bigint)
+        ),
+        pu as (
+            select
+                count(*) filter (where current_state = 'run')::int as pumps_running,
+                count(*) filter (where current_state = 'stop')::int as pumps_stopped,
+                coalesce(sum(starts_count), 0)::int as total_starts,
+                coalesce(sum(stops_count), 0)::int as total_stops
+            from kpi.v_operation_pumps_front
+            where (%(location_id)s::bigint is null or location_id = %(location_id)s::bigint)
+        )
         select
-            (
-                select count(*)
-                from kpi.v_tank_critical_events_detail
-                where status = 'active'
-                  and (%s::bigint is null or location_id = %s::bigint)
-            )::int as active_tank_events,
-
-            (
-                select count(*)
-                from kpi.v_tank_critical_events_detail
-                where (%s::bigint is null or location_id = %s::bigint)
-            )::int as total_tank_events,
-
-            (
-                select count(*)
-                from kpi.v_operation_pumps_front
-                where current_state = 'run'
-                  and (%s::bigint is null or location_id = %s::bigint)
-            )::int as pumps_running,
-
-            (
-                select count(*)
-                from kpi.v_operation_pumps_front
-                where current_state = 'stop'
-                  and (%s::bigint is null or location_id = %s::bigint)
-            )::int as pumps_stopped,
-
-            (
-                select coalesce(sum(starts_count), 0)
-                from kpi.v_operation_pumps_front
-                where (%s::bigint is null or location_id = %s::bigint)
-            )::int as total_starts,
-
-            (
-                select coalesce(sum(stops_count), 0)
-                from kpi.v_operation_pumps_front
-                where (%s::bigint is null or location_id = %s::bigint)
-            )::int as total_stops
+            ev.active_tank_events,
+            ev.total_tank_events,
+            pu.pumps_running,
+            pu.pumps_stopped,
+            pu.total_starts,
+            pu.total_stops
+        from ev
+        cross join pu
     """
 
     return {
         "ok": True,
-        "summary": _fetch_one(
-            sql,
-            (
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-                location_id,
-            ),
-        ),
+        "summary": _fetch_one(sql, {"location_id": location_id}),
     }
 
 
@@ -338,60 +425,7 @@ def get_pump_ranking(
 ):
     start, end = _month_bounds(month)
 
-    sql = """
-        select
-            pump_id,
-            pump_name,
-            location_id,
-            location_name,
-
-            coalesce(sum(starts_count), 0)::int as starts_count,
-            coalesce(sum(stops_count), 0)::int as stops_count,
-            coalesce(sum(running_seconds), 0)::int as running_seconds,
-            coalesce(sum(stopped_seconds), 0)::int as stopped_seconds,
-
-            case
-                when coalesce(sum(running_seconds + stopped_seconds), 0) > 0 then
-                    round(
-                        sum(running_seconds)::numeric
-                        / nullif(sum(running_seconds + stopped_seconds)::numeric, 0)
-                        * 100,
-                        2
-                    )
-                else null
-            end as availability_pct,
-
-            coalesce(sum(total_state_events), 0)::int as total_state_events,
-            min(first_event_at) as first_event_at,
-            max(last_event_at) as last_event_at,
-            coalesce(sum(problem_score), 0)::numeric(12,2) as problem_score,
-
-            case
-                when coalesce(sum(starts_count), 0) >= 40 then 'ciclado severo'
-                when coalesce(sum(starts_count), 0) >= 20 then 'muchos arranques'
-                when (
-                    coalesce(sum(running_seconds + stopped_seconds), 0) > 0
-                    and (
-                        sum(running_seconds)::numeric
-                        / nullif(sum(running_seconds + stopped_seconds)::numeric, 0)
-                        * 100
-                    ) < 30
-                ) then 'baja disponibilidad'
-                when coalesce(sum(starts_count), 0) >= 10 then 'revisar ciclos'
-                else 'normal'
-            end as estado_operativo
-
-        from kpi.v_pump_operation_1d_corrected
-        where day_ts between %s::date and %s::date
-          and (%s::bigint is null or location_id = %s::bigint)
-        group by
-            pump_id,
-            pump_name,
-            location_id,
-            location_name
-        order by problem_score desc, starts_count desc, pump_name asc
-        limit %s::int
-    """
+    sql = _SQL_PUMP_RANKING
 
     return {
         "ok": True,
@@ -521,60 +555,7 @@ def get_tank_ranking(
 ):
     start, end = _month_bounds(month)
 
-    sql = """
-        select
-            tank_id,
-            tank_name,
-            location_id,
-            location_name,
-
-            coalesce(sum(total_events), 0)::int as total_events,
-            coalesce(sum(active_events), 0)::int as active_events,
-            coalesce(sum(normalized_events), 0)::int as normalized_events,
-
-            coalesce(sum(low_events), 0)::int as low_events,
-            coalesce(sum(low_critical_events), 0)::int as low_critical_events,
-            coalesce(sum(high_events), 0)::int as high_events,
-            coalesce(sum(high_critical_events), 0)::int as high_critical_events,
-
-            min(min_detected_value) as min_detected_value,
-            max(max_detected_value) as max_detected_value,
-            round(avg(avg_detected_value), 2) as avg_detected_value,
-
-            coalesce(sum(total_duration_seconds), 0)::int as total_duration_seconds,
-
-            (
-                coalesce(sum(total_events), 0) * 2.0
-                + coalesce(sum(low_critical_events), 0) * 5.0
-                + coalesce(sum(high_critical_events), 0) * 5.0
-                + coalesce(sum(active_events), 0) * 8.0
-                + case
-                    when coalesce(sum(total_duration_seconds), 0) > 3600 then 10
-                    else 0
-                  end
-            )::numeric(12,2) as problem_score,
-
-            case
-                when coalesce(sum(active_events), 0) > 0 then 'activo'
-                when coalesce(sum(low_critical_events), 0) >= 5 then 'riesgo vacio'
-                when coalesce(sum(high_critical_events), 0) >= 5 then 'riesgo rebalse'
-                when coalesce(sum(total_events), 0) >= 20 then 'muy inestable'
-                when coalesce(sum(total_events), 0) >= 10 then 'inestable'
-                when coalesce(sum(total_duration_seconds), 0) > 3600 then 'evento prolongado'
-                else 'normal'
-            end as estado_operativo
-
-        from kpi.v_tank_operation_1d
-        where day_ts between %s::date and %s::date
-          and (%s::bigint is null or location_id = %s::bigint)
-        group by
-            tank_id,
-            tank_name,
-            location_id,
-            location_name
-        order by problem_score desc, total_events desc, tank_name asc
-        limit %s::int
-    """
+    sql = _SQL_TANK_RANKING
 
     return {
         "ok": True,
@@ -710,4 +691,140 @@ def get_tank_day_events(
     }
 
 
+# ------------------------------------------------------------
+# Snapshot: todos los bloques del tablero en un viaje a la DB
+# ------------------------------------------------------------
+# Bombas (lista de /pumps) + contadores de /summary: un recorrido de la
+# vista, los contadores como agregados de ventana sobre el mismo scan.
+_SQL_SNAPSHOT_PUMPS = """
+    select
+        pump_id,
+        pump_name,
+        location_id,
+        location_name,
+        current_state,
+        current_state_label,
+        online,
+        starts_count,
+        stops_count,
+        running_time_label,
+        stopped_time_label,
+        availability_pct,
+        last_started_at,
+        last_stopped_at,
+        last_activity_at,
+        last_activity_label,
+        (count(*) filter (where current_state = 'run') over ())::int as _pumps_running,
+        (count(*) filter (where current_state = 'stop') over ())::int as _pumps_stopped,
+        (coalesce(sum(starts_count) over (), 0))::int as _total_starts,
+        (coalesce(sum(stops_count) over (), 0))::int as _total_stops
+    from kpi.v_operation_pumps_front
+    where (%(location_id)s::bigint is null or location_id = %(location_id)s::bigint)
+    order by location_name, pump_name
+"""
+
+# Últimos eventos de tanques (/tank-events) + contadores de /summary.
+# Las ventanas se calculan antes del LIMIT: cuentan todos los eventos.
+_SQL_SNAPSHOT_TANK_EVENTS = """
+    select
+        id,
+        tank_id,
+        tank_name,
+        location_id,
+        location_name,
+        event_type,
+        event_label,
+        configured_limit,
+        detected_value,
+        started_at,
+        ended_at,
+        duration_seconds,
+        duration_label,
+        status,
+        status_label,
+        created_at,
+        (count(*) filter (where status = 'active') over ())::int as _active_tank_events,
+        (count(*) over ())::int as _total_tank_events
+    from kpi.v_tank_critical_events_detail
+    where (%(location_id)s::bigint is null or location_id = %(location_id)s::bigint)
+    order by started_at desc
+    limit %(limit)s::int
+"""
+
+
+def _fetch_pipelined(statements: list[tuple[str, tuple | dict]]) -> list[list[dict]]:
+    """
+    Ejecuta las consultas en pipeline (un solo viaje de red) dentro de una
+    transacción REPEATABLE READ de sólo lectura: todos los bloques ven la
+    misma foto de los datos.
+    """
+    with get_conn("analytics") as conn:
+        cursors = []
+        with conn.pipeline(), conn.transaction():
+            conn.execute("set transaction isolation level repeatable read, read only")
+            for sql, params in statements:
+                cur = conn.cursor(row_factory=dict_row)
+                cur.execute(sql, params)
+                cursors.append(cur)
+        try:
+            return [[_clean_row(dict(r)) for r in cur.fetchall()] for cur in cursors]
+        finally:
+            for cur in cursors:
+                cur.close()
+
+
+def _split_counters(rows: list[dict], names: tuple[str, ...]) -> tuple[list[dict], dict]:
+    """Saca las columnas _contador de cada fila; los valores salen de la primera."""
+    counters = {n: (rows[0][f"_{n}"] if rows else 0) for n in names}
+    items = [{k: v for k, v in r.items() if not k.startswith("_")} for r in rows]
+    return items, counters
+
+
+def _snapshot_key(kw: dict):
+    start, _ = _month_bounds(kw["month"])
+    return (kw["location_id"], start.isoformat(), kw["ranking_limit"], kw["events_limit"])
+
+
+@router.get("/snapshot")
+@cached_response("operation_reliability_snapshot", ttl=SNAPSHOT_TTL_SEC, key=_snapshot_key)
+def get_operation_reliability_snapshot(
+    location_id: int | None = Query(default=None),
+    month: str | None = Query(
+        default=None,
+        description="Mes en formato YYYY-MM para los rankings. Si se omite usa el mes actual.",
+    ),
+    ranking_limit: int = Query(default=20, ge=1, le=100),
+    events_limit: int = Query(default=50, ge=1, le=500),
+):
+    """
+    /summary + /pumps + /pump-ranking + /tank-ranking + /tank-events en
+    una sola respuesta: una consulta por vista, en pipeline sobre una
+    conexión. Se cachea OPERATION_SNAPSHOT_TTL_SEC por location_id/mes.
+    """
+    start, end = _month_bounds(month)
+
+    pumps, events, pump_ranking, tank_ranking = _fetch_pipelined([
+        (_SQL_SNAPSHOT_PUMPS, {"location_id": location_id}),
+        (_SQL_SNAPSHOT_TANK_EVENTS, {"location_id": location_id, "limit": events_limit}),
+        (_SQL_PUMP_RANKING, (start, end, location_id, location_id, ranking_limit)),
+        (_SQL_TANK_RANKING, (start, end, location_id, location_id, ranking_limit)),
+    ])
+
+    pumps, pump_counters = _split_counters(
+        pumps, ("pumps_running", "pumps_stopped", "total_starts", "total_stops")
+    )
+    events, event_counters = _split_counters(events, ("active_tank_events", "total_tank_events"))
 
+    return {
+        "ok": True,
+        "location_id": location_id,
+        "month": start.strftime("%Y-%m"),
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "summary": {**event_counters, **pump_counters},
+        # Igual que /pumps: sólo filas con bomba
+        "pumps": [p for p in pumps if p["pump_id"] is not None],
+        "pump_ranking": pump_ranking,
+        "tank_ranking": tank_ranking,
+        "tank_events": events,
+    }
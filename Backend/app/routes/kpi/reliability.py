@@ -76,7 +76,7 @@ def location_timeline(
         "tz": tz,
     }
 
-    with get_conn() as con, con.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as con, con.cursor(row_factory=dict_row) as cur:
         logger.debug("[KPI] /kpi/reliability/location_timeline SQL params=%s", params)
         cur.execute(sql, params)
         rows: List[dict] = cur.fetchall() or []
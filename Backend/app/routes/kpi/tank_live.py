@@ -1,19 +1,183 @@
 # app/routes/kpi/tank_live.py
 import os
+import numpy as np
 from fastapi import APIRouter, Query, HTTPException
 from psycopg.rows import dict_row
 from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta, timezone
-from app.db import get_conn
+from app.db_async import get_aconn
+from app.services import series_engine as se
+from app.services.tank_rollup import (
+    TANK_LEVELS_SOURCE,
+    TANK_ROLLUP_BACKFILL_DAYS,
+    TANK_ROLLUP_ENABLED,
+    TANK_ROLLUP_TABLE,
+    TIER_MINUTES,
+    floor_to_tier,
+    tank_rollup,
+    tank_rollup_ready,
+    tier_for_bucket,
+)
 
 router = APIRouter(prefix="/kpi/tanques", tags=["kpi-tanques-live"])
 
 TANKS_TABLE     = (os.getenv("TANKS_TABLE") or "public.tanks").strip()
 LOCATIONS_TABLE = (os.getenv("LOCATIONS_TABLE") or "public.locations").strip()
-LV_SOURCE       = (os.getenv("TANK_LEVELS_SOURCE") or "kpi.v_tank_levels_clean").strip()
+LV_SOURCE       = TANK_LEVELS_SOURCE  # env TANK_LEVELS_SOURCE; el rollup sale de la misma vista
 # opcional: MV por tanque-hora (bucket 1h directo); si no existe, deja en vacío
 LV_HOURLY_MV    = os.getenv("TANK_LEVELS_HOURLY_MV", "").strip()
 
+_BUCKET_MINUTES = {"1min": 1, "5min": 5, "15min": 15, "1h": 60, "1d": 1440}
+
+# Serie desde el rollup (app/services/tank_rollup), tier elegido por el planner.
+# LOCF sin cruzar tanques x minutos: cada fila aporta la diferencia con el
+# valor anterior de su tanque; la suma acumulada (y la cantidad de tanques
+# con valor) sobre la grilla del tier da el promedio en cada bucket.
+_SQL_ROLLUP_SERIES = f"""
+    WITH src AS (
+      SELECT r.tank_id, r.bucket_ts AS m, {{val_col}} AS v
+      FROM {TANK_ROLLUP_TABLE} r
+      WHERE r.tier = %(tier)s
+        AND r.tank_id = ANY(%(ids)s::int[])
+        AND r.bucket_ts >= %(df)s AND r.bucket_ts <= %(dt)s
+      UNION ALL
+      -- último valor anterior a la ventana (LOCF)
+      SELECT s.tank_id, %(df)s::timestamptz - interval '1 minute', b.level_last
+      FROM unnest(%(ids)s::int[]) AS s(tank_id)
+      CROSS JOIN LATERAL (
+        SELECT r.level_last
+        FROM {TANK_ROLLUP_TABLE} r
+        WHERE r.tier = %(tier)s AND r.tank_id = s.tank_id AND r.bucket_ts < %(df)s
+        ORDER BY r.bucket_ts DESC
+        LIMIT 1
+      ) b
+      WHERE %(carry)s
+    ),
+    deltas AS (
+      SELECT
+        m,
+        v - coalesce(lag(v) OVER w, 0) AS dv,
+        (lag(v) OVER w IS NULL)::int    AS dn
+      FROM src
+      WINDOW w AS (PARTITION BY tank_id ORDER BY m)
+    ),
+    steps AS (
+      SELECT m, sum(dv) AS dv, sum(dn) AS dn
+      FROM (
+        SELECT m, dv, dn FROM deltas
+        UNION ALL
+        SELECT generate_series(%(df)s::timestamptz, %(dt)s::timestamptz, %(step)s::interval), 0, 0
+      ) x
+      GROUP BY m
+    ),
+    running AS (
+      SELECT m, sum(dv) OVER w AS s, sum(dn) OVER w AS n
+      FROM steps
+      WINDOW w AS (ORDER BY m)
+    ),
+    bucketed AS (
+      SELECT {{bucket_expr}} AS b, AVG(s / nullif(n, 0))::float AS v
+      FROM running
+      WHERE m >= %(df)s
+      GROUP BY 1
+    )
+    SELECT extract(epoch FROM b)::bigint*1000 AS ts_ms, v
+    FROM bucketed
+    ORDER BY ts_ms
+"""
+
+# carry=false: sólo los buckets donde el tanque reportó
+_SQL_ROLLUP_SERIES_NO_CARRY = f"""
+    WITH src AS (
+      SELECT r.bucket_ts AS m, {{val_col}} AS v
+      FROM {TANK_ROLLUP_TABLE} r
+      WHERE r.tier = %(tier)s
+        AND r.tank_id = ANY(%(ids)s::int[])
+        AND r.bucket_ts >= %(df)s AND r.bucket_ts <= %(dt)s
+    ),
+    bucketed AS (
+      SELECT {{bucket_expr}} AS b, AVG(v)::float AS v
+      FROM src
+      GROUP BY 1
+    )
+    SELECT extract(epoch FROM b)::bigint*1000 AS ts_ms, v
+    FROM bucketed
+    ORDER BY ts_ms
+"""
+
+
+# Motor NumPy (app/services/series_engine): mismos datos, sin grilla en SQL.
+# Filas (tank_id, epoch, valor); la baseline va con epoch anterior a df.
+_SQL_ROLLUP_POINTS = f"""
+    SELECT r.tank_id, extract(epoch FROM r.bucket_ts)::float8, {{val_col}}
+    FROM {TANK_ROLLUP_TABLE} r
+    WHERE r.tier = %(tier)s
+      AND r.tank_id = ANY(%(ids)s::int[])
+      AND r.bucket_ts >= %(df)s AND r.bucket_ts <= %(dt)s
+    UNION ALL
+    SELECT s.tank_id, extract(epoch FROM %(df)s::timestamptz)::float8 - 60, b.level_last
+    FROM unnest(%(ids)s::int[]) AS s(tank_id)
+    CROSS JOIN LATERAL (
+      SELECT r.level_last
+      FROM {TANK_ROLLUP_TABLE} r
+      WHERE r.tier = %(tier)s AND r.tank_id = s.tank_id AND r.bucket_ts < %(df)s
+      ORDER BY r.bucket_ts DESC
+      LIMIT 1
+    ) b
+    WHERE %(carry)s
+"""
+
+_SQL_RAW_POINTS = f"""
+    SELECT c.tank_id, extract(epoch FROM c.ts)::float8, c.level_pct::float8
+    FROM {LV_SOURCE} c
+    WHERE c.tank_id = ANY(%(ids)s::int[])
+      AND c.ts >= %(df)s AND c.ts <= %(dt)s
+      AND c.level_pct IS NOT NULL
+    UNION ALL
+    SELECT * FROM (
+      SELECT DISTINCT ON (c.tank_id) c.tank_id, extract(epoch FROM c.ts)::float8, c.level_pct::float8
+      FROM {LV_SOURCE} c
+      WHERE c.tank_id = ANY(%(ids)s::int[]) AND c.ts < %(df)s
+        AND c.level_pct IS NOT NULL
+      ORDER BY c.tank_id, c.ts DESC
+    ) b
+    WHERE %(carry)s
+"""
+
+
+def _series_numpy(tank, ts, val, start: datetime, dt: datetime, step_s: int,
+                  bucket: str, agg: str, carry: bool):
+    """Puntos sueltos -> (timestamps, level_percent) con LOCF y bucket en NumPy."""
+    t0 = start.timestamp()
+    n_slots = int((dt.timestamp() - t0) // step_s) + 1
+    slot = se.slot_index(ts, t0, step_s)
+    # Baseline: todo lo anterior a la ventana cae en el slot -1
+    slot[slot < 0] = -1
+    how = "last" if agg == "last" else "avg"
+    tank, slot, val = se.reduce_slots(tank, slot, val, how, order=ts if how == "last" else None)
+    grid = se.locf_mean(tank, slot, val, n_slots, carry)
+    ts_ms, out = se.reduce_buckets(t0 + np.arange(n_slots, dtype=np.float64) * step_s, grid, bucket)
+    if not carry:
+        # Como en SQL: sólo buckets con lecturas
+        keep = ~np.isnan(out)
+        ts_ms, out = ts_ms[keep], out[keep]
+    return se.to_json_lists(ts_ms, out)
+
+
+async def _plan_tier(bucket: str, df: datetime) -> Optional[str]:
+    """
+    Tier del rollup para el bucket pedido (el más grueso que lo divide),
+    o None si hay que ir a la vista cruda: rollup apagado, todavía no al
+    día (backfill / atraso) o ventana más vieja que lo que cubre el backfill.
+    """
+    if not TANK_ROLLUP_ENABLED:
+        return None
+    if df < datetime.now(timezone.utc) - timedelta(days=TANK_ROLLUP_BACKFILL_DAYS):
+        return None
+    if not await tank_rollup_ready.aready():
+        return None
+    return tier_for_bucket(_BUCKET_MINUTES[bucket])
+
 def _bounds_utc_minute(f: Optional[datetime], t: Optional[datetime]):
     if t is None: t = datetime.now(timezone.utc)
     if f is None: f = t - timedelta(hours=24)
@@ -44,8 +208,13 @@ def _parse_ids(csv: Optional[str]) -> Optional[List[int]]:
         except: pass
     return out or None
 
+@router.get("/rollup/status")
+def tank_rollup_status():
+    """High-water mark de tank_ingest y resultado de la última corrida del rollup."""
+    return tank_rollup.status()
+
 @router.get("/live")
-def tanks_live_24h(
+async def tanks_live_24h(
     company_id: Optional[int] = Query(None),
     location_id: Optional[int] = Query(None),
     tank_ids: Optional[str]    = Query(None),
@@ -58,13 +227,14 @@ def tanks_live_24h(
 ):
     df, dt = _bounds_utc_minute(date_from, date_to)
     ids = _parse_ids(tank_ids)
+    tier = await _plan_tier(bucket, df)
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
         # scope de tanques
         if ids:
             scope_ids_all = ids
         else:
-            cur.execute(
+            await cur.execute(
                 f"""
                 WITH params AS (SELECT %(company_id)s::bigint AS company_id, %(location_id)s::bigint AS location_id)
                 SELECT t.id AS tank_id
@@ -76,14 +246,20 @@ def tanks_live_24h(
                 """,
                 {"company_id": company_id, "location_id": location_id},
             )
-            scope_ids_all = [int(r["tank_id"]) for r in cur.fetchall()]
+            scope_ids_all = [int(r["tank_id"]) for r in await cur.fetchall()]
 
         if not scope_ids_all:
             return {"timestamps": [], "level_percent": [], "tanks_total": 0, "tanks_connected": 0,
                     "window": {"from": df.isoformat(), "to": dt.isoformat()}}
 
+        if tier is not None:
+            return await _tanks_live_rollup(
+                conn, cur, tier, scope_ids_all, df, dt, agg=agg, carry=carry,
+                connected_only=connected_only, bucket=bucket,
+            )
+
         # conectados en ventana
-        cur.execute(
+        await cur.execute(
             f"""
             SELECT DISTINCT c.tank_id
             FROM {LV_SOURCE} c
@@ -92,7 +268,7 @@ def tanks_live_24h(
             """,
             {"ids": scope_ids_all, "df": df, "dt": dt},
         )
-        connected_set = {int(r["tank_id"]) for r in cur.fetchall()}
+        connected_set = {int(r["tank_id"]) for r in await cur.fetchall()}
         scope_ids = scope_ids_all if not connected_only else [tid for tid in scope_ids_all if tid in connected_set]
         if not scope_ids:
             return {"timestamps": [], "level_percent": [], "tanks_total": len(scope_ids_all), "tanks_connected": 0,
@@ -104,7 +280,7 @@ def tanks_live_24h(
         if use_mv:
             # Agrupo por bucket desde MV horaria por tanque, y luego promedios de tanques del scope
             bucket_expr = "date_trunc('day', bucket)" if bucket=="1d" else "bucket"
-            cur.execute(
+            await cur.execute(
                 f"""
                 WITH h AS (
                   SELECT
@@ -126,7 +302,7 @@ def tanks_live_24h(
                 """,
                 {"df": df, "dt": dt, "ids": scope_ids},
             )
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
             return {
                 "timestamps": [int(r["ts_ms"]) for r in rows],
                 "level_percent": [None if r["v"] is None else float(r["v"]) for r in rows],
@@ -135,6 +311,19 @@ def tanks_live_24h(
                 "window": {"from": df.isoformat(), "to": dt.isoformat()},
             }
 
+        if se.use_numpy():
+            tank, ts, val = await se.afetch_columns(
+                conn, _SQL_RAW_POINTS, {"ids": scope_ids, "df": df, "dt": dt, "carry": carry}, 3
+            )
+            timestamps, level_percent = _series_numpy(tank, ts, val, df, dt, 60, bucket, agg, carry)
+            return {
+                "timestamps": timestamps,
+                "level_percent": level_percent,
+                "tanks_total": len(scope_ids_all),
+                "tanks_connected": len(connected_set),
+                "window": {"from": df.isoformat(), "to": dt.isoformat()},
+            }
+
         # Camino normal desde vista limpia por minuto, con LOCF y bucket en SQL
         bucket_expr = _bucket_expr_sql(bucket)
         # Dentro de cada minuto: avg|last
@@ -142,7 +331,7 @@ def tanks_live_24h(
                          "((array_agg(c.level_pct ORDER BY c.ts DESC))[1])"
 
         # Serie minuto a minuto por tanque
-        cur.execute(
+        await cur.execute(
             f"""
             WITH bounds AS (
               SELECT %(df)s::timestamptz AS df, %(dt)s::timestamptz AS dt
@@ -190,7 +379,7 @@ def tanks_live_24h(
             """,
             {"ids": scope_ids, "df": df, "dt": dt},
         )
-        rows = cur.fetchall()
+        rows = await cur.fetchall()
 
     return {
         "timestamps": [int(r["ts_ms"]) for r in rows],
@@ -199,3 +388,79 @@ def tanks_live_24h(
         "tanks_connected": len(connected_set),
         "window": {"from": df.isoformat(), "to": dt.isoformat()},
     }
+
+
+async def _tanks_live_rollup(
+    conn,
+    cur,
+    tier: str,
+    scope_ids_all: List[int],
+    df: datetime,
+    dt: datetime,
+    *,
+    agg: str,
+    carry: bool,
+    connected_only: bool,
+    bucket: str,
+) -> Dict[str, Any]:
+    """/live desde el rollup: grilla del tier, agrupada al bucket pedido."""
+    tdf = floor_to_tier(df, tier)
+
+    # conectados en ventana (mismo tier: pocas filas por tanque)
+    await cur.execute(
+        f"""
+        SELECT DISTINCT r.tank_id
+        FROM {TANK_ROLLUP_TABLE} r
+        WHERE r.tier = %(tier)s
+          AND r.tank_id = ANY(%(ids)s::int[])
+          AND r.bucket_ts >= %(df)s AND r.bucket_ts <= %(dt)s
+        """,
+        {"tier": tier, "ids": scope_ids_all, "df": tdf, "dt": dt},
+    )
+    connected_set = {int(r["tank_id"]) for r in await cur.fetchall()}
+    scope_ids = scope_ids_all if not connected_only else [tid for tid in scope_ids_all if tid in connected_set]
+    window = {"from": df.isoformat(), "to": dt.isoformat()}
+    if not scope_ids:
+        return {"timestamps": [], "level_percent": [], "tanks_total": len(scope_ids_all), "tanks_connected": 0,
+                "window": window, "tier": tier}
+
+    # avg del bucket = promedio ponderado por muestras; last = última lectura
+    val_col = "r.level_avg" if agg == "avg" else "r.level_last"
+    params = {
+        "tier": tier,
+        "ids": scope_ids,
+        "df": tdf,
+        "dt": dt,
+        "carry": carry,
+        "step": f"{TIER_MINUTES[tier]} minutes",
+    }
+
+    if se.use_numpy():
+        tank, ts, val = await se.afetch_columns(conn, _SQL_ROLLUP_POINTS.format(val_col=val_col), params, 3)
+        # Una fila por (tanque, bucket del tier): "avg" = el valor del tier
+        timestamps, level_percent = _series_numpy(
+            tank, ts, val, tdf, dt, TIER_MINUTES[tier] * 60, bucket, "avg", carry
+        )
+        return {
+            "timestamps": timestamps,
+            "level_percent": level_percent,
+            "tanks_total": len(scope_ids_all),
+            "tanks_connected": len(connected_set),
+            "window": window,
+            "tier": tier,
+        }
+
+    sql = _SQL_ROLLUP_SERIES if carry else _SQL_ROLLUP_SERIES_NO_CARRY
+    await cur.execute(
+        sql.format(val_col=val_col, bucket_expr=_bucket_expr_sql(bucket)),
+        params,
+    )
+    rows = await cur.fetchall()
+    return {
+        "timestamps": [int(r["ts_ms"]) for r in rows],
+        "level_percent": [None if r["v"] is None else float(r["v"]) for r in rows],
+        "tanks_total": len(scope_ids_all),
+        "tanks_connected": len(connected_set),
+        "window": window,
+        "tier": tier,
+    }
@@ -4,11 +4,15 @@ from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
 from typing import Optional, List, Any
 from uuid import UUID
+from zoneinfo import ZoneInfo
 
+import numpy as np
 from fastapi import APIRouter, Query, HTTPException
 from psycopg.rows import dict_row
 
 from app.db import get_conn
+from app.services import series_engine as se
+from app.services.downsample import DownsampleMethod, downsample_info, downsample_rows
 
 from ._common import (
     logger,
@@ -207,7 +211,7 @@ def list_tanks_latest(
         """
         params: List[Any] = [company_id, company_id, location_id, location_id]
 
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
             logger.debug(
                 "[KPI] /tanks/latest LIVIANO SQL WHERE company_id=%s, location_id=%s",
                 company_id,
@@ -253,7 +257,7 @@ def list_tanks_latest(
     """
     params: List[Any] = [company_id, company_id, location_id, location_id]
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         logger.debug(
             "[KPI] /tanks/latest PESADO SQL WHERE company_id=%s, location_id=%s",
             company_id,
@@ -374,7 +378,7 @@ def tanks_level_avg(
     if entity_id is not None:
         params.append(entity_id)
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         logger.debug(
             "[KPI] /graphs/tanks/level_avg ejecutando SQL WHERE company_id=%s, location_id=%s, entity_id=%s",
             company_id,
@@ -590,7 +594,7 @@ def operation_tanks_summary_24h(
         "online_from": online_from,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql_items, params)
         rows_all = _clean_rows(cur.fetchall())
 
@@ -720,6 +724,72 @@ def operation_tanks_summary_24h(
 # -------------------------------------------------------------------
 # Operación PRO - Nivel por tanque cada 1 minuto / bucket
 # -------------------------------------------------------------------
+def _operation_level_aggregate_numpy(bucket: str, params: dict) -> List[dict]:
+    """
+    aggregate=true con el motor NumPy: trae los minutos del scope una vez
+    y arma los buckets (avg/min/max/samples/tanques) vectorizado. Mismos
+    campos y redondeo que la consulta SQL.
+    """
+    with get_conn("analytics") as conn:
+        ts, tank, lavg, lmin, lmax, samples = se.fetch_columns(
+            conn,
+            f"""
+            select
+                extract(epoch from v.minute_ts)::float8,
+                v.tank_id,
+                v.level_avg::float8,
+                v.level_min::float8,
+                v.level_max::float8,
+                v.samples::float8
+            from {OP_TANK_LEVEL_1M} v
+            left join {LOCATIONS_TABLE} l
+              on l.id = v.location_id
+            where v.minute_ts >= %(df)s
+              and v.minute_ts <= %(dt)s
+              and (%(company_id)s::bigint is null or l.company_id = %(company_id)s::bigint)
+              and (%(location_id)s::bigint is null or v.location_id = %(location_id)s::bigint)
+              and (%(tank_ids)s::int[] is null or v.tank_id = any(%(tank_ids)s::int[]))
+            """,
+            params,
+            6,
+        )
+
+    if ts.size == 0:
+        return []
+
+    keys, inv = se.bucket_groups(ts, bucket)
+    keys = keys[: params["limit"]]
+    n = keys.size
+    inside = inv < n
+    inv, tank = inv[inside], tank[inside]
+
+    level_avg = np.round(se.group_reduce(inv, n, lavg[inside], "avg"), 2)
+    level_min = np.round(se.group_reduce(inv, n, lmin[inside], "min"), 2)
+    level_max = np.round(se.group_reduce(inv, n, lmax[inside], "max"), 2)
+    samples_sum = se.group_reduce(inv, n, samples[inside], "sum").astype(np.int64)
+    # count(distinct tank_id) por bucket
+    pairs = np.unique(inv.astype(np.int64) * (1 << 32) + tank.astype(np.int64))
+    tanks_count = np.bincount(pairs >> 32, minlength=n)
+
+    local_tz = ZoneInfo(LOCAL_TZ)
+    items: List[dict] = []
+    for i, (k, a, lo, hi) in enumerate(zip(
+        keys.tolist(), se.nan_to_none(level_avg), se.nan_to_none(level_min), se.nan_to_none(level_max)
+    )):
+        bucket_ts = datetime.fromtimestamp(k, tz=timezone.utc)
+        items.append({
+            "minute_ts": bucket_ts.isoformat(),
+            "ts_ms": int(k) * 1000,
+            "local_minute_ts": bucket_ts.astimezone(local_tz).replace(tzinfo=None).isoformat(),
+            "level_avg": a,
+            "level_min": lo,
+            "level_max": hi,
+            "samples": int(samples_sum[i]),
+            "tanks_count": int(tanks_count[i]),
+        })
+    return items
+
+
 @router.get("/tanques/operation/level-1m")
 @router.get("/tanks/operation/level-1m")
 def operation_tanks_level_1m(
@@ -731,6 +801,11 @@ def operation_tanks_level_1m(
     bucket: str = Query("1min", pattern="^(1min|5min|15min|1h|1d)$"),
     aggregate: bool = Query(False, description="Si true devuelve serie agregada de todos los tanques"),
     limit: int = Query(200000, ge=1, le=300000),
+    max_points: Optional[int] = Query(
+        None, ge=10, le=100000,
+        description="Máximo de puntos por tanque (o de la serie agregada); mantiene picos y cruces de umbral",
+    ),
+    downsample: DownsampleMethod = Query("minmax"),
 ):
     df, dt = _bounds_utc_minute(date_from, date_to)
     ids = _parse_ids(tank_ids)
@@ -871,11 +946,23 @@ def operation_tanks_level_1m(
         "limit": limit,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall() or []
-
-    items = _clean_rows(rows)
+    if aggregate and se.use_numpy():
+        items = _operation_level_aggregate_numpy(bucket, params)
+    else:
+        with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall() or []
+
+        items = _clean_rows(rows)
+
+    points_in = len(items)
+    items = downsample_rows(
+        items,
+        max_points,
+        ["level_min", "level_max"],
+        method=downsample,
+        group_key=None if aggregate else "tank_id",
+    )
 
     response = {
         "ok": True,
@@ -886,6 +973,10 @@ def operation_tanks_level_1m(
         "items": items,
     }
 
+    info = downsample_info(downsample, max_points, points_in, len(items))
+    if info:
+        response["downsample"] = info
+
     if aggregate:
         response["timestamps"] = [r["ts_ms"] for r in items]
         response["level_avg"] = [r["level_avg"] for r in items]
@@ -1006,7 +1097,7 @@ def operation_tank_events(
         "limit": limit,
     }
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, params)
         rows = cur.fetchall() or []
 
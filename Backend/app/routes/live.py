@@ -0,0 +1,202 @@
+# app/routes/live.py
+"""
+Canal push de telemetría para pantallas SCADA.
+
+  ws://.../live/ws?company_id=&location_id=&tank_ids=1,2&pump_ids=&manifold_ids=&analyzer_ids=&types=tank,pump
+
+Al conectar (y en cada "subscribe") el server manda un snapshot con las
+últimas lecturas del scope (latest_store), y después solo novedades
+(live_bus) a medida que entran por /ingest/tank, /arduino-controler/
+heartbeat, /state, lecturas de manifolds y de analizadores. La carga en
+la DB ya no crece con la cantidad de pantallas abiertas.
+
+Mensajes server -> cliente (JSON):
+  {"type": "snapshot", "items": [{"type": "tank", "id": 1, ...}, ...]}
+  {"type": "tank", "id": 1, "level_pct": 55.0, "ts": ..., "location_id": .., "company_id": ..}
+  {"type": "pump", "id": 3, "plc_state": "run", "ts": ...}
+  {"type": "pump_event", "id": 3, "state": "stop", "event_id": .., "ts": ...}
+  {"type": "manifold_signal", "id": 4, "signal_type": "pressure", "value": .., "ts": ...}
+  {"type": "meter", "id": 7, "p_kw": .., "ts": ...}
+  {"type": "resync", "dropped": n}   cliente lento: se perdieron eventos, pedir de nuevo
+
+Mensajes cliente -> server (JSON), opcional:
+  {"action": "subscribe", "company_id": .., "location_id": .., "tank_ids": [..], ..., "types": [..]}
+
+Online / staleness: el cliente lo calcula con "ts" de cada entidad.
+
+Se usa WebSocket y no SSE porque GZipMiddleware bufferea las respuestas
+en streaming y demoraría los eventos.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+import asyncio
+import logging
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+from app.services.latest_store import latest_store
+from app.services.live_bus import LIVE_KINDS, LiveFilter, live_bus
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/live", tags=["live"])
+
+# parámetro -> tipo de entidad del filtro
+_ID_PARAMS = {
+    "tank_ids": "tank",
+    "pump_ids": "pump",
+    "manifold_ids": "manifold",
+    "analyzer_ids": "meter",
+}
+
+
+def _int_or_none(v: Any) -> Optional[int]:
+    if v is None or v == "":
+        return None
+    return int(v)
+
+
+def _id_set(v: Any) -> Optional[set[int]]:
+    if v is None or v == "":
+        return None
+    if isinstance(v, str):
+        v = [t for t in v.split(",") if t.strip()]
+    return {int(x) for x in v}
+
+
+def _parse_filter(src: dict) -> LiveFilter:
+    """src: query params o mensaje "subscribe". ValueError si algo no cierra."""
+    ids = {}
+    for param, kind in _ID_PARAMS.items():
+        s = _id_set(src.get(param))
+        if s is not None:
+            ids[kind] = s
+
+    types = src.get("types")
+    if isinstance(types, str):
+        types = [t.strip() for t in types.split(",") if t.strip()]
+    if types:
+        bad = set(types) - set(LIVE_KINDS)
+        if bad:
+            raise ValueError(f"types inválidos: {sorted(bad)}")
+        types = set(types)
+    else:
+        types = None
+
+    return LiveFilter(
+        company_id=_int_or_none(src.get("company_id")),
+        location_id=_int_or_none(src.get("location_id")),
+        ids=ids,
+        types=types,
+    )
+
+
+def _snapshot(flt: LiveFilter) -> list[dict]:
+    """Últimas lecturas (memoria) de las entidades que entran en el filtro."""
+    latest_store.ensure_warm()
+
+    sources = (
+        ("tank", "tank", latest_store.tank, lambda r: {"level_pct": r["level_pct"], "ts": r["created_at"]}),
+        ("pump", "pump", latest_store.pump, lambda r: {"plc_state": r["plc_state"], "ts": r["created_at"]}),
+        ("meter", "meter", latest_store.meter, lambda r: {k: v for k, v in r.items() if k != "analyzer_id"}),
+    )
+
+    items = []
+    for ev_type, kind, get_latest, fmt in sources:
+        if flt.types is not None and ev_type not in flt.types:
+            continue
+        for entity_id, location_id, company_id in live_bus.scope.entities(kind):
+            if not flt.matches_entity(kind, entity_id, location_id, company_id):
+                continue
+            row = get_latest(entity_id)
+            if row is None:
+                continue
+            items.append({
+                "type": ev_type,
+                "id": entity_id,
+                "location_id": location_id,
+                "company_id": company_id,
+                **fmt(row),
+            })
+
+    return items
+
+
+@router.get("/stats")
+def live_stats():
+    return {**live_bus.stats(), "latest_store": latest_store.stats()}
+
+
+@router.websocket("/ws")
+async def live_ws(websocket: WebSocket):
+    await websocket.accept()
+
+    try:
+        flt = _parse_filter(dict(websocket.query_params))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+
+    # Warm-up antes de suscribir, para no recibir el sync inicial como novedades.
+    await run_in_threadpool(latest_store.ensure_warm)
+    sub = live_bus.subscribe(flt)
+
+    async def send_snapshot():
+        items = await run_in_threadpool(_snapshot, sub.filter)
+        await websocket.send_json(jsonable_encoder({"type": "snapshot", "items": items}))
+
+    async def reader():
+        # Mensajes del cliente: cambiar la suscripción.
+        while True:
+            msg = await websocket.receive_json()
+            if not isinstance(msg, dict) or msg.get("action") != "subscribe":
+                continue
+            try:
+                sub.filter = _parse_filter(msg)
+            except (ValueError, TypeError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            # Vaciar lo encolado con el filtro viejo.
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            await send_snapshot()
+
+    reader_task = asyncio.create_task(reader())
+
+    try:
+        await send_snapshot()
+
+        while True:
+            get_task = asyncio.create_task(sub.queue.get())
+            done, _ = await asyncio.wait({get_task, reader_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if reader_task in done:
+                get_task.cancel()
+                reader_task.result()  # propaga WebSocketDisconnect
+                break
+
+            ev = get_task.result()
+
+            if sub.lagged:
+                # Se perdieron eventos: avisar y que el cliente use el snapshot nuevo.
+                dropped = sub.dropped
+                sub.lagged = False
+                sub.dropped = 0
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                await websocket.send_json({"type": "resync", "dropped": dropped})
+                await send_snapshot()
+                continue
+
+            await websocket.send_json(jsonable_encoder(ev))
+
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        log.exception("live ws: error")
+    finally:
+        live_bus.unsubscribe(sub)
+        reader_task.cancel()
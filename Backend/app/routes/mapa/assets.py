@@ -8,6 +8,7 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 
 from app.db import get_conn
+from app.services.response_cache import cached_response, invalidate_cache, notify_cache_invalidated
 
 
 router = APIRouter(prefix="/assets", tags=["mapa"])
@@ -228,6 +229,7 @@ def list_live_assets(
 # Resumen de activos por tipo/estado
 # ============================================================
 @router.get("/stats")
+@cached_response("mapa_assets_stats", ttl=30)
 def get_assets_stats():
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute(
@@ -355,7 +357,9 @@ def update_asset(asset_link_id: str, body: AssetUpdateBody):
         )
         asset = _fetchone_dict(cur)
 
+        notify_cache_invalidated(cur, "mapa_assets_stats")
         conn.commit()
+        invalidate_cache("mapa_assets_stats")
 
     return asset
 
@@ -465,7 +469,9 @@ def link_asset_to_map(asset_link_id: str, body: AssetLinkBody):
         )
         asset = _fetchone_dict(cur)
 
+        notify_cache_invalidated(cur, "mapa_assets_stats")
         conn.commit()
+        invalidate_cache("mapa_assets_stats")
 
     if not asset:
         raise HTTPException(
@@ -507,6 +513,8 @@ def unlink_asset_from_map(asset_link_id: str):
         )
         asset = _fetchone_dict(cur)
 
+        notify_cache_invalidated(cur, "mapa_assets_stats")
         conn.commit()
+        invalidate_cache("mapa_assets_stats")
 
     return asset
\ No newline at end of file
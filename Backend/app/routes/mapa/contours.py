@@ -5,17 +5,14 @@ import json
 from typing import Any, Optional
 
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
 
 from app.db import get_conn
 
-
-router = APIRouter(prefix="/contours", tags=["mapa"])
+from .geojson_stream import stream_feature_collection
+from .sim.network import bump_network_version
 
 
-def _fetchall_dict(cur):
-    cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, row)) for row in cur.fetchall()]
+router = APIRouter(prefix="/contours", tags=["mapa"])
 
 
 def _fetchone_dict(cur):
@@ -69,31 +66,13 @@ def _extract_elev_m(props: dict[str, Any]) -> Optional[float]:
     return None
 
 
-def _feature_from_row(row: dict[str, Any]) -> dict[str, Any]:
-    geom = row.get("geometry")
-
-    if isinstance(geom, str):
-        geom = json.loads(geom)
-
-    return {
-        "type": "Feature",
-        "id": row["id"],
-        "properties": {
-            "id": row["id"],
-            "elev_m": row["elev_m"],
-            "props": row.get("props") or {},
-        },
-        "geometry": geom,
-    }
-
-
 # ============================================================
 # GET /mapa/contours/debug
 # Diagnóstico rápido
 # ============================================================
 @router.get("/debug")
 def contours_debug():
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_conn("analytics") as conn, conn.cursor() as cur:
         cur.execute(
             """
             SELECT
@@ -143,12 +122,16 @@ def list_contours(
 
     where_sql = f"WHERE {' AND '.join(where)}" if where else ""
 
+    # Cada parte sale ya como texto JSON: se concatena sin json.loads/dumps.
     sql = f"""
         SELECT
-            id::text AS id,
-            elev_m::double precision AS elev_m,
-            props,
-            infraestructura.st_asgeojson(geom) AS geometry
+            to_json(id::text)::text AS id_json,
+            json_build_object(
+                'id', id::text,
+                'elev_m', elev_m::double precision,
+                'props', coalesce(props::jsonb, '{{}}'::jsonb)
+            )::text AS properties_json,
+            infraestructura.st_asgeojson(geom) AS geometry_json
         FROM "MapasAgua".contours
         {where_sql}
         ORDER BY elev_m, id
@@ -157,18 +140,7 @@ def list_contours(
 
     params.append(limit)
 
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql, params)
-        rows = _fetchall_dict(cur)
-
-    features = [_feature_from_row(r) for r in rows]
-
-    return JSONResponse(
-        {
-            "type": "FeatureCollection",
-            "features": features,
-        }
-    )
+    return stream_feature_collection(sql, params)
 
 
 # ============================================================
@@ -206,7 +178,7 @@ def sample_nearest_contour(
         LIMIT 1
     """
 
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_conn("analytics") as conn, conn.cursor() as cur:
         cur.execute(sql, (lng, lat, max_distance_m))
         row = _fetchone_dict(cur)
 
@@ -304,7 +276,7 @@ def import_contours_geojson(body: dict[str, Any]):
 
     inserted = 0
 
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_conn("analytics") as conn, conn.cursor() as cur:
         for elev_m, geom_json, props_json in rows_to_insert:
             cur.execute(
                 """
@@ -392,7 +364,7 @@ def fill_node_elevations(
             FROM nearest
         """
 
-        with get_conn() as conn, conn.cursor() as cur:
+        with get_conn("analytics") as conn, conn.cursor() as cur:
             cur.execute(sql, (max_distance_m,))
             row = _fetchone_dict(cur)
 
@@ -432,10 +404,11 @@ def fill_node_elevations(
         FROM upd
     """
 
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_conn("analytics") as conn, conn.cursor() as cur:
         cur.execute(sql, (max_distance_m,))
         row = _fetchone_dict(cur)
         conn.commit()
+        bump_network_version()
 
     return {
         "preview": False,
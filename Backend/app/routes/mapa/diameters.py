@@ -3,6 +3,7 @@ from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException, Query
 from app.db import get_conn
+from app.services.response_cache import cached_response
 
 router = APIRouter(prefix="/diameters", tags=["mapa-diameters"])
 
@@ -20,6 +21,7 @@ def _safe_rollback(conn):
 
 
 @router.get("/transitions")
+@cached_response("mapa_diameter_transitions", ttl=300)
 def get_diameter_transitions(
     min_delta_mm: float = Query(20, ge=0),
     min_ratio: float = Query(1.10, ge=1),
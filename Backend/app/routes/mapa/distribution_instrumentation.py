@@ -11,6 +11,8 @@ from pydantic import BaseModel, Field
 
 from app.db import get_conn
 
+from .sim.network import bump_network_version
+
 
 # IMPORTANTE:
 # Este router se incluye desde app/routes/mapa/__init__.py
@@ -948,6 +950,7 @@ def create_instrumentation_point(body: CreateInstrumentationPointIn):
         try:
             item = _create_meter(cur, body)
             conn.commit()
+            bump_network_version()
 
         except HTTPException:
             _safe_rollback(conn)
@@ -999,6 +1002,7 @@ def insert_instrumentation_on_pipe(body: InsertOnPipeIn):
         try:
             item = _create_meter(cur, payload)
             conn.commit()
+            bump_network_version()
 
         except HTTPException:
             _safe_rollback(conn)
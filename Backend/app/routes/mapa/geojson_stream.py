@@ -0,0 +1,81 @@
+# app/routes/mapa/geojson_stream.py
+"""
+FeatureCollection en streaming, sin re-parsear la geometría.
+
+Antes cada capa hacía: st_asgeojson (texto) -> json.loads -> dict ->
+JSONResponse (json.dumps otra vez), todo en memoria. Acá el SELECT ya
+devuelve cada pedazo como texto JSON y solo se concatena:
+
+    select
+      <id como JSON>          -- ej: to_json(id::text)::text
+      <properties como JSON>  -- ej: json_build_object(...)::text
+      <geometry como JSON>    -- ej: infraestructura.st_asgeojson(geom)
+
+Las filas se leen con un cursor del lado del servidor (de a
+GEOJSON_FETCH_ROWS) y se mandan por StreamingResponse: la memoria queda
+constante aunque la capa tenga 50k features.
+
+Ojo: la query se ejecuta recién cuando arranca el stream, así que un
+error de SQL corta la respuesta en vez de devolver un 500 prolijo.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterator, Sequence
+import uuid
+
+from fastapi.responses import StreamingResponse
+
+from app.db import get_conn
+
+
+GEOJSON_FETCH_ROWS = 2000
+
+_HEAD = b'{"type":"FeatureCollection","features":['
+_TAIL = b"]}"
+
+
+def iter_feature_collection(sql: str, params: Sequence[Any] | None = None) -> Iterator[bytes]:
+    """
+    Chunks de bytes del FeatureCollection. Las filas con geometría NULL
+    se saltean (igual que antes).
+    """
+    yield _HEAD
+
+    first = True
+
+    with get_conn("analytics") as conn:
+        # Cursor con nombre = cursor del servidor (DECLARE ... / FETCH n).
+        with conn.cursor(name=f"geojson_{uuid.uuid4().hex}") as cur:
+            cur.itersize = GEOJSON_FETCH_ROWS
+            cur.execute(sql, params)
+
+            while True:
+                rows = cur.fetchmany(GEOJSON_FETCH_ROWS)
+
+                if not rows:
+                    break
+
+                parts = [
+                    f'{{"type":"Feature","id":{fid},"properties":{props},"geometry":{geom}}}'
+                    for fid, props, geom in rows
+                    if geom
+                ]
+
+                if not parts:
+                    continue
+
+                chunk = ",".join(parts)
+                yield (chunk if first else "," + chunk).encode("utf-8")
+                first = False
+
+        # Solo lectura: cerrar la transacción del cursor.
+        conn.rollback()
+
+    yield _TAIL
+
+
+def stream_feature_collection(sql: str, params: Sequence[Any] | None = None) -> StreamingResponse:
+    return StreamingResponse(
+        iter_feature_collection(sql, params),
+        media_type="application/json",
+    )
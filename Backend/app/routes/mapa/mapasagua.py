@@ -1,11 +1,22 @@
+import hashlib
 import json
 from typing import Any
 
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Query, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
 from psycopg.types.json import Json
 
 from app.db import get_conn
+from app.services.response_cache import (
+    cached_response,
+    etag_matches,
+    invalidate_cache,
+    notify_cache_invalidated,
+)
+
+from .geojson_stream import stream_feature_collection
+from .sim.network import bump_network_version
+from .tile_cache import PIPES_CACHE_NAMES, invalidate_pipe_tiles, tile_cache
 
 router = APIRouter(prefix="/mapasagua", tags=["mapasagua"])
 
@@ -85,6 +96,37 @@ def _pipe_select_sql(where: str = "") -> str:
     """
 
 
+def _pipe_stream_sql(where: str = "") -> str:
+    """
+    Igual que _pipe_select_sql + _feature_from_row, pero cada parte sale
+    de la base ya como texto JSON (ver geojson_stream.py).
+    """
+    return f"""
+      select
+        to_json(p.id::text)::text as id_json,
+        json_build_object(
+          'id', p.id::text,
+          'diametro_mm', p.diametro_mm,
+          'material', p.material,
+          'type', p.type,
+          'estado', p.estado,
+          'flow_func', p.flow_func,
+          'style', coalesce(p.style::jsonb, '{{}}'::jsonb),
+          'props', coalesce(p.props::jsonb, '{{}}'::jsonb),
+          'active', coalesce(p.active, true),
+          'from_node', p.from_node::text,
+          'to_node', p.to_node::text,
+          'connected', coalesce(p.from_node is not null and p.to_node is not null and p.from_node <> p.to_node, false),
+          'length_m', coalesce(p.length_m, infraestructura.st_length(p.geom::geography))::double precision,
+          'roughness', p.roughness::double precision,
+          'is_open', coalesce(p.is_open, true)
+        )::text as properties_json,
+        infraestructura.st_asgeojson(p.geom) as geometry_json
+      from "MapasAgua".pipes p
+      {where}
+    """
+
+
 def _as_float(value: Any, default: float) -> float:
     try:
         if value is None:
@@ -598,19 +640,7 @@ def get_pipes(
         """
         params.extend([min_lng, min_lat, max_lng, max_lat])
 
-    sql = _pipe_select_sql(where)
-
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-
-    features = []
-    for row in rows:
-        feat = _feature_from_row(row)
-        if feat:
-            features.append(feat)
-
-    return JSONResponse({"type": "FeatureCollection", "features": features})
+    return stream_feature_collection(_pipe_stream_sql(where), params)
 
 
 # ============================================================
@@ -618,6 +648,7 @@ def get_pipes(
 # /mapa/mapasagua/pipes/extent
 # ============================================================
 @router.get("/pipes/extent")
+@cached_response("mapa_pipes_extent", ttl=300)
 def pipes_extent():
     sql = """
       select
@@ -649,6 +680,114 @@ def pipes_extent():
     }
 
 
+# ============================================================
+# GET vector tiles (MVT) de cañerías
+# /mapa/mapasagua/tiles/{z}/{x}/{y}.mvt
+# ============================================================
+MVT_LAYER = "pipes"
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MVT_MAX_ZOOM = 22
+# Desde este zoom la geometría va sin simplificar.
+MVT_FULL_DETAIL_ZOOM = 16
+WEB_MERCATOR_SIZE_M = 40075016.68557849
+
+# (zoom máximo, diámetro mínimo en mm): en zoom bajo solo troncales.
+# Las cañerías sin diametro_mm aparecen recién cuando no hay filtro.
+MVT_MIN_DIAM_BY_ZOOM = ((10, 200.0), (12, 110.0), (13, 75.0))
+
+_MVT_SQL = """
+  with bounds as (
+    select infraestructura.st_tileenvelope(%(z)s, %(x)s, %(y)s) as env
+  ),
+  tile as (
+    select
+      infraestructura.st_asmvtgeom(
+        case
+          when %(tol)s > 0
+            then infraestructura.st_simplify(infraestructura.st_transform(p.geom, 3857), %(tol)s, true)
+          else infraestructura.st_transform(p.geom, 3857)
+        end,
+        b.env,
+        %(extent)s,
+        %(buffer)s,
+        true
+      ) as geom,
+      p.id::text as id,
+      p.diametro_mm,
+      p.material,
+      p.type,
+      p.estado,
+      p.flow_func,
+      coalesce(p.active, true) as active,
+      coalesce(p.is_open, true) as is_open,
+      p.from_node::text as from_node,
+      p.to_node::text as to_node
+    from "MapasAgua".pipes p, bounds b
+    where p.geom is not null
+      and p.geom && infraestructura.st_transform(b.env, 4326)
+      and (%(min_diam)s <= 0 or coalesce(p.diametro_mm, 0) >= %(min_diam)s)
+  )
+  select infraestructura.st_asmvt(tile.*, %(layer)s, %(extent)s, 'geom')
+  from tile
+  where tile.geom is not null
+"""
+
+
+def _mvt_min_diam(z: int) -> float:
+    for max_zoom, min_diam in MVT_MIN_DIAM_BY_ZOOM:
+        if z <= max_zoom:
+            return min_diam
+    return 0.0
+
+
+def _mvt_tolerance_m(z: int) -> float:
+    """Una unidad de tile (1/4096 del ancho) en metros Web Mercator."""
+    if z >= MVT_FULL_DETAIL_ZOOM:
+        return 0.0
+    return WEB_MERCATOR_SIZE_M / (2 ** z) / MVT_EXTENT
+
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_pipes_tile(z: int, x: int, y: int, request: Request):
+    if not (0 <= z <= MVT_MAX_ZOOM) or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Tile fuera de rango")
+
+    gen = tile_cache.generation()
+    headers = {"Cache-Control": "no-cache"}
+    data = tile_cache.get(gen, MVT_LAYER, z, x, y)
+
+    if data is None:
+        params = {
+            "z": z,
+            "x": x,
+            "y": y,
+            "tol": _mvt_tolerance_m(z),
+            "min_diam": _mvt_min_diam(z),
+            "extent": MVT_EXTENT,
+            "buffer": MVT_BUFFER,
+            "layer": MVT_LAYER,
+        }
+
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(_MVT_SQL, params)
+            row = cur.fetchone()
+
+        data = bytes(row[0]) if row and row[0] is not None else b""
+        tile_cache.put(gen, MVT_LAYER, z, x, y, data)
+        headers["X-Cache"] = "MISS"
+    else:
+        headers["X-Cache"] = "HIT"
+
+    # ETag por contenido: la generación vive en disco local y puede volver
+    # a 0 (reinicio, otro host), así que no sirve para revalidar.
+    headers["ETag"] = f'"{hashlib.sha1(data).hexdigest()}"'
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=data, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+
 # ============================================================
 # GET pipe por ID
 # /mapa/mapasagua/pipes/{pipe_id}
@@ -761,7 +900,11 @@ def patch_pipe(pipe_id: str, body: dict[str, Any]):
         if not row:
             raise HTTPException(status_code=404, detail="Pipe not found")
 
+        notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
         conn.commit()
+        bump_network_version()
+        invalidate_pipe_tiles()
+        invalidate_cache(*PIPES_CACHE_NAMES)
 
     feat = _feature_from_row(row)
     if not feat:
@@ -829,7 +972,11 @@ def connect_pipe_mapasagua(pipe_id: str, body: dict[str, Any]):
         if not row:
             raise HTTPException(status_code=404, detail="Pipe not found")
 
+        notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
         conn.commit()
+        bump_network_version()
+        invalidate_pipe_tiles()
+        invalidate_cache(*PIPES_CACHE_NAMES)
 
     return {
         "ok": True,
@@ -904,7 +1051,11 @@ def patch_pipe_geometry(pipe_id: str, body: dict[str, Any]):
         if not row:
             raise HTTPException(status_code=404, detail="Pipe not found")
 
+        notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
         conn.commit()
+        bump_network_version()
+        invalidate_pipe_tiles()
+        invalidate_cache(*PIPES_CACHE_NAMES)
 
     feat = _feature_from_row(row)
     if not feat:
@@ -1041,7 +1192,11 @@ def create_pipe(body: dict[str, Any]):
         )
 
         row = cur.fetchone()
+        notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
         conn.commit()
+        bump_network_version()
+        invalidate_pipe_tiles()
+        invalidate_cache(*PIPES_CACHE_NAMES)
 
     feat = _feature_from_row(row)
 
@@ -1210,7 +1365,11 @@ def connect_intersection(body: dict[str, Any]):
             )
             original_inactivated.append(old_id)
 
+        notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
         conn.commit()
+        bump_network_version()
+        invalidate_pipe_tiles()
+        invalidate_cache(*PIPES_CACHE_NAMES)
 
     return JSONResponse(
         {
@@ -1260,6 +1419,10 @@ def delete_pipe(pipe_id: str):
         if not row:
             raise HTTPException(status_code=404, detail="Pipe not found")
 
+        notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
         conn.commit()
+        bump_network_version()
+        invalidate_pipe_tiles()
+        invalidate_cache(*PIPES_CACHE_NAMES)
 
     return JSONResponse({"ok": True, "deleted_id": row[0]})
\ No newline at end of file
@@ -9,6 +9,8 @@ from pydantic import BaseModel, Field
 
 from app.db import get_conn
 
+from .sim.network import bump_network_version
+
 
 router = APIRouter(prefix="/nodes", tags=["mapa"])
 
@@ -181,6 +183,7 @@ def create_node(body: NodeCreateBody):
         node = _fetchone_dict(cur)
 
         conn.commit()
+        bump_network_version()
 
     if not node:
         raise HTTPException(
@@ -294,6 +297,7 @@ def update_node(node_id: str, body: NodeUpdateBody):
         node = _fetchone_dict(cur)
 
         conn.commit()
+        bump_network_version()
 
     if not node:
         raise HTTPException(
@@ -363,6 +367,7 @@ def delete_node(node_id: str):
             raise HTTPException(status_code=404, detail="Nodo no encontrado")
 
         conn.commit()
+        bump_network_version()
 
     return {
         "ok": True,
@@ -475,6 +480,7 @@ def upsert_source(body: SourceUpsertBody):
         source = _fetchone_dict(cur)
 
         conn.commit()
+        bump_network_version()
 
     return {
         "ok": True,
@@ -6,6 +6,9 @@ from fastapi import APIRouter
 from .endpoints.debug import router as debug_router
 from .endpoints.run import router as run_router
 from .endpoints.connect import router as connect_router
+from .endpoints.whatif import router as whatif_router
+from .endpoints.batch import router as batch_router
+from .endpoints.ids import router as ids_router
 
 router = APIRouter()
 
@@ -13,9 +16,15 @@ router = APIRouter()
 # GET   /mapa/sim/debug_sources
 # GET   /mapa/sim/debug_network
 # POST  /mapa/sim/run
+# GET   /mapa/sim/ids
+# POST  /mapa/sim/whatif
+# POST  /mapa/sim/batch
 # PATCH /mapa/pipes/{pipe_id}/connect
 router.include_router(debug_router)
 router.include_router(run_router)
 router.include_router(connect_router)
+router.include_router(whatif_router)
+router.include_router(batch_router)
+router.include_router(ids_router)
 
 __all__ = ["router"]
@@ -0,0 +1,232 @@
+# app/routes/mapa/sim/batch.py
+"""
+Puente entre la red cacheada (NetworkModel, ids UUID) y el runner por
+lotes de app.services.sim_batch (todo por índice, en memoria compartida).
+
+Lo usan POST /mapa/sim/batch y la CLI `python -m app.services.sim_batch`.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Tuple
+import os
+import time
+
+import numpy as np
+
+from app.db import get_conn
+from app.services.sim_batch import BATCH_MODELS, batch_slot, run_batch
+
+from .models import SimBatchRequest, SimScenario
+from .network import NetworkModel, get_network
+from .repositories import read_demands, read_live_sources
+from .utils import safe_float, safe_rollback
+
+
+BATCH_MAX_SCENARIOS = 2000
+BATCH_MAX_WORKERS = 8
+
+
+def load_batch_inputs(body: SimBatchRequest) -> Tuple[NetworkModel, List[dict[str, Any]], Dict[str, float]]:
+    """Red (cacheada), fuentes vivas y demandas (solo GGA)."""
+    model = str(body.options.model or "SIMPLE").upper()
+    demands: Dict[str, float] = {}
+
+    with get_conn("analytics") as conn, conn.cursor() as cur:
+        try:
+            net = get_network(cur, conn, default_diam_mm=body.options.default_diam_mm)
+            sources = read_live_sources(cur)
+
+            if model == "GGA" and body.options.use_demands:
+                demands = read_demands(cur)
+        except Exception:
+            safe_rollback(conn)
+            raise
+
+    return net, sources, demands
+
+
+def batch_arrays(net: NetworkModel, demands: Dict[str, float]) -> Dict[str, np.ndarray]:
+    """Arrays numéricos que se publican en memoria compartida."""
+    n = len(net.node_ids)
+
+    node_valve_closed = np.zeros(n, dtype=bool)
+    for nid, is_open in net.valve_node_open.items():
+        i = net.node_index.get(nid)
+        if i is not None and is_open is False:
+            node_valve_closed[i] = True
+
+    pipe_valve_closed = np.zeros(len(net.pipe_ids), dtype=bool)
+    for pid, is_open in net.valve_pipe_open.items():
+        k = net.pipe_index.get(pid)
+        if k is not None and is_open is False:
+            pipe_valve_closed[k] = True
+
+    node_demand = np.zeros(n, dtype=np.float64)
+    for nid, q in demands.items():
+        i = net.node_index.get(nid)
+        if i is not None:
+            node_demand[i] += float(q or 0.0)
+
+    return {
+        "node_elev": net.node_elev,
+        "node_valve_closed": node_valve_closed,
+        "node_demand_lps": node_demand,
+        "pipe_u": net.pipe_u,
+        "pipe_v": net.pipe_v,
+        "pipe_length": net.pipe_length,
+        "pipe_diam": net.pipe_diam,
+        "pipe_roughness": net.pipe_roughness,
+        "pipe_is_open": net.pipe_is_open,
+        "pipe_valve_closed": pipe_valve_closed,
+    }
+
+
+def _source_list(
+    net: NetworkModel,
+    sources: List[dict[str, Any]],
+    off: set[str],
+    heads: Dict[str, float],
+) -> List[Tuple[int, float]]:
+    out: List[Tuple[int, float]] = []
+
+    for s in sources:
+        sid = s.get("id")
+        nid = s.get("node_id")
+
+        if sid in off or nid in off:
+            continue
+
+        i = net.node_index.get(nid) if nid else None
+        h = heads.get(sid, heads.get(nid, safe_float(s.get("head_m"))))
+
+        if i is None or h is None:
+            continue
+
+        out.append((i, float(h)))
+
+    return out
+
+
+def scenario_task(net: NetworkModel, sources: List[dict[str, Any]], index: int, sc: SimScenario) -> Tuple[Dict[str, Any], List[dict[str, Any]]]:
+    """Escenario por índices + overrides que no matchean con la red."""
+    task: Dict[str, Any] = {
+        "index": index,
+        "name": sc.name or f"scenario_{index}",
+        "pipes_open": [],
+        "pipes_closed": [],
+        "nodes_open": [],
+        "nodes_closed": [],
+        "sources": None,
+    }
+    ignored: List[dict[str, Any]] = []
+
+    for o in sc.overrides:
+        if o.pipe_id and o.pipe_id in net.pipe_index:
+            task["pipes_open" if o.is_open else "pipes_closed"].append(net.pipe_index[o.pipe_id])
+        elif o.node_id and o.node_id in net.node_index:
+            task["nodes_open" if o.is_open else "nodes_closed"].append(net.node_index[o.node_id])
+        else:
+            ignored.append(o.model_dump())
+
+    if sc.sources_off or sc.source_heads:
+        task["sources"] = _source_list(net, sources, set(sc.sources_off), sc.source_heads)
+
+    return task, ignored
+
+
+def batch_workers(body: SimBatchRequest) -> int:
+    if body.workers is not None:
+        return max(1, min(int(body.workers), BATCH_MAX_WORKERS))
+    return max(1, min(len(body.scenarios), os.cpu_count() or 1, BATCH_MAX_WORKERS))
+
+
+def iter_batch(
+    net: NetworkModel,
+    sources: List[dict[str, Any]],
+    demands: Dict[str, float],
+    body: SimBatchRequest,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Ocupa un lugar de batch_slot() mientras dura el lote: el primer next()
+    levanta BatchBusy si no hay lugar (antes de la línea "start").
+    """
+    with batch_slot():
+        yield from _iter_batch(net, sources, demands, body)
+
+
+def _iter_batch(
+    net: NetworkModel,
+    sources: List[dict[str, Any]],
+    demands: Dict[str, float],
+    body: SimBatchRequest,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Líneas NDJSON (como dicts):
+      {"type": "start", ...}
+      {"type": "scenario", "index": i, "name": ..., ...}   una por escenario, en orden de llegada
+      {"type": "end", ...}
+    """
+    t0 = time.perf_counter()
+    model = str(body.options.model or "SIMPLE").upper()
+    workers = batch_workers(body)
+
+    tasks: List[Dict[str, Any]] = []
+    ignored: Dict[int, List[dict[str, Any]]] = {}
+
+    for i, sc in enumerate(body.scenarios):
+        task, bad = scenario_task(net, sources, i, sc)
+        tasks.append(task)
+        if bad:
+            ignored[i] = bad
+
+    yield {
+        "type": "start",
+        "model": model,
+        "scenarios": len(tasks),
+        "workers": workers,
+        "network_version": net.version,
+        "nodes": len(net.node_ids),
+        "pipes": len(net.pipe_ids),
+    }
+
+    ok = 0
+    failed = 0
+    options = {**body.options.model_dump(), "model": model}
+    base_sources = _source_list(net, sources, set(), {})
+
+    for r in run_batch(batch_arrays(net, demands), base_sources, tasks, options, workers=workers):
+        if r.get("ok"):
+            ok += 1
+            r["nodes_lost_sample"] = [net.node_ids[i] for i in r["nodes_lost_sample"]]
+            r["worst_nodes"] = [
+                {"node_id": net.node_ids[i], "pressure_mca": p}
+                for i, p in r["worst_nodes"]
+            ]
+        else:
+            failed += 1
+
+        r["overrides_ignored"] = ignored.get(r.get("index"), [])
+        yield {"type": "scenario", **r}
+
+    yield {
+        "type": "end",
+        "ok": ok,
+        "failed": failed,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+    }
+
+
+def validate_batch(body: SimBatchRequest) -> str | None:
+    """Mensaje de error o None."""
+    model = str(body.options.model or "SIMPLE").upper()
+
+    if model not in BATCH_MODELS:
+        return f"Modelo desconocido: {body.options.model}. Usar {' / '.join(BATCH_MODELS)}."
+
+    if not body.scenarios:
+        return "scenarios vacío."
+
+    if len(body.scenarios) > BATCH_MAX_SCENARIOS:
+        return f"Máximo {BATCH_MAX_SCENARIOS} escenarios por lote."
+
+    return None
@@ -0,0 +1,164 @@
+# app/routes/mapa/sim/columnar.py
+"""
+Salida columnar (binaria) de /mapa/sim/run.
+
+El JSON normal repite UUIDs y dicts anidados por nodo/cañería: varios MB
+por corrida. En modo columnar se manda:
+
+  1) GET /mapa/sim/ids (una vez, cacheable por ETag):
+       {"etag": ..., "nodes": [node_id...], "pipes": [pipe_id...]}
+  2) POST /mapa/sim/run?format=columnar
+     (o Accept: application/vnd.dirac.sim-columnar):
+       arrays tipados en el mismo orden que la tabla de ids.
+
+Formato (little-endian, todo alineado a 4 bytes):
+
+  offset  tipo                 campo
+  0       4s                   magic "DSIM"
+  4       u16                  versión de formato (1)
+  6       u16                  reservado (0)
+  8       u32                  N = cantidad de nodos
+  12      u32                  P = cantidad de cañerías
+  16      u32                  M = largo del JSON de header (utf-8)
+  20      M bytes + padding    header JSON: model, run_id, ids_etag, sources, meta
+  ...     float32[N]           head_m        (NaN = no alcanzado)
+          float32[N]           pressure_mca  (NaN = sin cota o no alcanzado)
+          float32[P]           q_lps, signo from_node -> to_node (NaN = fuera del grafo)
+          uint8[N]             flags de nodo: 1 reached, 2 blocked, 4 is_source, 8 valve_closed
+          uint8[P]             flags de cañería: 1 en la corrida, 2 blocked, 4 valve_closed
+
+pressure_bar = pressure_mca / 10.197162129779 (se calcula en el front).
+El header trae ids_etag: si no coincide con el "etag" del body de
+/mapa/sim/ids cacheado, volver a pedirlo. (El header HTTP ETag es el
+mismo valor entre comillas.)
+"""
+from __future__ import annotations
+
+from typing import Any, Dict
+import hashlib
+import json
+import math
+import struct
+
+import numpy as np
+from fastapi import Request
+
+from .network import NetworkModel
+
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.dirac.sim-columnar"
+COLUMNAR_MAGIC = b"DSIM"
+COLUMNAR_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIII")
+
+NODE_REACHED = 1
+NODE_BLOCKED = 2
+NODE_IS_SOURCE = 4
+NODE_VALVE_CLOSED = 8
+
+PIPE_IN_RUN = 1
+PIPE_BLOCKED = 2
+PIPE_VALVE_CLOSED = 4
+
+
+def wants_columnar(request: Request, fmt: str | None) -> bool:
+    if fmt:
+        return fmt.lower() in {"columnar", "bin", "binary"}
+    return COLUMNAR_MEDIA_TYPE in (request.headers.get("accept") or "")
+
+
+def ids_etag(net: NetworkModel) -> str:
+    """
+    ETag de la tabla de ids. Depende solo de los ids y su orden, no del
+    estado de válvulas: sobrevive a los bumps que no agregan/quitan nodos.
+    """
+    etag = net.ids_etag
+
+    if etag is None:
+        h = hashlib.sha1()
+        for nid in net.node_ids[:net.node_count]:
+            h.update(nid.encode("utf-8"))
+            h.update(b"\n")
+        h.update(b"\x00")
+        for pid in net.pipe_ids:
+            h.update(pid.encode("utf-8"))
+            h.update(b"\n")
+        etag = h.hexdigest()
+        net.ids_etag = etag
+
+    return etag
+
+
+def ids_table(net: NetworkModel) -> Dict[str, Any]:
+    return {
+        "etag": ids_etag(net),
+        "network_version": net.version,
+        "nodes": net.node_ids[:net.node_count],
+        "pipes": net.pipe_ids,
+    }
+
+
+def _jsonable(v: Any) -> Any:
+    if isinstance(v, float) and not math.isfinite(v):
+        return None
+    return str(v)
+
+
+def encode_run_columnar(
+    net: NetworkModel,
+    header: Dict[str, Any],
+    head: Dict[str, float],
+    flows: Dict[str, float],
+    pipe_out: Dict[str, Any],
+    blocked: set[str],
+    sources: set[str],
+    valve_node_open: Dict[str, bool],
+) -> bytes:
+    """
+    head: node_id -> head_m (solo alcanzados)
+    flows: pipe_id -> q_lps con signo from_node -> to_node
+    pipe_out: salida por cañería de la corrida (para blocked / valve_closed)
+    """
+    n = net.node_count
+    node_ids = net.node_ids[:n]
+
+    heads = np.fromiter((head.get(nid, math.nan) for nid in node_ids), dtype=np.float64, count=n)
+    pressure = heads - net.node_elev[:n]
+
+    node_flags = np.zeros(n, dtype=np.uint8)
+    node_flags[np.isfinite(heads)] |= NODE_REACHED
+    for i, nid in enumerate(node_ids):
+        if nid in blocked:
+            node_flags[i] |= NODE_BLOCKED
+        if nid in sources:
+            node_flags[i] |= NODE_IS_SOURCE
+        if valve_node_open.get(nid) is False:
+            node_flags[i] |= NODE_VALVE_CLOSED
+
+    p = len(net.pipe_ids)
+    q = np.full(p, math.nan, dtype=np.float32)
+    pipe_flags = np.zeros(p, dtype=np.uint8)
+
+    for pid, po in pipe_out.items():
+        k = net.pipe_index[pid]
+        q[k] = flows.get(pid, 0.0)
+        pipe_flags[k] = (
+            PIPE_IN_RUN
+            | (PIPE_BLOCKED if po.get("blocked") else 0)
+            | (PIPE_VALVE_CLOSED if po.get("valve_closed") else 0)
+        )
+
+    meta = json.dumps(header, ensure_ascii=False, separators=(",", ":"), default=_jsonable).encode("utf-8")
+    pad = (-(_HEADER.size + len(meta))) % 4
+
+    return b"".join((
+        _HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, 0, n, p, len(meta)),
+        meta,
+        b" " * pad,
+        heads.astype("<f4").tobytes(),
+        pressure.astype("<f4").tobytes(),
+        q.astype("<f4").tobytes(),
+        node_flags.tobytes(),
+        pipe_flags.tobytes(),
+    ))
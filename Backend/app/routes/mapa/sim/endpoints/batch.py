@@ -0,0 +1,61 @@
+# app/routes/mapa/sim/endpoints/batch.py
+from __future__ import annotations
+
+import itertools
+import json
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.services.sim_batch import BatchBusy
+
+from ..batch import iter_batch, load_batch_inputs, validate_batch
+from ..models import SimBatchRequest
+
+router = APIRouter()
+
+
+# ============================================================
+# Batch de escenarios
+# POST /mapa/sim/batch
+# ============================================================
+
+@router.post("/sim/batch")
+def sim_batch(body: SimBatchRequest):
+    """
+    Corre N escenarios ("qué pasa si...") sobre la misma red y devuelve un
+    resumen por escenario en NDJSON, a medida que van terminando.
+
+    Cada escenario puede:
+    - abrir/cerrar cañerías o nodos con válvula (overrides)
+    - sacar fuentes de servicio (sources_off: source id o node_id)
+    - forzar el head de una fuente (source_heads)
+
+    options.model: SIMPLE (propagación) | LINEAR | GGA.
+    La red va a los workers por memoria compartida; se resuelve en paralelo
+    con un pool de procesos. Con SIM_BATCH_MAX_RUNNING lotes ya corriendo
+    responde 503.
+    """
+    error = validate_batch(body)
+
+    if error:
+        raise HTTPException(400, error)
+
+    try:
+        net, sources, demands = load_batch_inputs(body)
+    except Exception as e:
+        raise HTTPException(500, f"Error leyendo red/sources: {e}")
+
+    if not sources:
+        raise HTTPException(400, 'No hay fuentes hidráulicas en "MapasAgua"."v_sim_sources_live".')
+
+    items = iter_batch(net, sources, demands, body)
+
+    # La línea "start" se pide acá: si no hay lugar para otro lote, 503 en vez de cortar el stream.
+    try:
+        first = next(items)
+    except BatchBusy as e:
+        raise HTTPException(503, str(e))
+
+    lines = (json.dumps(item, ensure_ascii=False) + "\n" for item in itertools.chain([first], items))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
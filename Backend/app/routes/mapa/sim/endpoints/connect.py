@@ -4,8 +4,11 @@ from __future__ import annotations
 from fastapi import APIRouter, HTTPException
 
 from app.db import get_conn
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
 
 from ..models import ConnectPipeBody
+from ...tile_cache import PIPES_CACHE_NAMES, invalidate_pipe_tiles
+from ..network import bump_network_version
 from ..utils import safe_rollback
 
 router = APIRouter()
@@ -75,7 +78,11 @@ def connect_pipe(pipe_id: str, body: ConnectPipeBody):
             if not row:
                 raise HTTPException(404, "Pipe no encontrado")
 
+            notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
             conn.commit()
+            bump_network_version()
+            invalidate_pipe_tiles()
+            invalidate_cache(*PIPES_CACHE_NAMES)
 
         except HTTPException:
             safe_rollback(conn)
@@ -0,0 +1,50 @@
+# app/routes/mapa/sim/endpoints/ids.py
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.db import get_conn
+from app.services.response_cache import etag_matches
+
+from ..columnar import ids_table
+from ..network import get_network
+from ..utils import safe_rollback
+
+router = APIRouter()
+
+
+# ============================================================
+# Tabla de ids para la salida columnar
+# GET /mapa/sim/ids
+# ============================================================
+
+@router.get("/sim/ids")
+def sim_ids(request: Request, response: Response, default_diam_mm: float = 75.0):
+    """
+    Orden de nodos y cañerías de los arrays de /mapa/sim/run?format=columnar.
+    Cambia solo cuando se agregan/quitan nodos o cañerías: el front lo
+    guarda y lo revalida con If-None-Match.
+
+    default_diam_mm: el mismo que options.default_diam_mm de la corrida
+    (para reusar la red cacheada).
+    """
+    with get_conn() as conn, conn.cursor() as cur:
+        try:
+            net = get_network(cur, conn, default_diam_mm=default_diam_mm)
+        except Exception as e:
+            safe_rollback(conn)
+            raise HTTPException(500, f"Error leyendo pipes/nodes: {e}")
+
+    out = ids_table(net)
+    # En el body (y en ids_etag del binario) va sin comillas; el header
+    # HTTP las exige. etag_matches acepta también el If-None-Match viejo
+    # sin comillas.
+    etag = f'"{out["etag"]}"'
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+
+    return out
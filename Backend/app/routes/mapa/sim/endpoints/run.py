@@ -5,22 +5,25 @@ from typing import Any, Dict, List, Tuple
 import heapq
 import math
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 
 from app.db import get_conn
+from app.services.gga_solver import run_gga_simulation
 
-from ..hydraulics import pipe_R, propagate_from_single_source
+from ..columnar import COLUMNAR_MEDIA_TYPE, encode_run_columnar, ids_etag, wants_columnar
+from ..hydraulics import propagate_sources_reaching
 from ..models import SimRunRequest
-from ..pipes import pipe_role_from_row
-from ..repositories import read_live_sources, read_nodes, read_pipes
+from ..network import get_network
+from ..repositories import read_demands, read_live_sources
+from ..runs import save_run
 from ..sources import (
     is_pressure_like_group,
     pipe_pressure_kind,
+    source_group_counts,
     source_meta_from_row,
     summarize_sources_reaching,
 )
 from ..utils import merge_warnings, pressure_from_head, safe_float, safe_rollback
-from ..valves import read_valves
 
 router = APIRouter()
 
@@ -31,7 +34,11 @@ router = APIRouter()
 # ============================================================
 
 @router.post("/sim/run")
-def sim_run(body: SimRunRequest):
+def sim_run(
+    body: SimRunRequest,
+    request: Request,
+    fmt: str | None = Query(None, alias="format"),
+):
     """
     SIM SIMPLE:
     - Parte de fuentes con head fijo.
@@ -48,30 +55,31 @@ def sim_run(body: SimRunRequest):
         La simulación bloquea solo map_pipe_id.
     - Usa elev_m para calcular presión:
         pressure_mca = head_m - elev_m
+    - options.model = "GGA":
+        heads y caudales por gradiente global (Hazen-Williams o
+        Darcy-Weisbach, con roughness y demandas). La propagación
+        queda solo para fuente dominante / sources_reaching.
+    - ?format=columnar (o Accept: application/vnd.dirac.sim-columnar):
+        respuesta binaria con arrays float32 de head / presión / caudal
+        en el orden de GET /mapa/sim/ids. Ver columnar.py.
     """
-    with get_conn() as conn, conn.cursor() as cur:
-        # ----------------------------------------------------
-        # Pipes
-        # ----------------------------------------------------
-        try:
-            pipes = read_pipes(cur, default_diam_mm=body.options.default_diam_mm)
-        except Exception as e:
-            safe_rollback(conn)
-            raise HTTPException(500, f"Error leyendo pipes: {e}")
+    columnar = wants_columnar(request, fmt)
+    model = str(body.options.model or "SIMPLE").upper()
 
+    if model not in {"SIMPLE", "GGA"}:
+        raise HTTPException(400, f"Modelo desconocido: {body.options.model}. Usar SIMPLE o GGA.")
+
+    demands: Dict[str, float] = {}
+
+    with get_conn("analytics") as conn, conn.cursor() as cur:
         # ----------------------------------------------------
-        # Nodes
+        # Pipes / nodes / valves (cacheados por versión)
         # ----------------------------------------------------
         try:
-            nodes = read_nodes(cur)
+            net = get_network(cur, conn, default_diam_mm=body.options.default_diam_mm)
         except Exception as e:
             safe_rollback(conn)
-            raise HTTPException(500, f"Error leyendo nodes: {e}")
-
-        # ----------------------------------------------------
-        # Valves
-        # ----------------------------------------------------
-        valve_node_open, valve_pipe_open, valves_total = read_valves(cur, conn)
+            raise HTTPException(500, f"Error leyendo pipes/nodes: {e}")
 
         # ----------------------------------------------------
         # Sources hidráulicas vivas
@@ -82,6 +90,16 @@ def sim_run(body: SimRunRequest):
             safe_rollback(conn)
             raise HTTPException(500, f"Error leyendo sources desde v_sim_sources_live: {e}")
 
+        # ----------------------------------------------------
+        # Demandas (solo GGA)
+        # ----------------------------------------------------
+        if model == "GGA" and body.options.use_demands:
+            try:
+                demands = read_demands(cur)
+            except Exception as e:
+                safe_rollback(conn)
+                raise HTTPException(500, f"Error leyendo demands: {e}")
+
     if not sources:
         raise HTTPException(
             400,
@@ -89,89 +107,23 @@ def sim_run(body: SimRunRequest):
             "Se necesita al menos una fuente manual, tanque o manómetro con nodo y cota.",
         )
 
-    node_kind = {
-        n["id"]: (n.get("kind") or "JUNCTION")
-        for n in nodes
-    }
-
-    node_elev = {
-        n["id"]: n.get("elev_m")
-        for n in nodes
-    }
-
-    node_label = {
-        n["id"]: n.get("label")
-        for n in nodes
-    }
-
-    # --------------------------------------------------------
-    # Nodos bloqueados por válvula cerrada
-    # --------------------------------------------------------
-    blocked: set[str] = set()
-
-    if body.options.closed_valve_blocks_node:
-        for nid, is_open in valve_node_open.items():
-            if is_open is False:
-                blocked.add(nid)
+    valve_node_open = net.valve_node_open
+    valve_pipe_open = net.valve_pipe_open
 
     # --------------------------------------------------------
-    # Armar grafo de cañerías
+    # Grafo de cañerías (memoizado en el modelo por opciones)
     # node -> [(neighbor, pipe_id, R, length_m, diam_mm)]
+    # Nodos bloqueados por válvula cerrada incluidos.
     # --------------------------------------------------------
-    adj: Dict[str, List[Tuple[str, str, float, float, float]]] = {}
-    pipe_meta: Dict[str, dict[str, Any]] = {}
-
-    unconnected_count = 0
-    closed_count = 0
-    closed_by_valve_count = 0
-    blocked_count = 0
-
-    for p in pipes:
-        pid = p["id"]
-        pipe_role = pipe_role_from_row(p)
-
-        pipe_meta[pid] = {
-            "flow_func": p.get("flow_func"),
-            "role": pipe_role,
-            "props": p.get("props"),
-            "diam_mm": p.get("diametro_mm"),
-            "length_m": p.get("length_m"),
-        }
-
-        if not p.get("active", True):
-            continue
-
-        if not p.get("is_open", True):
-            closed_count += 1
-            continue
-
-        if body.options.closed_valve_blocks_pipe and valve_pipe_open.get(pid) is False:
-            closed_count += 1
-            closed_by_valve_count += 1
-            continue
-
-        u = p.get("from_node")
-        v = p.get("to_node")
-
-        if not u or not v or u == v:
-            unconnected_count += 1
-            continue
-
-        if u in blocked or v in blocked:
-            blocked_count += 1
-            continue
+    graph = net.graph(
+        closed_valve_blocks_node=body.options.closed_valve_blocks_node,
+        closed_valve_blocks_pipe=body.options.closed_valve_blocks_pipe,
+        r_scale=body.options.r_scale,
+    )
 
-        Lm = float(p.get("length_m") or 0.0)
-        Dmm = float(p.get("diametro_mm") or body.options.default_diam_mm)
-
-        R = pipe_R(
-            length_m=Lm,
-            diam_mm=Dmm,
-            r_scale=body.options.r_scale,
-        )
-
-        adj.setdefault(u, []).append((v, pid, R, Lm, Dmm))
-        adj.setdefault(v, []).append((u, pid, R, Lm, Dmm))
+    adj: Dict[str, List[Tuple[str, str, float, float, float]]] = graph["adj"]
+    blocked: set[str] = graph["blocked"]
+    gga_pipes = graph["gga_pipes"]
 
     # --------------------------------------------------------
     # Sources con head fijo
@@ -261,7 +213,7 @@ def sim_run(body: SimRunRequest):
             prev = pipe_out.get(pid)
 
             if prev is None or abs_q > prev.get("abs_q_lps", -1):
-                pm = pipe_meta.get(pid, {})
+                k = net.pipe_index[pid]
 
                 pipe_out[pid] = {
                     "q_lps": abs_q,
@@ -274,56 +226,96 @@ def sim_run(body: SimRunRequest):
                     "blocked": False,
                     "u": u,
                     "v": v,
-                    "flow_func": pm.get("flow_func"),
-                    "pipe_role": pm.get("role"),
+                    "flow_func": net.pipe_flow_func[k],
+                    "pipe_role": net.pipe_role[k],
                     "valve_closed": False,
                 }
 
     # --------------------------------------------------------
-    # Propagar cada fuente individualmente
+    # Fuentes que alcanzan cada nodo: una sola pasada multi-fuente.
+    # Por nodo quedan las max_sources_reaching mejores (head por fuente);
+    # conteo y mezcla salen de la componente conexa.
     # --------------------------------------------------------
-    node_sources_reaching: Dict[str, list[dict[str, Any]]] = {}
+    reaching_labels, comp_of, comp_sources = propagate_sources_reaching(
+        sources=[(sm["node_id"], float(sm["head_m"])) for sm in sources_valid_meta],
+        adj=adj,
+        blocked=blocked,
+        R0=R0,
+        head_drop_scale=head_drop_scale,
+        max_per_node=max_sources_reaching,
+    )
+
+    node_sources_reaching: Dict[str, list[dict[str, Any]]] = {
+        nid: [{**sources_valid_meta[s_idx], "head_m": float(h)} for s_idx, h in labels]
+        for nid, labels in reaching_labels.items()
+    }
 
-    for sm in sources_valid_meta:
-        start_node = sm.get("node_id")
-        start_head = safe_float(sm.get("head_m"))
+    # Por componente: grupos de todas las fuentes (nodos) y
+    # de las fuentes distintas por source_id (cañerías).
+    comp_group_counts: List[dict[str, int]] = []
+    comp_pipe_groups: List[dict[str, Any]] = []
 
-        if not start_node or start_head is None:
-            continue
+    for idxs in comp_sources:
+        metas = [sources_valid_meta[s_idx] for s_idx in idxs]
+        comp_group_counts.append(source_group_counts(m.get("source_group") for m in metas))
 
-        per_source_heads = propagate_from_single_source(
-            start_node=start_node,
-            start_head=start_head,
-            adj=adj,
-            blocked=blocked,
-            R0=R0,
-            head_drop_scale=head_drop_scale,
-        )
+        by_sid: dict[str, Any] = {}
+        for m in metas:
+            sid = str(m.get("source_id") or m.get("label") or "")
+            if sid:
+                by_sid[sid] = m.get("source_group")
+        comp_pipe_groups.append(by_sid)
 
-        for nid, h in per_source_heads.items():
-            reached_meta = {
-                **sm,
-                "head_m": float(h),
-            }
+    # --------------------------------------------------------
+    # GGA: reemplaza heads y caudales de la propagación visual.
+    # Alcanza a los mismos nodos/cañerías (componentes con fuente),
+    # así que el resto del armado de salida no cambia.
+    # --------------------------------------------------------
+    gga_meta: dict[str, Any] | None = None
 
-            node_sources_reaching.setdefault(nid, []).append(reached_meta)
+    if model == "GGA":
+        try:
+            gga = run_gga_simulation(
+                pipes=gga_pipes,
+                fixed_heads=fixed_sources,
+                demands_lps=demands,
+                headloss=body.options.headloss,
+                default_roughness=body.options.default_roughness,
+                max_iter=max(1, int(body.options.gga_max_iter)),
+                accuracy=float(body.options.gga_accuracy),
+                warm_start=body.options.warm_start,
+            )
+        except ValueError as e:
+            raise HTTPException(422, f"GGA no pudo resolver la red: {e}")
+
+        gga_meta = gga["meta"]
+        head = gga["heads"]
+
+        for pid, q in gga["flows_lps"].items():
+            po = pipe_out.get(pid)
+            if po is not None:
+                po["abs_q_lps"] = abs(float(q))
+                po["headloss_m"] = abs(float(gga["headloss_m"][pid]))
 
     # --------------------------------------------------------
     # Resumen de fuentes por nodo
     # --------------------------------------------------------
     node_source_summary: Dict[str, dict[str, Any]] = {}
 
-    for n in nodes:
-        nid = n["id"]
+    for i in range(net.node_count):
+        nid = net.node_ids[i]
         dominant_h = head.get(nid)
-        elev_m = node_elev.get(nid)
+        elev_m = net.elev(i)
         reaching = node_sources_reaching.get(nid, [])
+        comp = comp_of.get(nid)
 
         sources_reaching, sources_reaching_count, source_mix, source_warnings = summarize_sources_reaching(
             items=reaching,
             dominant_head=dominant_h,
             node_elev_m=elev_m,
             max_items=max_sources_reaching,
+            total_count=len(comp_sources[comp]) if comp is not None else None,
+            group_counts=comp_group_counts[comp] if comp is not None else None,
         )
 
         node_source_summary[nid] = {
@@ -337,11 +329,8 @@ def sim_run(body: SimRunRequest):
     # Agregar cañerías cerradas por válvula al output
     # para que el front pueda mostrarlas si lo necesita.
     # --------------------------------------------------------
-    for p in pipes:
-        pid = p["id"]
-
-        if not (body.options.closed_valve_blocks_pipe and valve_pipe_open.get(pid) is False):
-            continue
+    for k in graph["pipes_valve_closed"]:
+        pid = net.pipe_ids[k]
 
         pipe_out[pid] = {
             "q_lps": 0.0,
@@ -349,14 +338,14 @@ def sim_run(body: SimRunRequest):
             "dir": 1,
             "dH_m": None,
             "R": None,
-            "length_m": p.get("length_m"),
-            "diam_mm": p.get("diametro_mm"),
+            "length_m": float(net.pipe_length[k]),
+            "diam_mm": float(net.pipe_diam[k]),
             "blocked": True,
             "valve_closed": True,
-            "u": p.get("from_node"),
-            "v": p.get("to_node"),
-            "flow_func": p.get("flow_func"),
-            "pipe_role": pipe_meta.get(pid, {}).get("role"),
+            "u": net.pipe_endpoint(k, "u"),
+            "v": net.pipe_endpoint(k, "v"),
+            "flow_func": net.pipe_flow_func[k],
+            "pipe_role": net.pipe_role[k],
             "pressure_mca_u": None,
             "pressure_mca_v": None,
             "pressure_mca_avg": None,
@@ -416,18 +405,22 @@ def sim_run(body: SimRunRequest):
             if old is None or float(x.get("head_m") or -1e18) > float(old.get("head_m") or -1e18):
                 dedup[sid] = x
 
+        comp = comp_of.get(u, comp_of.get(v))
+        comp_groups = comp_pipe_groups[comp] if comp is not None else {}
+
         pipe_sources_reaching, pipe_sources_reaching_count, pipe_source_mix, pipe_source_warnings = summarize_sources_reaching(
             items=list(dedup.values()),
             dominant_head=max([x for x in [hu, hv] if x is not None], default=None),
             node_elev_m=None,
             max_items=max_sources_reaching,
+            total_count=len(comp_groups) if comp is not None else None,
+            group_counts=source_group_counts(comp_groups.values()) if comp is not None else None,
         )
 
-        pm = pipe_meta.get(pid, {})
-        pipe_role = pm.get("role")
+        pipe_role = net.pipe_role[net.pipe_index[pid]]
 
         if pipe_role in {"DISTRIBUCION", "RAMAL"}:
-            groups = [x.get("source_group") for x in list(dedup.values())]
+            groups = list(comp_groups.values())
 
             if any(is_pressure_like_group(g) for g in groups):
                 pipe_source_warnings.append("DISTRIBUTION_FED_BY_PRESSURE")
@@ -473,8 +466,8 @@ def sim_run(body: SimRunRequest):
         hu = float(hu)
         hv = float(hv)
 
-        elev_u = node_elev.get(u)
-        elev_v = node_elev.get(v)
+        elev_u = net.elev_of(u)
+        elev_v = net.elev_of(v)
 
         pressure_mca_u, pressure_bar_u = pressure_from_head(hu, elev_u)
         pressure_mca_v, pressure_bar_v = pressure_from_head(hv, elev_v)
@@ -549,15 +542,137 @@ def sim_run(body: SimRunRequest):
             po["dH_m"] = -dH
             po["q_lps"] = -po["abs_q_lps"]
 
+    # --------------------------------------------------------
+    # Guardar corrida para /mapa/sim/whatif
+    # Caudal con signo en sentido from_node -> to_node.
+    # --------------------------------------------------------
+    run_flows: Dict[str, float] = {}
+
+    for pid, po in pipe_out.items():
+        q = float(po.get("q_lps") or 0.0)
+
+        if q and po.get("u") != net.pipe_endpoint(net.pipe_index[pid], "u"):
+            q = -q
+
+        run_flows[pid] = q
+
+    run_id = save_run({
+        "network_version": net.version,
+        "model": model,
+        "options": body.options,
+        "sources": [
+            (s.get("node_id"), safe_float(s.get("head_m")))
+            for s in sources
+            if s.get("node_id") and safe_float(s.get("head_m")) is not None
+        ],
+        "demands": demands,
+        "overrides": {"pipes": {}, "nodes": {}},
+        "heads": head,
+        "flows": run_flows,
+    })
+
+    # --------------------------------------------------------
+    # Meta de la corrida
+    # --------------------------------------------------------
+    meta: Dict[str, Any] = {
+        "n_nodes": net.node_count,
+        "n_pipes_used": len(pipe_out),
+        "n_sources": len(fixed_sources),
+
+        "pipes_count": len(net.pipe_ids),
+        "nodes_count": net.node_count,
+        "sources_count": len(sources),
+        "sources_valid": len(sources_valid),
+        "sources_invalid": sources_invalid,
+        "sources_blocked": sources_blocked,
+
+        "pipes_unconnected": graph["counts"]["unconnected"],
+        "pipes_closed": graph["counts"]["closed"],
+        "pipes_closed_by_valve": graph["counts"]["closed_by_valve"],
+        "pipes_blocked_by_valve": graph["counts"]["blocked"],
+
+        "valves_total": net.valves_total,
+        "network_version": net.version,
+        "valves_on_nodes": len(valve_node_open),
+        "valves_on_pipes": len(valve_pipe_open),
+        "closed_node_valves": sum(1 for v in valve_node_open.values() if v is False),
+        "closed_pipe_valves": sum(1 for v in valve_pipe_open.values() if v is False),
+
+        "demands_ignored": model != "GGA" or not body.options.use_demands,
+        "demands_count": len(demands),
+        "gga": gga_meta,
+        "pressure_formula": "pressure_mca = head_m - elev_m",
+        "sources_origin": '"MapasAgua"."v_sim_sources_live"',
+        "source_mix_logic": "propagación multi-fuente (mejores fuentes por nodo) + fuente dominante por mayor head_m",
+        "valve_logic": {
+            "node_valve_closed": "bloquea todas las cañerías conectadas al nodo",
+            "pipe_valve_closed": "bloquea solo la cañería asociada",
+            "valve_with_node_and_pipe": "el nodo es ubicación física; el pipe es el tramo que se bloquea",
+        },
+        "pressure_kinds": {
+            "REAL": "Punto con presión real medida por manómetro/manifold",
+            "TANK": "Punto con carga por tanque, nivel y cota",
+            "MANUAL": "Fuente manual",
+            "CALC": "Presión teórica calculada por propagación",
+            "MIXED": "Cañería entre fuentes/orígenes distintos",
+        },
+        "source_mix_types": {
+            "TANK_ONLY": "Solo llega tanque",
+            "PRESSURE_ONLY": "Solo llega presión real medida",
+            "MANUAL_ONLY": "Solo llega fuente manual",
+            "MULTI_TANK": "Llegan varios tanques",
+            "MULTI_PRESSURE": "Llegan varias fuentes de presión",
+            "MIXED_TANK_PRESSURE": "Llegan tanque(s) y presión/impulsión",
+            "VALVE_CLOSED": "Cañería bloqueada por válvula cerrada",
+        },
+        "warnings_catalog": {
+            "TANK_AND_PRESSURE_REACH_NODE": "Al nodo/tramo llegan tanque e impulsión/presión",
+            "TANK_AND_REAL_PRESSURE_REACH_NODE": "Al nodo/tramo llegan tanque y manómetro real",
+            "TANK_AND_MANUAL_SOURCE_REACH_NODE": "Al nodo/tramo llegan tanque y fuente manual",
+            "MULTIPLE_TANKS_REACH_NODE": "Llegan varios tanques",
+            "MULTIPLE_PRESSURE_SOURCES_REACH_NODE": "Llegan varias fuentes de presión",
+            "REAL_AND_MANUAL_PRESSURE_REACH_NODE": "Llegan presión real y fuente manual",
+            "DISTRIBUTION_FED_BY_PRESSURE": "Cañería de distribución/ramal dominada o alcanzada por impulsión/presión",
+            "TANK_ZONE_INVADED_BY_PRESSURE": "Zona de tanque alcanzada también por impulsión/presión",
+            "PIPE_BLOCKED_BY_CLOSED_VALVE": "Cañería bloqueada por válvula cerrada",
+        },
+    }
+
+    # --------------------------------------------------------
+    # Salida columnar (binaria): arrays en el orden de /mapa/sim/ids.
+    # No arma los dicts por nodo.
+    # --------------------------------------------------------
+    if columnar:
+        return Response(
+            content=encode_run_columnar(
+                net,
+                header={
+                    "model": model,
+                    "run_id": run_id,
+                    "ids_etag": ids_etag(net),
+                    "sources": list(fixed_source_meta.values()),
+                    "meta": meta,
+                },
+                head=head,
+                flows=run_flows,
+                pipe_out=pipe_out,
+                blocked=blocked,
+                sources=set(fixed_sources),
+                valve_node_open=valve_node_open,
+            ),
+            media_type=COLUMNAR_MEDIA_TYPE,
+            headers={"X-Sim-Ids-ETag": ids_etag(net), "X-Sim-Run-Id": run_id},
+        )
+
     # --------------------------------------------------------
     # Salida de nodos
     # --------------------------------------------------------
     nodes_out: Dict[str, Any] = {}
 
-    for n in nodes:
-        nid = n["id"]
+    for i in range(net.node_count):
+        nid = net.node_ids[i]
         h = head.get(nid)
-        elev_m = node_elev.get(nid)
+        elev_m = net.elev(i)
 
         reached = h is not None and math.isfinite(float(h))
         source = fixed_source_meta.get(nid)
@@ -574,8 +689,8 @@ def sim_run(body: SimRunRequest):
         base = {
             "blocked": nid in blocked,
             "valve_closed": valve_node_open.get(nid) is False,
-            "kind": node_kind.get(nid, "JUNCTION"),
-            "label": node_label.get(nid),
+            "kind": net.node_kind[i],
+            "label": net.node_label[i],
 
             "is_source": nid in fixed_sources,
             "pressure_kind": pressure_kind,
@@ -615,68 +730,10 @@ def sim_run(body: SimRunRequest):
         }
 
     return {
-        "model": "SIMPLE",
+        "model": model,
+        "run_id": run_id,
         "nodes": nodes_out,
         "pipes": pipe_out,
         "sources": list(fixed_source_meta.values()),
-        "meta": {
-            "n_nodes": len(nodes),
-            "n_pipes_used": len(pipe_out),
-            "n_sources": len(fixed_sources),
-
-            "pipes_count": len(pipes),
-            "nodes_count": len(nodes),
-            "sources_count": len(sources),
-            "sources_valid": len(sources_valid),
-            "sources_invalid": sources_invalid,
-            "sources_blocked": sources_blocked,
-
-            "pipes_unconnected": unconnected_count,
-            "pipes_closed": closed_count,
-            "pipes_closed_by_valve": closed_by_valve_count,
-            "pipes_blocked_by_valve": blocked_count,
-
-            "valves_total": valves_total,
-            "valves_on_nodes": len(valve_node_open),
-            "valves_on_pipes": len(valve_pipe_open),
-            "closed_node_valves": sum(1 for v in valve_node_open.values() if v is False),
-            "closed_pipe_valves": sum(1 for v in valve_pipe_open.values() if v is False),
-
-            "demands_ignored": True,
-            "pressure_formula": "pressure_mca = head_m - elev_m",
-            "sources_origin": '"MapasAgua"."v_sim_sources_live"',
-            "source_mix_logic": "propagación individual por fuente + fuente dominante por mayor head_m",
-            "valve_logic": {
-                "node_valve_closed": "bloquea todas las cañerías conectadas al nodo",
-                "pipe_valve_closed": "bloquea solo la cañería asociada",
-                "valve_with_node_and_pipe": "el nodo es ubicación física; el pipe es el tramo que se bloquea",
-            },
-            "pressure_kinds": {
-                "REAL": "Punto con presión real medida por manómetro/manifold",
-                "TANK": "Punto con carga por tanque, nivel y cota",
-                "MANUAL": "Fuente manual",
-                "CALC": "Presión teórica calculada por propagación",
-                "MIXED": "Cañería entre fuentes/orígenes distintos",
-            },
-            "source_mix_types": {
-                "TANK_ONLY": "Solo llega tanque",
-                "PRESSURE_ONLY": "Solo llega presión real medida",
-                "MANUAL_ONLY": "Solo llega fuente manual",
-                "MULTI_TANK": "Llegan varios tanques",
-                "MULTI_PRESSURE": "Llegan varias fuentes de presión",
-                "MIXED_TANK_PRESSURE": "Llegan tanque(s) y presión/impulsión",
-                "VALVE_CLOSED": "Cañería bloqueada por válvula cerrada",
-            },
-            "warnings_catalog": {
-                "TANK_AND_PRESSURE_REACH_NODE": "Al nodo/tramo llegan tanque e impulsión/presión",
-                "TANK_AND_REAL_PRESSURE_REACH_NODE": "Al nodo/tramo llegan tanque y manómetro real",
-                "TANK_AND_MANUAL_SOURCE_REACH_NODE": "Al nodo/tramo llegan tanque y fuente manual",
-                "MULTIPLE_TANKS_REACH_NODE": "Llegan varios tanques",
-                "MULTIPLE_PRESSURE_SOURCES_REACH_NODE": "Llegan varias fuentes de presión",
-                "REAL_AND_MANUAL_PRESSURE_REACH_NODE": "Llegan presión real y fuente manual",
-                "DISTRIBUTION_FED_BY_PRESSURE": "Cañería de distribución/ramal dominada o alcanzada por impulsión/presión",
-                "TANK_ZONE_INVADED_BY_PRESSURE": "Zona de tanque alcanzada también por impulsión/presión",
-                "PIPE_BLOCKED_BY_CLOSED_VALVE": "Cañería bloqueada por válvula cerrada",
-            },
-        },
+        "meta": meta,
     }
@@ -0,0 +1,359 @@
+# app/routes/mapa/sim/endpoints/whatif.py
+from __future__ import annotations
+
+from collections import ChainMap
+from typing import Any, Dict, Iterable, List, Tuple
+
+from fastapi import APIRouter, HTTPException
+
+from app.db import get_conn
+from app.services.gga_solver import run_gga_simulation
+
+from ..hydraulics import pipe_R, propagate_heads
+from ..models import SimOptions, SimWhatIfRequest
+from ..network import NetworkModel, get_network
+from ..runs import get_run, save_run
+from ..utils import pressure_from_head, safe_rollback
+
+router = APIRouter()
+
+HEAD_EPS_M = 1e-6
+FLOW_EPS_LPS = 1e-9
+
+Adj = Dict[str, List[Tuple[str, str, float, float, float]]]
+
+
+# ============================================================
+# Helpers
+# ============================================================
+
+def _pipe_is_open(
+    net: NetworkModel,
+    k: int,
+    options: SimOptions,
+    pipe_overrides: Dict[str, bool],
+) -> bool:
+    pid = net.pipe_ids[k]
+
+    if pid in pipe_overrides:
+        return pipe_overrides[pid]
+
+    if not net.pipe_is_open[k]:
+        return False
+
+    if options.closed_valve_blocks_pipe and net.valve_pipe_open.get(pid) is False:
+        return False
+
+    return True
+
+
+def _overlay(
+    net: NetworkModel,
+    graph: Dict[str, Any],
+    options: SimOptions,
+    pipe_overrides: Dict[str, bool],
+    node_overrides: Dict[str, bool],
+) -> Tuple[ChainMap, set[str], set[str]]:
+    """
+    Grafo de la corrida con overrides aplicados, sin copiar el grafo base:
+    solo se rearma la lista de vecinos de los nodos tocados (extremos de
+    cañerías con override, nodos con override y sus vecinos).
+
+    Devuelve (adyacencia, nodos bloqueados, nodos tocados).
+    """
+    blocked = set(graph["blocked"])
+
+    if options.closed_valve_blocks_node:
+        for nid, is_open in node_overrides.items():
+            if is_open:
+                blocked.discard(nid)
+            else:
+                blocked.add(nid)
+
+    dirty: set[int] = set()
+
+    for pid in pipe_overrides:
+        k = net.pipe_index.get(pid)
+        if k is None:
+            continue
+        for i in (int(net.pipe_u[k]), int(net.pipe_v[k])):
+            if i >= 0:
+                dirty.add(i)
+
+    for nid in node_overrides:
+        i = net.node_index.get(nid)
+        if i is None:
+            continue
+        dirty.add(i)
+        dirty.update(int(j) for j in net.adj_node[net.adj_ptr[i]:net.adj_ptr[i + 1]])
+
+    patched: Adj = {}
+
+    for i in dirty:
+        u = net.node_ids[i]
+        items: List[Tuple[str, str, float, float, float]] = []
+
+        if u not in blocked:
+            for pos in range(int(net.adj_ptr[i]), int(net.adj_ptr[i + 1])):
+                v = net.node_ids[int(net.adj_node[pos])]
+                k = int(net.adj_pipe[pos])
+
+                if v in blocked or not _pipe_is_open(net, k, options, pipe_overrides):
+                    continue
+
+                Lm = float(net.pipe_length[k])
+                Dmm = float(net.pipe_diam[k])
+                R = pipe_R(length_m=Lm, diam_mm=Dmm, r_scale=options.r_scale)
+                items.append((v, net.pipe_ids[k], R, Lm, Dmm))
+
+        patched[u] = items
+
+    return ChainMap(patched, graph["adj"]), blocked, set(patched)
+
+
+def _components(adj, blocked: set[str], starts: Iterable[str]) -> set[str]:
+    seen: set[str] = set()
+    stack = [s for s in starts if s not in blocked]
+    seen.update(stack)
+
+    while stack:
+        u = stack.pop()
+        for v, _pid, _R, _Lm, _Dmm in adj.get(u, []):
+            if v in blocked or v in seen:
+                continue
+            seen.add(v)
+            stack.append(v)
+
+    return seen
+
+
+def _region_pipes(adj, region: set[str]) -> Dict[str, Tuple[float, float, float]]:
+    """pipe_id -> (R, length_m, diam_mm) de las cañerías activas dentro de la región."""
+    out: Dict[str, Tuple[float, float, float]] = {}
+
+    for u in region:
+        for _v, pid, R, Lm, Dmm in adj.get(u, []):
+            out[pid] = (R, Lm, Dmm)
+
+    return out
+
+
+# ============================================================
+# What-if
+# POST /mapa/sim/whatif
+# ============================================================
+
+@router.post("/sim/whatif")
+def sim_whatif(body: SimWhatIfRequest):
+    """
+    Recalcula una corrida previa (base_run_id) con válvulas / cañerías
+    abiertas o cerradas, tocando solo las componentes conexas afectadas:
+
+    - SIMPLE: re-propagación de heads dentro de la región.
+    - GGA: re-resuelve solo el sub-bloque de la región (warm start).
+
+    La región es la unión de las componentes de los nodos tocados antes y
+    después de aplicar los overrides. Fuera de ella nada cambia.
+
+    Devuelve solo los nodos y cañerías que cambiaron (caudal con signo en
+    sentido from_node -> to_node) y un run_id nuevo para encadenar.
+    """
+    base = get_run(body.base_run_id)
+
+    if base is None:
+        raise HTTPException(404, "base_run_id no existe o expiró. Volver a correr /mapa/sim/run.")
+
+    options: SimOptions = base["options"]
+
+    with get_conn("analytics") as conn, conn.cursor() as cur:
+        try:
+            net = get_network(cur, conn, default_diam_mm=options.default_diam_mm)
+        except Exception as e:
+            safe_rollback(conn)
+            raise HTTPException(500, f"Error leyendo pipes/nodes: {e}")
+
+    if net.version != base["network_version"]:
+        raise HTTPException(409, "La red cambió desde la corrida base. Volver a correr /mapa/sim/run.")
+
+    # --------------------------------------------------------
+    # Overrides: los de la corrida base + los nuevos
+    # --------------------------------------------------------
+    new_pipe: Dict[str, bool] = {}
+    new_node: Dict[str, bool] = {}
+    ignored: List[dict[str, Any]] = []
+
+    for o in body.overrides:
+        if o.pipe_id and o.pipe_id in net.pipe_index:
+            new_pipe[o.pipe_id] = o.is_open
+        elif o.node_id and o.node_id in net.node_index:
+            new_node[o.node_id] = o.is_open
+        else:
+            ignored.append(o.model_dump())
+
+    base_pipe = base["overrides"]["pipes"]
+    base_node = base["overrides"]["nodes"]
+
+    graph = net.graph(
+        closed_valve_blocks_node=options.closed_valve_blocks_node,
+        closed_valve_blocks_pipe=options.closed_valve_blocks_pipe,
+        r_scale=options.r_scale,
+    )
+
+    old_adj, old_blocked, _ = _overlay(net, graph, options, base_pipe, base_node)
+    new_adj, new_blocked, _ = _overlay(net, graph, options, {**base_pipe, **new_pipe}, {**base_node, **new_node})
+    _, _, touched = _overlay(net, graph, options, new_pipe, new_node)
+
+    region = _components(old_adj, old_blocked, touched) | _components(new_adj, new_blocked, touched) | touched
+
+    # --------------------------------------------------------
+    # Fuentes dentro de la región (mismos heads que la corrida base)
+    # --------------------------------------------------------
+    fixed: Dict[str, float] = {}
+
+    for nid, h in base["sources"]:
+        if nid in region and nid not in new_blocked:
+            fixed[nid] = max(h, fixed.get(nid, float("-inf")))
+
+    R0 = float(options.R0) if options.R0 else 500000.0
+    head_drop_scale = float(options.head_drop_scale)
+
+    new_pipes = _region_pipes(new_adj, region)
+    old_pipe_ids = set(_region_pipes(old_adj, region))
+
+    gga_meta: dict[str, Any] | None = None
+
+    if base["model"] == "GGA":
+        try:
+            gga = run_gga_simulation(
+                pipes=[
+                    (
+                        pid,
+                        net.pipe_endpoint(net.pipe_index[pid], "u"),
+                        net.pipe_endpoint(net.pipe_index[pid], "v"),
+                        Lm,
+                        Dmm,
+                        net.roughness(net.pipe_index[pid]),
+                    )
+                    for pid, (_R, Lm, Dmm) in new_pipes.items()
+                ],
+                fixed_heads=fixed,
+                demands_lps={nid: q for nid, q in base["demands"].items() if nid in region},
+                headloss=options.headloss,
+                default_roughness=options.default_roughness,
+                max_iter=max(1, int(options.gga_max_iter)),
+                accuracy=float(options.gga_accuracy),
+                warm_start=options.warm_start,
+            ) if fixed else {"heads": {}, "flows_lps": {}, "meta": None}
+        except ValueError as e:
+            raise HTTPException(422, f"GGA no pudo resolver la red: {e}")
+
+        gga_meta = gga["meta"]
+        new_heads = {nid: h for nid, h in gga["heads"].items() if nid in region}
+        new_flows = {pid: float(q) for pid, q in gga["flows_lps"].items()}
+    else:
+        new_heads = propagate_heads(fixed, new_adj, new_blocked, R0, head_drop_scale)
+        new_flows = {}
+
+        for pid, (R, _Lm, _Dmm) in new_pipes.items():
+            k = net.pipe_index[pid]
+            hu = new_heads.get(net.pipe_endpoint(k, "u"))
+            hv = new_heads.get(net.pipe_endpoint(k, "v"))
+
+            if hu is None or hv is None:
+                continue
+
+            abs_q = 1.0 / (1.0 + (R / R0))
+            new_flows[pid] = abs_q if hu >= hv else -abs_q
+
+    # --------------------------------------------------------
+    # Diff contra la corrida base
+    # --------------------------------------------------------
+    base_heads: Dict[str, float] = base["heads"]
+    base_flows: Dict[str, float] = base["flows"]
+
+    nodes_diff: Dict[str, Any] = {}
+
+    for nid in region:
+        h0 = base_heads.get(nid)
+        h1 = new_heads.get(nid)
+
+        if h0 is None and h1 is None:
+            continue
+
+        if h0 is not None and h1 is not None and abs(h1 - h0) <= HEAD_EPS_M:
+            continue
+
+        pressure_mca, pressure_bar = pressure_from_head(h1, net.elev_of(nid))
+
+        nodes_diff[nid] = {
+            "head_m": h1,
+            "head_m_base": h0,
+            "delta_head_m": (h1 - h0) if h0 is not None and h1 is not None else None,
+            "pressure_mca": pressure_mca,
+            "pressure_bar": pressure_bar,
+            "reached": h1 is not None,
+            "blocked": nid in new_blocked,
+        }
+
+    pipes_diff: Dict[str, Any] = {}
+
+    for pid in set(new_pipes) | old_pipe_ids:
+        q0 = float(base_flows.get(pid, 0.0))
+        q1 = float(new_flows.get(pid, 0.0))
+
+        if abs(q1 - q0) <= FLOW_EPS_LPS:
+            continue
+
+        k = net.pipe_index[pid]
+
+        pipes_diff[pid] = {
+            "q_lps": q1,
+            "q_lps_base": q0,
+            "abs_q_lps": abs(q1),
+            "dir": 1 if q1 >= 0 else -1,
+            "blocked": pid not in new_flows,
+            "u": net.pipe_endpoint(k, "u"),
+            "v": net.pipe_endpoint(k, "v"),
+        }
+
+    # --------------------------------------------------------
+    # Nueva corrida (para encadenar what-ifs)
+    # --------------------------------------------------------
+    heads = {nid: h for nid, h in base_heads.items() if nid not in region}
+    heads.update(new_heads)
+
+    flows = {pid: q for pid, q in base_flows.items() if pid not in old_pipe_ids}
+    flows.update(new_flows)
+
+    run_id = save_run({
+        **base,
+        "overrides": {
+            "pipes": {**base_pipe, **new_pipe},
+            "nodes": {**base_node, **new_node},
+        },
+        "heads": heads,
+        "flows": flows,
+    })
+
+    return {
+        "model": base["model"],
+        "run_id": run_id,
+        "base_run_id": body.base_run_id,
+        "nodes": nodes_diff,
+        "pipes": pipes_diff,
+        "meta": {
+            "region_nodes": len(region),
+            "region_pipes": len(new_pipes),
+            "nodes_changed": len(nodes_diff),
+            "pipes_changed": len(pipes_diff),
+            "sources_in_region": len(fixed),
+            "overrides_applied": len(new_pipe) + len(new_node),
+            "overrides_ignored": ignored,
+            "overrides_total": {
+                "pipes": len(base_pipe) + len([p for p in new_pipe if p not in base_pipe]),
+                "nodes": len(base_node) + len([n for n in new_node if n not in base_node]),
+            },
+            "flow_sign": "q_lps > 0 = from_node -> to_node (u -> v)",
+            "gga": gga_meta,
+        },
+    }
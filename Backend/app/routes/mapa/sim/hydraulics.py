@@ -1,7 +1,7 @@
 # app/routes/mapa/sim/hydraulics.py
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+from typing import Dict, List, Mapping, Tuple
 import heapq
 
 
@@ -61,3 +61,128 @@ def propagate_from_single_source(
                 heapq.heappush(pq, (-hv, v))
 
     return heads
+
+
+def propagate_heads(
+    starts: Dict[str, float],
+    adj: Mapping[str, List[Tuple[str, str, float, float, float]]],
+    blocked: set[str],
+    R0: float,
+    head_drop_scale: float,
+) -> Dict[str, float]:
+    """
+    Head dominante (mayor head entre todas las fuentes) por nodo.
+    Misma regla que la propagación de /mapa/sim/run, sin armar cañerías.
+    """
+    heads: Dict[str, float] = {}
+    pq: List[Tuple[float, str]] = []
+
+    for nid, h in starts.items():
+        if nid in blocked:
+            continue
+        heads[nid] = h
+        heapq.heappush(pq, (-h, nid))
+
+    while pq:
+        neg_h, u = heapq.heappop(pq)
+        hu = -neg_h
+
+        if heads.get(u, float("-inf")) > hu + 1e-9:
+            continue
+
+        for v, _pid, R, _Lm, _Dmm in adj.get(u, []):
+            if v in blocked:
+                continue
+
+            abs_q = 1.0 / (1.0 + (R / R0))
+            hv = hu - abs_q * R * head_drop_scale
+
+            if hv > heads.get(v, float("-inf")):
+                heads[v] = hv
+                heapq.heappush(pq, (-hv, v))
+
+    return heads
+
+
+def propagate_sources_reaching(
+    sources: List[Tuple[str, float]],
+    adj: Dict[str, List[Tuple[str, str, float, float, float]]],
+    blocked: set[str],
+    R0: float,
+    head_drop_scale: float,
+    max_per_node: int,
+) -> Tuple[Dict[str, List[Tuple[int, float]]], Dict[str, int], List[List[int]]]:
+    """
+    Reemplaza llamar a propagate_from_single_source una vez por fuente.
+
+    Una sola cola de prioridad con etiquetas (head, nodo, índice de fuente).
+    Cada nodo acepta como máximo max_per_node fuentes distintas, en orden de
+    head decreciente; las que llegan después nunca entrarían al top del nodo
+    ni de los nodos aguas abajo a través de él.
+
+    Como toda fuente alcanza a toda su componente conexa, el conteo y la
+    mezcla de fuentes salen de la componente, no de las etiquetas.
+
+    Devuelve:
+      reaching[nodo]   = [(idx_fuente, head)] mejores max_per_node, head desc
+      comp_of[nodo]    = id de componente (solo componentes con fuente)
+      comp_sources[c]  = índices de todas las fuentes de la componente c
+    """
+    comp_of: Dict[str, int] = {}
+    comp_sources: List[List[int]] = []
+
+    for s_idx, (start_node, _h) in enumerate(sources):
+        if start_node in blocked:
+            continue
+
+        c = comp_of.get(start_node)
+
+        if c is None:
+            c = len(comp_sources)
+            comp_sources.append([])
+            comp_of[start_node] = c
+            stack = [start_node]
+
+            while stack:
+                u = stack.pop()
+                for v, _pid, _R, _Lm, _Dmm in adj.get(u, []):
+                    if v in blocked or v in comp_of:
+                        continue
+                    comp_of[v] = c
+                    stack.append(v)
+
+        comp_sources[c].append(s_idx)
+
+    k_max = max(1, int(max_per_node))
+    reaching: Dict[str, List[Tuple[int, float]]] = {}
+    settled: Dict[str, set[int]] = {}
+    pq: List[Tuple[float, str, int]] = []
+
+    for s_idx, (start_node, start_head) in enumerate(sources):
+        if start_node in comp_of:
+            heapq.heappush(pq, (-start_head, start_node, s_idx))
+
+    while pq:
+        neg_h, u, s_idx = heapq.heappop(pq)
+
+        done = settled.setdefault(u, set())
+        if s_idx in done or len(done) >= k_max:
+            continue
+
+        hu = -neg_h
+        done.add(s_idx)
+        reaching.setdefault(u, []).append((s_idx, hu))
+
+        for v, _pid, R, _Lm, _Dmm in adj.get(u, []):
+            if v in blocked:
+                continue
+
+            done_v = settled.get(v)
+            if done_v is not None and (s_idx in done_v or len(done_v) >= k_max):
+                continue
+
+            abs_q = 1.0 / (1.0 + (R / R0))
+            drop = abs_q * R * head_drop_scale
+            heapq.heappush(pq, (-(hu - drop), v, s_idx))
+
+    return reaching, comp_of, comp_sources
@@ -32,6 +32,22 @@ class SimOptions(BaseModel):
     # Cuántas fuentes alternativas devolver por nodo/cañería.
     max_sources_reaching_per_node: int = 6
 
+    # Modelo de heads/caudales:
+    #   SIMPLE = propagación visual por resistencia (default)
+    #   GGA    = gradiente global (Todini-Pilati) con Newton y demandas reales
+    # En GGA la propagación se sigue usando solo para atribuir fuentes.
+    model: str = "SIMPLE"
+
+    # GGA: "HW" (Hazen-Williams, roughness = C) o "DW" (Darcy-Weisbach, roughness en mm)
+    headloss: str = "HW"
+    # Rugosidad para cañerías sin roughness cargado. None = 130 (HW) / 0.1 mm (DW).
+    default_roughness: float | None = None
+    use_demands: bool = True
+    gga_max_iter: int = 40
+    gga_accuracy: float = 0.001
+    # Arranca Newton desde los caudales de la corrida anterior.
+    warm_start: bool = True
+
 
 class SimRunRequest(BaseModel):
     options: SimOptions = Field(default_factory=SimOptions)
@@ -40,3 +56,33 @@ class SimRunRequest(BaseModel):
 class ConnectPipeBody(BaseModel):
     from_node: str
     to_node: str
+
+
+class SimOverride(BaseModel):
+    # Cañería (abre/cierra el tramo, como una válvula sobre map_pipe_id)
+    pipe_id: str | None = None
+    # Nodo con válvula (cerrado bloquea el nodo completo)
+    node_id: str | None = None
+    is_open: bool
+
+
+class SimWhatIfRequest(BaseModel):
+    base_run_id: str
+    overrides: list[SimOverride] = Field(default_factory=list)
+
+
+class SimScenario(BaseModel):
+    name: str | None = None
+    overrides: list[SimOverride] = Field(default_factory=list)
+    # Fuentes fuera de servicio (bomba parada, tanque vacío...): source id o node_id
+    sources_off: list[str] = Field(default_factory=list)
+    # Head forzado por fuente (source id o node_id -> head_m)
+    source_heads: dict[str, float] = Field(default_factory=dict)
+
+
+class SimBatchRequest(BaseModel):
+    # options.model: SIMPLE | LINEAR | GGA
+    options: SimOptions = Field(default_factory=SimOptions)
+    scenarios: list[SimScenario] = Field(default_factory=list)
+    # None = min(cantidad de escenarios, CPUs, BATCH_MAX_WORKERS)
+    workers: int | None = None
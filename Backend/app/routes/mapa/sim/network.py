@@ -0,0 +1,346 @@
+# app/routes/mapa/sim/network.py
+"""
+Cache en proceso de la topología hidráulica para /mapa/sim/run.
+
+Pipes, nodes y válvulas cambian solo cuando alguien edita el mapa, pero
+cada corrida los leía completos (con ST_Length por cañería) y rearmaba el
+grafo. Acá se guardan en arrays compactos junto con un número de versión:
+
+  - Los endpoints que editan "MapasAgua".pipes / nodes / valves llaman a
+    bump_network_version() después del commit.
+  - get_network() recarga solo si la versión cambió o si el modelo tiene
+    más de NETWORK_MAX_AGE_SECONDS (respaldo para ediciones hechas desde
+    otro worker o directo en la base).
+
+Por corrida se leen solamente las fuentes vivas.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+import math
+import threading
+import time
+
+import numpy as np
+
+from .hydraulics import pipe_R
+from .pipes import pipe_role_from_row
+from .repositories import read_nodes, read_pipes
+from .valves import read_valves
+
+
+NETWORK_MAX_AGE_SECONDS = 300.0
+
+# Grafos derivados por combinación de opciones (r_scale, válvulas...).
+GRAPH_CACHE_MAX = 4
+
+_STATE: Dict[str, Any] = {"version": 0, "model": None}
+_LOCK = threading.Lock()
+
+
+def bump_network_version() -> int:
+    """
+    Invalida la topología cacheada. Llamar después de commitear cualquier
+    cambio en pipes, nodes o valves del mapa.
+    """
+    with _LOCK:
+        _STATE["version"] += 1
+        return _STATE["version"]
+
+
+def network_version() -> int:
+    return _STATE["version"]
+
+
+class NetworkModel:
+    """
+    Red en arrays:
+      nodos   -> node_ids[i], node_kind[i], node_label[i], node_elev[i] (NaN = sin cota)
+      pipes   -> pipe_ids[k], pipe_u[k] / pipe_v[k] (índice de nodo, -1 = sin conectar),
+                 pipe_length[k], pipe_diam[k], pipe_roughness[k] (NaN = sin dato),
+                 pipe_is_open[k], pipe_flow_func[k], pipe_role[k]
+      adyacencia CSR sobre todas las cañerías conectadas:
+                 adj_ptr[i]:adj_ptr[i+1] -> adj_node / adj_pipe
+
+    Los nodos que aparecen solo como extremo de una cañería (sin fila en
+    "MapasAgua".nodes) van al final: node_count marca cuántos son reales.
+    """
+
+    __slots__ = (
+        "version",
+        "loaded_at",
+        "default_diam_mm",
+        "node_ids",
+        "node_index",
+        "node_count",
+        "node_kind",
+        "node_label",
+        "node_elev",
+        "pipe_ids",
+        "pipe_index",
+        "pipe_u",
+        "pipe_v",
+        "pipe_length",
+        "pipe_diam",
+        "pipe_roughness",
+        "pipe_is_open",
+        "pipe_flow_func",
+        "pipe_role",
+        "adj_ptr",
+        "adj_node",
+        "adj_pipe",
+        "valve_node_open",
+        "valve_pipe_open",
+        "valves_total",
+        "ids_etag",
+        "_graphs",
+        "_graphs_lock",
+    )
+
+    def __init__(
+        self,
+        nodes: List[dict[str, Any]],
+        pipes: List[dict[str, Any]],
+        valves: Tuple[Dict[str, bool], Dict[str, bool], int],
+        default_diam_mm: float,
+        version: int,
+    ) -> None:
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.default_diam_mm = float(default_diam_mm)
+
+        self.node_ids: List[str] = [n["id"] for n in nodes]
+        self.node_index: Dict[str, int] = {nid: i for i, nid in enumerate(self.node_ids)}
+        self.node_count = len(self.node_ids)
+        self.node_kind: List[str] = [n.get("kind") or "JUNCTION" for n in nodes]
+        self.node_label: List[Any] = [n.get("label") for n in nodes]
+
+        def node_idx(nid: Any) -> int:
+            if not nid:
+                return -1
+            i = self.node_index.get(nid)
+            if i is None:
+                i = len(self.node_ids)
+                self.node_index[nid] = i
+                self.node_ids.append(nid)
+                self.node_kind.append("JUNCTION")
+                self.node_label.append(None)
+            return i
+
+        m = len(pipes)
+        self.pipe_ids: List[str] = [p["id"] for p in pipes]
+        self.pipe_index: Dict[str, int] = {pid: k for k, pid in enumerate(self.pipe_ids)}
+        self.pipe_u = np.fromiter((node_idx(p.get("from_node")) for p in pipes), dtype=np.int32, count=m)
+        self.pipe_v = np.fromiter((node_idx(p.get("to_node")) for p in pipes), dtype=np.int32, count=m)
+        self.pipe_length = np.fromiter((float(p.get("length_m") or 0.0) for p in pipes), dtype=np.float64, count=m)
+        self.pipe_diam = np.fromiter(
+            (float(p.get("diametro_mm") or default_diam_mm) for p in pipes),
+            dtype=np.float64,
+            count=m,
+        )
+        self.pipe_roughness = np.fromiter(
+            (_nan_if_none(p.get("roughness")) for p in pipes),
+            dtype=np.float64,
+            count=m,
+        )
+        self.pipe_is_open = np.fromiter((bool(p.get("is_open", True)) for p in pipes), dtype=bool, count=m)
+        self.pipe_flow_func: List[Any] = [p.get("flow_func") for p in pipes]
+        self.pipe_role: List[str] = [pipe_role_from_row(p) for p in pipes]
+
+        elev = [n.get("elev_m") for n in nodes] + [None] * (len(self.node_ids) - self.node_count)
+        self.node_elev = np.fromiter((_nan_if_none(z) for z in elev), dtype=np.float64, count=len(elev))
+
+        # CSR de adyacencia (no dirigida) sobre cañerías conectadas
+        n = len(self.node_ids)
+        linked = np.flatnonzero((self.pipe_u >= 0) & (self.pipe_v >= 0) & (self.pipe_u != self.pipe_v))
+        src = np.concatenate([self.pipe_u[linked], self.pipe_v[linked]])
+        dst = np.concatenate([self.pipe_v[linked], self.pipe_u[linked]])
+        eid = np.concatenate([linked, linked]).astype(np.int32)
+        order = np.argsort(src, kind="stable")
+        self.adj_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.adj_ptr[1:])
+        self.adj_node = dst[order].astype(np.int32)
+        self.adj_pipe = eid[order]
+
+        self.valve_node_open, self.valve_pipe_open, self.valves_total = valves
+
+        # ETag de la tabla de ids para la salida columnar (lo calcula columnar.ids_etag)
+        self.ids_etag: str | None = None
+
+        self._graphs: Dict[tuple, Dict[str, Any]] = {}
+        self._graphs_lock = threading.Lock()
+
+    # --------------------------------------------------------
+    # Accesos por id (para armar la salida JSON)
+    # --------------------------------------------------------
+    def elev(self, i: int) -> float | None:
+        z = float(self.node_elev[i])
+        return None if math.isnan(z) else z
+
+    def elev_of(self, nid: str) -> float | None:
+        i = self.node_index.get(nid)
+        return self.elev(i) if i is not None else None
+
+    def roughness(self, k: int) -> float | None:
+        r = float(self.pipe_roughness[k])
+        return None if math.isnan(r) else r
+
+    def pipe_endpoint(self, k: int, which: str) -> str | None:
+        i = int(self.pipe_u[k] if which == "u" else self.pipe_v[k])
+        return self.node_ids[i] if i >= 0 else None
+
+    # --------------------------------------------------------
+    # Grafo hidráulico según opciones de la corrida
+    # --------------------------------------------------------
+    def graph(
+        self,
+        closed_valve_blocks_node: bool,
+        closed_valve_blocks_pipe: bool,
+        r_scale: float,
+    ) -> Dict[str, Any]:
+        """
+        Devuelve (memoizado por combinación de opciones):
+          adj:         node -> [(neighbor, pipe_id, R, length_m, diam_mm)]
+          gga_pipes:   [(pipe_id, u, v, length_m, diam_mm, roughness)]
+          blocked:     nodos bloqueados por válvula cerrada
+          pipes_valve_closed: índices de cañerías con válvula cerrada
+          counts:      unconnected / closed / closed_by_valve / blocked
+        El resultado es compartido entre requests: no modificarlo.
+        """
+        key = (bool(closed_valve_blocks_node), bool(closed_valve_blocks_pipe), float(r_scale))
+
+        with self._graphs_lock:
+            g = self._graphs.get(key)
+            if g is not None:
+                return g
+
+        g = self._build_graph(*key)
+
+        with self._graphs_lock:
+            if len(self._graphs) >= GRAPH_CACHE_MAX:
+                self._graphs.pop(next(iter(self._graphs)))
+            self._graphs[key] = g
+
+        return g
+
+    def _build_graph(
+        self,
+        closed_valve_blocks_node: bool,
+        closed_valve_blocks_pipe: bool,
+        r_scale: float,
+    ) -> Dict[str, Any]:
+        blocked: set[str] = set()
+
+        if closed_valve_blocks_node:
+            for nid, is_open in self.valve_node_open.items():
+                if is_open is False:
+                    blocked.add(nid)
+
+        adj: Dict[str, List[Tuple[str, str, float, float, float]]] = {}
+        gga_pipes: List[Tuple[str, str, str, float, float, float | None]] = []
+        valve_closed: List[int] = []
+
+        unconnected_count = 0
+        closed_count = 0
+        closed_by_valve_count = 0
+        blocked_count = 0
+
+        node_ids = self.node_ids
+        pipe_u = self.pipe_u.tolist()
+        pipe_v = self.pipe_v.tolist()
+        lengths = self.pipe_length.tolist()
+        diams = self.pipe_diam.tolist()
+        is_open = self.pipe_is_open.tolist()
+
+        for k, pid in enumerate(self.pipe_ids):
+            pipe_valve_closed = closed_valve_blocks_pipe and self.valve_pipe_open.get(pid) is False
+
+            if pipe_valve_closed:
+                valve_closed.append(k)
+
+            if not is_open[k]:
+                closed_count += 1
+                continue
+
+            if pipe_valve_closed:
+                closed_count += 1
+                closed_by_valve_count += 1
+                continue
+
+            iu = pipe_u[k]
+            iv = pipe_v[k]
+
+            if iu < 0 or iv < 0 or iu == iv:
+                unconnected_count += 1
+                continue
+
+            u = node_ids[iu]
+            v = node_ids[iv]
+
+            if u in blocked or v in blocked:
+                blocked_count += 1
+                continue
+
+            Lm = lengths[k]
+            Dmm = diams[k]
+            R = pipe_R(length_m=Lm, diam_mm=Dmm, r_scale=r_scale)
+
+            adj.setdefault(u, []).append((v, pid, R, Lm, Dmm))
+            adj.setdefault(v, []).append((u, pid, R, Lm, Dmm))
+            gga_pipes.append((pid, u, v, Lm, Dmm, self.roughness(k)))
+
+        return {
+            "adj": adj,
+            "gga_pipes": gga_pipes,
+            "blocked": blocked,
+            "pipes_valve_closed": valve_closed,
+            "counts": {
+                "unconnected": unconnected_count,
+                "closed": closed_count,
+                "closed_by_valve": closed_by_valve_count,
+                "blocked": blocked_count,
+            },
+        }
+
+
+def _nan_if_none(v: Any) -> float:
+    if v is None:
+        return math.nan
+    try:
+        return float(v)
+    except Exception:
+        return math.nan
+
+
+def load_network(cur, conn, default_diam_mm: float, version: int) -> NetworkModel:
+    pipes = read_pipes(cur, default_diam_mm=default_diam_mm)
+    nodes = read_nodes(cur)
+    valves = read_valves(cur, conn)
+    return NetworkModel(nodes, pipes, valves, default_diam_mm=default_diam_mm, version=version)
+
+
+def get_network(cur, conn, default_diam_mm: float) -> NetworkModel:
+    """
+    Devuelve la red cacheada si sigue vigente; si no, la relee con el
+    cursor recibido. Las excepciones de lectura se propagan al caller.
+    """
+    version = _STATE["version"]
+    model: NetworkModel | None = _STATE["model"]
+
+    if (
+        model is not None
+        and model.version == version
+        and model.default_diam_mm == float(default_diam_mm)
+        and (time.monotonic() - model.loaded_at) < NETWORK_MAX_AGE_SECONDS
+    ):
+        return model
+
+    model = load_network(cur, conn, default_diam_mm=default_diam_mm, version=version)
+
+    with _LOCK:
+        # Si hubo un bump mientras leíamos, el modelo ya nace viejo:
+        # se usa para esta corrida pero no se guarda.
+        if _STATE["version"] == version:
+            _STATE["model"] = model
+
+    return model
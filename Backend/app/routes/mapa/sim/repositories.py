@@ -19,6 +19,7 @@ def read_pipes(cur, default_diam_mm: float) -> list[dict[str, Any]]:
             COALESCE(active, true) AS active,
             COALESCE(type, 'WATER') AS type,
             COALESCE(flow_func, '') AS flow_func,
+            roughness::double precision AS roughness,
             COALESCE(props, '{}'::jsonb) AS props
         FROM "MapasAgua".pipes
         WHERE COALESCE(active, true) = true
@@ -43,6 +44,21 @@ def read_nodes(cur) -> list[dict[str, Any]]:
     return fetchall_dict(cur)
 
 
+def read_demands(cur) -> dict[str, float]:
+    cur.execute(
+        """
+        SELECT
+            node_id::text AS node_id,
+            SUM(demand_lps)::double precision AS demand_lps
+        FROM "MapasAgua".demands
+        WHERE node_id IS NOT NULL
+          AND demand_lps IS NOT NULL
+        GROUP BY node_id
+        """
+    )
+    return {r["node_id"]: float(r["demand_lps"]) for r in fetchall_dict(cur)}
+
+
 def read_live_sources(cur) -> list[dict[str, Any]]:
     cur.execute(
         """
@@ -0,0 +1,54 @@
+# app/routes/mapa/sim/runs.py
+"""
+Últimas corridas de simulación, en memoria del proceso.
+
+/mapa/sim/run guarda acá lo mínimo para poder recalcular un "what if"
+sin volver a correr toda la red:
+  - opciones y modelo
+  - fuentes (node_id, head_m) tal como se leyeron
+  - overrides de estado ya aplicados (para encadenar what-ifs)
+  - heads por nodo y caudal por cañería (sentido from_node -> to_node)
+
+Es un LRU chico: una corrida sobre la red completa pesa algunos MB.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict
+import threading
+import time
+import uuid
+
+
+RUNS_MAX = 8
+RUN_TTL_SECONDS = 3600.0
+
+_RUNS: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def save_run(record: Dict[str, Any]) -> str:
+    run_id = uuid.uuid4().hex
+    record = {**record, "run_id": run_id, "created_at": time.monotonic()}
+
+    with _LOCK:
+        _RUNS[run_id] = record
+        while len(_RUNS) > RUNS_MAX:
+            _RUNS.popitem(last=False)
+
+    return run_id
+
+
+def get_run(run_id: str) -> Dict[str, Any] | None:
+    with _LOCK:
+        record = _RUNS.get(run_id)
+
+        if record is None:
+            return None
+
+        if time.monotonic() - record["created_at"] > RUN_TTL_SECONDS:
+            _RUNS.pop(run_id, None)
+            return None
+
+        _RUNS.move_to_end(run_id)
+        return record
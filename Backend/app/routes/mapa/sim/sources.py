@@ -1,7 +1,7 @@
 # app/routes/mapa/sim/sources.py
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Iterable
 
 from .utils import pressure_from_head, safe_float
 
@@ -96,6 +96,16 @@ def source_meta_from_row(s: dict[str, Any], head_m: float) -> dict[str, Any]:
     }
 
 
+def source_group_counts(groups: Iterable[str | None]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+
+    for g in groups:
+        key = g or "OTHER"
+        counts[key] = counts.get(key, 0) + 1
+
+    return counts
+
+
 def classify_sources_reaching(items: list[dict[str, Any]]) -> tuple[str | None, list[str]]:
     """
     Clasifica mezcla de fuentes que llegan a un nodo/cañería.
@@ -106,11 +116,21 @@ def classify_sources_reaching(items: list[dict[str, Any]]) -> tuple[str | None,
     if not items:
         return None, []
 
-    groups = [x.get("source_group") for x in items]
-    tank_count = sum(1 for g in groups if g == "TANK")
-    pressure_count = sum(1 for g in groups if is_pressure_like_group(g))
-    manual_count = sum(1 for g in groups if g == "MANUAL")
-    real_pressure_count = sum(1 for g in groups if g == "PRESSURE")
+    return classify_source_groups(source_group_counts(x.get("source_group") for x in items))
+
+
+def classify_source_groups(counts: dict[str, int]) -> tuple[str | None, list[str]]:
+    """
+    Igual que classify_sources_reaching, pero a partir del conteo por grupo
+    (para no tener que armar la lista completa de fuentes de cada nodo).
+    """
+    if not counts:
+        return None, []
+
+    tank_count = counts.get("TANK", 0)
+    manual_count = counts.get("MANUAL", 0)
+    real_pressure_count = counts.get("PRESSURE", 0)
+    pressure_count = manual_count + real_pressure_count
 
     warnings: list[str] = []
 
@@ -154,9 +174,14 @@ def summarize_sources_reaching(
     dominant_head: float | None,
     node_elev_m: float | None,
     max_items: int = 6,
+    total_count: int | None = None,
+    group_counts: dict[str, int] | None = None,
 ) -> tuple[list[dict[str, Any]], int, str | None, list[str]]:
     """
     Prepara sources_reaching para salida JSON.
+
+    Si items trae solo las mejores fuentes (propagación multi-fuente),
+    total_count y group_counts describen el conjunto completo.
     """
     if not items:
         return [], 0, None, []
@@ -167,7 +192,10 @@ def summarize_sources_reaching(
         reverse=True,
     )
 
-    source_mix, warnings = classify_sources_reaching(sorted_items)
+    if group_counts is None:
+        source_mix, warnings = classify_sources_reaching(sorted_items)
+    else:
+        source_mix, warnings = classify_source_groups(group_counts)
 
     out: list[dict[str, Any]] = []
 
@@ -198,4 +226,6 @@ def summarize_sources_reaching(
             "live_status": x.get("live_status"),
         })
 
-    return out, len(sorted_items), source_mix, warnings
+    count = total_count if total_count is not None else len(sorted_items)
+
+    return out, count, source_mix, warnings
@@ -0,0 +1,176 @@
+# app/routes/mapa/tile_cache.py
+"""
+Cache en disco de vector tiles (MVT) de /mapa/mapasagua/tiles.
+
+- Un archivo por tile: {root}/{generation}/{layer}/{z}/{x}/{y}.mvt
+- LRU por mtime: en cada hit se "toca" el archivo; al pasar MAX_BYTES se
+  borran los más viejos hasta quedar en el 80%.
+- Invalidación por generación: editar cañerías llama a invalidate(), que
+  sube el número guardado en {root}/GENERATION. Todos los workers leen ese
+  archivo, así que la invalidación vale para todos los procesos; los
+  directorios de generaciones viejas se borran en el momento.
+
+Env:
+  MVT_CACHE_DIR     (default: /tmp/dirac_mvt_cache)
+  MVT_CACHE_MAX_MB  (default: 256)
+"""
+from __future__ import annotations
+
+from typing import Tuple
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+MVT_CACHE_DIR = os.getenv("MVT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dirac_mvt_cache"))
+MVT_CACHE_MAX_BYTES = int(float(os.getenv("MVT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+_GENERATION_FILE = "GENERATION"
+_EVICT_TO_RATIO = 0.8
+
+
+class TileCache:
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_bytes: int | None = None
+
+    # --------------------------------------------------------
+    # Generación
+    # --------------------------------------------------------
+    def generation(self) -> int:
+        try:
+            with open(os.path.join(self.root, _GENERATION_FILE), "r", encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def invalidate(self) -> int:
+        """Nueva generación: los tiles cacheados dejan de usarse y se borran."""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            gen = self.generation() + 1
+            self._write_atomic(os.path.join(self.root, _GENERATION_FILE), str(gen).encode("ascii"))
+
+            for name in os.listdir(self.root):
+                if name.isdigit() and int(name) < gen:
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+            self._approx_bytes = 0
+            return gen
+
+    # --------------------------------------------------------
+    # Tiles
+    # --------------------------------------------------------
+    def _path(self, gen: int, layer: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self.root, str(gen), layer, str(z), str(x), f"{y}.mvt")
+
+    def get(self, gen: int, layer: str, z: int, x: int, y: int) -> bytes | None:
+        path = self._path(gen, layer, z, x, y)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return data
+
+    def put(self, gen: int, layer: str, z: int, x: int, y: int, data: bytes) -> None:
+        # Si alguien invalidó mientras se generaba el tile, no guardarlo.
+        if gen != self.generation():
+            return
+
+        path = self._path(gen, layer, z, x, y)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_atomic(path, data)
+        except OSError as e:
+            log.warning("tile cache: no se pudo escribir %s: %s", path, e)
+            return
+
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan()[0]
+            else:
+                self._approx_bytes += len(data)
+
+            if self._approx_bytes > self.max_bytes:
+                self._evict()
+
+    # --------------------------------------------------------
+    # LRU
+    # --------------------------------------------------------
+    def _scan(self) -> Tuple[int, list]:
+        total = 0
+        files = []
+
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith(".mvt"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                total += st.st_size
+                files.append((st.st_mtime, st.st_size, path))
+
+        return total, files
+
+    def _evict(self) -> None:
+        total, files = self._scan()
+        target = int(self.max_bytes * _EVICT_TO_RATIO)
+
+        files.sort()
+        for _mtime, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        self._approx_bytes = total
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+
+tile_cache = TileCache(MVT_CACHE_DIR, MVT_CACHE_MAX_BYTES)
+
+
+# Respuestas de app/services/response_cache que dependen de "MapasAgua".pipes:
+# se invalidan en los mismos lugares que los tiles.
+PIPES_CACHE_NAMES = ("mapa_pipes_extent", "mapa_diameter_transitions")
+
+
+def invalidate_pipe_tiles() -> None:
+    """Llamar después de commitear cambios en "MapasAgua".pipes."""
+    try:
+        tile_cache.invalidate()
+    except OSError as e:
+        log.warning("tile cache: no se pudo invalidar: %s", e)
@@ -6,6 +6,10 @@ from pydantic import BaseModel
 from typing import Optional, Literal
 
 from app.db import get_conn
+from app.services.response_cache import invalidate_cache, notify_cache_invalidated
+
+from .sim.network import bump_network_version
+from .tile_cache import PIPES_CACHE_NAMES, invalidate_pipe_tiles
 
 router = APIRouter(prefix="/valves", tags=["mapa-valves"])
 
@@ -248,6 +252,7 @@ def create_valve(body: ValveCreateBody):
 
             valve_id = cur.fetchone()[0]
             conn.commit()
+            bump_network_version()
 
             item = _get_valve(cur, valve_id)
 
@@ -599,7 +604,11 @@ def insert_valve_on_pipe(body: ValveInsertOnPipeBody):
                 (valve_id, body.pipe_id),
             )
 
+            notify_cache_invalidated(cur, *PIPES_CACHE_NAMES)
             conn.commit()
+            bump_network_version()
+            invalidate_pipe_tiles()
+            invalidate_cache(*PIPES_CACHE_NAMES)
 
             item = _get_valve(cur, valve_id)
 
@@ -654,6 +663,7 @@ def update_valve_state(valve_id: str, body: ValveStateBody):
                 raise HTTPException(404, "Válvula no encontrada")
 
             conn.commit()
+            bump_network_version()
 
             item = _get_valve(cur, valve_id)
 
@@ -691,6 +701,7 @@ def delete_valve(valve_id: str):
                 raise HTTPException(404, "Válvula no encontrada")
 
             conn.commit()
+            bump_network_version()
 
         except HTTPException:
             _safe_rollback(conn)
@@ -1,13 +1,24 @@
 # app/routes/plc/location_alarm.py
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Literal, Optional
 from psycopg.rows import dict_row
+import os
+import time
 
 from app.db import get_conn
+from app.services.location_alarm_queue import (
+  ALARM_QUEUE_FALLBACK_SEC,
+  alarm_queue,
+  notify_alarm_done,
+)
+from app.services.pg_listen import pg_listener
 
 router = APIRouter(tags=["plc-location-alarm"])
 
+ALARM_LONGPOLL_MAX_SEC = int(os.getenv("ALARM_LONGPOLL_MAX_SEC", "55"))
+
 # Modelo para ACK desde PLC
 class LocationAlarmAck(BaseModel):
   status: Literal["sent", "acked", "failed"]
@@ -17,60 +28,49 @@ class LocationAlarmAck(BaseModel):
 
 
 @router.get("/location_alarm/pending")
-def get_pending_location_alarm_commands(
+async def get_pending_location_alarm_commands(
   limit: int = Query(50, ge=1, le=500),
   location_id: Optional[int] = Query(None),
   company_id: Optional[int] = Query(None),
+  wait: int = Query(
+    0,
+    ge=0,
+    le=ALARM_LONGPOLL_MAX_SEC,
+    description="Long-poll: segundos a esperar si no hay comandos (0 = responde al toque)",
+  ),
 ):
   """
   Endopoint para el PLC / Node-RED:
   devuelve comandos de alarma pendientes (status = 'pending'),
   filtrables por location_id y/o company_id.
+
+  Se responde desde la cola en memoria (alarm_queue), sin ir a la DB en
+  cada vuelta. Con ?wait=N, si no hay nada la respuesta se demora hasta
+  que se cree un comando que entre en el filtro (en este worker o en otro,
+  vía pg_notify('location_alarm_commands')) o hasta N segundos.
   """
-  with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-    conds = ["c.status = 'pending'"]
-    params: list = []
-
-    if location_id is not None:
-      conds.append("c.location_id = %s")
-      params.append(location_id)
-
-    if company_id is not None:
-      conds.append("l.company_id = %s")
-      params.append(company_id)
-
-    sql = f"""
-      SELECT
-        c.id,
-        c.location_id,
-        l.name AS location_name,
-        l.company_id,
-        c.action,
-        c.status,
-        c.requested_at
-      FROM public.location_alarm_commands c
-      JOIN public.locations l ON l.id = c.location_id
-      WHERE {" AND ".join(conds)}
-      ORDER BY c.requested_at
-      LIMIT %s
-    """
-    params.append(limit)
-
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-
-    return [
-      {
-        "id": r["id"],
-        "location_id": r["location_id"],
-        "location_name": r["location_name"],
-        "company_id": r["company_id"],
-        "action": r["action"],
-        "status": r["status"],
-        "requested_at": r["requested_at"].isoformat(),
-      }
-      for r in rows
-    ]
+  await run_in_threadpool(alarm_queue.ensure_fresh)
+  rows = alarm_queue.pending(location_id, company_id, limit)
+
+  if rows or wait <= 0:
+    return rows
+
+  deadline = time.monotonic() + wait
+
+  while not rows:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+      break
+
+    # Sin LISTEN, los comandos creados en otro worker solo llegan con el
+    # re-sync: se despierta cada ALARM_QUEUE_FALLBACK_SEC para hacerlo.
+    step = remaining if pg_listener.connected else min(remaining, ALARM_QUEUE_FALLBACK_SEC)
+
+    if not await alarm_queue.wait(location_id, company_id, step):
+      await run_in_threadpool(alarm_queue.ensure_fresh)
+    rows = alarm_queue.pending(location_id, company_id, limit)
+
+  return rows
 
 
 @router.post("/location_alarm/{command_id}/ack")
@@ -80,7 +80,7 @@ def ack_location_alarm_command(command_id: int, payload: LocationAlarmAck):
   - Actualiza status en location_alarm_commands.
   - Opcionalmente registra un evento on/off en location_alarm_events.
   """
-  with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+  with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
     # Traer comando y localidad
     cur.execute(
       """
@@ -127,8 +127,12 @@ def ack_location_alarm_command(command_id: int, payload: LocationAlarmAck):
         (cmd["location_id"], payload.state),
       )
 
+    # Ya no está pending: sacarlo de la cola de todos los workers
+    notify_alarm_done(cur, command_id)
     conn.commit()
 
+    alarm_queue.remove(command_id)
+
     return {
       "ok": True,
       "command_id": command_id,
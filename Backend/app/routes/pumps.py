@@ -1,18 +1,15 @@
 # app/routes/pumps.py
-import json
-import time
-import hashlib
 from datetime import datetime, date
 from decimal import Decimal
 from uuid import UUID
 
-from fastapi import APIRouter, Request, Response
+from fastapi import APIRouter
 from app.db import get_conn
+from app.services.response_cache import cached_response
 from psycopg.rows import dict_row
 
 router = APIRouter(prefix="/pumps", tags=["pumps"])
 
-_PUMPS_CONFIG_CACHE = {"ts": 0.0, "data": None, "etag": None}
 _PUMPS_CONFIG_TTL_SECONDS = 10
 
 
@@ -28,35 +25,9 @@ def _jsonable(v):
     return v
 
 
-def _compute_etag(data) -> str:
-    # Aseguramos json 100% serializable
-    body = json.dumps(
-        data,
-        separators=(",", ":"),
-        ensure_ascii=False,
-        default=_jsonable,
-    ).encode("utf-8")
-    return hashlib.sha1(body).hexdigest()
-
-
 @router.get("/config")
-def list_pumps_config(request: Request, response: Response):
-    now = time.time()
-
-    # 1) cache HIT
-    cached = _PUMPS_CONFIG_CACHE["data"]
-    if cached is not None and (now - _PUMPS_CONFIG_CACHE["ts"]) < _PUMPS_CONFIG_TTL_SECONDS:
-        etag = _PUMPS_CONFIG_CACHE["etag"]
-        response.headers["ETag"] = etag
-        response.headers["Cache-Control"] = f"public, max-age={_PUMPS_CONFIG_TTL_SECONDS}"
-        response.headers["X-Cache"] = "HIT"
-
-        if request.headers.get("if-none-match") == etag:
-            return Response(status_code=304, headers=dict(response.headers))
-
-        return cached
-
-    # 2) cache MISS => DB
+@cached_response("pumps_config", ttl=_PUMPS_CONFIG_TTL_SECONDS)
+def list_pumps_config():
     sql = """
     SELECT
       v.pump_id,
@@ -92,11 +63,9 @@ def list_pumps_config(request: Request, response: Response):
     ORDER BY v.pump_id
     """
 
-    t0 = time.perf_counter()
     with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql)
         rows = cur.fetchall()
-    db_ms = int((time.perf_counter() - t0) * 1000)
 
     out = []
     for r in rows:
@@ -134,15 +103,4 @@ def list_pumps_config(request: Request, response: Response):
             }
         )
 
-    etag = _compute_etag(out)
-    _PUMPS_CONFIG_CACHE.update({"ts": now, "data": out, "etag": etag})
-
-    response.headers["ETag"] = etag
-    response.headers["Cache-Control"] = f"public, max-age={_PUMPS_CONFIG_TTL_SECONDS}"
-    response.headers["X-Cache"] = "MISS"
-    response.headers["X-DB-MS"] = str(db_ms)
-
-    if request.headers.get("if-none-match") == etag:
-        return Response(status_code=304, headers=dict(response.headers))
-
-    return out
\ No newline at end of file
+    return out
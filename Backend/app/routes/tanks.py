@@ -1,19 +1,15 @@
 # app/routes/tanks.py
-import json
-import time
-import hashlib
 from datetime import datetime, date
 from decimal import Decimal
 from uuid import UUID
 
-from fastapi import APIRouter, Request, Response
+from fastapi import APIRouter
 from app.db import get_conn
+from app.services.response_cache import cached_response
 from psycopg.rows import dict_row
 
 router = APIRouter(prefix="/tanks", tags=["tanks"])
 
-# Cache RAM (como pumps)
-_TANKS_CONFIG_CACHE = {"ts": 0.0, "data": None, "etag": None}
 _TANKS_CONFIG_TTL_SECONDS = 10  # subilo a 30/60 si querés
 
 
@@ -29,16 +25,6 @@ def _jsonable(v):
     return v
 
 
-def _compute_etag(data) -> str:
-    body = json.dumps(
-        data,
-        separators=(",", ":"),
-        ensure_ascii=False,
-        default=_jsonable,
-    ).encode("utf-8")
-    return hashlib.sha1(body).hexdigest()
-
-
 def compute_alarm(level_pct, low_low, low, high, high_high):
     """Devuelve 'normal' | 'alerta' | 'critico'."""
     if level_pct is None:
@@ -57,23 +43,8 @@ def compute_alarm(level_pct, low_low, low, high, high_high):
 
 
 @router.get("/config")
-def list_tanks_config(request: Request, response: Response):
-    now = time.time()
-
-    # 1) Cache HIT
-    cached = _TANKS_CONFIG_CACHE["data"]
-    if cached is not None and (now - _TANKS_CONFIG_CACHE["ts"]) < _TANKS_CONFIG_TTL_SECONDS:
-        etag = _TANKS_CONFIG_CACHE["etag"]
-        response.headers["ETag"] = etag
-        response.headers["Cache-Control"] = f"public, max-age={_TANKS_CONFIG_TTL_SECONDS}"
-        response.headers["X-Cache"] = "HIT"
-
-        if request.headers.get("if-none-match") == etag:
-            return Response(status_code=304, headers=dict(response.headers))
-
-        return cached
-
-    # 2) Cache MISS => DB
+@cached_response("tanks_config", ttl=_TANKS_CONFIG_TTL_SECONDS)
+def list_tanks_config():
     sql = """
     select
       v.tank_id,
@@ -104,11 +75,9 @@ def list_tanks_config(request: Request, response: Response):
     order by v.tank_id
     """
 
-    t0 = time.perf_counter()
     with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql)
         rows = cur.fetchall()
-    db_ms = int((time.perf_counter() - t0) * 1000)
 
     out = []
     for r in rows:
@@ -158,15 +127,4 @@ def list_tanks_config(request: Request, response: Response):
             }
         )
 
-    etag = _compute_etag(out)
-    _TANKS_CONFIG_CACHE.update({"ts": now, "data": out, "etag": etag})
-
-    response.headers["ETag"] = etag
-    response.headers["Cache-Control"] = f"public, max-age={_TANKS_CONFIG_TTL_SECONDS}"
-    response.headers["X-Cache"] = "MISS"
-    response.headers["X-DB-MS"] = str(db_ms)
-
-    if request.headers.get("if-none-match") == etag:
-        return Response(status_code=304, headers=dict(response.headers))
-
-    return out
\ No newline at end of file
+    return out
@@ -1,5 +1,5 @@
 # app/schemas.py
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel, conint, confloat
 
@@ -72,3 +72,17 @@ class TankIngestOut(BaseModel):
     tank_id: int
     level_pct: float
     created_at: datetime
+
+
+class TankIngestBatchRowOut(BaseModel):
+    index: int
+    status: str  # "accepted" | "rejected"
+    tank_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class TankIngestBatchOut(BaseModel):
+    received: int
+    accepted: int
+    rejected: int
+    results: List[TankIngestBatchRowOut]
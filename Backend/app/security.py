@@ -1,11 +1,66 @@
 # app/security.py
+"""
+Autenticación de las rutas dirac/*.
+
+Dos formas de mandar credenciales:
+  - Basic (email + password_plain, como siempre). La validación exitosa
+    queda en una caché en memoria AUTH_CACHE_TTL_SEC segundos, con clave
+    sha256 de las credenciales (no se guarda la password), así un panel
+    que llama cada pocos segundos no consulta app_users en cada request.
+  - Bearer: token firmado (HMAC-SHA256 con AUTH_TOKEN_SECRET) que se pide
+    una vez con Basic en POST /dirac/me/token. La firma se valida sin ir a
+    la DB; el estado del usuario (status, password_updated_at) se lee de
+    app_users y se cachea por uid AUTH_CACHE_TTL_SEC segundos.
+
+Invalidación: un token deja de valer si el usuario no existe, no está
+active o cambió la password después de emitido (iat < password_updated_at).
+Eso sale de la DB, así que vale en todos los workers y sobrevive a los
+reinicios, con un atraso de a lo sumo AUTH_CACHE_TTL_SEC. Además
+dirac_admin/users llama a notify_user_changed() dentro de la transacción
+(pg_notify, para los demás workers vía pg_listener) e invalidate_user()
+después del commit: borra la caché del usuario en el momento.
+
+Env:
+  AUTH_CACHE_TTL_SEC   (default 60; 0 desactiva la caché)
+  AUTH_CACHE_MAX       (default 1000 entradas)
+  AUTH_TOKEN_SECRET    (sin valor: secreto aleatorio por proceso, los
+                        tokens sólo valen en el worker que los emitió)
+  AUTH_TOKEN_TTL_SEC   (default 43200 = 12 h)
+"""
+from typing import Optional
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
 from psycopg.rows import dict_row
+
 from app.db import get_conn
+from app.services.pg_listen import pg_listener
+
+log = logging.getLogger("security")
+
+AUTH_CACHE_TTL_SEC = float(os.getenv("AUTH_CACHE_TTL_SEC", "60"))
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "1000"))
+AUTH_TOKEN_TTL_SEC = int(os.getenv("AUTH_TOKEN_TTL_SEC", "43200"))
+
+_TOKEN_SECRET = os.getenv("AUTH_TOKEN_SECRET", "").encode()
+if not _TOKEN_SECRET:
+    log.warning("AUTH_TOKEN_SECRET no definido: los tokens sólo valen en este proceso")
+    _TOKEN_SECRET = secrets.token_bytes(32)
+
+USERS_CHANNEL = "app_users_changed"
 
 # No usamos passlib ni hash. Login básico con password_plain.
 security = HTTPBasic(auto_error=False)
+bearer = HTTPBearer(auto_error=False)
 
 def _unauth():
     return HTTPException(
@@ -14,14 +69,202 @@ def _unauth():
         headers={"WWW-Authenticate": 'Basic realm="dirac", charset="UTF-8"'},
     )
 
-def require_user(credentials: HTTPBasicCredentials = Depends(security)):
-    # Si no hay credenciales, 401
-    if credentials is None or not credentials.username or credentials.password is None:
-        raise _unauth()
+# ============================================================
+# Caché de credenciales Basic
+# ============================================================
+class CredentialCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # sha256(email, password) -> (vence, identidad)
+        self._by_key: dict[str, tuple[float, dict]] = {}
+        # user_id -> momento del último cambio (tokens anteriores no valen)
+        self._changed_at: dict[int, float] = {}
+        # user_id -> (vence, tokens válidos desde | None = usuario inválido)
+        self._token_state: dict[int, tuple[float, Optional[float]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(email: str, pwd: str) -> str:
+        return hashlib.sha256(f"{email}\0{pwd}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._by_key.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._by_key[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, identity: dict, read_at: float) -> None:
+        """read_at: time.time() de antes de leer app_users."""
+        if AUTH_CACHE_TTL_SEC <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # Un cambio del usuario durante la lectura: no cachear lo leído
+            if self._changed_at.get(identity["user_id"], 0.0) >= read_at:
+                return
+            if len(self._by_key) >= AUTH_CACHE_MAX:
+                self._by_key = {k: e for k, e in self._by_key.items() if e[0] > now}
+                # Sigue lleno: fuera las más viejas (dict mantiene orden de alta)
+                while len(self._by_key) >= AUTH_CACHE_MAX:
+                    del self._by_key[next(iter(self._by_key))]
+            self._by_key[key] = (now + AUTH_CACHE_TTL_SEC, identity)
+
+    def token_state(self, user_id: int) -> tuple[bool, Optional[float]]:
+        """(hay dato vigente, tokens válidos desde) del usuario."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._token_state.get(user_id)
+            if entry is not None and entry[0] > now:
+                return True, entry[1]
+            return False, None
+
+    def put_token_state(self, user_id: int, valid_after: Optional[float], read_at: float) -> None:
+        if AUTH_CACHE_TTL_SEC <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._changed_at.get(user_id, 0.0) >= read_at:
+                return
+            if len(self._token_state) >= AUTH_CACHE_MAX:
+                self._token_state = {u: e for u, e in self._token_state.items() if e[0] > now}
+                while len(self._token_state) >= AUTH_CACHE_MAX:
+                    del self._token_state[next(iter(self._token_state))]
+            self._token_state[user_id] = (now + AUTH_CACHE_TTL_SEC, valid_after)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._by_key = {k: e for k, e in self._by_key.items() if e[1]["user_id"] != user_id}
+            self._token_state.pop(user_id, None)
+            self._changed_at[user_id] = time.time()
+
+    def changed_at(self, user_id: int) -> float:
+        with self._lock:
+            return self._changed_at.get(user_id, 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._by_key), "hits": self.hits, "misses": self.misses}
+
+
+credential_cache = CredentialCache()
+
+
+def invalidate_user(user_id: int) -> None:
+    """Después del commit de un cambio en app_users (este worker)."""
+    credential_cache.invalidate(int(user_id))
+
+
+def notify_user_changed(cur, user_id: int) -> None:
+    """Dentro de la transacción del UPDATE/DELETE (sale al commit, demás workers)."""
+    cur.execute("SELECT pg_notify(%s, %s)", (USERS_CHANNEL, json.dumps({"id": int(user_id)})))
+
+
+def _on_pg_notify(payload: str) -> None:
+    try:
+        invalidate_user(json.loads(payload)["id"])
+    except (ValueError, KeyError, TypeError):
+        log.warning("app_users_changed: payload inválido %r", payload[:200])
+
+
+pg_listener.on(USERS_CHANNEL, _on_pg_notify)
 
+# ============================================================
+# Tokens firmados
+# ============================================================
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64(hmac.new(_TOKEN_SECRET, body.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_token(user: dict) -> dict:
+    now = time.time()
+    claims = {
+        "uid": user["user_id"],
+        "email": user["email"],
+        "su": user["superadmin"],
+        "iat": round(now, 3),
+        "exp": int(now) + AUTH_TOKEN_TTL_SEC,
+    }
+    body = _b64(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return {
+        "access_token": f"{body}.{_sign(body)}",
+        "token_type": "bearer",
+        "expires_in": AUTH_TOKEN_TTL_SEC,
+    }
+
+
+def _token_valid_after(user_id: int) -> Optional[float]:
+    """
+    Desde cuándo valen los tokens del usuario (epoch): el último cambio de
+    password. None si el usuario no existe o no está active.
+    """
+    cached, valid_after = credential_cache.token_state(user_id)
+    if cached:
+        return valid_after
+
+    read_at = time.time()
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT status::text, extract(epoch FROM password_updated_at)::float8
+            FROM app_users
+            WHERE id = %s
+            """,
+            (user_id,),
+        )
+        row = cur.fetchone()
+
+    valid_after = (row[1] or 0.0) if row and row[0] == "active" else None
+    credential_cache.put_token_state(user_id, valid_after, read_at)
+    return valid_after
+
+
+def verify_token(token: str) -> Optional[dict]:
+    """Identidad del token o None si la firma, el vencimiento o la revocación fallan."""
+    body, _, sig = token.partition(".")
+    try:
+        if not body or not sig or not hmac.compare_digest(sig.encode("ascii"), _sign(body).encode("ascii")):
+            return None
+        claims = json.loads(_unb64(body))
+        uid = int(claims["uid"])
+        if claims["exp"] <= time.time() or claims["iat"] < credential_cache.changed_at(uid):
+            return None
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    # Revocación compartida: usuario borrado / inactivo / password cambiada
+    valid_after = _token_valid_after(uid)
+    if valid_after is None or claims["iat"] < valid_after:
+        return None
+    return {"user_id": uid, "email": claims["email"], "superadmin": bool(claims["su"])}
+
+# ============================================================
+# Dependencias
+# ============================================================
+def _check_basic(credentials: HTTPBasicCredentials) -> dict:
     email = credentials.username.strip().lower()
     pwd = credentials.password
 
+    key = CredentialCache.key(email, pwd)
+    cached = credential_cache.get(key)
+    if cached is not None:
+        return cached
+
+    read_at = time.time()
     with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(
             """
@@ -33,13 +276,41 @@ def require_user(credentials: HTTPBasicCredentials = Depends(security)):
         )
         u = cur.fetchone()
 
-        # Fallar-cerrado: usuario no existe, inactivo o password_plain no coincide
-        if not u or u["status"] != "active" or u.get("password_plain") is None or pwd != u["password_plain"]:
+    # Fallar-cerrado: usuario no existe, inactivo o password_plain no coincide
+    if (
+        not u
+        or u["status"] != "active"
+        or u.get("password_plain") is None
+        or not hmac.compare_digest(pwd.encode("utf-8"), u["password_plain"].encode("utf-8"))
+    ):
+        raise _unauth()
+
+    # OK: identidad básica
+    identity = {
+        "user_id": int(u["id"]),
+        "email": u["email"],
+        "superadmin": bool(u.get("is_superadmin")),
+    }
+    credential_cache.put(key, identity, read_at)
+    return identity
+
+
+def require_basic_user(credentials: HTTPBasicCredentials = Depends(security)):
+    """Sólo Basic: para emitir tokens (un token no se renueva a sí mismo)."""
+    if credentials is None or not credentials.username or credentials.password is None:
+        raise _unauth()
+    return dict(_check_basic(credentials))
+
+
+def require_user(
+    credentials: HTTPBasicCredentials = Depends(security),
+    token: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+):
+    if token is not None and token.credentials:
+        user = verify_token(token.credentials)
+        if user is None:
             raise _unauth()
+        return user
+
+    return require_basic_user(credentials)
 
-        # OK: devolvemos identidad básica
-        return {
-            "user_id": int(u["id"]),
-            "email": u["email"],
-            "superadmin": bool(u.get("is_superadmin")),
-        }
@@ -0,0 +1,108 @@
+# app/services/command_notify.py
+"""
+Aviso de "hay comando nuevo para la bomba X" para el long-poll de
+/arduino-controler/next_commands.
+
+- En proceso: quien crea el comando llama a command_notifier.notify()
+  después del commit.
+- Entre procesos / workers: notify_command_created(cur, pump_id) hace
+  pg_notify('pump_commands', pump_id) dentro de la misma transacción; el
+  aviso sale al commitear y lo recibe pg_listener en cada worker.
+
+command_notifier.wait() es async: el long-poll no ocupa un hilo del
+threadpool mientras espera.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+import asyncio
+import logging
+import threading
+
+from app.services.pg_listen import pg_listener
+
+log = logging.getLogger("command-notify")
+
+PUMP_COMMANDS_CHANNEL = "pump_commands"
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(True)
+
+
+class CommandNotifier:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Contador por bomba: evita perder un aviso que llega entre el
+        # SELECT del long-poll y el wait().
+        self._seq: dict[int, int] = defaultdict(int)
+        self._waiters: dict[int, set] = defaultdict(set)
+
+    def seq(self, pump_id: int) -> int:
+        return self._seq.get(int(pump_id), 0)
+
+    def notify(self, pump_id: int) -> None:
+        """Se puede llamar desde cualquier hilo."""
+        pump_id = int(pump_id)
+        with self._lock:
+            self._seq[pump_id] += 1
+            waiters = self._waiters.pop(pump_id, ())
+
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, fut)
+            except RuntimeError:
+                pass
+
+    async def wait(self, pump_id: int, seq: int, timeout: float) -> bool:
+        """True si hubo aviso (o ya había uno desde `seq`), False si venció el timeout."""
+        pump_id = int(pump_id)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        entry = (loop, fut)
+
+        with self._lock:
+            if self._seq.get(pump_id, 0) != seq:
+                return True
+            self._waiters[pump_id].add(entry)
+
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                ws = self._waiters.get(pump_id)
+                if ws is not None:
+                    ws.discard(entry)
+                    if not ws:
+                        self._waiters.pop(pump_id, None)
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._waiters.values())
+
+
+command_notifier = CommandNotifier()
+
+
+def notify_command_created(cur, pump_id: int) -> None:
+    """Dentro de la transacción que inserta en pump_commands (sale al commit)."""
+    cur.execute("SELECT pg_notify(%s, %s)", (PUMP_COMMANDS_CHANNEL, str(int(pump_id))))
+
+
+async def anotify_command_created(cur, pump_id: int) -> None:
+    """notify_command_created() para cursores async."""
+    await cur.execute("SELECT pg_notify(%s, %s)", (PUMP_COMMANDS_CHANNEL, str(int(pump_id))))
+
+
+def _on_pg_notify(payload: str) -> None:
+    try:
+        command_notifier.notify(int(payload))
+    except ValueError:
+        log.warning("pump_commands: payload inválido %r", payload)
+
+
+pg_listener.on(PUMP_COMMANDS_CHANNEL, _on_pg_notify)
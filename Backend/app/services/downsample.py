@@ -0,0 +1,129 @@
+# app/services/downsample.py
+"""
+Reducción de puntos para gráficos (parámetro max_points de los históricos).
+
+Un mes a 1 minuto son ~43k puntos por serie y el gráfico dibuja ~1500
+píxeles. Dos métodos, sobre filas ya ordenadas por tiempo:
+
+  minmax  (default) parte la serie en buckets de igual cantidad de
+          puntos y de cada uno se queda con la fila del mínimo y la del
+          máximo de cada columna pedida. Los picos sobreviven siempre, y
+          un cruce de umbral (alarma) dentro de un bucket también: su
+          mínimo queda de un lado y su máximo del otro.
+  lttb    Largest-Triangle-Three-Buckets sobre la primera columna: la
+          forma más fiel con menos puntos. Se agregan igual las filas del
+          mínimo y máximo global de cada columna.
+
+Primera y última fila se mantienen siempre. Los NULL no cuentan para
+min/max. Con group_key se reduce cada serie (tanque, bomba) por separado
+y se devuelve en el orden original de las filas.
+"""
+from __future__ import annotations
+
+from typing import Any, Literal, Optional, Sequence
+
+import numpy as np
+
+DownsampleMethod = Literal["minmax", "lttb"]
+
+
+def _column(rows: Sequence[dict], key: str) -> np.ndarray:
+    # Decimal / int / None -> float64 (None -> NaN)
+    return np.array([r.get(key) for r in rows], dtype=np.float64)
+
+
+def _first_per_bucket(order: np.ndarray, bucket: np.ndarray) -> np.ndarray:
+    b = bucket[order]
+    return order[np.r_[True, b[1:] != b[:-1]]]
+
+
+def minmax_indices(columns: Sequence[np.ndarray], max_points: int) -> np.ndarray:
+    n = columns[0].size if columns else 0
+    if n <= max_points or not columns:
+        return np.arange(n)
+    per_bucket = 2 * len(columns)
+    n_buckets = max(1, (max_points - 2) // per_bucket)
+    bucket = (np.arange(n) * n_buckets) // n
+
+    keep = [np.array([0, n - 1])]
+    for col in columns:
+        lo = np.where(np.isnan(col), np.inf, col)
+        hi = np.where(np.isnan(col), -np.inf, col)
+        # lexsort: por bucket y dentro del bucket por valor -> primera fila = extremo
+        keep.append(_first_per_bucket(np.lexsort((lo, bucket)), bucket))
+        keep.append(_first_per_bucket(np.lexsort((-hi, bucket)), bucket))
+    return np.unique(np.concatenate(keep))
+
+
+def lttb_indices(columns: Sequence[np.ndarray], max_points: int) -> np.ndarray:
+    n = columns[0].size if columns else 0
+    if n <= max_points or max_points < 3 or not columns:
+        return np.arange(n)
+    y = columns[0]
+    y = np.where(np.isnan(y), np.nanmean(y) if np.any(~np.isnan(y)) else 0.0, y)
+    x = np.arange(n, dtype=np.float64)
+
+    # Lugar para los extremos globales que se agregan al final
+    n_out = max(3, max_points - 2 * len(columns))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+
+    keep = [out]
+    for col in columns:
+        if np.any(~np.isnan(col)):
+            keep.append(np.array([np.nanargmin(col), np.nanargmax(col)]))
+    return np.unique(np.concatenate(keep))
+
+
+def downsample_rows(
+    rows: Sequence[dict],
+    max_points: Optional[int],
+    keys: Sequence[str],
+    *,
+    method: DownsampleMethod = "minmax",
+    group_key: Optional[str] = None,
+) -> list:
+    """
+    rows ordenadas por tiempo (dentro de cada grupo). max_points es por
+    serie; None o series más cortas vuelven sin tocar.
+    """
+    rows = list(rows)
+    if not max_points or not rows:
+        return rows
+    pick = lttb_indices if method == "lttb" else minmax_indices
+
+    if group_key is None:
+        groups: dict[Any, list[int]] = {None: list(range(len(rows)))}
+    else:
+        groups = {}
+        for i, r in enumerate(rows):
+            groups.setdefault(r.get(group_key), []).append(i)
+
+    kept: list[np.ndarray] = []
+    for idx in groups.values():
+        if len(idx) <= max_points:
+            kept.append(np.asarray(idx, dtype=np.int64))
+            continue
+        sub = [rows[i] for i in idx]
+        sel = pick([_column(sub, k) for k in keys], max_points)
+        kept.append(np.asarray(idx, dtype=np.int64)[sel])
+
+    order = np.sort(np.concatenate(kept))
+    return [rows[i] for i in order.tolist()]
+
+
+def downsample_info(method: str, max_points: Optional[int], points_in: int, points_out: int) -> Optional[dict]:
+    """Bloque "downsample" de la respuesta (None si no se pidió)."""
+    if not max_points:
+        return None
+    return {"method": method, "max_points": max_points, "points_in": points_in, "points_out": points_out}
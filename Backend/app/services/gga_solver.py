@@ -0,0 +1,253 @@
+# app/services/gga_solver.py
+"""
+Solver hidráulico no lineal por Gradiente Global (Todini-Pilati, el de EPANET).
+
+Incógnitas: caudal por cañería (Q) y head en nodos libres (H).
+Cada iteración de Newton linealiza la pérdida de carga:
+
+    p_k = 1 / h'(Q_k)          y_k = p_k * h(Q_k)
+    (Σ p) H_i - Σ p H_j = Σ_in (Q - y) - Σ_out (Q - y) - demanda_i
+    Q_k' = (Q_k - y_k) + p_k * (H_u - H_v)
+
+El sistema en H es un Laplaciano ponderado por p, disperso y simétrico,
+y se resuelve con LU dispersa igual que en sim_solver.
+
+Unidades internas SI: Q [m³/s], H [m], L [m], D [m].
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+import math
+import threading
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve
+
+
+G_ACCEL = 9.81
+NU_WATER = 1.004e-6  # viscosidad cinemática a 20 °C [m²/s]
+HW_EXP = 1.852
+RQ_TOL = 1e-7  # piso de dh/dQ cerca de Q=0 (mismo criterio que EPANET)
+INIT_VELOCITY_MPS = 0.3  # arranque en frío: ~1 ft/s en cada cañería
+
+# Hazen-Williams: roughness = coeficiente C
+# Darcy-Weisbach: roughness = rugosidad absoluta en mm
+DEFAULT_ROUGHNESS = {"HW": 130.0, "DW": 0.1}
+
+# Último caudal resuelto por cañería (m³/s).
+# Se usa como punto de partida de la corrida siguiente: como entre corridas
+# solo cambian los heads de las fuentes, Newton converge en 2-3 iteraciones.
+_WARM_FLOWS: Dict[str, float] = {}
+_WARM_LOCK = threading.Lock()
+
+GgaPipe = Tuple[str, str, str, float, float, Optional[float]]
+
+
+def clear_warm_start() -> None:
+    with _WARM_LOCK:
+        _WARM_FLOWS.clear()
+
+
+def _headloss(
+    Q: np.ndarray,
+    L: np.ndarray,
+    D: np.ndarray,
+    rough: np.ndarray,
+    formula: str,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Devuelve (h(Q), h'(Q)) por cañería, con el signo de Q.
+    """
+    aQ = np.abs(Q)
+
+    if formula == "DW":
+        area = math.pi * D * D / 4.0
+        Re = aQ / area * D / NU_WATER
+        r = 8.0 * L / (math.pi ** 2 * G_ACCEL * D ** 5)
+
+        # Turbulento: Swamee-Jain
+        eps = rough / 1000.0
+        Re_t = np.maximum(Re, 2000.0)
+        f = 0.25 / np.log10(eps / (3.7 * D) + 5.74 / Re_t ** 0.9) ** 2
+        hl_t = f * r * aQ * Q
+        dh_t = 2.0 * f * r * aQ
+
+        # Laminar: f = 64/Re => h lineal en Q
+        k_lam = 128.0 * NU_WATER * L / (math.pi * G_ACCEL * D ** 4)
+        laminar = Re < 2000.0
+
+        hl = np.where(laminar, k_lam * Q, hl_t)
+        dh = np.where(laminar, k_lam, dh_t)
+    else:
+        r = 10.67 * L / (rough ** HW_EXP * D ** 4.871)
+        q_pow = aQ ** (HW_EXP - 1.0)
+        hl = r * q_pow * Q
+        dh = HW_EXP * r * q_pow
+
+    return hl, np.maximum(dh, RQ_TOL)
+
+
+def run_gga_simulation(
+    pipes: List[GgaPipe],
+    fixed_heads: Dict[str, float],
+    demands_lps: Optional[Dict[str, float]] = None,
+    headloss: str = "HW",
+    default_roughness: Optional[float] = None,
+    max_iter: int = 40,
+    accuracy: float = 1e-3,
+    warm_start: bool = True,
+) -> Dict[str, Any]:
+    """
+    pipes: [(pipe_id, u, v, length_m, diam_mm, roughness|None)] ya filtradas
+           (abiertas, activas, sin válvula cerrada).
+    fixed_heads: node_id -> head_m de las fuentes.
+    demands_lps: node_id -> consumo en l/s (positivo = sale de la red).
+
+    Los nodos sin camino a una fuente quedan fuera del sistema
+    (no aparecen en "heads" y sus demandas se ignoran).
+
+    Devuelve heads por nodo, caudal (l/s, sentido u -> v) y pérdida de carga
+    por cañería, más datos de convergencia.
+    """
+    formula = "DW" if str(headloss or "HW").upper() == "DW" else "HW"
+    rough_default = float(default_roughness or DEFAULT_ROUGHNESS[formula])
+    demands_lps = demands_lps or {}
+
+    # --------------------------------------------------------
+    # Índices de nodos
+    # --------------------------------------------------------
+    idx: Dict[str, int] = {}
+    for nid in fixed_heads:
+        idx.setdefault(nid, len(idx))
+    for _pid, u, v, _L, _D, _rough in pipes:
+        idx.setdefault(u, len(idx))
+        idx.setdefault(v, len(idx))
+
+    n = len(idx)
+    m = len(pipes)
+
+    iu = np.fromiter((idx[p[1]] for p in pipes), dtype=np.int64, count=m)
+    iv = np.fromiter((idx[p[2]] for p in pipes), dtype=np.int64, count=m)
+
+    fixed = np.fromiter((idx[nid] for nid in fixed_heads), dtype=np.int64, count=len(fixed_heads))
+    H = np.zeros(n, dtype=np.float64)
+    H[fixed] = np.fromiter(fixed_heads.values(), dtype=np.float64, count=len(fixed_heads))
+
+    # --------------------------------------------------------
+    # Solo entran componentes conectadas a alguna fuente
+    # --------------------------------------------------------
+    topo = coo_matrix((np.ones(m), (iu, iv)), shape=(n, n))
+    _, labels = connected_components(topo, directed=False)
+    anchored_comp = np.zeros(int(labels.max()) + 1 if n else 0, dtype=bool)
+    anchored_comp[labels[fixed]] = True
+    anchored = anchored_comp[labels]
+
+    is_free = anchored.copy()
+    is_free[fixed] = False
+    free = np.flatnonzero(is_free)
+
+    keep = anchored[iu]
+    pipe_ids = [p[0] for p, k in zip(pipes, keep) if k]
+    iu = iu[keep]
+    iv = iv[keep]
+    kept = [p for p, k in zip(pipes, keep) if k]
+    m = len(kept)
+
+    L = np.fromiter((max(0.1, float(p[3] or 0.0)) for p in kept), dtype=np.float64, count=m)
+    D = np.fromiter((max(0.001, float(p[4] or 75.0) / 1000.0) for p in kept), dtype=np.float64, count=m)
+    rough = np.fromiter(
+        (float(p[5]) if p[5] is not None and float(p[5]) > 0 else rough_default for p in kept),
+        dtype=np.float64,
+        count=m,
+    )
+
+    demand = np.zeros(n, dtype=np.float64)
+    demands_ignored = 0
+    for nid, q in demands_lps.items():
+        i = idx.get(nid)
+        if i is None or not is_free[i]:
+            demands_ignored += 1
+            continue
+        demand[i] += float(q or 0.0) / 1000.0
+
+    # --------------------------------------------------------
+    # Caudal inicial: corrida anterior o velocidad fija
+    # --------------------------------------------------------
+    Q = INIT_VELOCITY_MPS * math.pi * D * D / 4.0
+    warm_count = 0
+    if warm_start:
+        with _WARM_LOCK:
+            for k, pid in enumerate(pipe_ids):
+                q_prev = _WARM_FLOWS.get(pid)
+                if q_prev is not None:
+                    Q[k] = q_prev
+                    warm_count += 1
+
+    # --------------------------------------------------------
+    # Newton
+    # --------------------------------------------------------
+    iterations = 0
+    rel_change = float("inf")
+    converged = free.size == 0 or m == 0
+
+    while not converged and iterations < max_iter:
+        iterations += 1
+
+        hl, dh = _headloss(Q, L, D, rough, formula)
+        p = 1.0 / dh
+        a = Q - p * hl
+
+        lap = coo_matrix(
+            (
+                np.concatenate([p, p, -p, -p]),
+                (np.concatenate([iu, iv, iu, iv]), np.concatenate([iu, iv, iv, iu])),
+            ),
+            shape=(n, n),
+        ).tocsr()
+
+        F = np.bincount(iv, weights=a, minlength=n) - np.bincount(iu, weights=a, minlength=n) - demand
+
+        lap_free = lap[free]
+        rhs = F[free] - lap_free[:, fixed] @ H[fixed]
+        H[free] = spsolve(lap_free[:, free].tocsc(), rhs, permc_spec="MMD_AT_PLUS_A")
+
+        if not np.all(np.isfinite(H[free])):
+            raise ValueError("GGA: sistema singular o divergente.")
+
+        Q_new = a + p * (H[iu] - H[iv])
+
+        total = float(np.abs(Q_new).sum())
+        rel_change = float(np.abs(Q_new - Q).sum()) / (total if total > 1e-12 else 1.0)
+        Q = Q_new
+
+        if rel_change <= accuracy:
+            converged = True
+
+    hl, _dh = _headloss(Q, L, D, rough, formula)
+
+    if warm_start and converged:
+        with _WARM_LOCK:
+            _WARM_FLOWS.update(zip(pipe_ids, Q.tolist()))
+
+    node_ids = list(idx)
+    heads = {node_ids[i]: float(H[i]) for i in np.flatnonzero(anchored)}
+
+    return {
+        "heads": heads,
+        "flows_lps": dict(zip(pipe_ids, (Q * 1000.0).tolist())),
+        "headloss_m": dict(zip(pipe_ids, hl.tolist())),
+        "meta": {
+            "headloss_formula": formula,
+            "default_roughness": rough_default,
+            "iterations": iterations,
+            "converged": converged,
+            "relative_change": rel_change if math.isfinite(rel_change) else None,
+            "warm_started_pipes": warm_count,
+            "pipes_solved": m,
+            "nodes_solved": int(anchored.sum()),
+            "nodes_unanchored": int(n - anchored.sum()),
+            "demands_ignored": demands_ignored,
+        },
+    }
@@ -0,0 +1,519 @@
+# app/services/heartbeat_buffer.py
+"""
+Write-behind de public.pump_heartbeat.
+
+Antes cada POST /arduino-controler/heartbeat usaba 2 conexiones del pool
+(validar bomba + INSERT). Con cientos de equipos latiendo cada pocos
+segundos eso agota el pool de 8.
+
+Ahora:
+  - La bomba se valida contra un set de ids en memoria (PumpIds), que se
+    relee cada PUMP_IDS_REFRESH_SEC o ante un id desconocido.
+  - El endpoint solo encola la fila (con created_at = hora de recepción).
+  - Un hilo vacía la cola cada HB_FLUSH_EVERY_SEC o al juntar
+    HB_FLUSH_ROWS filas, con un único COPY por lote.
+  - Si la DB no responde, el lote se agrega a un archivo NDJSON
+    (HB_SPILL_PATH, con fsync) y se re-inserta cuando la DB vuelve.
+  - Si la cola está llena (HB_QUEUE_MAX), las filas nuevas van directo al
+    archivo: el endpoint no se bloquea ni pierde latidos.
+  - Una fila que la DB rechaza por sus datos (rssi fuera de rango, \u0000
+    en el payload, ...) no frena al resto: ante DataError / violación de
+    constraint el lote se parte en mitades hasta aislarla, y esa fila va a
+    HB_DEADLETTER_PATH (NDJSON con el error) en vez de volver al spill.
+
+Env:
+  HB_BUFFER_ENABLED     (default 1; 0 = INSERT directo como antes)
+  HB_FLUSH_ROWS         (default 500)
+  HB_FLUSH_EVERY_SEC    (default 1.0)
+  HB_QUEUE_MAX          (default 20000)
+  HB_SPILL_PATH         (default /tmp/dirac_hb_spill.ndjson)
+  HB_DEADLETTER_PATH    (default /tmp/dirac_hb_deadletter.ndjson)
+  PUMP_IDS_REFRESH_SEC  (default 60)
+"""
+from __future__ import annotations
+
+from collections import deque
+from datetime import datetime
+from typing import Any, Optional
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import psycopg
+from psycopg.types.json import Json
+
+from app.db import get_conn
+
+log = logging.getLogger("heartbeat-buffer")
+
+HB_BUFFER_ENABLED = os.getenv("HB_BUFFER_ENABLED", "1") == "1"
+HB_FLUSH_ROWS = int(os.getenv("HB_FLUSH_ROWS", "500"))
+HB_FLUSH_EVERY_SEC = float(os.getenv("HB_FLUSH_EVERY_SEC", "1.0"))
+HB_QUEUE_MAX = int(os.getenv("HB_QUEUE_MAX", "20000"))
+HB_SPILL_PATH = os.getenv("HB_SPILL_PATH", os.path.join(tempfile.gettempdir(), "dirac_hb_spill.ndjson"))
+HB_DEADLETTER_PATH = os.getenv(
+    "HB_DEADLETTER_PATH", os.path.join(tempfile.gettempdir(), "dirac_hb_deadletter.ndjson")
+)
+PUMP_IDS_REFRESH_SEC = int(os.getenv("PUMP_IDS_REFRESH_SEC", "60"))
+
+# Ante un id desconocido se relee public.pumps, pero no más seguido que esto
+_PUMP_IDS_MIN_REFRESH_SEC = 10
+# Archivos .replay de otro proceso: se toman si nadie los tocó en este tiempo
+_STALE_REPLAY_SEC = 300
+# Con la DB caída, cada cuánto se vuelve a intentar el spill
+_REPLAY_RETRY_SEC = 30
+
+_COPY_SQL = "copy public.pump_heartbeat (pump_id, rssi, payload, plc_state, created_at) from stdin"
+
+# Errores por el contenido de una fila (no de la DB): se aísla la fila.
+_ROW_ERRORS = (psycopg.errors.DataError, psycopg.errors.IntegrityError)
+
+
+# ============================================================
+# Ids de bombas
+# ============================================================
+class PumpIds:
+    def __init__(self) -> None:
+        self._ids: frozenset = frozenset()
+        self._ts = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, cur=None) -> frozenset:
+        if cur is None:
+            with get_conn("ingest") as conn, conn.cursor() as c:
+                c.execute("select id from public.pumps")
+                rows = c.fetchall()
+        else:
+            cur.execute("select id from public.pumps")
+            rows = cur.fetchall()
+
+        ids = frozenset(int(r[0]) for r in rows)
+
+        with self._lock:
+            self._ids = ids
+            self._ts = time.time()
+
+        return ids
+
+    def exists(self, pump_id: int) -> bool:
+        """
+        True/False según public.pumps. Solo va a la DB si el set venció o si
+        el id no está (bomba recién creada). Si la DB no responde se usa el
+        set viejo; si nunca se cargó, propaga el error.
+        """
+        age = time.time() - self._ts
+
+        if pump_id in self._ids and age < PUMP_IDS_REFRESH_SEC:
+            return True
+
+        if pump_id not in self._ids and age < _PUMP_IDS_MIN_REFRESH_SEC:
+            return False
+
+        try:
+            ids = self.refresh()
+        except psycopg.OperationalError:
+            if not self._ts:
+                raise
+            log.warning("No se pudo releer public.pumps; uso el set en memoria", exc_info=True)
+            ids = self._ids
+
+        return pump_id in ids
+
+
+pump_ids = PumpIds()
+
+
+# ============================================================
+# Buffer
+# ============================================================
+def _row_to_json(row: tuple) -> str:
+    pump_id, rssi, payload, plc_state, created_at = row
+    return json.dumps(
+        {
+            "pump_id": pump_id,
+            "rssi": rssi,
+            "payload": payload,
+            "plc_state": plc_state,
+            "created_at": created_at.isoformat(),
+        },
+        ensure_ascii=False,
+        default=str,
+    )
+
+
+def _row_from_json(line: str) -> tuple:
+    d = json.loads(line)
+    return (
+        d["pump_id"],
+        d.get("rssi"),
+        d.get("payload"),
+        d.get("plc_state"),
+        datetime.fromisoformat(d["created_at"]),
+    )
+
+
+class HeartbeatBuffer:
+    def __init__(
+        self,
+        flush_rows: int = HB_FLUSH_ROWS,
+        flush_every_sec: float = HB_FLUSH_EVERY_SEC,
+        queue_max: int = HB_QUEUE_MAX,
+        spill_path: str = HB_SPILL_PATH,
+        deadletter_path: str = HB_DEADLETTER_PATH,
+    ) -> None:
+        self.flush_rows = max(1, flush_rows)
+        self.flush_every_sec = max(0.05, flush_every_sec)
+        self.queue_max = max(1, queue_max)
+        self.spill_path = spill_path
+        self.deadletter_path = deadletter_path
+
+        self._q: deque = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        self._stats: dict[str, Any] = {
+            "enqueued": 0,
+            "flushed": 0,
+            "flush_batches": 0,
+            "spilled": 0,
+            "spilled_queue_full": 0,
+            "replayed": 0,
+            "dropped_unknown_pump": 0,
+            "dead_lettered": 0,
+            "last_dead_letter_error": None,
+            "queue_high_watermark": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": None,
+            "last_flush_at": None,
+            "last_error": None,
+            "last_error_at": None,
+        }
+
+    # --------------------------------------------------------
+    # API
+    # --------------------------------------------------------
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def enqueue(
+        self,
+        pump_id: int,
+        rssi: Optional[int],
+        payload: Any,
+        plc_state: Optional[str],
+        created_at: datetime,
+    ) -> str:
+        """Devuelve "queued" o "spilled" (cola llena -> directo a disco)."""
+        row = (pump_id, rssi, payload, plc_state, created_at)
+
+        with self._cond:
+            if len(self._q) < self.queue_max:
+                self._q.append(row)
+                n = len(self._q)
+                self._stats["enqueued"] += 1
+                if n > self._stats["queue_high_watermark"]:
+                    self._stats["queue_high_watermark"] = n
+                if n >= self.flush_rows:
+                    self._cond.notify()
+                return "queued"
+
+        self._spill([row])
+        self._stats["spilled_queue_full"] += 1
+        return "spilled"
+
+    def stats(self) -> dict:
+        with self._cond:
+            qlen = len(self._q)
+
+        return {
+            "enabled": HB_BUFFER_ENABLED,
+            "running": self.running,
+            "queue_len": qlen,
+            "queue_max": self.queue_max,
+            "queue_fill_pct": round(100.0 * qlen / self.queue_max, 1),
+            "flush_rows": self.flush_rows,
+            "flush_every_sec": self.flush_every_sec,
+            "spill_path": self.spill_path,
+            "spill_pending_bytes": self._spill_pending_bytes(),
+            "deadletter_path": self.deadletter_path,
+            **self._stats,
+        }
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker, name="heartbeat-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Corta el hilo y hace un último flush (lo que no entra va a disco)."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+        rest = self._drain(len(self._q))
+        if rest:
+            self._flush(rest)
+
+    # --------------------------------------------------------
+    # Hilo
+    # --------------------------------------------------------
+    def _drain(self, n: int) -> list:
+        with self._cond:
+            n = min(n, len(self._q))
+            return [self._q.popleft() for _ in range(n)]
+
+    def _worker(self) -> None:
+        log.info(
+            "Heartbeat buffer started (flush_rows=%s every=%.2fs queue_max=%s spill=%s)",
+            self.flush_rows,
+            self.flush_every_sec,
+            self.queue_max,
+            self.spill_path,
+        )
+
+        self._claim_stale_replays()
+        next_flush = time.monotonic() + self.flush_every_sec
+        next_replay_try = 0.0
+        db_ok = True
+
+        while not self._stop.is_set():
+            with self._cond:
+                timeout = next_flush - time.monotonic()
+                if len(self._q) < self.flush_rows and timeout > 0:
+                    self._cond.wait(timeout)
+
+            if self._stop.is_set():
+                break
+
+            full = len(self._q) >= self.flush_rows
+            if not full and time.monotonic() < next_flush:
+                continue
+
+            next_flush = time.monotonic() + self.flush_every_sec
+
+            batch = self._drain(self.flush_rows)
+            if batch:
+                db_ok = self._flush(batch)
+
+            # El archivo se re-intenta con la DB respondiendo; si el último
+            # flush falló y no entra tráfico, se prueba cada tanto.
+            if db_ok or time.monotonic() >= next_replay_try:
+                db_ok = self._replay_spill()
+                next_replay_try = time.monotonic() + _REPLAY_RETRY_SEC
+
+        log.info("Heartbeat buffer stopped")
+
+    # --------------------------------------------------------
+    # Escritura
+    # --------------------------------------------------------
+    def _copy(self, rows: list) -> None:
+        with get_conn("ingest") as conn, conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = 15000;")
+
+            for attempt in (1, 2):
+                try:
+                    with cur.copy(_COPY_SQL) as copy:
+                        for pump_id, rssi, payload, plc_state, created_at in rows:
+                            copy.write_row((
+                                pump_id,
+                                rssi,
+                                Json(payload) if payload is not None else None,
+                                plc_state,
+                                created_at,
+                            ))
+                    break
+
+                except psycopg.errors.ForeignKeyViolation:
+                    # Se borró una bomba con latidos en cola: sacarlos y reintentar.
+                    conn.rollback()
+                    if attempt == 2:
+                        raise
+                    ids = pump_ids.refresh(cur)
+                    kept = [r for r in rows if r[0] in ids]
+                    self._stats["dropped_unknown_pump"] += len(rows) - len(kept)
+                    rows = kept
+                    cur.execute("SET LOCAL statement_timeout = 15000;")
+                    if not rows:
+                        return
+
+            conn.commit()
+
+    def _write(self, rows: list) -> int:
+        """
+        COPY de rows aislando las filas con datos inválidos: ante un error
+        de fila se parte el lote en mitades; la fila que falla sola va al
+        dead-letter. Devuelve cuántas se escribieron. Errores de conexión /
+        DB se propagan (el caller hace spill).
+        """
+        try:
+            self._copy(rows)
+            return len(rows)
+        except _ROW_ERRORS as e:
+            if len(rows) == 1:
+                self._dead_letter(rows[0], e)
+                return 0
+            mid = len(rows) // 2
+            return self._write(rows[:mid]) + self._write(rows[mid:])
+
+    def _flush(self, rows: list) -> bool:
+        t0 = time.perf_counter()
+
+        try:
+            written = self._write(rows)
+        except Exception as e:
+            log.warning("Heartbeat flush falló (%s filas) -> spill a disco: %s", len(rows), e)
+            self._stats["last_error"] = str(e)[:300]
+            self._stats["last_error_at"] = time.time()
+            self._spill(rows)
+            return False
+
+        dt_ms = (time.perf_counter() - t0) * 1000.0
+        self._stats["flushed"] += written
+        self._stats["flush_batches"] += 1
+        self._stats["last_flush_rows"] = len(rows)
+        self._stats["last_flush_ms"] = round(dt_ms, 1)
+        self._stats["last_flush_at"] = time.time()
+        return True
+
+    # --------------------------------------------------------
+    # Spill a disco
+    # --------------------------------------------------------
+    @staticmethod
+    def _append(path: str, data: bytes) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _spill(self, rows: list) -> None:
+        data = "".join(_row_to_json(r) + "\n" for r in rows).encode("utf-8")
+
+        with self._spill_lock:
+            try:
+                self._append(self.spill_path, data)
+            except OSError:
+                # Último recurso: si ni el disco anda, se pierden.
+                log.exception("No se pudo escribir el spill de heartbeats (%s filas perdidas)", len(rows))
+                return
+
+        self._stats["spilled"] += len(rows)
+
+    def _dead_letter(self, row: tuple, err: Exception) -> None:
+        """Fila que la DB no acepta: fuera del circuito, con el error, para revisarla a mano."""
+        entry = json.loads(_row_to_json(row))
+        entry["error"] = str(err)[:300]
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+        log.warning("Heartbeat inválido de pump_id=%s -> dead-letter: %s", row[0], err)
+        self._stats["dead_lettered"] += 1
+        self._stats["last_dead_letter_error"] = entry["error"]
+        try:
+            self._append(self.deadletter_path, data)
+        except OSError:
+            log.exception("No se pudo escribir el dead-letter de heartbeats (fila perdida)")
+
+    def _replay_path(self) -> str:
+        return f"{self.spill_path}.{os.getpid()}.replay"
+
+    def _spill_pending_bytes(self) -> int:
+        total = 0
+        for path in [self.spill_path, *glob.glob(f"{self.spill_path}.*.replay")]:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _claim_stale_replays(self) -> None:
+        """Archivos .replay que dejó un proceso que murió a mitad de re-inserción."""
+        mine = self._replay_path()
+        for path in glob.glob(f"{self.spill_path}.*.replay"):
+            if path == mine:
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) < _STALE_REPLAY_SEC:
+                    continue
+                with open(path, "rb") as src, open(self.spill_path, "ab") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(path)
+            except OSError:
+                log.warning("No se pudo tomar %s", path, exc_info=True)
+
+    def _replay_spill(self) -> bool:
+        """Re-inserta el spill. False si la DB sigue fallando."""
+        mine = self._replay_path()
+
+        if not os.path.exists(mine):
+            # rename es atómico: con varios workers solo uno se lo lleva.
+            with self._spill_lock:
+                try:
+                    os.rename(self.spill_path, mine)
+                except FileNotFoundError:
+                    return True
+                except OSError:
+                    log.warning("No se pudo renombrar el spill", exc_info=True)
+                    return True
+
+        try:
+            with open(mine, "r", encoding="utf-8") as f:
+                lines = [ln for ln in f if ln.strip()]
+        except OSError:
+            log.warning("No se pudo leer %s", mine, exc_info=True)
+            return True
+
+        rows = []
+        for ln in lines:
+            try:
+                rows.append(_row_from_json(ln))
+            except (ValueError, KeyError):
+                log.warning("Línea inválida en spill de heartbeats descartada: %r", ln[:200])
+
+        for i in range(0, len(rows), self.flush_rows):
+            chunk = rows[i:i + self.flush_rows]
+            try:
+                written = self._write(chunk)
+            except Exception as e:
+                # Lo que falta queda en el .replay; se reintenta en el próximo ciclo.
+                self._stats["last_error"] = str(e)[:300]
+                self._stats["last_error_at"] = time.time()
+                rest = "".join(_row_to_json(r) + "\n" for r in rows[i:])
+                with open(mine, "w", encoding="utf-8") as f:
+                    f.write(rest)
+                    f.flush()
+                    os.fsync(f.fileno())
+                return False
+            self._stats["replayed"] += written
+
+        os.remove(mine)
+        log.info("Heartbeats re-insertados desde disco: %s", len(rows))
+        return True
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+
+def start_heartbeat_buffer():
+    if not HB_BUFFER_ENABLED:
+        log.info("Heartbeat buffer disabled (HB_BUFFER_ENABLED=0)")
+        return
+    heartbeat_buffer.start()
+
+
+def stop_heartbeat_buffer():
+    heartbeat_buffer.stop()
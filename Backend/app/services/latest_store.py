@@ -0,0 +1,288 @@
+# app/services/latest_store.py
+"""
+Última lectura por entidad, en memoria.
+
+Varios endpoints calculaban "última lectura" por su cuenta con
+LEFT JOIN LATERAL (... ORDER BY created_at DESC LIMIT 1) en cada request.
+Acá se guarda una sola vez por proceso:
+
+  - tanks:  último public.tank_ingest por tank_id
+  - pumps:  último public.pump_heartbeat por pump_id (plc_state + hora)
+  - meters: último public.network_analyzer_readings por analyzer_id (lite)
+
+Los endpoints de ingesta llaman a update_*() después de escribir, así
+que la lectura es O(1) y sin DB. Al arrancar se hace un warm-up desde la
+DB, y un hilo re-sincroniza cada LATEST_SYNC_SEC: con varios workers de
+uvicorn cada proceso solo ve sus propias escrituras, y el sync trae las
+de los demás. Un valor de la DB nunca pisa uno más nuevo en memoria (ej:
+heartbeats todavía en la cola de heartbeat_buffer).
+
+Online / staleness se calculan con age_sec() / is_online() sobre el
+timestamp cacheado. Cada lectura nueva (también las que trae el sync) se
+publica en live_bus para /live/ws.
+
+Env:
+  LATEST_SYNC_SEC  (default 15; 0 = solo warm-up)
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+import logging
+import os
+import threading
+import time
+
+from psycopg.rows import dict_row
+
+from app.db import get_conn
+from app.services.live_bus import live_bus
+
+log = logging.getLogger("latest-store")
+
+LATEST_SYNC_SEC = int(os.getenv("LATEST_SYNC_SEC", "15"))
+
+# Mismos campos que GET /components/network_analyzers/{id}/latest?fields=lite
+METER_LITE_FIELDS = (
+    "id",
+    "analyzer_id",
+    "ts",
+    "p_kw",
+    "q_kvar",
+    "pf",
+    "e_kwh_import",
+    "e_kvarh_import",
+    "e_kvah_import",
+    "avg_p_kw",
+    "max_p_kw",
+    "source",
+)
+
+_SQL_TANKS = """
+    SELECT t.id AS tank_id, li.id, li.level_pct, li.created_at
+    FROM public.tanks t
+    JOIN LATERAL (
+      SELECT i.id, i.level_pct, i.created_at
+      FROM public.tank_ingest i
+      WHERE i.tank_id = t.id
+      ORDER BY i.created_at DESC, i.id DESC
+      LIMIT 1
+    ) li ON TRUE
+"""
+
+_SQL_PUMPS = """
+    SELECT p.id AS pump_id, ph.plc_state, ph.created_at
+    FROM public.pumps p
+    JOIN LATERAL (
+      SELECT h.plc_state, h.created_at
+      FROM public.pump_heartbeat h
+      WHERE h.pump_id = p.id
+      ORDER BY h.created_at DESC, h.id DESC
+      LIMIT 1
+    ) ph ON TRUE
+"""
+
+_SQL_METERS = f"""
+    SELECT r.*
+    FROM public.network_analyzers na
+    JOIN LATERAL (
+      SELECT {", ".join(METER_LITE_FIELDS)}
+      FROM public.network_analyzer_readings x
+      WHERE x.analyzer_id = na.id
+      ORDER BY x.ts DESC
+      LIMIT 1
+    ) r ON TRUE
+"""
+
+
+def _utc(ts: Optional[datetime]) -> Optional[datetime]:
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def age_sec(ts: Optional[datetime], now: Optional[datetime] = None) -> Optional[int]:
+    if ts is None:
+        return None
+    now = now or datetime.now(timezone.utc)
+    return int((now - _utc(ts)).total_seconds())
+
+
+def is_online(ts: Optional[datetime], max_age_sec: float, now: Optional[datetime] = None) -> bool:
+    age = age_sec(ts, now)
+    return age is not None and age <= max_age_sec
+
+
+class LatestStore:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+        self._tanks: dict[int, dict] = {}
+        self._pumps: dict[int, dict] = {}
+        self._meters: dict[int, dict] = {}
+
+        self.synced_at: Optional[float] = None
+
+    # --------------------------------------------------------
+    # Escritura
+    # --------------------------------------------------------
+    def _put(self, table: dict, key: int, row: dict, ts_key: str) -> bool:
+        """Guarda si no es más vieja que la cacheada. True si es una lectura nueva."""
+        ts = row.get(ts_key)
+        with self._lock:
+            cur = table.get(key)
+            cur_ts = None if cur is None else cur.get(ts_key)
+            if cur_ts is None or (ts is not None and ts >= cur_ts):
+                table[key] = row
+                return cur is None or cur_ts is None or ts > cur_ts
+            return False
+
+    def update_tank(
+        self,
+        tank_id: int,
+        level_pct: Optional[float],
+        created_at: datetime,
+        id: Optional[int] = None,
+    ) -> None:
+        row = {
+            "id": id,
+            "tank_id": int(tank_id),
+            "level_pct": None if level_pct is None else float(level_pct),
+            "created_at": _utc(created_at),
+        }
+        if self._put(self._tanks, int(tank_id), row, "created_at"):
+            live_bus.publish("tank", tank_id, {"level_pct": row["level_pct"], "ts": row["created_at"]})
+
+    def update_pump(self, pump_id: int, plc_state: Optional[str], created_at: datetime) -> None:
+        row = {"pump_id": int(pump_id), "plc_state": plc_state, "created_at": _utc(created_at)}
+        if self._put(self._pumps, int(pump_id), row, "created_at"):
+            live_bus.publish("pump", pump_id, {"plc_state": plc_state, "ts": row["created_at"]})
+
+    def update_meter(self, analyzer_id: int, row: dict) -> None:
+        lite = {k: row.get(k) for k in METER_LITE_FIELDS}
+        lite["analyzer_id"] = int(analyzer_id)
+        lite["ts"] = _utc(lite.get("ts"))
+        if self._put(self._meters, int(analyzer_id), lite, "ts"):
+            live_bus.publish("meter", analyzer_id, {k: v for k, v in lite.items() if k != "analyzer_id"})
+
+    # --------------------------------------------------------
+    # Lectura (copias, para que nadie modifique el cache)
+    # --------------------------------------------------------
+    def tank(self, tank_id: int) -> Optional[dict]:
+        row = self._tanks.get(int(tank_id))
+        return dict(row) if row else None
+
+    def pump(self, pump_id: int) -> Optional[dict]:
+        row = self._pumps.get(int(pump_id))
+        return dict(row) if row else None
+
+    def meter(self, analyzer_id: int) -> Optional[dict]:
+        row = self._meters.get(int(analyzer_id))
+        return dict(row) if row else None
+
+    def tanks(self, ids: Optional[Iterable[int]] = None) -> list[dict]:
+        if ids is None:
+            return [dict(r) for r in list(self._tanks.values())]
+        return [dict(r) for r in (self._tanks.get(int(i)) for i in ids) if r]
+
+    def pumps(self, ids: Optional[Iterable[int]] = None) -> list[dict]:
+        if ids is None:
+            return [dict(r) for r in list(self._pumps.values())]
+        return [dict(r) for r in (self._pumps.get(int(i)) for i in ids) if r]
+
+    # --------------------------------------------------------
+    # Sync con la DB
+    # --------------------------------------------------------
+    @property
+    def warm(self) -> bool:
+        return self.synced_at is not None
+
+    def sync(self) -> None:
+        with self._sync_lock:
+            t0 = time.perf_counter()
+
+            with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(_SQL_TANKS)
+                tanks = cur.fetchall()
+                cur.execute(_SQL_PUMPS)
+                pumps = cur.fetchall()
+                cur.execute(_SQL_METERS)
+                meters = cur.fetchall()
+
+            for r in tanks:
+                self.update_tank(r["tank_id"], r["level_pct"], r["created_at"], id=r["id"])
+            for r in pumps:
+                self.update_pump(r["pump_id"], r["plc_state"], r["created_at"])
+            for r in meters:
+                self.update_meter(r["analyzer_id"], r)
+
+            self.synced_at = time.time()
+            log.debug(
+                "latest store sync: tanks=%s pumps=%s meters=%s en %.3f s",
+                len(tanks),
+                len(pumps),
+                len(meters),
+                time.perf_counter() - t0,
+            )
+
+    def ensure_warm(self) -> None:
+        """Para los lectores: si el warm-up todavía no corrió (o falló), hacerlo ahora."""
+        if not self.warm:
+            self.sync()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "tanks": len(self._tanks),
+            "pumps": len(self._pumps),
+            "meters": len(self._meters),
+            "synced_at": self.synced_at,
+            "sync_every_sec": LATEST_SYNC_SEC,
+        }
+
+
+latest_store = LatestStore()
+
+
+# ============================================================
+# Hilo de warm-up / re-sync
+# ============================================================
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def _worker():
+    log.info("Latest store started (sync_every=%ss)", LATEST_SYNC_SEC)
+
+    while not _stop.is_set():
+        try:
+            latest_store.sync()
+        except Exception:
+            log.exception("Latest store sync failed")
+
+        if LATEST_SYNC_SEC <= 0 and latest_store.warm:
+            break
+
+        _stop.wait(max(1, LATEST_SYNC_SEC))
+
+    log.info("Latest store stopped")
+
+
+def start_latest_store():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+
+    _stop.clear()
+    _thread = threading.Thread(target=_worker, name="latest-store", daemon=True)
+    _thread.start()
+
+
+def stop_latest_store():
+    global _thread
+    _stop.set()
+    if _thread and _thread.is_alive():
+        _thread.join(timeout=5)
+    _thread = None
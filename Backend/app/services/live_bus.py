@@ -0,0 +1,238 @@
+# app/services/live_bus.py
+"""
+Bus en memoria de novedades de telemetría para las pantallas SCADA.
+
+Los endpoints de ingesta (o latest_store, cuando cambia una última
+lectura) llaman a publish(); cada cliente de /live/ws tiene una
+Subscription con su filtro (empresa, localidad, ids, tipos) y una cola
+asyncio. publish() se puede llamar desde cualquier hilo (los handlers
+sync corren en el threadpool): la entrega va por call_soon_threadsafe.
+
+Si no hay suscriptores, publish() no hace nada. Un cliente lento que
+llena su cola queda marcado "lagged" y recibe un aviso de resync en vez
+de bloquear a los demás.
+
+Cada evento lleva location_id / company_id, sacados de un mapa
+(tipo, id) -> (localidad, empresa) cacheado desde la DB. publish() corre
+también en el event loop (ingesta async), así que nunca va a la DB: el
+mapa se relee en un hilo aparte y mientras tanto se usa el anterior.
+
+Env:
+  LIVE_QUEUE_MAX  (default 1000 eventos por cliente)
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from app.db import get_conn
+
+log = logging.getLogger("live-bus")
+
+LIVE_QUEUE_MAX = int(os.getenv("LIVE_QUEUE_MAX", "1000"))
+
+LIVE_KINDS = ("tank", "pump", "pump_event", "manifold_signal", "meter")
+
+# Tipo de evento -> tipo de entidad en el mapa de scope
+_SCOPE_KIND = {
+    "tank": "tank",
+    "pump": "pump",
+    "pump_event": "pump",
+    "manifold_signal": "manifold",
+    "meter": "meter",
+}
+
+_SCOPE_TTL_SEC = 300
+# Ante una entidad desconocida se relee, pero no más seguido que esto
+_SCOPE_MIN_REFRESH_SEC = 30
+
+_SQL_SCOPE = """
+    SELECT 'tank' AS kind, t.id, l.id AS location_id, l.company_id
+    FROM public.tanks t JOIN public.locations l ON l.id = t.location_id
+    UNION ALL
+    SELECT 'pump', p.id, l.id, l.company_id
+    FROM public.pumps p JOIN public.locations l ON l.id = p.location_id
+    UNION ALL
+    SELECT 'manifold', m.id, l.id, l.company_id
+    FROM public.manifolds m JOIN public.locations l ON l.id = m.location_id
+    UNION ALL
+    SELECT 'meter', na.id, l.id, l.company_id
+    FROM public.network_analyzers na JOIN public.locations l ON l.id = na.location_id
+"""
+
+
+# ============================================================
+# Scope (entidad -> localidad / empresa)
+# ============================================================
+class EntityScope:
+    def __init__(self) -> None:
+        self._map: dict[tuple[str, int], tuple[Optional[int], Optional[int]]] = {}
+        self._ts = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self) -> None:
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(_SQL_SCOPE)
+            rows = cur.fetchall()
+
+        m = {(str(k), int(i)): (loc, comp) for k, i, loc, comp in rows}
+
+        with self._lock:
+            self._map = m
+            self._ts = time.time()
+
+    def _refresh_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            log.warning("live bus: no se pudo releer el scope de entidades", exc_info=True)
+            with self._lock:
+                self._ts = time.time()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _schedule_refresh(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_background, name="live-bus-scope", daemon=True).start()
+
+    def get(self, kind: str, entity_id: int) -> tuple[Optional[int], Optional[int]]:
+        """Sin I/O: si el mapa venció (o falta la entidad) se relee en segundo plano."""
+        key = (kind, int(entity_id))
+        age = time.time() - self._ts
+
+        if key in self._map and age < _SCOPE_TTL_SEC:
+            return self._map[key]
+
+        if age >= _SCOPE_MIN_REFRESH_SEC:
+            self._schedule_refresh()
+
+        return self._map.get(key, (None, None))
+
+    def entities(self, kind: str) -> list[tuple[int, Optional[int], Optional[int]]]:
+        """[(id, location_id, company_id)] de un tipo de entidad."""
+        if not self._ts:
+            self.refresh()
+        return [(i, loc, comp) for (k, i), (loc, comp) in list(self._map.items()) if k == kind]
+
+
+# ============================================================
+# Filtro / suscripción
+# ============================================================
+@dataclass
+class LiveFilter:
+    company_id: Optional[int] = None
+    location_id: Optional[int] = None
+    # tipo de entidad ("tank", "pump", "manifold", "meter") -> ids
+    ids: dict[str, set[int]] = field(default_factory=dict)
+    # tipos de evento (LIVE_KINDS); None = todos
+    types: Optional[set[str]] = None
+
+    def matches_entity(self, kind: str, entity_id: int, location_id, company_id) -> bool:
+        if self.company_id is not None and company_id != self.company_id:
+            return False
+        if self.location_id is not None and location_id != self.location_id:
+            return False
+        wanted = self.ids.get(kind)
+        if wanted is not None and int(entity_id) not in wanted:
+            return False
+        return True
+
+    def matches(self, ev: dict) -> bool:
+        if self.types is not None and ev["type"] not in self.types:
+            return False
+        return self.matches_entity(
+            _SCOPE_KIND[ev["type"]],
+            ev["id"],
+            ev.get("location_id"),
+            ev.get("company_id"),
+        )
+
+
+class Subscription:
+    def __init__(self, flt: LiveFilter, loop: asyncio.AbstractEventLoop, maxsize: int) -> None:
+        self.filter = flt
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+        self.dropped = 0
+
+    def _offer(self, ev: dict) -> None:
+        # Corre en el event loop del cliente.
+        try:
+            self.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            self.lagged = True
+            self.dropped += 1
+
+
+# ============================================================
+# Bus
+# ============================================================
+class LiveBus:
+    def __init__(self, queue_max: int = LIVE_QUEUE_MAX) -> None:
+        self.queue_max = queue_max
+        self.scope = EntityScope()
+        self._subs: set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def subscribe(self, flt: LiveFilter) -> Subscription:
+        """Llamar desde el event loop (handler async)."""
+        sub = Subscription(flt, asyncio.get_running_loop(), self.queue_max)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def publish(self, kind: str, entity_id: int, data: dict[str, Any]) -> None:
+        if not self._subs:
+            return
+
+        location_id, company_id = self.scope.get(_SCOPE_KIND[kind], entity_id)
+        ev = {
+            "type": kind,
+            "id": int(entity_id),
+            "location_id": location_id,
+            "company_id": company_id,
+            **data,
+        }
+
+        with self._lock:
+            subs = list(self._subs)
+
+        self._published += 1
+
+        for sub in subs:
+            if not sub.filter.matches(ev):
+                continue
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, ev)
+            except RuntimeError:
+                # loop cerrado: el cliente se fue
+                self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subs = list(self._subs)
+        return {
+            "subscribers": len(subs),
+            "published": self._published,
+            "lagged": sum(1 for s in subs if s.lagged),
+            "queue_max": self.queue_max,
+        }
+
+
+live_bus = LiveBus()
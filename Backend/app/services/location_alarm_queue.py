@@ -0,0 +1,226 @@
+# app/services/location_alarm_queue.py
+"""
+Cola en memoria de comandos de alarma por localidad (status = 'pending').
+
+GET /plc/location_alarm/pending se llama en loop desde Node-RED / PLCs y
+antes hacía el JOIN location_alarm_commands + locations en cada vuelta.
+Ahora se responde desde esta cola, y con ?wait=N la respuesta espera
+hasta que haya un comando para esa localidad (long-poll).
+
+Cómo se mantiene al día:
+  - create_location_alarm_command: add() después del commit y
+    pg_notify('location_alarm_commands', {"op": "add", ...}) en la
+    transacción, para los demás workers (vía pg_listener).
+  - ack: remove() + pg_notify {"op": "done", "id": ...}.
+  - load(): relee todo lo pending desde la DB. Se hace al primer uso y
+    cada ALARM_QUEUE_RESYNC_SEC (o cada ALARM_QUEUE_FALLBACK_SEC si no
+    hay LISTEN, porque entonces no se ven los comandos de otros workers).
+
+Env:
+  ALARM_QUEUE_RESYNC_SEC    (default 300)
+  ALARM_QUEUE_FALLBACK_SEC  (default 5)
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from psycopg.rows import dict_row
+
+from app.db import get_conn
+from app.services.pg_listen import pg_listener
+
+log = logging.getLogger("location-alarm-queue")
+
+LOCATION_ALARM_CHANNEL = "location_alarm_commands"
+
+ALARM_QUEUE_RESYNC_SEC = float(os.getenv("ALARM_QUEUE_RESYNC_SEC", "300"))
+ALARM_QUEUE_FALLBACK_SEC = float(os.getenv("ALARM_QUEUE_FALLBACK_SEC", "5"))
+
+# Ids cerrados recientemente: un "add" atrasado no los revive
+_DONE_KEEP_SEC = 600
+
+_SQL_PENDING = """
+    SELECT
+      c.id,
+      c.location_id,
+      l.name AS location_name,
+      l.company_id,
+      c.action,
+      c.status,
+      c.requested_at
+    FROM public.location_alarm_commands c
+    JOIN public.locations l ON l.id = c.location_id
+    WHERE c.status = 'pending'
+"""
+
+
+def command_out(r: dict) -> dict:
+    """Formato de salida de /plc/location_alarm/pending."""
+    ts = r["requested_at"]
+    return {
+        "id": r["id"],
+        "location_id": r["location_id"],
+        "location_name": r["location_name"],
+        "company_id": r["company_id"],
+        "action": r["action"],
+        "status": r["status"],
+        "requested_at": ts if isinstance(ts, str) else ts.isoformat(),
+    }
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(True)
+
+
+class AlarmCommandQueue:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._by_id: dict[int, dict] = {}
+        self._done: dict[int, float] = {}
+        self._waiters: set = set()
+        self.loaded_at: Optional[float] = None
+
+    # --------------------------------------------------------
+    # Estado
+    # --------------------------------------------------------
+    @staticmethod
+    def _matches(cmd: dict, location_id: Optional[int], company_id: Optional[int]) -> bool:
+        if location_id is not None and cmd["location_id"] != location_id:
+            return False
+        if company_id is not None and cmd["company_id"] != company_id:
+            return False
+        return True
+
+    def _wake_matching(self, cmd: dict) -> None:
+        # Llamar con self._lock tomado.
+        for entry in list(self._waiters):
+            loop, fut, location_id, company_id = entry
+            if self._matches(cmd, location_id, company_id):
+                self._waiters.discard(entry)
+                try:
+                    loop.call_soon_threadsafe(_wake, fut)
+                except RuntimeError:
+                    pass
+
+    def add(self, cmd: dict) -> None:
+        cmd = command_out(cmd)
+        with self._lock:
+            if cmd["id"] in self._done:
+                return
+            is_new = cmd["id"] not in self._by_id
+            self._by_id[cmd["id"]] = cmd
+            if is_new:
+                self._wake_matching(cmd)
+
+    def remove(self, cmd_id: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._by_id.pop(int(cmd_id), None)
+            self._done[int(cmd_id)] = now
+            if len(self._done) > 1000:
+                self._done = {k: t for k, t in self._done.items() if now - t < _DONE_KEEP_SEC}
+
+    def load(self) -> None:
+        with self._load_lock:
+            with get_conn("ingest") as conn, conn.cursor(row_factory=dict_row) as cur:
+                cur.execute(_SQL_PENDING)
+                rows = [command_out(r) for r in cur.fetchall()]
+
+            with self._lock:
+                old = self._by_id
+                self._by_id = {r["id"]: r for r in rows}
+                for r in rows:
+                    if r["id"] not in old:
+                        self._wake_matching(r)
+                # Lo que la DB dice pending ya no se considera cerrado.
+                for r in rows:
+                    self._done.pop(r["id"], None)
+
+            self.loaded_at = time.time()
+
+    def ensure_fresh(self) -> None:
+        max_age = ALARM_QUEUE_RESYNC_SEC if pg_listener.connected else ALARM_QUEUE_FALLBACK_SEC
+        if self.loaded_at is None or time.time() - self.loaded_at >= max_age:
+            self.load()
+
+    def pending(
+        self,
+        location_id: Optional[int] = None,
+        company_id: Optional[int] = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        with self._lock:
+            rows = [c for c in self._by_id.values() if self._matches(c, location_id, company_id)]
+        rows.sort(key=lambda c: (c["requested_at"], c["id"]))
+        return [dict(c) for c in rows[:limit]]
+
+    # --------------------------------------------------------
+    # Long-poll
+    # --------------------------------------------------------
+    async def wait(self, location_id: Optional[int], company_id: Optional[int], timeout: float) -> bool:
+        """True si aparece un comando para el filtro, False si vence el timeout."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        entry = (loop, fut, location_id, company_id)
+
+        with self._lock:
+            if any(self._matches(c, location_id, company_id) for c in self._by_id.values()):
+                return True
+            self._waiters.add(entry)
+
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(entry)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._by_id),
+                "waiting": len(self._waiters),
+                "loaded_at": self.loaded_at,
+                "listen": pg_listener.connected,
+            }
+
+
+alarm_queue = AlarmCommandQueue()
+
+
+# ============================================================
+# NOTIFY
+# ============================================================
+def notify_alarm_added(cur, cmd: dict) -> None:
+    """Dentro de la transacción del INSERT (sale al commit)."""
+    payload = json.dumps({"op": "add", "cmd": command_out(cmd)}, default=str)
+    cur.execute("SELECT pg_notify(%s, %s)", (LOCATION_ALARM_CHANNEL, payload))
+
+
+def notify_alarm_done(cur, cmd_id: int) -> None:
+    payload = json.dumps({"op": "done", "id": int(cmd_id)})
+    cur.execute("SELECT pg_notify(%s, %s)", (LOCATION_ALARM_CHANNEL, payload))
+
+
+def _on_pg_notify(payload: str) -> None:
+    try:
+        msg = json.loads(payload)
+        if msg.get("op") == "add":
+            alarm_queue.add(msg["cmd"])
+        elif msg.get("op") == "done":
+            alarm_queue.remove(msg["id"])
+    except (ValueError, KeyError, TypeError):
+        log.warning("location_alarm_commands: payload inválido %r", payload[:200])
+
+
+pg_listener.on(LOCATION_ALARM_CHANNEL, _on_pg_notify)
@@ -0,0 +1,125 @@
+# app/services/pg_listen.py
+"""
+LISTEN de Postgres en un hilo, con reconexión.
+
+Uso:
+    pg_listener.on("pump_commands", callback)   # callback(payload: str)
+
+El callback corre en el hilo del listener: tiene que ser rápido y no
+bloquear (ej: despertar waiters con call_soon_threadsafe). Los avisos
+que llegan mientras está desconectado se pierden: quien escucha tiene
+que tener su propio re-chequeo contra la DB.
+
+Ojo: LISTEN necesita una conexión de sesión. El pooler de Supabase en
+modo transacción (puerto 6543, el de DATABASE_URL) no entrega
+notificaciones, por eso se usa DATABASE_LISTEN_URL (conexión directa o
+pooler en modo sesión, puerto 5432). Sin esa env el listener no arranca
+y cada feature cae a su modo sin LISTEN.
+
+Env:
+  DATABASE_LISTEN_URL  (default: vacío = deshabilitado)
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Callable
+import logging
+import os
+import threading
+
+import psycopg
+from psycopg import sql
+
+log = logging.getLogger("pg-listen")
+
+DATABASE_LISTEN_URL = (os.getenv("DATABASE_LISTEN_URL") or "").strip()
+
+_RECONNECT_MIN_SEC = 1.0
+_RECONNECT_MAX_SEC = 30.0
+
+
+class PgListener:
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self._handlers: dict[str, list[Callable[[str], None]]] = defaultdict(list)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.connected = False
+        self.received = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.dsn)
+
+    def on(self, channel: str, callback: Callable[[str], None]) -> None:
+        """Registrar antes de start(); los canales se escuchan al conectar."""
+        self._handlers[channel].append(callback)
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        self.received += 1
+        for cb in self._handlers.get(channel, ()):
+            try:
+                cb(payload)
+            except Exception:
+                log.exception("pg listen: handler de %s falló", channel)
+
+    def _worker(self) -> None:
+        backoff = _RECONNECT_MIN_SEC
+
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(
+                    self.dsn,
+                    autocommit=True,
+                    sslmode="require",
+                    connect_timeout=5,
+                ) as conn:
+                    for ch in self._handlers:
+                        conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(ch)))
+
+                    self.connected = True
+                    backoff = _RECONNECT_MIN_SEC
+                    log.info("pg listen conectado: %s", ", ".join(self._handlers))
+
+                    while not self._stop.is_set():
+                        for n in conn.notifies(timeout=1.0):
+                            self._dispatch(n.channel, n.payload)
+
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                log.warning("pg listen desconectado (%s); reintento en %.0fs", e, backoff)
+
+            self.connected = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, _RECONNECT_MAX_SEC)
+
+        self.connected = False
+        log.info("pg listen stopped")
+
+    def start(self) -> None:
+        if not self.enabled:
+            log.info("pg listen deshabilitado (falta DATABASE_LISTEN_URL)")
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker, name="pg-listen", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+
+pg_listener = PgListener(DATABASE_LISTEN_URL)
+
+
+def start_pg_listener():
+    pg_listener.start()
+
+
+def stop_pg_listener():
+    pg_listener.stop()
@@ -0,0 +1,416 @@
+# app/services/pump_rollup.py
+"""
+Rollup incremental del estado por minuto de las bombas.
+
+Reemplaza el REFRESH MATERIALIZED VIEW de kpi.mv_pump_state_1m, que
+recalculaba toda la historia en cada corrida. Ahora hay una tabla común
+(PUMP_ROLLUP_TABLE, mismas columnas que leen los KPIs: pump_id,
+minute_ts, is_on) y un hilo que cada PUMP_ROLLUP_INTERVAL_SEC:
+
+  1. Lee el high-water mark (último id procesado de pump_heartbeat y de
+     pump_events) de kpi.rollup_watermarks.
+  2. Junta los (bomba, minuto) tocados por filas con id mayor (hasta
+     PUMP_ROLLUP_BATCH por tabla y corrida) más la ventana de gracia:
+     las PUMP_ROLLUP_GRACE_ROWS filas anteriores al mark con created_at en
+     los últimos PUMP_ROLLUP_GRACE_MIN minutos (ids que se commitearon
+     fuera de orden). Todo se filtra por rango de id (PK), sin recorrer
+     la tabla por created_at.
+     Los latidos re-insertados desde el spill de heartbeat_buffer llegan
+     con created_at viejo pero id nuevo, así que también entran.
+  3. Recalcula sólo esos minutos y hace upsert (sin escribir si no cambió).
+  4. Avanza el mark en la misma transacción.
+
+Regla por minuto: is_on = último estado no nulo del minuto (plc_state de
+pump_heartbeat o state de pump_events; a igual hora gana el evento) es
+'run'. Hay fila sólo si la bomba reportó algo en ese minuto.
+
+Con varios workers corre uno a la vez (pg_try_advisory_xact_lock: se
+suelta solo al terminar la transacción, sirve con el pooler de Supabase).
+La primera corrida arranca PUMP_ROLLUP_BACKFILL_DAYS hacia atrás y
+avanza de a lotes sin esperar el intervalo hasta alcanzar el presente.
+
+Las lecturas usan la tabla sólo si está al día: pump_rollup_ready
+(RollupReadiness) mira caught_up_at del mark, que se pone en cada
+corrida que no dejó filas pendientes. Con el rollup apagado, durante el
+backfill o si deja de correr, los KPIs siguen en kpi.mv_pump_state_1m.
+
+Env:
+  PUMP_ROLLUP_ENABLED        (default 1)
+  PUMP_ROLLUP_TABLE          (default kpi.pump_state_1m_rollup)
+  PUMP_ROLLUP_INTERVAL_SEC   (default 60)
+  PUMP_ROLLUP_GRACE_MIN      (default 10)
+  PUMP_ROLLUP_GRACE_ROWS     (default 5000)
+  PUMP_ROLLUP_BATCH          (default 50000)
+  PUMP_ROLLUP_BACKFILL_DAYS  (default 35)
+  ROLLUP_READY_CHECK_SEC     (default 30; cada cuánto se relee el estado)
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import Any, Optional
+import logging
+import os
+import threading
+import time
+
+from psycopg.rows import dict_row
+
+from app.db import get_conn
+from app.db_async import get_aconn
+
+log = logging.getLogger("pump-rollup")
+
+PUMP_ROLLUP_ENABLED = os.getenv("PUMP_ROLLUP_ENABLED", "1") == "1"
+PUMP_ROLLUP_TABLE = (os.getenv("PUMP_ROLLUP_TABLE") or "kpi.pump_state_1m_rollup").strip()
+PUMP_ROLLUP_INTERVAL_SEC = float(os.getenv("PUMP_ROLLUP_INTERVAL_SEC", "60"))
+PUMP_ROLLUP_GRACE_MIN = int(os.getenv("PUMP_ROLLUP_GRACE_MIN", "10"))
+PUMP_ROLLUP_GRACE_ROWS = int(os.getenv("PUMP_ROLLUP_GRACE_ROWS", "5000"))
+PUMP_ROLLUP_BATCH = int(os.getenv("PUMP_ROLLUP_BATCH", "50000"))
+PUMP_ROLLUP_BACKFILL_DAYS = int(os.getenv("PUMP_ROLLUP_BACKFILL_DAYS", "35"))
+ROLLUP_READY_CHECK_SEC = float(os.getenv("ROLLUP_READY_CHECK_SEC", "30"))
+
+WATERMARKS_TABLE = "kpi.rollup_watermarks"
+WATERMARK_NAME = "pump_state_1m"
+ROLLUP_LOCK_KEY = 987654322
+
+_SQL_SCHEMA = f"""
+    CREATE SCHEMA IF NOT EXISTS kpi;
+
+    CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} (
+      name           text PRIMARY KEY,
+      last_hb_id     bigint NOT NULL DEFAULT 0,
+      last_event_id  bigint NOT NULL DEFAULT 0,
+      last_run_at    timestamptz,
+      rows_upserted  bigint NOT NULL DEFAULT 0
+    );
+    ALTER TABLE {WATERMARKS_TABLE} ADD COLUMN IF NOT EXISTS caught_up_at timestamptz;
+
+    CREATE TABLE IF NOT EXISTS {PUMP_ROLLUP_TABLE} (
+      pump_id      bigint      NOT NULL,
+      minute_ts    timestamptz NOT NULL,
+      is_on        boolean     NOT NULL,
+      last_state   text,
+      hb_count     integer     NOT NULL DEFAULT 0,
+      event_count  integer     NOT NULL DEFAULT 0,
+      updated_at   timestamptz NOT NULL DEFAULT now(),
+      PRIMARY KEY (pump_id, minute_ts)
+    );
+
+    CREATE INDEX IF NOT EXISTS pump_state_1m_rollup_minute_idx
+      ON {PUMP_ROLLUP_TABLE} (minute_ts);
+"""
+
+# Punto de partida: el último id anterior a la ventana de backfill.
+_SQL_INIT_WATERMARK = f"""
+    INSERT INTO {WATERMARKS_TABLE} (name, last_hb_id, last_event_id)
+    SELECT
+      %(name)s,
+      coalesce((SELECT min(id) - 1 FROM public.pump_heartbeat WHERE created_at >= %(floor)s),
+               (SELECT max(id) FROM public.pump_heartbeat), 0),
+      coalesce((SELECT min(id) - 1 FROM public.pump_events WHERE created_at >= %(floor)s),
+               (SELECT max(id) FROM public.pump_events), 0)
+    ON CONFLICT (name) DO NOTHING
+"""
+
+_SQL_RANGE = """
+    SELECT max(id) AS hi, count(*)::int AS n
+    FROM (
+      SELECT id FROM {table} WHERE id > %s ORDER BY id LIMIT %s
+    ) s
+"""
+
+_SQL_UPSERT = f"""
+    WITH touched AS (
+      SELECT h.pump_id, date_trunc('minute', h.created_at) AS minute_ts
+      FROM public.pump_heartbeat h
+      WHERE h.id > %(hb_lo)s - %(grace_rows)s AND h.id <= %(hb_hi)s
+        AND (h.id > %(hb_lo)s OR h.created_at >= %(grace_from)s)
+      UNION
+      SELECT e.pump_id, date_trunc('minute', e.created_at)
+      FROM public.pump_events e
+      WHERE e.id > %(ev_lo)s - %(grace_rows)s AND e.id <= %(ev_hi)s
+        AND (e.id > %(ev_lo)s OR e.created_at >= %(grace_from)s)
+    ),
+    samples AS (
+      SELECT t.pump_id, t.minute_ts, h.created_at AS ts, 0 AS src, h.id, h.plc_state AS state
+      FROM touched t
+      JOIN public.pump_heartbeat h
+        ON h.pump_id = t.pump_id
+       AND h.created_at >= t.minute_ts
+       AND h.created_at <  t.minute_ts + interval '1 minute'
+      UNION ALL
+      SELECT t.pump_id, t.minute_ts, e.created_at, 1, e.id, e.state
+      FROM touched t
+      JOIN public.pump_events e
+        ON e.pump_id = t.pump_id
+       AND e.created_at >= t.minute_ts
+       AND e.created_at <  t.minute_ts + interval '1 minute'
+    ),
+    agg AS (
+      SELECT
+        pump_id,
+        minute_ts,
+        (array_agg(state ORDER BY ts DESC, src DESC, id DESC) FILTER (WHERE state IS NOT NULL))[1] AS last_state,
+        count(*) FILTER (WHERE src = 0)::int AS hb_count,
+        count(*) FILTER (WHERE src = 1)::int AS event_count
+      FROM samples
+      GROUP BY pump_id, minute_ts
+    )
+    INSERT INTO {PUMP_ROLLUP_TABLE} AS r
+      (pump_id, minute_ts, is_on, last_state, hb_count, event_count, updated_at)
+    SELECT
+      pump_id, minute_ts, coalesce(last_state = 'run', false), last_state, hb_count, event_count, now()
+    FROM agg
+    WHERE minute_ts >= %(floor)s
+    ON CONFLICT (pump_id, minute_ts) DO UPDATE
+      SET is_on       = excluded.is_on,
+          last_state  = excluded.last_state,
+          hb_count    = excluded.hb_count,
+          event_count = excluded.event_count,
+          updated_at  = now()
+      WHERE (r.is_on, r.last_state, r.hb_count, r.event_count)
+            IS DISTINCT FROM
+            (excluded.is_on, excluded.last_state, excluded.hb_count, excluded.event_count)
+"""
+
+
+class PumpRollup:
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._run_lock = threading.Lock()
+        self._schema_ready = False
+        self.last_result: Optional[dict[str, Any]] = None
+        self.runs = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --------------------------------------------------------
+    # Una corrida
+    # --------------------------------------------------------
+    def ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        with get_conn("analytics") as conn, conn.cursor() as cur:
+            cur.execute(_SQL_SCHEMA)
+            conn.commit()
+        self._schema_ready = True
+
+    def run_once(self) -> dict[str, Any]:
+        """Procesa un lote. caught_up=False: quedan filas pendientes."""
+        if not PUMP_ROLLUP_ENABLED:
+            return {"ok": True, "skipped": True, "reason": "rollup disabled"}
+
+        with self._run_lock:
+            self.ensure_schema()
+            t0 = time.perf_counter()
+
+            with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS ok", (ROLLUP_LOCK_KEY,))
+                if not cur.fetchone()["ok"]:
+                    conn.rollback()
+                    return {"ok": True, "skipped": True, "reason": "rollup already running"}
+
+                cur.execute("SELECT now() AS now")
+                now = cur.fetchone()["now"]
+                floor = now - timedelta(days=PUMP_ROLLUP_BACKFILL_DAYS)
+
+                cur.execute(_SQL_INIT_WATERMARK, {"name": WATERMARK_NAME, "floor": floor})
+                cur.execute(
+                    f"SELECT last_hb_id, last_event_id FROM {WATERMARKS_TABLE} WHERE name = %s FOR UPDATE",
+                    (WATERMARK_NAME,),
+                )
+                wm = cur.fetchone()
+                hb_lo, ev_lo = int(wm["last_hb_id"]), int(wm["last_event_id"])
+
+                cur.execute(_SQL_RANGE.format(table="public.pump_heartbeat"), (hb_lo, PUMP_ROLLUP_BATCH))
+                r = cur.fetchone()
+                hb_hi, hb_n = (int(r["hi"]) if r["hi"] is not None else hb_lo), r["n"]
+
+                cur.execute(_SQL_RANGE.format(table="public.pump_events"), (ev_lo, PUMP_ROLLUP_BATCH))
+                r = cur.fetchone()
+                ev_hi, ev_n = (int(r["hi"]) if r["hi"] is not None else ev_lo), r["n"]
+
+                cur.execute(
+                    _SQL_UPSERT,
+                    {
+                        "hb_lo": hb_lo,
+                        "hb_hi": hb_hi,
+                        "ev_lo": ev_lo,
+                        "ev_hi": ev_hi,
+                        "grace_from": now - timedelta(minutes=PUMP_ROLLUP_GRACE_MIN),
+                        "grace_rows": PUMP_ROLLUP_GRACE_ROWS,
+                        "floor": floor,
+                    },
+                )
+                upserted = max(cur.rowcount, 0)
+                caught_up = hb_n < PUMP_ROLLUP_BATCH and ev_n < PUMP_ROLLUP_BATCH
+
+                cur.execute(
+                    f"""
+                    UPDATE {WATERMARKS_TABLE}
+                       SET last_hb_id = %s,
+                           last_event_id = %s,
+                           last_run_at = now(),
+                           caught_up_at = CASE WHEN %s THEN now() ELSE caught_up_at END,
+                           rows_upserted = rows_upserted + %s
+                     WHERE name = %s
+                    """,
+                    (hb_hi, ev_hi, caught_up, upserted, WATERMARK_NAME),
+                )
+                conn.commit()
+
+            result = {
+                "ok": True,
+                "skipped": False,
+                "heartbeats": hb_n,
+                "events": ev_n,
+                "rows_upserted": upserted,
+                "last_hb_id": hb_hi,
+                "last_event_id": ev_hi,
+                "caught_up": caught_up,
+                "ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+            self.last_result = result
+            self.runs += 1
+            return result
+
+    def status(self) -> dict[str, Any]:
+        with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                f"""
+                SELECT last_hb_id, last_event_id, last_run_at, caught_up_at, rows_upserted,
+                       now() - last_run_at AS since_last_run
+                FROM {WATERMARKS_TABLE}
+                WHERE name = %s
+                """,
+                (WATERMARK_NAME,),
+            )
+            wm = cur.fetchone()
+            cur.execute(f"SELECT max(minute_ts) AS last_minute FROM {PUMP_ROLLUP_TABLE}")
+            last_minute = cur.fetchone()["last_minute"]
+
+        return {
+            "table": PUMP_ROLLUP_TABLE,
+            "ready": pump_rollup_ready.ready(),
+            "thread": self.running,
+            "runs": self.runs,
+            "errors": self.errors,
+            "watermark": wm,
+            "last_minute": last_minute,
+            "last_result": self.last_result,
+        }
+
+    # --------------------------------------------------------
+    # Hilo
+    # --------------------------------------------------------
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker, name="pump-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            wait = PUMP_ROLLUP_INTERVAL_SEC
+            try:
+                res = self.run_once()
+                if not res.get("skipped") and not res.get("caught_up"):
+                    wait = 0.5  # backfill / atraso: seguir de a lotes
+            except Exception as e:
+                self.errors += 1
+                log.warning("pump rollup falló: %s", e)
+            self._stop.wait(wait)
+
+
+# ============================================================
+# ¿Se puede leer la tabla del rollup?
+# ============================================================
+_SQL_READY = f"""
+    SELECT coalesce(caught_up_at >= now() - make_interval(secs => %(max_lag)s), false)
+    FROM {WATERMARKS_TABLE}
+    WHERE name = %(name)s
+"""
+
+
+class RollupReadiness:
+    """
+    Un rollup está listo si alguna corrida (de cualquier worker) terminó
+    al día hace menos de max_lag_sec: 3 intervalos, mínimo 3 minutos.
+    Apagado, en backfill, atrasado o sin tabla todavía -> False. Se
+    cachea ROLLUP_READY_CHECK_SEC por proceso.
+    """
+
+    def __init__(self, name: str, enabled: bool, interval_sec: float) -> None:
+        self.name = name
+        self.enabled = enabled
+        self.max_lag_sec = max(3 * interval_sec, 180.0)
+        self._ready = False
+        self._checked = -float("inf")
+
+    def _cached(self) -> Optional[bool]:
+        if not self.enabled:
+            return False
+        if time.monotonic() - self._checked < ROLLUP_READY_CHECK_SEC:
+            return self._ready
+        return None
+
+    def _store(self, row) -> bool:
+        ready = bool(row and row[0])
+        if ready != self._ready:
+            log.info("rollup %s: %s", self.name, "al día, se lee la tabla" if ready else "no está al día, se lee la vista")
+        self._ready = ready
+        self._checked = time.monotonic()
+        return ready
+
+    def _params(self) -> dict:
+        return {"name": self.name, "max_lag": self.max_lag_sec}
+
+    def ready(self) -> bool:
+        cached = self._cached()
+        if cached is not None:
+            return cached
+        try:
+            with get_conn("analytics") as conn, conn.cursor() as cur:
+                cur.execute(_SQL_READY, self._params())
+                return self._store(cur.fetchone())
+        except Exception as e:
+            log.warning("rollup %s: no se pudo leer el mark: %s", self.name, e)
+            return self._store(None)
+
+    async def aready(self) -> bool:
+        cached = self._cached()
+        if cached is not None:
+            return cached
+        try:
+            async with get_aconn() as conn, conn.cursor() as cur:
+                await cur.execute(_SQL_READY, self._params())
+                return self._store(await cur.fetchone())
+        except Exception as e:
+            log.warning("rollup %s: no se pudo leer el mark: %s", self.name, e)
+            return self._store(None)
+
+
+pump_rollup = PumpRollup()
+pump_rollup_ready = RollupReadiness(WATERMARK_NAME, PUMP_ROLLUP_ENABLED, PUMP_ROLLUP_INTERVAL_SEC)
+
+
+def start_pump_rollup():
+    if not PUMP_ROLLUP_ENABLED:
+        log.info("Pump rollup disabled (PUMP_ROLLUP_ENABLED=0)")
+        return
+    pump_rollup.start()
+
+
+def stop_pump_rollup():
+    pump_rollup.stop()
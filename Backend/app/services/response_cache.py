@@ -0,0 +1,311 @@
+# app/services/response_cache.py
+"""
+Cache en memoria de respuestas JSON para endpoints de lectura frecuente.
+
+Reemplaza los _CACHE a mano de /tanks/config y /pumps/config:
+
+    @router.get("/config")
+    @cached_response("tanks_config", ttl=10)
+    def list_tanks_config():
+        ...
+        return out
+
+- Se guarda el JSON ya serializado (bytes) + ETag (sha1 del cuerpo):
+  un HIT no vuelve a serializar ni a validar el response_model.
+- Clave por defecto: los argumentos del endpoint (query/path y
+  dependencias, p. ej. el usuario de require_user). Se puede pasar key=.
+- TTL por clave: ttl puede ser un número o una función de los argumentos.
+- LRU acotado (max_entries por endpoint).
+- Single-flight: si llegan N requests iguales con la entrada vencida,
+  uno solo calcula y el resto espera ese resultado.
+- If-None-Match -> 304. Headers ETag, Cache-Control y X-Cache (HIT/MISS).
+- Invalidación explícita: invalidate_cache("nombre", ...) en este
+  worker después del commit, y notify_cache_invalidated(cur, ...) dentro
+  de la transacción para los demás workers (vía pg_listener).
+
+Lo que el endpoint devuelva como Response (FileResponse, 304 propio,
+etc.) pasa sin cachear; las excepciones tampoco se cachean.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Union
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+from app.services.pg_listen import pg_listener
+
+log = logging.getLogger("response-cache")
+
+CACHE_CHANNEL = "response_cache_invalidate"
+
+# Tope de espera de un request "seguidor" mientras otro calcula la misma clave
+_FOLLOWER_WAIT_SEC = 30.0
+
+
+def _encode(data: Any) -> bytes:
+    # Igual que JSONResponse de Starlette
+    return json.dumps(
+        jsonable_encoder(data),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "expires", "ttl")
+
+    def __init__(self, body: bytes, ttl: float) -> None:
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.ttl = ttl
+        self.expires = time.monotonic() + ttl
+
+
+class ResponseCache:
+    def __init__(self, name: str, max_entries: int = 128) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Any, CacheEntry] = OrderedDict()
+        self._inflight: dict[Any, threading.Event] = {}
+        self._ainflight: dict[Any, asyncio.Event] = {}
+        # Sube con cada invalidate(): un cálculo empezado antes no se guarda
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    # --------------------------------------------------------
+    # Entradas
+    # --------------------------------------------------------
+    def _fresh(self, key: Any) -> Optional[CacheEntry]:
+        # Llamar con self._lock tomado.
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Any, generation: int, value: Any, ttl: float) -> Union[CacheEntry, Response]:
+        if isinstance(value, Response):
+            return value
+        entry = CacheEntry(_encode(value), ttl)
+        with self._lock:
+            if generation == self._generation and ttl > 0:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def _lookup(self, key: Any, inflight: dict, make_event: Callable):
+        """(entrada, evento_propio, evento_ajeno): exactamente uno no es None."""
+        with self._lock:
+            entry = self._fresh(key)
+            if entry is not None:
+                self.hits += 1
+                return entry, None, None
+            ev = inflight.get(key)
+            if ev is not None:
+                self.coalesced += 1
+                return None, None, ev
+            self.misses += 1
+            ev = inflight[key] = make_event()
+            return None, ev, None
+
+    def _done(self, key: Any, inflight: dict, ev) -> None:
+        with self._lock:
+            if inflight.get(key) is ev:
+                del inflight[key]
+        ev.set()
+
+    def get_or_compute(self, key: Any, ttl: float, compute: Callable[[], Any]):
+        """(CacheEntry | Response, hit)."""
+        while True:
+            entry, own, other = self._lookup(key, self._inflight, threading.Event)
+            if entry is not None:
+                return entry, True
+            if other is not None:
+                # Si el que calculaba falló, en la próxima vuelta calcula este.
+                other.wait(_FOLLOWER_WAIT_SEC)
+                continue
+            try:
+                generation = self._generation
+                return self._store(key, generation, compute(), ttl), False
+            finally:
+                self._done(key, self._inflight, own)
+
+    async def aget_or_compute(self, key: Any, ttl: float, compute: Callable[[], Any]):
+        while True:
+            entry, own, other = self._lookup(key, self._ainflight, asyncio.Event)
+            if entry is not None:
+                return entry, True
+            if other is not None:
+                try:
+                    await asyncio.wait_for(other.wait(), _FOLLOWER_WAIT_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                generation = self._generation
+                return self._store(key, generation, await compute(), ttl), False
+            finally:
+                self._done(key, self._ainflight, own)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+            }
+
+
+# ============================================================
+# Registro por nombre
+# ============================================================
+_caches: dict[str, ResponseCache] = {}
+
+
+def get_cache(name: str, max_entries: int = 128) -> ResponseCache:
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches[name] = ResponseCache(name, max_entries)
+    return cache
+
+
+def invalidate_cache(*names: str) -> None:
+    """Después del commit (este worker). Nombres sin cache registrada se ignoran."""
+    for name in names:
+        cache = _caches.get(name)
+        if cache is not None:
+            cache.invalidate()
+
+
+def notify_cache_invalidated(cur, *names: str) -> None:
+    """Dentro de la transacción de la escritura (sale al commit, demás workers)."""
+    cur.execute("SELECT pg_notify(%s, %s)", (CACHE_CHANNEL, json.dumps(list(names))))
+
+
+async def anotify_cache_invalidated(cur, *names: str) -> None:
+    """notify_cache_invalidated() para cursores async."""
+    await cur.execute("SELECT pg_notify(%s, %s)", (CACHE_CHANNEL, json.dumps(list(names))))
+
+
+def response_cache_stats() -> dict:
+    return {name: c.stats() for name, c in sorted(_caches.items())}
+
+
+def _on_pg_notify(payload: str) -> None:
+    try:
+        invalidate_cache(*[str(n) for n in json.loads(payload)])
+    except (ValueError, TypeError):
+        log.warning("response_cache_invalidate: payload inválido %r", payload[:200])
+
+
+pg_listener.on(CACHE_CHANNEL, _on_pg_notify)
+
+
+# ============================================================
+# Decorador
+# ============================================================
+def _default_key(kwargs: dict) -> str:
+    return json.dumps(kwargs, sort_keys=True, default=str)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match contra etag (con comillas); acepta listas, W/ y '*'."""
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    if inm.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+    # Compatibilidad: ETag sin comillas como lo mandaban tanks/pumps
+    return etag in tags or etag.strip('"') in tags
+
+
+def _respond(request: Request, result, hit: bool, cache_control: str) -> Response:
+    if isinstance(result, Response):
+        return result
+    headers = {
+        "ETag": result.etag,
+        "Cache-Control": f"{cache_control}, max-age={int(result.ttl)}",
+        "X-Cache": "HIT" if hit else "MISS",
+    }
+    if etag_matches(request, result.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=result.body, media_type="application/json", headers=headers)
+
+
+def cached_response(
+    name: str,
+    ttl: Union[float, Callable[[dict], float]],
+    *,
+    max_entries: int = 128,
+    key: Optional[Callable[[dict], Any]] = None,
+    cache_control: str = "public",
+):
+    """
+    Decorador para endpoints GET (sync o async). Va debajo de @router.get.
+
+    ttl:           segundos, o función(kwargs) -> segundos (TTL por clave)
+    key:           función(kwargs) -> clave hashable (default: todos los kwargs)
+    cache_control: "public" o "private" (respuestas por usuario)
+    """
+    cache = get_cache(name, max_entries)
+    key_fn = key or _default_key
+    ttl_fn = ttl if callable(ttl) else (lambda _kw, _t=float(ttl): _t)
+
+    def decorator(fn):
+        # Firma resuelta (por `from __future__ import annotations`) + el
+        # Request que necesita el cache, para que FastAPI lo inyecte.
+        sig = inspect.signature(fn, eval_str=True)
+        req_param = inspect.Parameter("_cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        new_sig = sig.replace(parameters=[*sig.parameters.values(), req_param])
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, _cache_request: Request, **kwargs):
+                result, hit = await cache.aget_or_compute(
+                    key_fn(kwargs), ttl_fn(kwargs), lambda: fn(*args, **kwargs)
+                )
+                return _respond(_cache_request, result, hit, cache_control)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, _cache_request: Request, **kwargs):
+                result, hit = cache.get_or_compute(
+                    key_fn(kwargs), ttl_fn(kwargs), lambda: fn(*args, **kwargs)
+                )
+                return _respond(_cache_request, result, hit, cache_control)
+
+        wrapper.__signature__ = new_sig
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
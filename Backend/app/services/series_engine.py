@@ -0,0 +1,186 @@
+# app/services/series_engine.py
+"""
+Series de KPIs en NumPy: LOCF, promedio entre series y reducción a bucket.
+
+Las rutas traen las lecturas una sola vez, como columnas (ids, epoch en
+segundos, valores), y el resto se hace vectorizado en vez de con ventanas
+SQL sobre una grilla minuto x tanque:
+
+  reduce_slots()    varias lecturas del mismo slot (minuto / bucket del
+                    tier) por serie -> una (avg o last)
+  locf_mean()       promedio entre series en cada slot de la grilla,
+                    arrastrando el último valor de cada una (LOCF). Sin
+                    matriz series x slots: cada valor aporta la diferencia
+                    con el anterior de su serie y se acumula (cumsum).
+  reduce_buckets()  grilla / minutos -> bucket pedido (avg | max)
+  bucket_groups() + group_reduce()
+                    varias columnas al mismo bucket (avg/min/max/sum)
+
+Buckets en UTC (epoch), igual que los date_trunc de las rutas con la
+sesión en UTC. Los huecos son NaN y salen como None en el JSON.
+
+SERIES_ENGINE=sql vuelve al cálculo en SQL (referencia / bench).
+"""
+from __future__ import annotations
+
+from typing import Optional, Sequence
+import os
+
+import numpy as np
+
+SERIES_ENGINE = (os.getenv("SERIES_ENGINE") or "numpy").strip().lower()
+
+BUCKET_SECONDS = {"1min": 60, "5min": 300, "15min": 900, "1h": 3600, "1d": 86400}
+
+
+def use_numpy() -> bool:
+    return SERIES_ENGINE == "numpy"
+
+
+# ============================================================
+# Lectura
+# ============================================================
+def _to_columns(rows: Sequence[tuple], ncols: int) -> list[np.ndarray]:
+    if not rows:
+        return [np.empty(0, dtype=np.float64) for _ in range(ncols)]
+    arr = np.array(rows, dtype=np.float64).reshape(-1, ncols)
+    return [arr[:, i] for i in range(ncols)]
+
+
+def fetch_columns(conn, sql: str, params, ncols: int) -> list[np.ndarray]:
+    """Ejecuta sql (filas de ncols números) y devuelve una columna float64 por campo (NULL -> NaN)."""
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return _to_columns(cur.fetchall(), ncols)
+
+
+async def afetch_columns(conn, sql: str, params, ncols: int) -> list[np.ndarray]:
+    async with conn.cursor() as cur:
+        await cur.execute(sql, params)
+        return _to_columns(await cur.fetchall(), ncols)
+
+
+# ============================================================
+# Cálculo
+# ============================================================
+def slot_index(ts_s: np.ndarray, start_s: float, step_s: int) -> np.ndarray:
+    """Slot de la grilla [start, start+step, ...] que contiene cada timestamp."""
+    return np.floor((ts_s - start_s) / step_s).astype(np.int64)
+
+
+def reduce_slots(
+    series: np.ndarray,
+    slot: np.ndarray,
+    values: np.ndarray,
+    how: str = "avg",
+    order: Optional[np.ndarray] = None,
+):
+    """
+    Una fila por (serie, slot). how="last" toma la de mayor `order`
+    (timestamp); how="avg" promedia. Devuelve (series, slot, values)
+    ordenado por serie y slot.
+    """
+    if values.size == 0:
+        return series.astype(np.int64), slot, values
+    idx = np.lexsort(_lexkeys(series, slot, order))
+    s, k, v = series[idx].astype(np.int64), slot[idx], values[idx]
+
+    starts = np.flatnonzero(np.r_[True, (s[1:] != s[:-1]) | (k[1:] != k[:-1])])
+    if how == "last":
+        ends = np.r_[starts[1:], s.size] - 1
+        return s[starts], k[starts], v[ends]
+    sums = np.add.reduceat(v, starts)
+    counts = np.diff(np.r_[starts, s.size])
+    return s[starts], k[starts], sums / counts
+
+
+def _lexkeys(series: np.ndarray, slot: np.ndarray, order: Optional[np.ndarray]):
+    # np.lexsort ordena por la última clave primero
+    if order is None:
+        return (slot, series)
+    return (order, slot, series)
+
+
+def locf_mean(
+    series: np.ndarray,
+    slot: np.ndarray,
+    values: np.ndarray,
+    n_slots: int,
+    carry: bool = True,
+) -> np.ndarray:
+    """
+    Promedio entre series en cada slot 0..n_slots-1 (NaN si ninguna tiene
+    valor). Entrada: una fila por (serie, slot) ordenada por serie y slot
+    (salida de reduce_slots). Slots negativos = valor previo a la ventana
+    (baseline): sólo cuentan con carry.
+    """
+    out = np.full(n_slots, np.nan)
+    if values.size == 0 or n_slots <= 0:
+        return out
+
+    if not carry:
+        inside = (slot >= 0) & (slot < n_slots)
+        sums = np.bincount(slot[inside], weights=values[inside], minlength=n_slots)
+        counts = np.bincount(slot[inside], minlength=n_slots)
+        np.divide(sums, counts, out=out, where=counts > 0)
+        return out
+
+    first = np.r_[True, series[1:] != series[:-1]]
+    prev = np.r_[0.0, values[:-1]]
+    dv = values - np.where(first, 0.0, prev)
+
+    keep = slot < n_slots
+    pos = np.clip(slot[keep], 0, None)
+    total = np.cumsum(np.bincount(pos, weights=dv[keep], minlength=n_slots))
+    active = np.cumsum(np.bincount(pos, weights=first[keep], minlength=n_slots))
+    np.divide(total, active, out=out, where=active > 0)
+    return out
+
+
+def bucket_groups(ts_s: np.ndarray, bucket: str):
+    """(inicio de cada bucket en epoch s, índice de bucket de cada fila)."""
+    step = BUCKET_SECONDS[bucket]
+    return np.unique((ts_s // step) * step, return_inverse=True)
+
+
+def group_reduce(inv: np.ndarray, n: int, values: np.ndarray, how: str = "avg") -> np.ndarray:
+    """
+    Reduce values por grupo ignorando NaN, como los agregados SQL con
+    NULL: un grupo sin valores queda NaN (sum: 0).
+    """
+    ok = ~np.isnan(values)
+    if how == "sum":
+        return np.bincount(inv[ok], weights=values[ok], minlength=n)
+    if how in ("max", "min"):
+        fill = -np.inf if how == "max" else np.inf
+        out = np.full(n, fill)
+        (np.maximum if how == "max" else np.minimum).at(out, inv[ok], values[ok])
+        out[np.isinf(out)] = np.nan
+        return out
+    sums = np.bincount(inv[ok], weights=values[ok], minlength=n)
+    counts = np.bincount(inv[ok], minlength=n)
+    out = np.full(n, np.nan)
+    np.divide(sums, counts, out=out, where=counts > 0)
+    return out
+
+
+def reduce_buckets(ts_s: np.ndarray, values: np.ndarray, bucket: str, how: str = "avg"):
+    """
+    Agrupa por bucket (UTC). Buckets donde todo es NaN quedan con NaN
+    (mismo resultado que AVG de NULLs en SQL). Devuelve (ts_ms, values).
+    """
+    if ts_s.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    keys, inv = bucket_groups(ts_s, bucket)
+    return (keys * 1000).astype(np.int64), group_reduce(inv, keys.size, values, how)
+
+
+def nan_to_none(values: np.ndarray) -> list:
+    vals = values.astype(object)
+    vals[np.isnan(values)] = None
+    return vals.tolist()
+
+
+def to_json_lists(ts_ms: np.ndarray, values: np.ndarray):
+    """(timestamps, valores) como listas de Python, NaN -> None."""
+    return ts_ms.tolist(), nan_to_none(values)
@@ -0,0 +1,544 @@
+# app/services/sim_batch.py
+"""
+Corrida por lotes de escenarios ("qué pasa si para la bomba X / se cierra
+la válvula Y") sobre una misma topología.
+
+- La red se publica UNA vez en memoria compartida (multiprocessing.shared_memory):
+  cada worker del ProcessPoolExecutor mapea los arrays sin copiarlos ni
+  picklearlos. Por escenario viaja solo lo que cambia: índices de cañerías /
+  nodos con override y las fuentes (índice de nodo, head).
+- Todo es por índice: los workers no conocen los UUID. El caller traduce.
+- Este módulo no importa app.db ni las rutas, así los workers (spawn)
+  arrancan livianos.
+- Cada lote levanta su propio pool de procesos (la red y las opciones van
+  en el initializer). Para que N requests en paralelo no sean N pools,
+  batch_slot() deja correr SIM_BATCH_MAX_RUNNING lotes a la vez por
+  proceso de la API; el resto espera SIM_BATCH_WAIT_SEC y si no hay lugar
+  sale BatchBusy.
+
+Modelos:
+  SIMPLE = misma propagación visual que /mapa/sim/run (head dominante).
+  LINEAR = run_linear_simulation sobre las componentes con fuente.
+  GGA    = run_gga_simulation (Todini-Pilati) con demandas.
+
+CLI:
+  python -m app.services.sim_batch escenarios.json [--workers N] > resultados.ndjson
+"""
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Iterator, List, Tuple
+import math
+import os
+import threading
+import time
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+from app.services.gga_solver import run_gga_simulation
+from app.services.sim_solver import run_linear_simulation
+
+
+BATCH_MODELS = ("SIMPLE", "LINEAR", "GGA")
+
+# Arrays que se publican en memoria compartida (nombre -> dtype).
+SHARED_FIELDS: Dict[str, Any] = {
+    "node_elev": np.float64,          # NaN = sin cota
+    "node_valve_closed": np.bool_,
+    "node_demand_lps": np.float64,
+    "pipe_u": np.int32,               # -1 = sin conectar
+    "pipe_v": np.int32,
+    "pipe_length": np.float64,
+    "pipe_diam": np.float64,
+    "pipe_roughness": np.float64,     # NaN = sin dato
+    "pipe_is_open": np.bool_,
+    "pipe_valve_closed": np.bool_,
+}
+
+WORST_NODES = 10
+LOST_NODES_SAMPLE = 50
+
+# Piso de caída por cañería en SIMPLE: dijkstra no admite pesos 0.
+MIN_DROP_M = 1e-12
+
+# Lotes corriendo a la vez en este proceso (cada uno con hasta
+# BATCH_MAX_WORKERS procesos) y cuánto espera un lote por un lugar.
+SIM_BATCH_MAX_RUNNING = max(1, int(os.getenv("SIM_BATCH_MAX_RUNNING", "1")))
+SIM_BATCH_WAIT_SEC = float(os.getenv("SIM_BATCH_WAIT_SEC", "5"))
+
+_RUN_SLOTS = threading.BoundedSemaphore(SIM_BATCH_MAX_RUNNING)
+
+
+class BatchBusy(RuntimeError):
+    """Ya hay SIM_BATCH_MAX_RUNNING lotes corriendo."""
+
+
+@contextmanager
+def batch_slot(wait_sec: float = SIM_BATCH_WAIT_SEC):
+    if not _RUN_SLOTS.acquire(timeout=wait_sec):
+        raise BatchBusy(
+            f"Hay {SIM_BATCH_MAX_RUNNING} lote(s) de simulación corriendo; reintentar en unos segundos."
+        )
+    try:
+        yield
+    finally:
+        _RUN_SLOTS.release()
+
+
+# ============================================================
+# Memoria compartida
+# ============================================================
+
+class SharedArrays:
+    """
+    Copia arrays numpy a bloques SharedMemory. `spec` es lo único que se
+    manda a los workers: {nombre: (shm_name, dtype, shape)}.
+    Usar como context manager: al salir se liberan los bloques.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        self._blocks: List[SharedMemory] = []
+        self.spec: Dict[str, Tuple[str, str, Tuple[int, ...]]] = {}
+
+        try:
+            for name, arr in arrays.items():
+                arr = np.ascontiguousarray(arr, dtype=SHARED_FIELDS.get(name, arr.dtype))
+                shm = SharedMemory(create=True, size=max(1, arr.nbytes))
+                self._blocks.append(shm)
+                np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+                self.spec[name] = (shm.name, arr.dtype.str, arr.shape)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        for shm in self._blocks:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def attach_arrays(spec: Dict[str, Tuple[str, str, Tuple[int, ...]]]) -> Tuple[Dict[str, np.ndarray], List[SharedMemory]]:
+    """Vistas numpy (sin copia) sobre los bloques publicados por SharedArrays."""
+    arrays: Dict[str, np.ndarray] = {}
+    blocks: List[SharedMemory] = []
+
+    for name, (shm_name, dtype, shape) in spec.items():
+        shm = SharedMemory(name=shm_name)
+        blocks.append(shm)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        arrays[name] = arr
+
+    return arrays, blocks
+
+
+# ============================================================
+# Worker
+# ============================================================
+
+# Estado por proceso (lo arma _init_worker una vez).
+_W: Dict[str, Any] = {}
+
+
+def _init_worker(spec, options: Dict[str, Any], base_sources: List[Tuple[int, float]]) -> None:
+    arrays, blocks = attach_arrays(spec)
+
+    r_scale = float(options.get("r_scale") or 1.0)
+    R0 = float(options.get("R0") or 500000.0)
+    head_drop_scale = float(options.get("head_drop_scale") or 0.0)
+
+    # Misma resistencia / caída que pipe_R + propagación de /mapa/sim/run
+    L = np.maximum(0.1, arrays["pipe_length"])
+    D = np.maximum(0.001, arrays["pipe_diam"] / 1000.0)
+    R = (L / D ** 4) * r_scale
+    drop = np.maximum((1.0 / (1.0 + R / R0)) * R * head_drop_scale, MIN_DROP_M)
+
+    _W.clear()
+    _W.update(
+        arrays=arrays,
+        blocks=blocks,
+        options=options,
+        model=str(options.get("model") or "SIMPLE").upper(),
+        n=int(arrays["node_elev"].shape[0]),
+        drop=drop,
+        base_sources=base_sources,
+        base_reached=None,
+    )
+
+
+def _release_worker() -> None:
+    arrays = _W.get("arrays") or {}
+    arrays.clear()
+
+    for shm in _W.get("blocks") or []:
+        try:
+            shm.close()
+        except BufferError:
+            # Queda alguna vista viva; el bloque se libera al terminar el proceso.
+            pass
+
+    _W.clear()
+
+
+def _masks(sc: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """(cañerías activas, nodos bloqueados) del escenario."""
+    a = _W["arrays"]
+    opts = _W["options"]
+
+    pipe_open = a["pipe_is_open"].copy()
+
+    if opts.get("closed_valve_blocks_pipe", True):
+        pipe_open &= ~a["pipe_valve_closed"]
+
+    pipe_open[np.asarray(sc.get("pipes_open") or [], dtype=np.int64)] = True
+    pipe_open[np.asarray(sc.get("pipes_closed") or [], dtype=np.int64)] = False
+
+    blocked = np.zeros(_W["n"], dtype=bool)
+
+    if opts.get("closed_valve_blocks_node", True):
+        blocked |= a["node_valve_closed"]
+        blocked[np.asarray(sc.get("nodes_open") or [], dtype=np.int64)] = False
+        blocked[np.asarray(sc.get("nodes_closed") or [], dtype=np.int64)] = True
+
+    u = a["pipe_u"]
+    v = a["pipe_v"]
+    active = pipe_open & (u >= 0) & (v >= 0) & (u != v)
+
+    k = np.flatnonzero(active)
+    active[k] = ~blocked[u[k]] & ~blocked[v[k]]
+
+    return active, blocked
+
+
+def _fixed_sources(sources: List[Tuple[int, float]], blocked: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuentes no bloqueadas; si hay varias en un nodo, la de mayor head."""
+    best: Dict[int, float] = {}
+
+    for i, h in sources:
+        if blocked[i]:
+            continue
+        if h > best.get(i, float("-inf")):
+            best[i] = h
+
+    idx = np.fromiter(best.keys(), dtype=np.int64, count=len(best))
+    head = np.fromiter(best.values(), dtype=np.float64, count=len(best))
+    return idx, head
+
+
+def _heads_simple(active: np.ndarray, src_idx: np.ndarray, src_head: np.ndarray) -> np.ndarray:
+    """
+    Head dominante por nodo = max_s (head_s - camino mínimo de caída desde s).
+    Se resuelve con un solo dijkstra desde un nodo virtual unido a cada fuente
+    con peso (top - head_s).
+    """
+    a = _W["arrays"]
+    n = _W["n"]
+
+    k = np.flatnonzero(active)
+    iu = a["pipe_u"][k].astype(np.int64)
+    iv = a["pipe_v"][k].astype(np.int64)
+    w = _W["drop"][k]
+
+    top = float(src_head.max()) + 1.0
+
+    rows = np.concatenate([iu, iv, np.full(src_idx.size, n, dtype=np.int64)])
+    cols = np.concatenate([iv, iu, src_idx])
+    data = np.concatenate([w, w, top - src_head])
+
+    # Cañerías en paralelo: queda la de menor caída (csr sumaría duplicados).
+    order = np.lexsort((data, cols, rows))
+    rows, cols, data = rows[order], cols[order], data[order]
+    first = np.ones(rows.size, dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+
+    G = csr_matrix((data[first], (rows[first], cols[first])), shape=(n + 1, n + 1))
+    dist = dijkstra(G, directed=True, indices=n)[:n]
+
+    heads = top - dist
+    heads[~np.isfinite(dist)] = np.nan
+    return heads
+
+
+def _heads_linear(active: np.ndarray, src_idx: np.ndarray, src_head: np.ndarray) -> np.ndarray:
+    a = _W["arrays"]
+    opts = _W["options"]
+    n = _W["n"]
+
+    k = np.flatnonzero(active)
+    iu = a["pipe_u"][k]
+    iv = a["pipe_v"][k]
+
+    # run_linear_simulation exige que todo nodo libre tenga camino a una fuente.
+    topo = coo_matrix((np.ones(k.size), (iu, iv)), shape=(n, n))
+    _, labels = connected_components(topo, directed=False)
+    anchored = np.isin(labels, labels[src_idx])
+
+    keep = anchored[iu]
+    nodes_rows = [{"id": str(i)} for i in np.flatnonzero(anchored).tolist()]
+    pipes_rows = [
+        {
+            "id": str(kk),
+            "from_node": str(uu),
+            "to_node": str(vv),
+            "length_m": float(a["pipe_length"][kk]),
+            "diametro_mm": float(a["pipe_diam"][kk]),
+        }
+        for kk, uu, vv in zip(k[keep].tolist(), iu[keep].tolist(), iv[keep].tolist())
+    ]
+    sources_rows = [{"node_id": str(i), "head_m": h} for i, h in zip(src_idx.tolist(), src_head.tolist())]
+
+    out = run_linear_simulation(
+        nodes_rows,
+        pipes_rows,
+        [],
+        sources_rows,
+        [],
+        {
+            "default_diam_mm": opts.get("default_diam_mm", 75.0),
+            "r_scale": opts.get("r_scale", 1.0),
+            "closed_valve_blocks_node": False,
+        },
+    )
+
+    heads = np.full(n, np.nan)
+    for nid, o in out["nodes"].items():
+        heads[int(nid)] = o["head_m"]
+    return heads
+
+
+def _heads_gga(active: np.ndarray, src_idx: np.ndarray, src_head: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
+    a = _W["arrays"]
+    opts = _W["options"]
+    n = _W["n"]
+
+    k = np.flatnonzero(active)
+    rough = a["pipe_roughness"]
+
+    pipes = [
+        (
+            str(kk),
+            str(uu),
+            str(vv),
+            float(a["pipe_length"][kk]),
+            float(a["pipe_diam"][kk]),
+            None if math.isnan(rough[kk]) else float(rough[kk]),
+        )
+        for kk, uu, vv in zip(k.tolist(), a["pipe_u"][k].tolist(), a["pipe_v"][k].tolist())
+    ]
+
+    demands: Dict[str, float] = {}
+    if opts.get("use_demands", True):
+        dem = a["node_demand_lps"]
+        for i in np.flatnonzero(dem).tolist():
+            demands[str(i)] = float(dem[i])
+
+    out = run_gga_simulation(
+        pipes=pipes,
+        fixed_heads={str(i): h for i, h in zip(src_idx.tolist(), src_head.tolist())},
+        demands_lps=demands,
+        headloss=opts.get("headloss") or "HW",
+        default_roughness=opts.get("default_roughness"),
+        max_iter=max(1, int(opts.get("gga_max_iter") or 40)),
+        accuracy=float(opts.get("gga_accuracy") or 1e-3),
+        warm_start=bool(opts.get("warm_start", True)),
+    )
+
+    heads = np.full(n, np.nan)
+    for nid, h in out["heads"].items():
+        heads[int(nid)] = h
+
+    meta = out["meta"]
+    return heads, {"iterations": meta["iterations"], "converged": meta["converged"]}
+
+
+def _solve(sc: Dict[str, Any], sources: List[Tuple[int, float]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int, Dict[str, Any] | None]:
+    active, blocked = _masks(sc)
+    src_idx, src_head = _fixed_sources(sources, blocked)
+    extra = None
+
+    if src_idx.size == 0:
+        heads = np.full(_W["n"], np.nan)
+    elif _W["model"] == "LINEAR":
+        heads = _heads_linear(active, src_idx, src_head)
+    elif _W["model"] == "GGA":
+        heads, extra = _heads_gga(active, src_idx, src_head)
+    else:
+        heads = _heads_simple(active, src_idx, src_head)
+
+    return heads, active, blocked, int(src_idx.size), extra
+
+
+def _base_reached() -> np.ndarray:
+    """Nodos alcanzados sin overrides (para contar los que se pierden)."""
+    if _W["base_reached"] is None:
+        heads, _active, _blocked, _n_src, _extra = _solve({}, _W["base_sources"])
+        _W["base_reached"] = np.isfinite(heads)
+    return _W["base_reached"]
+
+
+def _f(x: Any) -> float | None:
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+def run_scenario(sc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    sc: {index, name, pipes_open, pipes_closed, nodes_open, nodes_closed,
+         sources: [(node_idx, head_m)] | None (= fuentes base)}
+    Devuelve un resumen por escenario, con nodos por índice.
+    """
+    t0 = time.perf_counter()
+
+    try:
+        a = _W["arrays"]
+        sources = sc.get("sources")
+        sources = _W["base_sources"] if sources is None else sources
+
+        heads, active, blocked, n_src, extra = _solve(sc, sources)
+
+        reached = np.isfinite(heads)
+        lost = np.flatnonzero(_base_reached() & ~reached)
+
+        elev = a["node_elev"]
+        with_z = np.flatnonzero(reached & np.isfinite(elev))
+        pressure = heads[with_z] - elev[with_z]
+        worst = np.argsort(pressure, kind="stable")[:WORST_NODES]
+
+        u = a["pipe_u"]
+        v = a["pipe_v"]
+        k = np.flatnonzero(active)
+        flowing = int(np.count_nonzero(reached[u[k]] & reached[v[k]]))
+
+        min_pressure_m = float(_W["options"].get("min_pressure_m") or 0.0)
+
+        return {
+            "index": sc["index"],
+            "name": sc.get("name"),
+            "ok": True,
+            "model": _W["model"],
+            "sources_active": n_src,
+            "nodes_reached": int(reached.sum()),
+            "nodes_unreached": int(_W["n"] - reached.sum()),
+            "nodes_blocked": int(blocked.sum()),
+            "nodes_lost": int(lost.size),
+            "nodes_lost_sample": lost[:LOST_NODES_SAMPLE].tolist(),
+            "pipes_active": int(k.size),
+            "pipes_flowing": flowing,
+            "head_m_min": _f(np.nanmin(heads)) if reached.any() else None,
+            "head_m_max": _f(np.nanmax(heads)) if reached.any() else None,
+            "pressure_mca_min": _f(pressure.min()) if pressure.size else None,
+            "pressure_mca_avg": _f(pressure.mean()) if pressure.size else None,
+            "nodes_below_min_pressure": int(np.count_nonzero(pressure < min_pressure_m)),
+            "worst_nodes": [(int(with_z[j]), float(pressure[j])) for j in worst.tolist()],
+            "gga": extra,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+        }
+    except Exception as e:
+        return {
+            "index": sc.get("index"),
+            "name": sc.get("name"),
+            "ok": False,
+            "error": str(e),
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+        }
+
+
+# ============================================================
+# Orquestación
+# ============================================================
+
+def run_batch(
+    arrays: Dict[str, np.ndarray],
+    base_sources: List[Tuple[int, float]],
+    scenarios: List[Dict[str, Any]],
+    options: Dict[str, Any],
+    workers: int = 1,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Resuelve los escenarios y devuelve los resúmenes a medida que terminan
+    (no en orden: cada uno trae su "index").
+    Con workers <= 1 corre en el proceso actual (misma ruta de código).
+    """
+    with SharedArrays(arrays) as shared:
+        if workers <= 1 or len(scenarios) <= 1:
+            _init_worker(shared.spec, options, base_sources)
+            try:
+                for sc in scenarios:
+                    yield run_scenario(sc)
+            finally:
+                _release_worker()
+            return
+
+        # spawn: el proceso padre puede tener threads (pool de DB, uvicorn).
+        ex = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shared.spec, options, base_sources),
+        )
+
+        try:
+            pending = {ex.submit(run_scenario, sc) for sc in scenarios}
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        finally:
+            # Si el cliente corta el stream, no seguir resolviendo.
+            ex.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv: List[str] | None = None) -> int:
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(
+        prog="python -m app.services.sim_batch",
+        description="Corre escenarios de /mapa/sim/batch desde consola y escribe NDJSON.",
+    )
+    parser.add_argument("scenarios", help='JSON con {"options": {...}, "scenarios": [...]} o una lista de escenarios ("-" = stdin)')
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--model", default=None, help="SIMPLE | LINEAR | GGA (pisa options.model)")
+    args = parser.parse_args(argv)
+
+    raw = json.load(sys.stdin if args.scenarios == "-" else open(args.scenarios, encoding="utf-8"))
+    if isinstance(raw, list):
+        raw = {"scenarios": raw}
+    if args.workers is not None:
+        raw["workers"] = args.workers
+    if args.model:
+        raw.setdefault("options", {})["model"] = args.model
+
+    # Import tardío: solo el proceso principal necesita la base.
+    from app.routes.mapa.sim.batch import load_batch_inputs, iter_batch
+    from app.routes.mapa.sim.models import SimBatchRequest
+
+    body = SimBatchRequest.model_validate(raw)
+    net, sources, demands = load_batch_inputs(body)
+
+    for item in iter_batch(net, sources, demands, body):
+        sys.stdout.write(json.dumps(item, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
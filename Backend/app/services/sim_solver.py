@@ -1,8 +1,20 @@
 # app/services/sim_solver.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 import math
 
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve
+
+
+# Con solver="auto", redes de hasta este tamaño van por la eliminación densa
+# (más barata que armar la matriz dispersa); el resto por LU dispersa.
+DENSE_MAX_NODES = 200
+
+_SINGULAR_MSG = "Matriz singular (red desconectada o sin anclaje de fuentes)."
+
 
 def _solve_linear_system(A: List[List[float]], b: List[float]) -> List[float]:
     n = len(A)
@@ -17,7 +29,7 @@ def _solve_linear_system(A: List[List[float]], b: List[float]) -> List[float]:
                 max_abs = v
                 pivot = r
         if max_abs < 1e-12:
-            raise ValueError("Matriz singular (red desconectada o sin anclaje de fuentes).")
+            raise ValueError(_SINGULAR_MSG)
 
         if pivot != col:
             M[col], M[pivot] = M[pivot], M[col]
@@ -43,6 +55,93 @@ def _solve_linear_system(A: List[List[float]], b: List[float]) -> List[float]:
     return x
 
 
+def _solve_heads_dense(
+    n: int,
+    edges: List[Tuple[int, int, float]],
+    fixed_indices: Dict[int, float],
+) -> List[float]:
+    """
+    Arma G (n×n) densa, fija las filas de las fuentes y resuelve por Gauss.
+    Solo para redes chicas: O(n²) memoria y O(n³) tiempo.
+    """
+    G = [[0.0 for _ in range(n)] for __ in range(n)]
+    b = [0.0 for _ in range(n)]
+
+    for iu, iv, g in edges:
+        G[iu][iu] += g
+        G[iv][iv] += g
+        G[iu][iv] -= g
+        G[iv][iu] -= g
+
+    for k, head in fixed_indices.items():
+        for c in range(n):
+            # Pasar el aporte de la fuente al lado derecho antes de anular la columna.
+            if c not in fixed_indices:
+                b[c] -= G[c][k] * head
+            G[k][c] = 0.0
+            G[c][k] = 0.0
+        G[k][k] = 1.0
+        b[k] = head
+
+    return _solve_linear_system(G, b)
+
+
+def _solve_heads_sparse(
+    n: int,
+    edges: List[Tuple[int, int, float]],
+    fixed_indices: Dict[int, float],
+) -> List[float]:
+    """
+    Arma G en COO -> CSR, elimina las filas/columnas de head fijo y resuelve
+    el bloque libre con factorización LU dispersa (SuperLU):
+
+        G_ff * H_f = -G_fc * H_c
+    """
+    H = np.zeros(n, dtype=np.float64)
+
+    fixed = np.fromiter(fixed_indices.keys(), dtype=np.int64, count=len(fixed_indices))
+    H[fixed] = np.fromiter(fixed_indices.values(), dtype=np.float64, count=len(fixed_indices))
+
+    is_free = np.ones(n, dtype=bool)
+    is_free[fixed] = False
+    free = np.flatnonzero(is_free)
+
+    if free.size == 0:
+        return H.tolist()
+
+    iu = np.fromiter((e[0] for e in edges), dtype=np.int64, count=len(edges))
+    iv = np.fromiter((e[1] for e in edges), dtype=np.int64, count=len(edges))
+    g = np.fromiter((e[2] for e in edges), dtype=np.float64, count=len(edges))
+
+    # Los duplicados (cañerías en paralelo) se suman al pasar a CSR.
+    G = coo_matrix(
+        (
+            np.concatenate([g, g, -g, -g]),
+            (np.concatenate([iu, iv, iu, iv]), np.concatenate([iu, iv, iv, iu])),
+        ),
+        shape=(n, n),
+    ).tocsr()
+
+    # Mismo criterio que la versión densa: todo nodo libre tiene que estar
+    # conectado a alguna fuente, si no la matriz es singular.
+    _, labels = connected_components(G, directed=False)
+    anchored = np.zeros(int(labels.max()) + 1, dtype=bool)
+    anchored[labels[fixed]] = True
+    if not anchored[labels[free]].all():
+        raise ValueError(_SINGULAR_MSG)
+
+    G_free = G[free]
+    rhs = -(G_free[:, fixed] @ H[fixed])
+    # G es simétrica: el orden mínimo-grado sobre A^T+A da menos fill-in que COLAMD.
+    x = spsolve(G_free[:, free].tocsc(), rhs, permc_spec="MMD_AT_PLUS_A")
+
+    if not np.all(np.isfinite(x)):
+        raise ValueError(_SINGULAR_MSG)
+
+    H[free] = x
+    return H.tolist()
+
+
 def _pipe_resistance(length_m: float, diam_mm: float, r_scale: float) -> float:
     L = max(0.1, float(length_m))
     D = max(0.001, float(diam_mm) / 1000.0)
@@ -62,6 +161,8 @@ def run_linear_simulation(
     closed_valve_blocks_node = bool(options.get("closed_valve_blocks_node", True))
     min_pressure_m = float(options.get("min_pressure_m", 0.0))
     r_scale = float(options.get("r_scale", 1.0))
+    # "auto" | "sparse" | "dense"
+    solver = str(options.get("solver") or "auto").lower()
 
     node_ids = [str(r["id"]) for r in nodes_rows]
     idx = {nid: i for i, nid in enumerate(node_ids)}
@@ -87,14 +188,12 @@ def run_linear_simulation(
     if not source_head:
         raise ValueError("No hay sources. Creá al menos una fuente (node_id + head_m).")
 
-    # G * H = b
-    G = [[0.0 for _ in range(n)] for __ in range(n)]
-    b = [0.0 for _ in range(n)]
-
     # ✅ DEMANDS IGNORADAS (modo simple)
     demands_count = len(demands_rows) if demands_rows is not None else 0
 
     used_pipes = []
+    # (i_u, i_v, conductancia) para armar G * H = b
+    edges: List[Tuple[int, int, float]] = []
 
     for p in pipes_rows:
         pid = str(p["id"])
@@ -119,14 +218,7 @@ def run_linear_simulation(
         R = _pipe_resistance(L, Dmm, r_scale=r_scale)
         g = 1.0 / max(R, 1e-12)
 
-        iu = idx[u]
-        iv = idx[v]
-
-        G[iu][iu] += g
-        G[iv][iv] += g
-        G[iu][iv] -= g
-        G[iv][iu] -= g
-
+        edges.append((idx[u], idx[v], g))
         used_pipes.append((pid, u, v, g, R, L, Dmm))
 
     fixed_indices: Dict[int, float] = {}
@@ -137,14 +229,14 @@ def run_linear_simulation(
     if not fixed_indices:
         raise ValueError("No hay sources válidas (todas bloqueadas o inexistentes).")
 
-    for k, head in fixed_indices.items():
-        for c in range(n):
-            G[k][c] = 0.0
-            G[c][k] = 0.0
-        G[k][k] = 1.0
-        b[k] = head
+    if solver == "auto":
+        solver = "dense" if n <= DENSE_MAX_NODES else "sparse"
 
-    H = _solve_linear_system(G, b)
+    if solver == "dense":
+        H = _solve_heads_dense(n, edges, fixed_indices)
+    else:
+        solver = "sparse"
+        H = _solve_heads_sparse(n, edges, fixed_indices)
 
     nodes_out = {}
     for nid in node_ids:
@@ -192,6 +284,7 @@ def run_linear_simulation(
             "n_nodes": n,
             "n_pipes_used": len(used_pipes),
             "n_sources": len(fixed_indices),
+            "solver": solver,
             "demands_ignored": True,
             "demands_count": demands_count,
         },
@@ -0,0 +1,403 @@
+# app/services/tank_rollup.py
+"""
+Rollup incremental del nivel de tanques en varias resoluciones.
+
+Una tabla (TANK_ROLLUP_TABLE) con una fila por (tier, tank_id, bucket_ts)
+y min / max / avg / last / cantidad de muestras:
+
+  tier  bucket      se calcula desde
+  1m    1 minuto    TANK_LEVELS_SOURCE (lecturas limpias, ts / level_pct)
+  5m    5 minutos   1m
+  1h    1 hora      5m
+  1d    1 día (UTC) 1h
+
+Mismo esquema que pump_rollup: un hilo cada TANK_ROLLUP_INTERVAL_SEC lee
+el último id procesado de tank_ingest (kpi.rollup_watermarks, columna
+last_id), junta los (tanque, minuto) tocados por filas nuevas (hasta
+TANK_ROLLUP_BATCH por corrida) más la ventana de gracia
+(TANK_ROLLUP_GRACE_ROWS ids anteriores al mark con created_at en los
+últimos TANK_ROLLUP_GRACE_MIN minutos), recalcula esos minutos desde
+TANK_LEVELS_SOURCE (la misma vista que lee /kpi/tanques/live sin
+rollup) y en cascada sólo los buckets 5m / 1h / 1d que los contienen.
+Todo en una transacción, con el mark.
+
+kpi/tank_live lee el rollup sólo si tank_rollup_ready dice que está al
+día (ver pump_rollup.RollupReadiness); si no, va a la vista.
+
+avg de los tiers gruesos = promedio ponderado por muestras (no promedio
+de promedios); last = el último valor por ts.
+
+tier_for_bucket() elige el tier más grueso cuyo tamaño divide el bucket
+pedido (15min -> 5m, 1h -> 1h, ...). Lo usa kpi/tank_live.
+
+Env:
+  TANK_ROLLUP_ENABLED        (default 1)
+  TANK_ROLLUP_TABLE          (default kpi.tank_level_rollup)
+  TANK_ROLLUP_INTERVAL_SEC   (default 60)
+  TANK_ROLLUP_GRACE_MIN      (default 10)
+  TANK_ROLLUP_GRACE_ROWS     (default 5000)
+  TANK_ROLLUP_BATCH          (default 100000)
+  TANK_ROLLUP_BACKFILL_DAYS  (default 35)
+  TANK_LEVELS_SOURCE         (default kpi.v_tank_levels_clean)
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Any, Optional
+import logging
+import os
+import threading
+import time
+
+from psycopg.rows import dict_row
+
+from app.db import get_conn
+from app.services.pump_rollup import WATERMARKS_TABLE, RollupReadiness
+
+log = logging.getLogger("tank-rollup")
+
+TANK_ROLLUP_ENABLED = os.getenv("TANK_ROLLUP_ENABLED", "1") == "1"
+TANK_ROLLUP_TABLE = (os.getenv("TANK_ROLLUP_TABLE") or "kpi.tank_level_rollup").strip()
+TANK_ROLLUP_INTERVAL_SEC = float(os.getenv("TANK_ROLLUP_INTERVAL_SEC", "60"))
+TANK_ROLLUP_GRACE_MIN = int(os.getenv("TANK_ROLLUP_GRACE_MIN", "10"))
+TANK_ROLLUP_GRACE_ROWS = int(os.getenv("TANK_ROLLUP_GRACE_ROWS", "5000"))
+TANK_ROLLUP_BATCH = int(os.getenv("TANK_ROLLUP_BATCH", "100000"))
+TANK_ROLLUP_BACKFILL_DAYS = int(os.getenv("TANK_ROLLUP_BACKFILL_DAYS", "35"))
+TANK_LEVELS_SOURCE = (os.getenv("TANK_LEVELS_SOURCE") or "kpi.v_tank_levels_clean").strip()
+
+# "_clean": el 1m sale de TANK_LEVELS_SOURCE. El mark anterior ("tank_level",
+# desde tank_ingest crudo) queda sin uso; el backfill rehace la ventana.
+WATERMARK_NAME = "tank_level_clean"
+ROLLUP_LOCK_KEY = 987654323
+
+# (tier, minutos, bucket SQL sobre la columna {c}, tier del que sale)
+TIERS = (
+    ("1m", 1, "date_trunc('minute', {c})", None),
+    ("5m", 5, "date_trunc('hour', {c}) + (extract(minute from {c})::int / 5) * interval '5 min'", "1m"),
+    ("1h", 60, "date_trunc('hour', {c})", "5m"),
+    ("1d", 1440, "date_trunc('day', {c})", "1h"),
+)
+TIER_MINUTES = {name: minutes for name, minutes, _, _ in TIERS}
+
+
+def tier_for_bucket(bucket_minutes: int) -> str:
+    """El tier más grueso cuyo tamaño divide el bucket pedido."""
+    best = "1m"
+    for name, minutes, _, _ in TIERS:
+        if minutes <= bucket_minutes and bucket_minutes % minutes == 0:
+            best = name
+    return best
+
+
+def floor_to_tier(ts: datetime, tier: str) -> datetime:
+    """Inicio del bucket del tier que contiene ts (ts en UTC)."""
+    ts = ts.replace(second=0, microsecond=0)
+    if tier == "5m":
+        return ts.replace(minute=ts.minute - ts.minute % 5)
+    if tier == "1h":
+        return ts.replace(minute=0)
+    if tier == "1d":
+        return ts.replace(hour=0, minute=0)
+    return ts
+
+
+_SQL_SCHEMA = f"""
+    CREATE SCHEMA IF NOT EXISTS kpi;
+
+    CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} (
+      name           text PRIMARY KEY,
+      last_hb_id     bigint NOT NULL DEFAULT 0,
+      last_event_id  bigint NOT NULL DEFAULT 0,
+      last_run_at    timestamptz,
+      rows_upserted  bigint NOT NULL DEFAULT 0
+    );
+    ALTER TABLE {WATERMARKS_TABLE} ADD COLUMN IF NOT EXISTS last_id bigint NOT NULL DEFAULT 0;
+    ALTER TABLE {WATERMARKS_TABLE} ADD COLUMN IF NOT EXISTS caught_up_at timestamptz;
+
+    CREATE TABLE IF NOT EXISTS {TANK_ROLLUP_TABLE} (
+      tier        text             NOT NULL,
+      tank_id     bigint           NOT NULL,
+      bucket_ts   timestamptz      NOT NULL,
+      level_min   double precision NOT NULL,
+      level_max   double precision NOT NULL,
+      level_avg   double precision NOT NULL,
+      level_last  double precision NOT NULL,
+      last_ts     timestamptz      NOT NULL,
+      samples     integer          NOT NULL,
+      updated_at  timestamptz      NOT NULL DEFAULT now(),
+      PRIMARY KEY (tier, tank_id, bucket_ts)
+    );
+"""
+
+_SQL_INIT_WATERMARK = f"""
+    INSERT INTO {WATERMARKS_TABLE} (name, last_id)
+    SELECT
+      %(name)s,
+      coalesce((SELECT min(id) - 1 FROM public.tank_ingest WHERE created_at >= %(floor)s),
+               (SELECT max(id) FROM public.tank_ingest), 0)
+    ON CONFLICT (name) DO NOTHING
+"""
+
+_SQL_RANGE = """
+    SELECT max(id) AS hi, count(*)::int AS n
+    FROM (
+      SELECT id FROM public.tank_ingest WHERE id > %s ORDER BY id LIMIT %s
+    ) s
+"""
+
+# Minutos tocados por el lote (+ gracia), por id de tank_ingest. Base de la cascada.
+_SQL_TOUCHED = """
+    CREATE TEMP TABLE tank_rollup_touched ON COMMIT DROP AS
+    SELECT DISTINCT i.tank_id, date_trunc('minute', i.created_at) AS bucket_ts
+    FROM public.tank_ingest i
+    WHERE i.id > %(lo)s - %(grace_rows)s AND i.id <= %(hi)s
+      AND (i.id > %(lo)s OR i.created_at >= %(grace_from)s)
+      AND i.created_at >= %(floor)s
+"""
+
+_UPSERT_TAIL = """
+    ON CONFLICT (tier, tank_id, bucket_ts) DO UPDATE
+      SET level_min  = excluded.level_min,
+          level_max  = excluded.level_max,
+          level_avg  = excluded.level_avg,
+          level_last = excluded.level_last,
+          last_ts    = excluded.last_ts,
+          samples    = excluded.samples,
+          updated_at = now()
+      WHERE (r.level_min, r.level_max, r.level_avg, r.level_last, r.last_ts, r.samples)
+            IS DISTINCT FROM
+            (excluded.level_min, excluded.level_max, excluded.level_avg,
+             excluded.level_last, excluded.last_ts, excluded.samples)
+"""
+
+_SQL_UPSERT_1M = f"""
+    INSERT INTO {TANK_ROLLUP_TABLE} AS r
+      (tier, tank_id, bucket_ts, level_min, level_max, level_avg, level_last, last_ts, samples, updated_at)
+    SELECT
+      '1m', t.tank_id, t.bucket_ts,
+      min(c.level_pct)::float8,
+      max(c.level_pct)::float8,
+      avg(c.level_pct)::float8,
+      ((array_agg(c.level_pct ORDER BY c.ts DESC))[1])::float8,
+      max(c.ts),
+      count(*)::int,
+      now()
+    FROM tank_rollup_touched t
+    JOIN {TANK_LEVELS_SOURCE} c
+      ON c.tank_id = t.tank_id
+     AND c.ts >= t.bucket_ts
+     AND c.ts <  t.bucket_ts + interval '1 minute'
+    WHERE c.level_pct IS NOT NULL
+    GROUP BY t.tank_id, t.bucket_ts
+    {_UPSERT_TAIL}
+"""
+
+# Tier grueso desde el anterior, sólo para los buckets que contienen minutos tocados.
+_SQL_UPSERT_TIER = f"""
+    WITH touched AS (
+      SELECT DISTINCT tank_id, {{bucket_t}} AS bucket_ts
+      FROM tank_rollup_touched
+    )
+    INSERT INTO {TANK_ROLLUP_TABLE} AS r
+      (tier, tank_id, bucket_ts, level_min, level_max, level_avg, level_last, last_ts, samples, updated_at)
+    SELECT
+      %(tier)s, t.tank_id, t.bucket_ts,
+      min(s.level_min),
+      max(s.level_max),
+      sum(s.level_avg * s.samples) / sum(s.samples),
+      (array_agg(s.level_last ORDER BY s.last_ts DESC))[1],
+      max(s.last_ts),
+      sum(s.samples)::int,
+      now()
+    FROM touched t
+    JOIN {TANK_ROLLUP_TABLE} s
+      ON s.tier = %(src)s
+     AND s.tank_id = t.tank_id
+     AND s.bucket_ts >= t.bucket_ts
+     AND s.bucket_ts <  t.bucket_ts + %(size)s::interval
+    GROUP BY t.tank_id, t.bucket_ts
+    {_UPSERT_TAIL}
+"""
+
+
+class TankRollup:
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._run_lock = threading.Lock()
+        self._schema_ready = False
+        self.last_result: Optional[dict[str, Any]] = None
+        self.runs = 0
+        self.errors = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --------------------------------------------------------
+    # Una corrida
+    # --------------------------------------------------------
+    def ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        with get_conn("analytics") as conn, conn.cursor() as cur:
+            cur.execute(_SQL_SCHEMA)
+            conn.commit()
+        self._schema_ready = True
+
+    def run_once(self) -> dict[str, Any]:
+        """Procesa un lote. caught_up=False: quedan filas pendientes."""
+        with self._run_lock:
+            self.ensure_schema()
+            t0 = time.perf_counter()
+
+            with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS ok", (ROLLUP_LOCK_KEY,))
+                if not cur.fetchone()["ok"]:
+                    conn.rollback()
+                    return {"ok": True, "skipped": True, "reason": "rollup already running"}
+
+                # Buckets de día en UTC, independiente del TimeZone de la sesión
+                cur.execute("SET LOCAL timezone = 'UTC'")
+                cur.execute("SELECT now() AS now")
+                now = cur.fetchone()["now"]
+                floor = now - timedelta(days=TANK_ROLLUP_BACKFILL_DAYS)
+
+                cur.execute(_SQL_INIT_WATERMARK, {"name": WATERMARK_NAME, "floor": floor})
+                cur.execute(
+                    f"SELECT last_id FROM {WATERMARKS_TABLE} WHERE name = %s FOR UPDATE",
+                    (WATERMARK_NAME,),
+                )
+                lo = int(cur.fetchone()["last_id"])
+
+                cur.execute(_SQL_RANGE, (lo, TANK_ROLLUP_BATCH))
+                r = cur.fetchone()
+                hi, n = (int(r["hi"]) if r["hi"] is not None else lo), r["n"]
+
+                cur.execute(
+                    _SQL_TOUCHED,
+                    {
+                        "lo": lo,
+                        "hi": hi,
+                        "grace_from": now - timedelta(minutes=TANK_ROLLUP_GRACE_MIN),
+                        "grace_rows": TANK_ROLLUP_GRACE_ROWS,
+                        "floor": floor,
+                    },
+                )
+                minutes = max(cur.rowcount, 0)
+
+                caught_up = n < TANK_ROLLUP_BATCH
+                upserted: dict[str, int] = {}
+                if minutes:
+                    cur.execute(_SQL_UPSERT_1M)
+                    upserted["1m"] = max(cur.rowcount, 0)
+                    for tier, size, bucket_sql, src in TIERS[1:]:
+                        cur.execute(
+                            _SQL_UPSERT_TIER.format(bucket_t=bucket_sql.format(c="bucket_ts")),
+                            {"tier": tier, "src": src, "size": f"{size} minutes"},
+                        )
+                        upserted[tier] = max(cur.rowcount, 0)
+
+                cur.execute(
+                    f"""
+                    UPDATE {WATERMARKS_TABLE}
+                       SET last_id = %s,
+                           last_run_at = now(),
+                           caught_up_at = CASE WHEN %s THEN now() ELSE caught_up_at END,
+                           rows_upserted = rows_upserted + %s
+                     WHERE name = %s
+                    """,
+                    (hi, caught_up, sum(upserted.values()), WATERMARK_NAME),
+                )
+                conn.commit()
+
+            result = {
+                "ok": True,
+                "skipped": False,
+                "rows": n,
+                "minutes_touched": minutes,
+                "rows_upserted": upserted,
+                "last_id": hi,
+                "caught_up": caught_up,
+                "ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+            self.last_result = result
+            self.runs += 1
+            return result
+
+    def status(self) -> dict[str, Any]:
+        with get_conn("analytics") as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(
+                f"""
+                SELECT last_id, last_run_at, caught_up_at, rows_upserted,
+                       now() - last_run_at AS since_last_run
+                FROM {WATERMARKS_TABLE}
+                WHERE name = %s
+                """,
+                (WATERMARK_NAME,),
+            )
+            wm = cur.fetchone()
+
+        return {
+            "table": TANK_ROLLUP_TABLE,
+            "source": TANK_LEVELS_SOURCE,
+            "ready": tank_rollup_ready.ready(),
+            "tiers": [name for name, _, _, _ in TIERS],
+            "thread": self.running,
+            "runs": self.runs,
+            "errors": self.errors,
+            "watermark": wm,
+            "last_result": self.last_result,
+        }
+
+    # --------------------------------------------------------
+    # Hilo
+    # --------------------------------------------------------
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._worker, name="tank-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            wait = TANK_ROLLUP_INTERVAL_SEC
+            try:
+                res = self.run_once()
+                if not res.get("skipped") and not res.get("caught_up"):
+                    wait = 0.5  # backfill / atraso: seguir de a lotes
+            except Exception as e:
+                self.errors += 1
+                log.warning("tank rollup falló: %s", e)
+            self._stop.wait(wait)
+
+
+tank_rollup = TankRollup()
+tank_rollup_ready = RollupReadiness(WATERMARK_NAME, TANK_ROLLUP_ENABLED, TANK_ROLLUP_INTERVAL_SEC)
+
+
+def delete_tank_rollup(cur, tank_id: int) -> None:
+    """Borra el rollup de un tanque (dentro de la transacción del DELETE del tanque)."""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL AS ok", (TANK_ROLLUP_TABLE,))
+    row = cur.fetchone()
+    exists = row["ok"] if isinstance(row, dict) else row[0]
+    if exists:
+        cur.execute(f"DELETE FROM {TANK_ROLLUP_TABLE} WHERE tank_id = %s", (tank_id,))
+
+
+def start_tank_rollup():
+    if not TANK_ROLLUP_ENABLED:
+        log.info("Tank rollup disabled (TANK_ROLLUP_ENABLED=0)")
+        return
+    tank_rollup.start()
+
+
+def stop_tank_rollup():
+    tank_rollup.stop()
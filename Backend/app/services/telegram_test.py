@@ -9,6 +9,7 @@ from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
 from app.db import get_conn
+from app.services.latest_store import latest_store
 from app.services.telegram_client import send_telegram_message
 
 router = APIRouter(prefix="/telegram", tags=["telegram"])
@@ -33,54 +34,49 @@ def _age_sec(ts):
 def telegram_report_now():
     try:
         with get_conn() as conn, conn.cursor() as cur:
-            # ---- TANQUES + localidad + último ingest ----
+            # ---- TANQUES + localidad (última lectura: latest_store) ----
             cur.execute(
                 """
                 SELECT
                   l.id AS location_id,
                   l.name AS location_name,
                   t.id AS tank_id,
-                  t.name AS tank_name,
-                  ti.level_pct,
-                  ti.created_at AS last_seen
+                  t.name AS tank_name
                 FROM public.tanks t
                 JOIN public.locations l ON l.id = t.location_id
-                LEFT JOIN LATERAL (
-                  SELECT level_pct, created_at
-                  FROM public.tank_ingest
-                  WHERE tank_id = t.id
-                  ORDER BY created_at DESC
-                  LIMIT 1
-                ) ti ON true
                 ORDER BY l.name, t.name
                 """
             )
             tanks = [dict(zip([d[0] for d in cur.description], r)) for r in cur.fetchall()]
 
-            # ---- BOMBAS + localidad + último heartbeat ----
+            # ---- BOMBAS + localidad (último heartbeat: latest_store) ----
             cur.execute(
                 """
                 SELECT
                   l.id AS location_id,
                   l.name AS location_name,
                   p.id AS pump_id,
-                  p.name AS pump_name,
-                  ph.plc_state,
-                  ph.created_at AS last_seen
+                  p.name AS pump_name
                 FROM public.pumps p
                 JOIN public.locations l ON l.id = p.location_id
-                LEFT JOIN LATERAL (
-                  SELECT plc_state, created_at
-                  FROM public.pump_heartbeat
-                  WHERE pump_id = p.id
-                  ORDER BY created_at DESC
-                  LIMIT 1
-                ) ph ON true
                 ORDER BY l.name, p.name
                 """
             )
             pumps = [dict(zip([d[0] for d in cur.description], r)) for r in cur.fetchall()]
 
+        # ---- Últimas lecturas desde memoria ----
+        latest_store.ensure_warm()
+
+        for t in tanks:
+            last = latest_store.tank(t["tank_id"]) or {}
+            t["level_pct"] = last.get("level_pct")
+            t["last_seen"] = last.get("created_at")
+
+        for p in pumps:
+            last = latest_store.pump(p["pump_id"]) or {}
+            p["plc_state"] = last.get("plc_state")
+            p["last_seen"] = last.get("created_at")
+
         # ---- Agrupar por localidad ----
         by_loc = defaultdict(lambda: {"location_name": None, "tanks": [], "pumps": [], "loc_online": False})
 
@@ -0,0 +1,170 @@
+# bench/async_db_throughput.py
+"""
+Benchmark: requests concurrentes contra la DB, antes y después del pool async.
+
+Levanta una app FastAPI mínima con el mismo patrón de handler en tres
+variantes y le manda --requests pedidos con --concurrency en vuelo,
+llamando a la app ASGI directo (sin red ni uvicorn de por medio):
+
+  blocking    async def + get_conn() sync   (cómo estaban layout.py /
+              mantenimiento.py: cada query frena el event loop)
+  threadpool  def + get_conn() sync          (resto de las rutas: threadpool
+              de Starlette + ConnectionPool(max_size=8))
+  async       async def + get_aconn()        (app/db_async.py)
+
+Cada request hace --sql (default: SELECT pg_sleep(--query-ms/1000), para
+simular la latencia de la DB/pooler sin depender de los datos).
+
+Uso (desde Backend/, con DATABASE_URL apuntando a una DB de prueba):
+    python bench/async_db_throughput.py [--requests 400] [--concurrency 50] [--query-ms 20]
+    python bench/async_db_throughput.py --sql "select * from public.tanks limit 50"
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from fastapi import FastAPI  # noqa: E402
+
+from app.db import get_conn, close_pool  # noqa: E402
+from app.db_async import get_aconn, open_async_pool, close_async_pool  # noqa: E402
+
+
+def build_app(sql: str, params: tuple) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/blocking")
+    async def blocking():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return {"rows": len(cur.fetchall())}
+
+    @app.get("/threadpool")
+    def threadpool():
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            return {"rows": len(cur.fetchall())}
+
+    @app.get("/async")
+    async def async_():
+        async with get_aconn() as conn, conn.cursor() as cur:
+            await cur.execute(sql, params)
+            return {"rows": len(await cur.fetchall())}
+
+    return app
+
+
+async def asgi_get(app, path: str) -> int:
+    """GET contra la app ASGI en proceso. Devuelve el status."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("bench", 0),
+        "server": ("bench", 80),
+    }
+    status = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(msg):
+        nonlocal status
+        if msg["type"] == "http.response.start":
+            status = msg["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run_mode(app, path: str, n_requests: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            status = await asgi_get(app, path)
+            latencies.append(time.perf_counter() - t0)
+            if status != 200:
+                errors += 1
+
+    # Calentar conexiones de ambos pools
+    await asyncio.gather(*(asgi_get(app, path) for _ in range(min(concurrency, 8))))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "rps": n_requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def amain(args) -> None:
+    if args.sql:
+        sql, params = args.sql, ()
+    else:
+        sql, params = "select pg_sleep(%s)", (args.query_ms / 1000.0,)
+
+    app = build_app(sql, params)
+    await open_async_pool()
+
+    try:
+        print(f"requests={args.requests} concurrency={args.concurrency} sql={sql!r} {params}")
+        results = {}
+        for mode in args.modes.split(","):
+            results[mode] = await run_mode(app, f"/{mode}", args.requests, args.concurrency)
+            r = results[mode]
+            print(
+                f"{mode:<11} {r['rps']:8.1f} req/s   p50={r['p50_ms']:7.1f} ms   "
+                f"p95={r['p95_ms']:7.1f} ms   errores={r['errors']}"
+            )
+
+        if "async" in results:
+            for mode in ("blocking", "threadpool"):
+                if mode in results:
+                    print(f"async vs {mode}: {results['async']['rps'] / results[mode]['rps']:.1f}x")
+    finally:
+        await close_async_pool()
+        close_pool()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--query-ms", type=float, default=20.0)
+    ap.add_argument("--sql", default="")
+    ap.add_argument("--modes", default="blocking,threadpool,async")
+    args = ap.parse_args()
+
+    asyncio.run(amain(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# bench/downsample_extremes.py
+"""
+Benchmark + chequeo: max_points de los históricos (app/services/downsample).
+
+Corre un corpus de series sintéticas de un mes a 1 minuto (43.200 puntos)
+con picos aislados, cruces de umbral de alarma, escalones, ruido y
+huecos (NULL), las reduce con minmax y lttb y verifica:
+
+  - extremos: el mínimo y el máximo de cada columna siguen estando
+  - bordes: primera y última fila se mantienen
+  - alarmas: cada tramo que cruza el umbral deja al menos un punto del
+    otro lado cerca (a menos de un bucket de distancia)
+  - tamaño: puntos y bytes del JSON antes/después, y tiempo de reducción
+
+Sale con código 1 si algún chequeo de minmax falla (lttb sólo garantiza
+extremos globales; los cruces se informan).
+
+Uso (desde Backend/, no necesita DB):
+    python bench/downsample_extremes.py [--points 43200] [--max-points 1500] [--seed 1]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from app.services.downsample import downsample_rows  # noqa: E402
+
+ALARM_HIGH = 90.0
+ALARM_LOW = 10.0
+
+
+def corpus(n: int, seed: int) -> dict[str, np.ndarray]:
+    rnd = np.random.default_rng(seed)
+    t = np.arange(n, dtype=np.float64)
+    series: dict[str, np.ndarray] = {}
+
+    # Nivel de tanque: ciclos de llenado/vaciado que tocan las alarmas
+    series["tank_cycles"] = 50 + 45 * np.sin(t / 700) + rnd.normal(0, 1.5, n)
+
+    # Ruido con picos de un solo minuto
+    spikes = 50 + rnd.normal(0, 3, n)
+    idx = rnd.choice(n, 12, replace=False)
+    spikes[idx[:6]] = 99.0
+    spikes[idx[6:]] = 1.0
+    series["isolated_spikes"] = spikes
+
+    # Bombas encendidas: escalones enteros
+    series["pump_steps"] = np.repeat(rnd.integers(0, 8, n // 60 + 1), 60)[:n].astype(np.float64)
+
+    # Caminata al azar acotada
+    series["random_walk"] = np.clip(50 + np.cumsum(rnd.normal(0, 0.8, n)), 0, 100)
+
+    # Plana con un glitch y huecos (NULL)
+    flat = np.full(n, 42.0)
+    flat[n // 3] = 95.0
+    flat[rnd.random(n) < 0.1] = np.nan
+    series["flat_glitch_nulls"] = flat
+
+    # Cruces breves de alarma (2-3 minutos) en una base tranquila
+    brief = 50 + rnd.normal(0, 2, n)
+    for start in rnd.choice(n - 5, 20, replace=False):
+        brief[start:start + rnd.integers(2, 4)] = ALARM_HIGH + 3
+    series["brief_alarms"] = brief
+
+    return series
+
+
+def _excursions(v: np.ndarray, above: bool, th: float) -> list[tuple[int, int]]:
+    m = (v > th) if above else (v < th)
+    m = np.where(np.isnan(v), False, m)
+    edges = np.flatnonzero(np.diff(np.r_[0, m.astype(np.int8), 0]))
+    return list(zip(edges[0::2], edges[1::2]))
+
+
+def check(name: str, v: np.ndarray, max_points: int, method: str) -> dict:
+    n = v.size
+    rows = [{"ts": i, "val": None if np.isnan(x) else float(x)} for i, x in enumerate(v)]
+
+    t0 = time.perf_counter()
+    out = downsample_rows(rows, max_points, ["val"], method=method)
+    ms = (time.perf_counter() - t0) * 1000
+
+    kept_ts = np.array([r["ts"] for r in out])
+    kept_v = np.array([np.nan if r["val"] is None else r["val"] for r in out])
+
+    extremes_ok = (
+        np.nanmax(kept_v) == np.nanmax(v)
+        and np.nanmin(kept_v) == np.nanmin(v)
+        and kept_ts[0] == 0
+        and kept_ts[-1] == n - 1
+    )
+
+    # Cruces: algún punto conservado del otro lado del umbral cerca del tramo
+    window = max(1, n // max(1, max_points // 2))
+    total = missed = 0
+    for above, th in ((True, ALARM_HIGH), (False, ALARM_LOW)):
+        side = (kept_v > th) if above else (kept_v < th)
+        side_ts = kept_ts[np.where(np.isnan(kept_v), False, side)]
+        for a, b in _excursions(v, above, th):
+            total += 1
+            j = np.searchsorted(side_ts, a - window)
+            if j >= side_ts.size or side_ts[j] > b + window:
+                missed += 1
+
+    return {
+        "name": name,
+        "method": method,
+        "points": len(out),
+        "ratio": n / len(out),
+        "bytes_in": len(json.dumps(rows)),
+        "bytes_out": len(json.dumps(out)),
+        "ms": ms,
+        "extremes_ok": bool(extremes_ok),
+        "crossings": total,
+        "crossings_missed": missed,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", type=int, default=43200)
+    ap.add_argument("--max-points", type=int, default=1500)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    failed = False
+    print(f"{args.points} puntos -> max_points={args.max_points}  umbrales {ALARM_LOW}/{ALARM_HIGH}")
+    for name, v in corpus(args.points, args.seed).items():
+        for method in ("minmax", "lttb"):
+            r = check(name, v, args.max_points, method)
+            print(
+                f"{name:<18} {method:<6} puntos={r['points']:>5}  x{r['ratio']:5.1f}  "
+                f"json {r['bytes_in'] / 1024:7.0f} -> {r['bytes_out'] / 1024:5.0f} KiB  "
+                f"{r['ms']:6.1f} ms  extremos={'ok' if r['extremes_ok'] else 'FALLA'}  "
+                f"cruces {r['crossings'] - r['crossings_missed']}/{r['crossings']}"
+            )
+            if not r["extremes_ok"] or (method == "minmax" and r["crossings_missed"]):
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# bench/live_series_engine.py
+"""
+Benchmark: series "live" con el motor NumPy (app/services/series_engine)
+contra el cálculo en SQL (grilla + ventanas), para ventanas de 1, 7 y 30
+días.
+
+Con DB (desde Backend/, DATABASE_URL apuntando a una copia con datos):
+
+    python bench/live_series_engine.py [--days 1,7,30] [--repeat 5]
+        [--company-id N] [--location-id N] [--bucket 1min] [--raw]
+
+  Llama a las rutas directo (sin HTTP) alternando SERIES_ENGINE=sql y
+  numpy, y compara tiempos (mediana) y resultados (max |diferencia|):
+
+    tanks_live       /kpi/tanques/live            (agg=avg, carry=true)
+    pumps_live       /kpi/bombas/live             (agg_mode=avg)
+    level_1m_agg     /kpi/tanques/operation/level-1m?aggregate=true
+
+  --raw: /kpi/tanques/live desde la vista cruda (TANK_LEVELS_SOURCE) en
+  vez del rollup por tiers.
+
+Sin DB:
+
+    python bench/live_series_engine.py --synthetic [--tanks 100] [--period-sec 30]
+
+  Genera lecturas sueltas (con huecos) y mide sólo el cálculo: NumPy
+  contra un LOCF minuto a minuto en Python (lo que costaría armar la
+  serie a partir de filas dict), verificando que den lo mismo.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import math
+import pathlib
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from app.services import series_engine as se  # noqa: E402
+
+
+def _max_diff(a: list, b: list) -> float:
+    if len(a) != len(b):
+        return math.inf
+    worst = 0.0
+    for x, y in zip(a, b):
+        if x is None or y is None:
+            if x is not y:
+                return math.inf
+            continue
+        worst = max(worst, abs(float(x) - float(y)))
+    return worst
+
+
+def _median_ms(samples: list[float]) -> float:
+    return statistics.median(samples) * 1000
+
+
+# ============================================================
+# Sintético
+# ============================================================
+def synth_readings(n_tanks: int, days: int, period_s: int, seed: int):
+    rnd = np.random.default_rng(seed)
+    t0 = 1_700_000_000 - 1_700_000_000 % 86400
+    span = days * 86400
+    per_tank = span // period_s
+    tank = np.repeat(np.arange(n_tanks), per_tank).astype(np.float64)
+    ts = t0 + np.tile(np.arange(per_tank) * period_s, n_tanks) + rnd.uniform(0, period_s, tank.size)
+    val = rnd.uniform(0, 100, tank.size)
+    # huecos: ~20% de las lecturas no llegan
+    keep = rnd.random(tank.size) > 0.2
+    return t0, span, tank[keep], ts[keep], val[keep]
+
+
+def numpy_series(t0: int, span: int, tank, ts, val, bucket: str):
+    n_slots = span // 60
+    slot = se.slot_index(ts, t0, 60)
+    s, k, v = se.reduce_slots(tank, slot, val, "avg")
+    grid = se.locf_mean(s, k, v, n_slots, carry=True)
+    return se.to_json_lists(*se.reduce_buckets(t0 + np.arange(n_slots) * 60.0, grid, bucket))
+
+
+def python_series(t0: int, span: int, tank, ts, val, bucket: str):
+    """Referencia: dict por (tanque, minuto), LOCF y buckets con loops."""
+    per_min: dict[tuple[int, int], list[float]] = {}
+    for a, b, c in zip(tank.tolist(), ts.tolist(), val.tolist()):
+        per_min.setdefault((int(a), int((b - t0) // 60)), []).append(c)
+    by_tank: dict[int, dict[int, float]] = {}
+    for (a, m), vals in per_min.items():
+        by_tank.setdefault(a, {})[m] = sum(vals) / len(vals)
+
+    step = se.BUCKET_SECONDS[bucket] // 60
+    last: dict[int, float] = {}
+    buckets: dict[int, list[float]] = {}
+    for m in range(span // 60):
+        for a, mins in by_tank.items():
+            if m in mins:
+                last[a] = mins[m]
+        minute_avg = sum(last.values()) / len(last) if last else None
+        if minute_avg is not None:
+            buckets.setdefault(m // step, []).append(minute_avg)
+    keys = sorted(buckets)
+    return (
+        [(t0 + k * step * 60) * 1000 for k in keys],
+        [sum(buckets[k]) / len(buckets[k]) for k in keys],
+    )
+
+
+def run_synthetic(args) -> None:
+    print(f"tanques={args.tanks} lectura cada ~{args.period_sec}s (20% perdidas) bucket={args.bucket}")
+    for days in args.days:
+        t0, span, tank, ts, val = synth_readings(args.tanks, days, args.period_sec, args.seed)
+        times_np, times_py = [], []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            out_np = numpy_series(t0, span, tank, ts, val, args.bucket)
+            times_np.append(time.perf_counter() - t)
+        # El loop en Python es lento: una sola corrida en ventanas largas
+        for _ in range(1 if days > 1 else args.repeat):
+            t = time.perf_counter()
+            out_py = python_series(t0, span, tank, ts, val, args.bucket)
+            times_py.append(time.perf_counter() - t)
+        ok = out_np[0] == out_py[0] and _max_diff(out_np[1], out_py[1]) < 1e-6
+        print(
+            f"{days:>3} d  lecturas={tank.size:>9,}  puntos={len(out_np[0]):>6}  "
+            f"numpy={_median_ms(times_np):8.1f} ms  python={_median_ms(times_py):9.1f} ms  "
+            f"x{_median_ms(times_py) / _median_ms(times_np):6.1f}  iguales={ok}"
+        )
+
+
+# ============================================================
+# Contra la DB
+# ============================================================
+async def _timed(fn, repeat: int):
+    times, out = [], None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = await fn()
+        times.append(time.perf_counter() - t)
+    return _median_ms(times), out
+
+
+async def run_db(args) -> None:
+    from fastapi.concurrency import run_in_threadpool
+
+    from app.db import close_pool
+    from app.db_async import close_async_pool, open_async_pool
+    from app.routes.kpi import bombas_live, tank_live, tanques
+
+    if args.raw:
+        tank_live.TANK_ROLLUP_ENABLED = False
+
+    await open_async_pool()
+    try:
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        for days in args.days:
+            df = now - timedelta(days=days)
+            scope = {"company_id": args.company_id, "location_id": args.location_id}
+
+            cases = {
+                "tanks_live": (
+                    lambda: tank_live.tanks_live_24h(
+                        **scope, tank_ids=None, date_from=df, date_to=now, agg="avg",
+                        carry=True, connected_only=True, bucket=args.bucket,
+                    ),
+                    "level_percent",
+                ),
+                "pumps_live": (
+                    lambda: bombas_live.pumps_live(
+                        **scope, pump_ids=None, date_from=df, date_to=now, bucket=args.bucket,
+                        agg_mode="avg", connected_only=True,
+                    ),
+                    "is_on",
+                ),
+                "level_1m_agg": (
+                    lambda: run_in_threadpool(
+                        tanques.operation_tanks_level_1m,
+                        **scope, tank_ids=None, date_from=df, date_to=now, bucket=args.bucket,
+                        aggregate=True, limit=300000,
+                    ),
+                    "level_avg",
+                ),
+            }
+
+            for name, (call, field) in cases.items():
+                se.SERIES_ENGINE = "sql"
+                await call()  # calentar
+                ms_sql, out_sql = await _timed(call, args.repeat)
+                se.SERIES_ENGINE = "numpy"
+                await call()
+                ms_np, out_np = await _timed(call, args.repeat)
+
+                same_ts = out_sql["timestamps"] == out_np["timestamps"]
+                diff = _max_diff(out_sql[field], out_np[field]) if same_ts else math.inf
+                print(
+                    f"{days:>3} d  {name:<13} puntos={len(out_np['timestamps']):>6}  "
+                    f"sql={ms_sql:8.1f} ms  numpy={ms_np:8.1f} ms  x{ms_sql / ms_np:5.2f}  "
+                    f"max|dif|={diff:.2g}"
+                )
+    finally:
+        await close_async_pool()
+        close_pool()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", default="1,7,30")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--bucket", default="1min", choices=sorted(se.BUCKET_SECONDS))
+    ap.add_argument("--synthetic", action="store_true")
+    ap.add_argument("--tanks", type=int, default=100)
+    ap.add_argument("--period-sec", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=random.randrange(1 << 16))
+    ap.add_argument("--company-id", type=int, default=None)
+    ap.add_argument("--location-id", type=int, default=None)
+    ap.add_argument("--raw", action="store_true")
+    args = ap.parse_args()
+    args.days = [int(d) for d in args.days.split(",") if d.strip()]
+
+    if args.synthetic:
+        run_synthetic(args)
+    else:
+        asyncio.run(run_db(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench/sim_sources_reaching.py
+"""
+Benchmark: fuentes que alcanzan cada nodo en /mapa/sim/run.
+
+Compara la versión anterior (propagate_from_single_source una vez por
+fuente) contra propagate_sources_reaching (una sola pasada multi-fuente)
+sobre una grilla sintética.
+
+Uso (desde Backend/):
+    python bench/sim_sources_reaching.py [--side 100] [--sources 60] [--top 6]
+
+Con --side 100 la grilla tiene 10.000 nodos y 19.800 cañerías.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import pathlib
+import random
+import time
+
+# hydraulics.py no depende de la DB: se carga directo para no levantar
+# app.db (que exige DATABASE_URL) al importar el paquete de rutas.
+_HYDRAULICS = pathlib.Path(__file__).resolve().parents[1] / "app" / "routes" / "mapa" / "sim" / "hydraulics.py"
+_spec = importlib.util.spec_from_file_location("sim_hydraulics", _HYDRAULICS)
+hydraulics = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(hydraulics)
+
+
+def build_grid(side: int, seed: int):
+    rnd = random.Random(seed)
+    adj: dict[str, list[tuple[str, str, float, float, float]]] = {}
+    n_pipes = 0
+
+    for i in range(side):
+        for j in range(side):
+            for a, b in ((i + 1, j), (i, j + 1)):
+                if a >= side or b >= side:
+                    continue
+
+                u = f"n{i}_{j}"
+                v = f"n{a}_{b}"
+                pid = f"p{n_pipes}"
+                Lm = rnd.uniform(10.0, 200.0)
+                Dmm = rnd.choice([63.0, 75.0, 110.0, 160.0, 200.0])
+                R = hydraulics.pipe_R(Lm, Dmm, 1.0)
+
+                adj.setdefault(u, []).append((v, pid, R, Lm, Dmm))
+                adj.setdefault(v, []).append((u, pid, R, Lm, Dmm))
+                n_pipes += 1
+
+    return adj, n_pipes
+
+
+def per_source(sources, adj, R0, scale, top):
+    reaching: dict[str, list[tuple[int, float]]] = {}
+
+    for s_idx, (node, h) in enumerate(sources):
+        heads = hydraulics.propagate_from_single_source(node, h, adj, set(), R0, scale)
+        for nid, hv in heads.items():
+            reaching.setdefault(nid, []).append((s_idx, hv))
+
+    return {
+        nid: sorted(items, key=lambda x: x[1], reverse=True)[:top]
+        for nid, items in reaching.items()
+    }
+
+
+def multi_source(sources, adj, R0, scale, top):
+    reaching, _comp_of, _comp_sources = hydraulics.propagate_sources_reaching(
+        sources, adj, set(), R0, scale, top
+    )
+    return reaching
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--side", type=int, default=100)
+    ap.add_argument("--sources", type=int, default=60)
+    ap.add_argument("--top", type=int, default=6)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    adj, n_pipes = build_grid(args.side, args.seed)
+    rnd = random.Random(args.seed + 1)
+    nodes = list(adj)
+    sources = [(rnd.choice(nodes), rnd.uniform(30.0, 80.0)) for _ in range(args.sources)]
+
+    R0 = 500000.0
+    scale = 0.00001
+
+    t0 = time.perf_counter()
+    old = per_source(sources, adj, R0, scale, args.top)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new = multi_source(sources, adj, R0, scale, args.top)
+    t_new = time.perf_counter() - t0
+
+    mismatches = sum(
+        1
+        for nid in old
+        if [(s, round(h, 9)) for s, h in old[nid]] != [(s, round(h, 9)) for s, h in new.get(nid, [])]
+    )
+
+    print(f"nodos={len(nodes)} cañerías={n_pipes} fuentes={len(sources)} top={args.top}")
+    print(f"por fuente:   {t_old:8.3f} s")
+    print(f"multi-fuente: {t_new:8.3f} s")
+    print(f"speedup:      {t_old / t_new:8.1f}x")
+    print(f"nodos con top distinto: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
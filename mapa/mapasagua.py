@@ -1,8 +1,6 @@
-import json
 from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
 
-from app.db import get_conn
+from app.routes.mapa.geojson_stream import stream_feature_collection
 
 router = APIRouter(prefix="/mapasagua", tags=["mapasagua"])
 
@@ -27,44 +25,21 @@ def get_pipes(
         """
         params.extend([min_lng, min_lat, max_lng, max_lat])
 
+    # Cada pedazo sale de la DB como texto JSON: sin json.loads por fila.
     sql = f"""
       select
-        p.id::text as id,
-        p.diametro_mm,
-        p.material,
-        p.type,
-        p.estado,
-        p.style,
-        p.props,
+        to_json(p.id::text)::text as id,
+        json_build_object(
+          'diametro_mm', p.diametro_mm,
+          'material', p.material,
+          'type', p.type,
+          'estado', p.estado,
+          'style', p.style,
+          'props', p.props
+        )::text as properties,
         infraestructura.st_asgeojson(p.geom) as geometry_json
       from "MapasAgua".pipes p
       {where}
     """
 
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-
-    features = []
-    for (pid, diam, material, typ, estado, style, props, geometry_json) in rows:
-        if not geometry_json:
-            continue
-        geom = json.loads(geometry_json)
-        features.append(
-            {
-                "type": "Feature",
-                "id": pid,
-                "properties": {
-                    "diametro_mm": diam,
-                    "material": material,
-                    "type": typ,
-                    "estado": estado,
-                    "style": style,
-                    "props": props,
-                },
-                "geometry": geom,
-            }
-        )
-
-
-    return JSONResponse({"type": "FeatureCollection", "features": features})
+    return stream_feature_collection(sql, params)